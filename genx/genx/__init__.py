@@ -7,28 +7,66 @@ import os
 import sys
 
 from importlib import import_module
-from importlib.abc import MetaPathFinder
-from importlib.util import spec_from_file_location
+from importlib.abc import Loader, MetaPathFinder
+from importlib.util import find_spec, spec_from_loader
 
 _buildin_metafinder = list(sys.meta_path)
 
 
+def _package_names():
+    # names of the modules and subpackages within genx that can be imported without the "genx." prefix
+    names = set()
+    with os.scandir(os.path.dirname(os.path.abspath(__file__))) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if os.path.exists(os.path.join(entry.path, "__init__.py")):
+                    names.add(entry.name)
+            elif entry.name.endswith(".py") and not entry.name.startswith("__"):
+                names.add(entry.name[:-3])
+    return frozenset(names)
+
+
+class GenxAliasLoader(Loader):
+    """
+    Loads a legacy module name as alias of the already imported genx module.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.target_spec = None
+
+    def create_module(self, spec):
+        module = import_module(self.target)
+        self.target_spec = module.__spec__
+        return module
+
+    def exec_module(self, module):
+        # the import system sets the alias spec, the module keeps its own
+        module.__spec__ = self.target_spec
+
+
 class GenxModuleFinder(MetaPathFinder):
+    """
+    Resolves the legacy top-level names used e.g. by model scripts (import models.spec_nx) to the
+    modules of the genx package. All other imports are rejected by a single lookup in a name index
+    that is built once.
+    """
+
+    def __init__(self):
+        self.aliases = _package_names()
 
     def find_spec(self, fullname, path=None, target=None):
-        if fullname.startswith("genx"):
+        if fullname.partition(".")[0] not in self.aliases:
+            return None
+        try:
+            target_spec = find_spec("genx." + fullname)
+        except ModuleNotFoundError:
+            return None
+        if target_spec is None:
             return None
-        itms = fullname.split(".")
-        fname = os.path.join(os.path.dirname(os.path.abspath(__file__)), *itms) + ".py"
-        pname = os.path.join(os.path.dirname(os.path.abspath(__file__)), *itms, "__init__.py")
-        if os.path.exists(fname):
-            m = import_module("genx." + fullname)
-            sys.modules[fullname] = m
-            return spec_from_file_location(fullname, fname)
-        if os.path.exists(pname):
-            m = import_module("genx." + fullname)
-            sys.modules[fullname] = m
-            return spec_from_file_location(fullname, pname)
+        return spec_from_loader(
+            fullname, GenxAliasLoader("genx." + fullname), is_package=target_spec.submodule_search_locations is not None
+        )
 
 
 sys.meta_path.insert(0, GenxModuleFinder())
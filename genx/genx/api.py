@@ -277,6 +277,26 @@ def fit_update(model, optimizer):
     model.simulate()
 
 
+def fit_batch(processes=None, warm_start=False, adjust_bounds=False, calc_errors=False, fname=None):
+    """
+    Fit all datasets of a sequence (controller.model_store) in parallel processes. The script and
+    parameters of the current model are used for all of them. With warm_start each fit starts from
+    the result of the previous dataset and if fname is given each result is saved to the .hgx file
+    as soon as its fit has finished.
+
+    Returns a list of batch.BatchResult.
+    """
+    controller.update_store_models()
+    return controller.batch_fit(
+        processes=processes,
+        warm_start=warm_start,
+        adjust_bounds=adjust_bounds,
+        calc_errors=calc_errors,
+        fname=fname,
+        callback=lambda model, result: print(f"Finished {model.h5group_name}, FOM: {result.fom}"),
+    )
+
+
 class Reflectivity(SampleBuilder):
     """
     Interface to build a model script for reflectivity simulations. Surves the same purpose
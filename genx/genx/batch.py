@@ -0,0 +1,266 @@
+"""
+Batch fitting of a sequence of models, e.g. the datasets of a temperature or field series
+read with ModelController.read_sequence.
+
+The models are fitted independently with differential evolution, each one in a worker process
+of a pool. With warm_start the fitted parameters of a model are used as start values of its
+next neighbour in the sequence. The sequence is then split into one contiguous segment per
+process and the models of each segment are fitted one after another.
+"""
+
+import multiprocessing as processing
+import queue
+import time
+
+from collections import deque
+from dataclasses import dataclass
+from logging import debug
+from typing import Callable, List, Optional
+
+from numpy import array, ndarray, seterr
+
+from .core import custom_logging
+from .diffev import DiffEv, DiffEvConfig, _cpu_count, set_numba_single
+from .model import Model
+from .solver_basis import GenxOptimizerCallback
+
+
+@dataclass
+class BatchResult:
+    index: int
+    values: Optional[ndarray] = None
+    fom: Optional[float] = None
+    n_fom_evals: int = 0
+    errors: Optional[ndarray] = None
+    sims: Optional[List[ndarray]] = None
+    error_message: Optional[str] = None
+    fit_time: float = 0.0
+
+
+class BatchCallbacks(GenxOptimizerCallback):
+    # the optimizers in the worker processes do not report their progress
+    def text_output(self, text):
+        debug(text)
+
+    def plot_output(self, update_data):
+        pass
+
+    def parameter_output(self, param_info):
+        pass
+
+    def fitting_ended(self, result_data):
+        pass
+
+    def autosave(self):
+        pass
+
+
+def set_start_values(model: Model, values, adjust_bounds=False):
+    """
+    Use values as start values of the fit parameters of model. With adjust_bounds the
+    bounds are centered around the new values, keeping their range.
+    """
+    parameters = model.parameters
+    row_nmb, funcs, _, min_, max_ = parameters.get_fit_pars()
+    for ri, vi, mii, mai in zip(row_nmb, values, min_, max_):
+        parameters.set_value(ri, 1, vi)
+        if adjust_bounds:
+            val_range = mai - mii
+            parameters.set_value(ri, 3, vi - val_range / 2.0)
+            parameters.set_value(ri, 4, vi + val_range / 2.0)
+
+
+def batch_init(numba_procs=None, overwrite_single=False, log_queue=None):
+    """
+    Initialization of the worker processes of a batch fit.
+    """
+    if log_queue:
+        custom_logging.setup_mp(log_queue)
+    # ignore KeyboardInterrupt so that master process can handle it
+    import signal
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    seterr(divide="ignore", over="ignore", under="ignore", invalid="ignore")
+    if overwrite_single:
+        set_numba_single()
+    elif numba_procs is not None:
+        try:
+            import numba
+        except ImportError:
+            pass
+        else:
+            if hasattr(numba, "set_num_threads") and numba.get_num_threads() > numba_procs:
+                numba.set_num_threads(numba_procs)
+
+
+def batch_fit(
+    index: int, model: Model, config: DiffEvConfig, start_values=None, adjust_bounds=False, calc_errors=False
+) -> BatchResult:
+    """
+    Fit a single model of the batch, this function runs in the worker processes.
+    """
+    t_start = time.time()
+    try:
+        if start_values is not None:
+            set_start_values(model, start_values, adjust_bounds)
+        model.reset()
+        model.simulate()
+        model.parameters.clear_error_pars()
+
+        optimizer = DiffEv()
+        optimizer.opt = config
+        optimizer.set_callbacks(BatchCallbacks())
+        optimizer.reset()
+        optimizer.init_fitting(model)
+        optimizer.optimize()
+
+        model.parameters.set_value_pars(optimizer.best_vec)
+        model.simulate(compile=False)
+        result = BatchResult(
+            index,
+            values=array(optimizer.best_vec),
+            fom=float(optimizer.best_fom),
+            n_fom_evals=optimizer.n_fom,
+            sims=[di.y_sim for di in model.data],
+        )
+        if calc_errors:
+            result.errors = array(optimizer.calc_error_bars())
+    except Exception as e:
+        debug(f"Batch fit of model {index} failed", exc_info=True)
+        result = BatchResult(index, error_message=f"An error occured in the model while executing:\n{e!r}")
+    result.fit_time = time.time() - t_start
+    return result
+
+
+def apply_result(model: Model, result: BatchResult):
+    """
+    Set the fitted parameters, errors and simulations of a batch result in the model.
+    """
+    if result.error_message:
+        return
+    model.parameters.set_value_pars(result.values)
+    if result.errors is not None:
+        model.parameters.set_error_pars(["(%.3e, %.3e,)" % (low, high) for low, high in result.errors])
+    for di, sim in zip(model.data, result.sims):
+        di.y_sim = sim
+    model.fom = result.fom
+
+
+class BatchFitter:
+    """
+    Fits a sequence of models in a pool of processes.
+
+    The fit results are applied to the models as soon as each fit has finished and
+    result_callback(model, result) is called, e.g. to store the model in a file.
+    """
+
+    def __init__(
+        self,
+        models: List[Model],
+        config: DiffEvConfig,
+        processes=_cpu_count,
+        warm_start=False,
+        adjust_bounds=False,
+        calc_errors=False,
+        result_callback: Callable[[Model, BatchResult], None] = None,
+    ):
+        self.models = models
+        self.config = config.copy()
+        # each worker runs its own fit without further parallelization
+        self.config.use_parallel_processing = False
+        self.config.use_mpi = False
+        self.config.use_autosave = False
+        self.processes = max(1, min(processes, len(models)))
+        self.warm_start = warm_start
+        self.adjust_bounds = adjust_bounds
+        self.calc_errors = calc_errors
+        self.result_callback = result_callback
+
+        self.pool = None
+        self.stop = False
+        self.results: List[Optional[BatchResult]] = [None] * len(models)
+        self._finished = queue.Queue()
+
+    def segments(self):
+        """
+        Indices of the models fitted one after another. Without warm_start each model is its own segment.
+        """
+        if not self.warm_start:
+            return [[i] for i in range(len(self.models))]
+        n = len(self.models)
+        bounds = [n * i // self.processes for i in range(self.processes + 1)]
+        return [list(range(start, end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+    def setup_pool(self):
+        from .models.lib import USE_NUMBA
+
+        numba_procs = None
+        overwrite_single = False
+        if USE_NUMBA:
+            try:
+                import numba
+            except ImportError:
+                pass
+            else:
+                overwrite_single = getattr(numba, "GENX_OVERWRITE_SINGLE", False)
+                numba_procs = max(1, _cpu_count // self.processes)
+        log_queue = custom_logging.mp_logger and custom_logging.mp_logger.queue
+        self.pool = processing.Pool(
+            processes=self.processes, initializer=batch_init, initargs=(numba_procs, overwrite_single, log_queue)
+        )
+
+    def dismount_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def submit(self, index, start_values=None):
+        self.pool.apply_async(
+            batch_fit,
+            (
+                index,
+                self.models[index].pickable_copy(),
+                self.config,
+                start_values,
+                self.adjust_bounds,
+                self.calc_errors,
+            ),
+            callback=self._finished.put,
+            error_callback=lambda e: self._finished.put(BatchResult(index, error_message=repr(e))),
+        )
+
+    def run(self) -> List[Optional[BatchResult]]:
+        """
+        Fit all models and return the results in the order of the models. Models not fitted
+        because the batch was stopped have a result of None.
+        """
+        segments = self.segments()
+        successor = {}
+        for segment in segments:
+            successor.update(zip(segment[:-1], segment[1:]))
+        # models that can be fitted next with their start values, at most one fit per process is submitted
+        ready = deque((segment[0], None) for segment in segments)
+        if self.pool is None:
+            self.setup_pool()
+        try:
+            running = 0
+            while running > 0 or (ready and not self.stop):
+                while ready and running < self.processes and not self.stop:
+                    self.submit(*ready.popleft())
+                    running += 1
+                result = self._finished.get()
+                running -= 1
+                self.results[result.index] = result
+                model = self.models[result.index]
+                apply_result(model, result)
+                if self.result_callback is not None:
+                    self.result_callback(model, result)
+                next_index = successor.get(result.index)
+                if next_index is not None:
+                    start_values = result.values if self.warm_start and not result.error_message else None
+                    # continue the chain before starting new segments
+                    ready.appendleft((next_index, start_values))
+        finally:
+            self.dismount_pool()
+        return self.results
@@ -21,6 +21,7 @@ from bumps.monitor import TimedUpdate
 
 from .core import custom_logging
 from .core.config import BaseConfig
+from .core.shared_data import SharedDataBuffer
 from .exceptions import ErrorBarError, OptimizerInterrupted
 from .model import GenxCurve, Model
 from .solver_basis import GenxOptimizer, GenxOptimizerCallback, SolverParameterInfo, SolverResultInfo, SolverUpdateInfo
@@ -163,6 +164,7 @@ class BumpsOptimizer(GenxOptimizer):
 
     n_fom_evals = 0
     _running = False
+    pool = None
 
     def is_running(self):
         return self._running
@@ -325,46 +327,55 @@ class BumpsOptimizer(GenxOptimizer):
             if fitclass.name == self.opt.method:
                 break
 
-        if self.opt.use_parallel_processing:
-            from .models.lib import USE_NUMBA, paratt
-
-            use_cuda = paratt.Refl.__module__.rsplit(".", 1)[1] == "paratt_cuda"
-            # reduce numba thread count for numba functions
-            if USE_NUMBA:
-                numba_procs = max(1, _cpu_count // self.opt.parallel_processes)
+        shared_data = None
+        try:
+            if self.opt.use_parallel_processing:
+                from .models.lib import USE_NUMBA, paratt
+
+                use_cuda = paratt.Refl.__module__.rsplit(".", 1)[1] == "paratt_cuda"
+                # reduce numba thread count for numba functions
+                if USE_NUMBA:
+                    numba_procs = max(1, _cpu_count // self.opt.parallel_processes)
+                else:
+                    numba_procs = None
+                self.text_output("Starting a pool with %i workers ..." % (self.opt.parallel_processes,))
+                # send the problem only once with the data arrays in shared memory
+                shared_data = SharedDataBuffer(self.model.data)
+                self.pool = multiprocessing.Pool(
+                    processes=self.opt.parallel_processes,
+                    initializer=parallel_init,
+                    initargs=(numba_procs, custom_logging.mp_logger.queue, shared_data.dumps(problem)),
+                )
+                if use_cuda:
+                    self.pool.apply_async(init_cuda)
+                options["mapper"] = lambda p: list(
+                    self.pool.map(parallel_nllf, p, chunksize=self.opt.parallel_chunksize)
+                )
+                # TODO: investigate why function connection is lost here
+                (param_funcs, start_guess, par_min, par_max) = self.model.get_fit_pars()
+                self.par_funcs = param_funcs
+
+            monitors = [FitterMonitor(problem, self)]
+            driver = FitDriver(fitclass=fitclass, problem=problem, monitors=monitors, **options)
+            driver.clip()  # make sure fit starts within domain
+            x0 = problem.getp()
+            self.start_guess = self.map_bumps2genx(x0)
+            x, fx = driver.fit()
+            problem.setp(x)
+            dx = driver.stderr()
+            if self.opt.method.lower() == "dream":
+                dxpm = self.model.asym_stderr(driver.fitter)
             else:
-                numba_procs = None
-            self.text_output("Starting a pool with %i workers ..." % (self.opt.parallel_processes,))
-            self.pool = multiprocessing.Pool(
-                processes=self.opt.parallel_processes,
-                initializer=parallel_init,
-                initargs=(numba_procs, custom_logging.mp_logger.queue),
-            )
-            if use_cuda:
-                self.pool.apply_async(init_cuda)
-            options["mapper"] = lambda p: list(self.pool.map(problem.nllf, p, chunksize=self.opt.parallel_chunksize))
-            # TODO: investigate why function connection is lost here
-            (param_funcs, start_guess, par_min, par_max) = self.model.get_fit_pars()
-            self.par_funcs = param_funcs
-
-        monitors = [FitterMonitor(problem, self)]
-        driver = FitDriver(fitclass=fitclass, problem=problem, monitors=monitors, **options)
-        driver.clip()  # make sure fit starts within domain
-        x0 = problem.getp()
-        self.start_guess = self.map_bumps2genx(x0)
-        x, fx = driver.fit()
-        problem.setp(x)
-        dx = driver.stderr()
-        if self.opt.method.lower() == "dream":
-            dxpm = self.model.asym_stderr(driver.fitter)
-        else:
-            dxpm = None
-        cov = driver.cov()
-
-        if self.opt.use_parallel_processing:
-            self.pool.close()
-            self.pool.join()
-            self.pool = None
+                dxpm = None
+            cov = driver.cov()
+        finally:
+            # release the workers and shared memory also if the fit failed
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+            if shared_data is not None:
+                shared_data.close()
 
         result = BumpsResult(x=x, dx=dx, dxpm=dxpm, cov=cov, chisq=driver.chisq(), bproblem=self.bproblem)
         if hasattr(driver.fitter, "state"):
@@ -429,11 +440,13 @@ class BumpsOptimizer(GenxOptimizer):
         return result
 
 
-def parallel_init(numba_procs=None, log_queue=None):
+problem = None  # global variable set in parallel_init
+
+
+def parallel_init(numba_procs=None, log_queue=None, pkl_problem=None):
     """
     parallel initialization of a pool of processes. The function takes a
-    pickle safe copy of the model and resets the script module and the compiles
-    the script and creates function to set the variables.
+    pickled copy of the bumps problem that is used to evaluate parallel_nllf.
     """
     if log_queue is not None:
         custom_logging.setup_mp(log_queue)
@@ -447,6 +460,19 @@ def parallel_init(numba_procs=None, log_queue=None):
                 debug(f"Setting numba threads to {numba_procs}")
                 numba.set_num_threads(numba_procs)
     debug(f"Initialize multiprocessing for bumps")
+    global problem
+    if pkl_problem is not None:
+        try:
+            problem = pickle.loads(pkl_problem)
+        except Exception:
+            debug("Exception when initializing worker process", exc_info=True)
+
+
+def parallel_nllf(p):
+    """
+    Evaluate the negative log-likelihood of the problem in a worker process.
+    """
+    return problem.nllf(p)
 
 
 def init_cuda():
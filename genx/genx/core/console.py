@@ -75,10 +75,8 @@ class CursesHandler(logging.Handler):
 
 def calc_errorbars(mod, opt: GenxOptimizer):
     error_values = []
-    n_elements = len(opt.start_guess)
-    for index in range(n_elements):
-        # calculate the error for given optimizer, accuracy depends on settings
-        (error_low, error_high) = opt.calc_error_bar(index)
+    # calculate the errors for given optimizer, accuracy depends on settings
+    for error_low, error_high in opt.calc_error_bars():
         error_values.append("(%.3e, %.3e,)" % (error_low, error_high))
     mod.parameters.set_error_pars(error_values)
 
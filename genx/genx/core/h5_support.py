@@ -8,9 +8,7 @@ from abc import ABC, abstractmethod
 from datetime import datetime
 from inspect import isclass
 from logging import debug, warning
-from typing import List, Union, get_type_hints
-
-import h5py
+from typing import TYPE_CHECKING, List, Union, get_type_hints
 
 from numpy import ndarray, void
 
@@ -25,6 +23,11 @@ except ImportError:
         return getattr(tp, "__extra__", None) or getattr(tp, "__origin__", None)
 
 
+if TYPE_CHECKING:
+    # h5py is imported on first use to speed up the start
+    import h5py
+
+
 class H5Savable(ABC):
 
     # Defines minimum required methods for a class to be used upon saving
@@ -38,14 +41,14 @@ class H5Savable(ABC):
         """
 
     @abstractmethod
-    def write_h5group(self, group: h5py.Group):
+    def write_h5group(self, group: "h5py.Group"):
         """Save configuration to hdf5 group"""
 
     @abstractmethod
-    def read_h5group(self, group: h5py.Group):
+    def read_h5group(self, group: "h5py.Group"):
         """Configure object from hdf5 group"""
 
-    def h5_write_free_dict(self, group: h5py.Group, obj: dict):
+    def h5_write_free_dict(self, group: "h5py.Group", obj: dict):
         """Help method to write an arbitrary dictionary of variable depth to hdf5 group"""
         for key, value in obj.items():
             vtyp = type(value)
@@ -67,7 +70,7 @@ class H5Savable(ABC):
                 group[key] = void(pickle.dumps(value))
                 group[key].attrs["genx_type"] = "dump".encode("ascii")
 
-    def h5_read_free_dict(self, output: dict, group: Union[h5py.Group, h5py.Dataset], item_path: List[str]):
+    def h5_read_free_dict(self, output: dict, group: Union["h5py.Group", "h5py.Dataset"], item_path: List[str]):
         """
         Recursive read of meta data from hdf5 group
         """
@@ -80,6 +83,8 @@ class H5Savable(ABC):
                 new_node = {}
                 node[pathi] = new_node
                 node = new_node
+        import h5py
+
         if type(group) is h5py.Dataset:
             prev_typ = group.attrs.get("genx_type", None)
             value = group[()]
@@ -126,11 +131,13 @@ class H5HintedExport(H5Savable):
             if not hasattr(self.__class__, attr):
                 continue  # might be a case that does not exist
             default = getattr(self.__class__, attr)
+            if hasattr(default, "__get__"):
+                continue  # descriptor that creates the value on first access
             if hasattr(default, "copy"):
                 default = default.copy()  # for array, dict and lists, make sure a copy is used
             setattr(self, attr, default)
 
-    def write_h5group(self, group: h5py.Group):
+    def write_h5group(self, group: "h5py.Group"):
         """
         Uses this objects type hints to write attributes to hdf5 group.
 
@@ -180,7 +187,7 @@ class H5HintedExport(H5Savable):
         for key, value in self._group_attr.items():
             group.attrs[key] = value
 
-    def read_h5group(self, group: h5py.Group):
+    def read_h5group(self, group: "h5py.Group"):
         """
         Uses this objects type hints to read attributes from hdf5 group.
 
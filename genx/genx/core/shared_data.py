@@ -0,0 +1,146 @@
+"""
+Transport of dataset arrays to worker processes using shared memory.
+
+When a model is sent to the workers of a multiprocessing pool each worker would
+otherwise receive its own pickled copy of all data arrays. The SharedDataBuffer
+copies these arrays once into a shared memory block and pickles references to it,
+the workers attach to the block and use read-only views of the arrays.
+"""
+
+import gc
+import io
+import pickle
+
+from logging import debug
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+# shared memory blocks attached within this (worker) process, kept open as long as the process lives
+_attached = {}
+
+
+def attach_array(name, offset, shape, dtype):
+    """
+    Return a read-only view of an array stored in the shared memory block name.
+    Used when unpickling arrays that were pickled by a SharedDataBuffer.
+    """
+    if name not in _attached:
+        # worker processes share the resource tracker of the parent that owns the block
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    output = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attached[name].buf, offset=offset)
+    output.flags.writeable = False
+    return output
+
+
+def release_blocks(names):
+    """
+    Close the attached shared memory blocks that are not in names, e.g. after the data they held was replaced.
+    Blocks still used by arrays within this process stay attached.
+    """
+    unused = [name for name in _attached if name not in names]
+    if unused:
+        # views of the replaced data might only be referenced within cycles
+        gc.collect()
+    for name in unused:
+        try:
+            _attached[name].close()
+        except BufferError:
+            debug(f"Shared memory {name} is still in use")
+            continue
+        del _attached[name]
+
+
+class SharedDataPickler(pickle.Pickler):
+    """
+    Pickler that replaces arrays known to a SharedDataBuffer by references to the shared memory.
+    """
+
+    def __init__(self, file, shared: "SharedDataBuffer"):
+        pickle.Pickler.__init__(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.shared = shared
+
+    def reducer_override(self, obj):
+        if type(obj) is np.ndarray and id(obj) in self.shared.references:
+            return attach_array, self.shared.references[id(obj)]
+        return NotImplemented
+
+
+class SharedDataBuffer:
+    """
+    Copy the data arrays of a list of DataSet objects into one shared memory block.
+
+    Objects pickled with dumps that reference these arrays (e.g. a model) will
+    only contain the location of the arrays within the block.
+    If shared memory is not available or the data is small, dumps falls back to normal pickling.
+    The block exists until close is called, which has to happen after all
+    workers have finished using it.
+    """
+
+    array_attributes = ["x", "y", "error", "x_raw", "y_raw", "error_raw"]
+    dict_attributes = ["extra_data", "extra_data_raw"]
+    min_size = 65536  # smaller data is faster to pickle directly
+
+    def __init__(self, datasets):
+        self.shm = None
+        self.references = {}
+        self._arrays = []
+
+        for di in datasets:
+            self._arrays += [getattr(di, name, None) for name in self.array_attributes]
+            for name in self.dict_attributes:
+                self._arrays += list(getattr(di, name, {}).values())
+        self._arrays = [ai for ai in self._arrays if type(ai) is np.ndarray and ai.dtype.kind in "biufc"]
+        total_size = sum(ai.nbytes for ai in self._arrays)
+        if shared_memory is None or total_size == 0 or total_size < self.min_size:
+            self._arrays = []
+            return
+
+        try:
+            self.shm = shared_memory.SharedMemory(create=True, size=total_size)
+        except OSError:
+            debug("Could not create shared memory block for data, using pickle instead", exc_info=True)
+            self._arrays = []
+            return
+        offset = 0
+        for ai in self._arrays:
+            if id(ai) in self.references:
+                continue
+            view = np.ndarray(ai.shape, dtype=ai.dtype, buffer=self.shm.buf, offset=offset)
+            view[...] = ai
+            del view
+            self.references[id(ai)] = (self.shm.name, offset, ai.shape, ai.dtype.str)
+            offset += ai.nbytes
+        debug(f"Copied {len(self.references)} data arrays to shared memory {self.shm.name} ({total_size} bytes)")
+
+    @property
+    def size(self):
+        if self.shm is None:
+            return 0
+        return self.shm.size
+
+    def dumps(self, obj) -> bytes:
+        if self.shm is None:
+            return pickle.dumps(obj)
+        output = io.BytesIO()
+        SharedDataPickler(output, self).dump(obj)
+        return output.getvalue()
+
+    def close(self):
+        """
+        Release the shared memory block.
+        """
+        self.references = {}
+        self._arrays = []
+        if self.shm is None:
+            return
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = None
@@ -7,6 +7,7 @@ import os
 import sys
 import time
 
+from functools import lru_cache
 from sys import platform
 from typing import Dict, List, Tuple, Union
 
@@ -20,24 +21,81 @@ from .core.custom_logging import iprint
 from .core.h5_support import H5HintedExport, H5Savable
 from .exceptions import GenxIOError
 
-try:
-    from orsopy.fileio import Orso
-
-    META_DEFAULT = Orso.empty().to_dict()
-except ImportError:
-    META_DEFAULT = {
-        "data_source": {
-            "owner": {"name": None, "affiliation": None},
-            "experiment": {"title": None, "instrument": None, "start_date": None, "probe": None},
-            "sample": {"name": None},
-            "measurement": {
-                "instrument_settings": {"incident_angle": {"magnitude": None}, "wavelength": {"magnitude": None}},
-                "data_files": [],
-            },
+# minimal header used if orsopy is not available
+_META_FALLBACK = {
+    "data_source": {
+        "owner": {"name": None, "affiliation": None},
+        "experiment": {"title": None, "instrument": None, "start_date": None, "probe": None},
+        "sample": {"name": None},
+        "measurement": {
+            "instrument_settings": {"incident_angle": {"magnitude": None}, "wavelength": {"magnitude": None}},
+            "data_files": [],
         },
-        "reduction": {"software": {"name": None}},
-        "columns": [{"name": "Qz", "unit": "1/angstrom"}, {"name": "R"}],
-    }
+    },
+    "reduction": {"software": {"name": None}},
+    "columns": [{"name": "Qz", "unit": "1/angstrom"}, {"name": "R"}],
+}
+
+
+@lru_cache(maxsize=None)
+def meta_default():
+    """
+    The default ORSO header of datasets, created on first use as importing orsopy is slow.
+    """
+    try:
+        from orsopy.fileio import Orso
+    except ImportError:
+        return _META_FALLBACK
+    return Orso.empty().to_dict()
+
+
+def __getattr__(name):
+    if name == "META_DEFAULT":
+        return meta_default()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@lru_cache(maxsize=256)
+def compile_command(command: str):
+    """
+    Code object of a data command, compiled once for all data sets that use the same command string.
+    """
+    return compile(command, "<string>", "eval")
+
+
+def error_functions(xt, yt):
+    """
+    Helper functions available in the error command, using the transformed x and y values.
+    """
+
+    def fpe(xmax=0.05, relerr=0.01, x=xt, y=yt):
+        """
+        Estimate intensity error due to beam crossection deviating from model foot print
+        xmax: the full beam hits the sample at locations larger than this x-value
+        relerr: relative intensity error expected wrt. footprint
+        """
+        return where(x < xmax, y * relerr, 0.0)
+
+    def dydx(x=xt, y=yt):
+        # numerical calculation of local derivative from data
+        return hstack(
+            [(y[1] - y[0]) / (x[1] - x[0]), (y[2:] - y[:-2]) / (x[2:] - x[:-2]), (y[-1] - y[-2]) / (x[-1] - x[-2])]
+        )
+
+    return {"fpe": fpe, "dydx": dydx}
+
+
+class _MetaDefault:
+    # each dataset gets its copy of the default header when the meta data is first used
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = meta_default().copy()
+        instance.__dict__[self.name] = value
+        return value
 
 
 class DataSet(H5HintedExport):
@@ -89,7 +147,7 @@ class DataSet(H5HintedExport):
     sim_linetype: str = "-"
     sim_linethickness: int = 2
 
-    meta: dict = META_DEFAULT
+    meta: dict = _MetaDefault()
 
     simulation_params = [0.01, 6.01, 600]
 
@@ -308,77 +366,37 @@ class DataSet(H5HintedExport):
             sitems += itm**2
         return sqrt(sitems)
 
-    def run_x_command(self):
-        x = self.x_raw
-        y = self.y_raw
-        e = self.error_raw
-        rms = self.rms
-
-        gscope=globals()
-        lscope=locals()
-        for key in self.extra_data:
-            exec('%s = self.extra_data_raw["%s"]' % (key, key), gscope, lscope)
-
-        self.x = eval(self.x_command, gscope, lscope)
-
-    def run_y_command(self):
-        x = self.x_raw
-        y = self.y_raw
-        e = self.error_raw
-        rms = self.rms
-
-        gscope=globals()
-        lscope=locals()
-        for key in self.extra_data:
-            exec('%s = self.extra_data_raw["%s"]' % (key, key), gscope, lscope)
-
-        self.y = eval(self.y_command, gscope, lscope)
-
-    def run_error_command(self):
-        x = self.x_raw
-        y = self.y_raw
-        e = self.error_raw
-        rms = self.rms
-
-        xt = self.x
-        yt = self.y
-
-        gscope=globals()
-        lscope=locals()
-        for key in self.extra_data:
-            exec('%s = self.extra_data_raw["%s"]' % (key, key), gscope, lscope)
-
-        def fpe(xmax=0.05, relerr=0.01, x=xt, y=yt):
-            """
-            Estimate intensity error due to beam crossection deviating from model foot print
-            xmax: the full beam hits the sample at locations larger than this x-value
-            relerr: relative intensity error expected wrt. footprint
-            """
-            return where(x < xmax, y * relerr, 0.0)
-
-        def dydx(x=xt, y=yt):
-            # numerical calculation of local derivative from data
-            return hstack(
-                [(y[1] - y[0]) / (x[1] - x[0]), (y[2:] - y[:-2]) / (x[2:] - x[:-2]), (y[-1] - y[-2]) / (x[-1] - x[-2])]
-            )
+    def command_scope(self):
+        """
+        Names available in the data commands, the extra data columns are used with their raw values.
+        """
+        scope = {"x": self.x_raw, "y": self.y_raw, "e": self.error_raw, "rms": self.rms, "self": self}
+        scope.update(self.extra_data_raw)
+        return scope
 
-        self.error = eval(self.error_command, gscope, lscope)
+    def run_x_command(self, scope=None):
+        if scope is None:
+            scope = self.command_scope()
+        self.x = eval(compile_command(self.x_command), globals(), scope)
 
-    def run_extra_commands(self):
-        x = self.x_raw
-        y = self.y_raw
-        e = self.error_raw
-        rms = self.rms
+    def run_y_command(self, scope=None):
+        if scope is None:
+            scope = self.command_scope()
+        self.y = eval(compile_command(self.y_command), globals(), scope)
 
-        gscope=globals()
-        lscope=locals()
-        for key in self.extra_data_raw:
-            exec('%s = self.extra_data_raw["%s"]' % (key, key), gscope, lscope)
+    def run_error_command(self, scope=None):
+        if scope is None:
+            scope = self.command_scope()
+        scope = dict(scope, xt=self.x, yt=self.y, **error_functions(self.x, self.y))
+        self.error = eval(compile_command(self.error_command), globals(), scope)
 
+    def run_extra_commands(self, scope=None):
+        if scope is None:
+            scope = self.command_scope()
         for key in self.extra_data_raw:
             if not key in self.extra_commands:
                 self.extra_commands[key] = "%s" % key
-            self.extra_data[key] = eval(self.extra_commands["%s" % key], gscope, lscope)
+            self.extra_data[key] = eval(compile_command(self.extra_commands[key]), globals(), scope)
 
         if "res" in self.extra_data:
             self.res = self.extra_data["res"]
@@ -396,10 +414,12 @@ class DataSet(H5HintedExport):
             # if no data is loaded and no user setting for simulation, use default
             self.set_simulation()
         else:
-            self.run_x_command()
-            self.run_y_command()
-            self.run_error_command()
-            self.run_extra_commands()
+            # all commands are evaluated with the same scope
+            scope = self.command_scope()
+            self.run_x_command(scope)
+            self.run_y_command(scope)
+            self.run_error_command(scope)
+            self.run_extra_commands(scope)
 
     def try_commands(self, command_dict):
         """
@@ -408,53 +428,26 @@ class DataSet(H5HintedExport):
         """
         result = ""
 
-        x = self.x_raw
-        y = self.y_raw
-        e = self.error_raw
-        rms = self.rms
-        xt, yt, et = x, y, e  # make sure values are always defined
-
-        # Know we have to do this with the extra data
-        gscope=globals()
-        lscope=locals()
-        for key in self.extra_data_raw:
-            exec('%s = self.extra_data_raw["%s"]' % (key, key), gscope, lscope)
+        scope = self.command_scope()
+        xt, yt, et = self.x_raw, self.y_raw, self.error_raw  # make sure values are always defined
 
         # Try to evaluate all the expressions
         if command_dict["x"] != "":
             try:
-                xt = eval(command_dict["x"], gscope, lscope)
+                xt = eval(compile_command(command_dict["x"]), globals(), scope)
             except Exception as e:
                 result += "Error in evaluating x expression.\n\nPython output:\n" + e.__str__() + "\n"
 
         if command_dict["y"] != "":
             try:
-                yt = eval(command_dict["y"], gscope, lscope)
+                yt = eval(compile_command(command_dict["y"]), globals(), scope)
             except Exception as e:
                 result += "Error in evaluating y expression.\n\nPython output:\n" + e.__str__() + "\n"
 
         if command_dict["e"] != "":
-
-            def fpe(xmax=0.05, relerr=0.01, x=xt, y=yt):
-                """
-                Estimate intensity error due to beam crossection deviating from model foot print
-                xmax: the full beam hits the sample at locations larger than this x-value
-                relerr: relative intensity error expected wrt. footprint
-                """
-                return where(x < xmax, y * relerr, 0.0)
-
-            def dydx(x=xt, y=yt):
-                # numerical calculation of local derivative from data
-                return hstack(
-                    [
-                        (y[1] - y[0]) / (x[1] - x[0]),
-                        (y[2:] - y[:-2]) / (x[2:] - x[:-2]),
-                        (y[-1] - y[-2]) / (x[-1] - x[-2]),
-                    ]
-                )
-
+            error_scope = dict(scope, xt=xt, yt=yt, **error_functions(xt, yt))
             try:
-                et = eval(command_dict["e"], gscope, lscope)
+                et = eval(compile_command(command_dict["e"]), globals(), error_scope)
             except Exception as e:
                 result += "Error in evaluating e expression.\n\nPython output:\n" + e.__str__() + "\n"
 
@@ -463,7 +456,7 @@ class DataSet(H5HintedExport):
             value = command_dict[key]
             if command_dict[key] != "":
                 try:
-                    extra_results[key] = eval(value, gscope, lscope)
+                    extra_results[key] = eval(compile_command(value), globals(), scope)
                 except Exception as e:
                     result += "Error in evaluating %s expression.\n\nPython output:\n" % key + e.__str__() + "\n"
 
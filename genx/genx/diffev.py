@@ -2,40 +2,42 @@
 An implementation of the differential evolution algorithm for fitting.
 """
 
+import hashlib
 import multiprocessing as processing
 import pickle
+import queue
 import random as random_mod
+import tempfile
 import threading
 import time
+import weakref
 
 from dataclasses import dataclass
 from logging import debug
 
-from numpy import (append, argmin, argsort, array, bitwise_and, ceil, compress, copy, mean, ndarray, ones, r_, random,
-                   seterr, where, zeros)
+from numpy import (arange, argmin, argsort, array, array_split, asarray, bitwise_and, compress, concatenate, copy,
+                   float64, inf, isfinite, maximum, mean, memmap, minimum, ndarray, newaxis, ones, random, seterr, sort,
+                   where, zeros)
 
 from .core import custom_logging
 from .core.config import BaseConfig
+from .core.shared_data import SharedDataBuffer, release_blocks
 from .core.Simplex import Simplex
-from .exceptions import ErrorBarError
+from .data import DataSet
+from .exceptions import ErrorBarError, OptimizerInterrupted
 from .model import Model
+from .mpi_engine import MPI as mpi
+from .mpi_engine import MPIEvaluator, get_comm
 from .solver_basis import GenxOptimizer, GenxOptimizerCallback, SolverParameterInfo, SolverResultInfo, SolverUpdateInfo
 
-__mpi_loaded__ = False
 __parallel_loaded__ = True
 _cpu_count = processing.cpu_count()
 
-try:
-    from mpi4py import MPI as mpi
-except ImportError:
-    rank = 0
-    __mpi_loaded__ = False
-    mpi = None
-else:
-    __mpi_loaded__ = True
-    comm = mpi.COMM_WORLD
-    size = comm.Get_size()
-    rank = comm.Get_rank()
+# without mpi4py a single rank communicator is used
+__mpi_loaded__ = mpi is not None
+comm = get_comm()
+size = comm.Get_size()
+rank = comm.Get_rank()
 
 iprint = custom_logging.iprint
 
@@ -64,6 +66,7 @@ class DiffEvConfig(BaseConfig):
     km: float = BaseConfig.GParam(0.7, pmin=0.0, pmax=1.0)
     kr: float = BaseConfig.GParam(0.7, pmin=0.0, pmax=1.0)
     allowed_fom_discrepancy: float = 1e-10
+    random_seed: int = -1
 
     use_pop_mult: bool = True
     pop_size: int = BaseConfig.GParam(50, pmin=5, pmax=10000, label="Fixed size")
@@ -87,18 +90,27 @@ class DiffEvConfig(BaseConfig):
     use_parallel_processing: bool = False
     parallel_processes: int = BaseConfig.GParam(_cpu_count, pmin=2, pmax=_cpu_count, label="# processes")
     parallel_chunksize: int = BaseConfig.GParam(10, pmin=1, pmax=1000, label="items/chunk")
+    use_batch_eval: bool = False
+    use_persistent_pool: bool = False
+    use_steady_state: bool = False
 
     use_autosave: bool = False
     autosave_interval: int = BaseConfig.GParam(10, pmin=1, pmax=1000, label=", interval")
 
     save_all_evals: bool = False
+    use_evals_file: bool = False
     errorbar_level: float = BaseConfig.GParam(1.05, pmin=1.001, pmax=2.0)
 
+    use_lazy_sim: bool = False
+    sim_check_interval: int = BaseConfig.GParam(10, pmin=1, pmax=1000, label=", check interval")
+
     groups = {  # for building config dialogs
         "Fitting": [
             ["use_start_guess", "use_boundaries"],
             ["use_autosave", "autosave_interval"],
             ["save_all_evals", "max_log_elements"],
+            "use_evals_file",
+            ["use_lazy_sim", "sim_check_interval"],
         ],
         "Differential Evolution": [
             "km",
@@ -108,7 +120,14 @@ class DiffEvConfig(BaseConfig):
             ["Max. Generations:", "use_max_generations", "max_generations", "max_generation_mult"],
             "min_parameter_spread",
         ],
-        "Parallel processing": ["use_parallel_processing", "parallel_processes", "parallel_chunksize"],
+        "Parallel processing": [
+            "use_parallel_processing",
+            "parallel_processes",
+            "parallel_chunksize",
+            "use_batch_eval",
+            "use_persistent_pool",
+            "use_steady_state",
+        ],
     }
 
 
@@ -131,6 +150,7 @@ class DiffEv(GenxOptimizer):
     simplex_n = 0.0  # Number of individuals that will be optimized by simplex
     simplex_rel_epsilon = 1000  # The relative epsilon - convergence criteria
     simplex_max_iter = 100  # THe maximum number of simplex runs
+    batch_test_size = 5  # number of population members evaluated in check_batch_eval
 
     _callbacks: GenxOptimizerCallback = DiffEvDefaultCallbacks()
 
@@ -161,10 +181,20 @@ class DiffEv(GenxOptimizer):
         self.stop = False  # true if the optimization should stop
         self.setup_ok = False  # True if the optimization have been setup
         self.error = None  # None/string if an error ahs occurred
+        self.sim_requested = False  # True if the best should be simulated after the next generation
+        self.best_sim_current = True  # True if the model data is the simulation of the best vector
         self.pool = None
+        self.mpi_evaluator = None
+        self._pool_config = None
+        self._pool_hashes = {}
+        self._workers_started = None  # number of worker processes started for the pool
+        self._pool_finalizer = None
+        self._shared_data = []
+        self._data_buffers = {}
 
         # Logging variables
         self.fom_log = array([[0, 0]])[0:0]
+        self._fom_log_storage = None
 
         self.par_evals = CircBuffer(self.opt.max_log_elements, buffer=array([[]])[0:0])
         self.fom_evals = CircBuffer(self.opt.max_log_elements)
@@ -173,6 +203,8 @@ class DiffEv(GenxOptimizer):
         self.updated_kr = []
         self.updated_km = []
 
+        self.rng = random.default_rng()
+
     @property
     def n_fom_evals(self):
         return len(self.fom_evals)
@@ -226,7 +258,7 @@ class DiffEv(GenxOptimizer):
         return self.running
 
     def project_evals(self, index):
-        return self.par_evals[:, index], self.fom_evals[:]
+        return self.par_evals.values()[:, index], self.fom_evals.values()
 
     def is_fitted(self):
         return len(self.start_guess) > 0
@@ -245,7 +277,7 @@ class DiffEv(GenxOptimizer):
         self.setup_ok = other.setup_ok
 
         # Logging variables
-        self.fom_log = other.fom_log[:]
+        self.fom_log = array(other.fom_log)
         self.par_evals.copy_from(other.par_evals)
         self.fom_evals.copy_from(other.fom_evals)
 
@@ -281,8 +313,8 @@ class DiffEv(GenxOptimizer):
         cpy = DiffEv()
         cpy.safe_copy(self)
         if clear_evals:
-            cpy.par_evals.buffer = cpy.par_evals.buffer[0:0]
-            cpy.fom_evals.buffer = cpy.fom_evals.buffer[0:0]
+            cpy.par_evals.reset(cpy.par_evals.buffer[0:0])
+            cpy.fom_evals.reset()
         cpy.create_trial = None
         cpy.update_pop = None
         cpy.init_new_generation = None
@@ -344,10 +376,11 @@ class DiffEv(GenxOptimizer):
         else:
             self.max_gen = int(self.opt.max_generation_mult * self.n_dim * self.n_pop)
 
+        # Random number generator used for all trial vector creations, negative seed uses system entropy
+        self.rng = random.default_rng(self.opt.random_seed if self.opt.random_seed >= 0 else None)
+
         # Starting values setup
-        self.pop_vec = [
-            self.par_min + random.rand(self.n_dim) * (self.par_max - self.par_min) for _ in range(self.n_pop)
-        ]
+        self.pop_vec = list(self.par_min + self.rng.random((self.n_pop, self.n_dim)) * (self.par_max - self.par_min))
 
         if self.opt.use_start_guess:
             self.pop_vec[0] = array(self.start_guess)
@@ -364,8 +397,13 @@ class DiffEv(GenxOptimizer):
 
         # Logging variables
         self.fom_log = array([[0, 1]])[0:0]
-        self.par_evals = CircBuffer(self.opt.max_log_elements, buffer=array([self.par_min])[0:0])
-        self.fom_evals = CircBuffer(self.opt.max_log_elements)
+        if self.opt.save_all_evals and self.opt.use_evals_file:
+            # keep millions of evaluations in temporary files instead of memory
+            par_file, fom_file = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+        else:
+            par_file, fom_file = None, None
+        self.par_evals = CircBuffer(self.opt.max_log_elements, buffer=array([self.par_min])[0:0], backing_file=par_file)
+        self.fom_evals = CircBuffer(self.opt.max_log_elements, backing_file=fom_file)
         # Number of FOM evaluations
         self.n_fom = 0
 
@@ -379,17 +417,48 @@ class DiffEv(GenxOptimizer):
         """
         Makes the eval_fom function
         """
+        use_batch = self.opt.use_batch_eval and not self.opt.use_mpi and self.check_batch_eval()
         # Setting up for parallel processing
         if self.opt.use_parallel_processing and __parallel_loaded__:
             self.text_output("Setting up a pool of workers ...")
             self.setup_parallel()
-            self.eval_fom = self.calc_trial_fom_parallel
-        elif self.opt.use_mpi and __mpi_loaded__:
+            if use_batch:
+                self.eval_fom = self.calc_trial_fom_parallel_batch
+            else:
+                self.eval_fom = self.calc_trial_fom_parallel
+        elif self.opt.use_mpi:
             self.setup_parallel_mpi()
             self.eval_fom = self.calc_trial_fom_parallel_mpi
+        elif use_batch:
+            self.eval_fom = self.calc_trial_fom_batch
         else:
             self.eval_fom = self.calc_trial_fom
 
+    def check_batch_eval(self):
+        """
+        Test if the model supports evaluation of the whole population in one call and
+        if the result agrees with the evaluation of individual parameter vectors.
+        The model parameters are set to the best vector afterwards.
+        """
+        test_vecs = array(self.pop_vec[: self.batch_test_size])
+        try:
+            try:
+                batch_fom = self.model.evaluate_fit_func_batch(self.par_funcs, test_vecs)
+            except Exception as e:
+                self.text_output("Model does not support batch evaluation, evaluating individual vectors")
+                debug(f"Batch evaluation failed with {e!r}", exc_info=True)
+                return False
+            single_fom = array([_calc_fom(self.model, vec, self.par_funcs) for vec in test_vecs])
+        finally:
+            list(map(lambda func, value: func(value), self.par_funcs, self.best_vec))
+        # large FOM values are compared relative to their magnitude
+        tolerance = self.opt.allowed_fom_discrepancy * maximum(1.0, abs(single_fom))
+        if not (isfinite(batch_fom) & (abs(batch_fom - single_fom) <= tolerance)).all():
+            self.text_output("Batch evaluation disagrees with single vector evaluation, evaluating individual vectors")
+            debug(f"Batch evaluation test yielded {batch_fom} instead of {single_fom}")
+            return False
+        return True
+
     def start_fit(self, model_obj):
         """
         Starts fitting in a seperate thred.
@@ -465,8 +534,9 @@ class DiffEv(GenxOptimizer):
         Note that this method does not run in a separate thread.
         For threading use start_fit, stop_fit and resume_fit instead.
         """
-        if self.opt.use_mpi:
-            self.optimize_mpi()
+        use_pool = self.opt.use_parallel_processing and __parallel_loaded__ and not self.opt.use_mpi
+        if self.opt.use_steady_state and use_pool:
+            self.optimize_steady_state()
         else:
             self.optimize_standard()
 
@@ -485,15 +555,15 @@ class DiffEv(GenxOptimizer):
 
         self.trial_vec = self.pop_vec[:]
         self.eval_fom()
-        [self.par_evals.append(vec, axis=0) for vec in self.pop_vec]
-        [self.fom_evals.append(vec) for vec in self.trial_fom]
+        self.par_evals.append_many(self.pop_vec)
+        self.fom_evals.append_many(self.trial_fom)
         self.fom_vec = self.trial_fom[:]
 
         best_index = argmin(self.fom_vec)
         self.best_vec = copy(self.pop_vec[best_index])
         self.best_fom = self.fom_vec[best_index]
         if len(self.fom_log) == 0:
-            self.fom_log = r_[self.fom_log, [[len(self.fom_log), self.best_fom]]]
+            self.log_best_fom()
         # Flag to keep track if there has been any improvements
         # in the fit - used for updates
         self.new_best = True
@@ -516,30 +586,20 @@ class DiffEv(GenxOptimizer):
 
             # Create the vectors who will be compared to the
             # population vectors
-            [self.create_trial(index) for index in range(self.n_pop)]
+            self.create_population_trials()
             self.eval_fom()
             # Calculate the fom of the trial vectors and update the population
-            [self.update_pop(index) for index in range(self.n_pop)]
+            self.update_population()
 
             # Add the evaluation to the logging
-            [self.par_evals.append(vec, axis=0) for vec in self.trial_vec]
-            [self.fom_evals.append(vec) for vec in self.trial_fom]
+            self.par_evals.append_many(self.trial_vec)
+            self.fom_evals.append_many(self.trial_fom)
 
             # Add the best value to the fom log
-            self.fom_log = r_[self.fom_log, [[len(self.fom_log), self.best_fom]]]
+            self.log_best_fom()
 
             # Let the model calculate the simulation of the best.
-            sim_fom = self.calc_sim(self.best_vec)
-
-            # Sanity of the model does the simulations fom agree with
-            # the best fom
-            if abs(sim_fom - self.best_fom) > self.opt.allowed_fom_discrepancy:
-                self.text_output("Disagrement between two different fom" " evaluations")
-                self.error = (
-                    "The disagreement between two subsequent "
-                    "evaluations is larger than %s. Check the "
-                    "model for circular assignments." % self.opt.allowed_fom_discrepancy
-                )
+            if not self.simulate_best(gen):
                 break
 
             # Update the plot data for any gui or other output
@@ -568,10 +628,11 @@ class DiffEv(GenxOptimizer):
                 self.autosave()
 
         if not self.error:
+            self.finish_best_sim()
             self.text_output("Stopped at Generation: %d after %d fom evaluations..." % (gen, gen * self.n_pop))
 
-        # Lets clean up and delete our pool of workers
-        if self.opt.use_parallel_processing:
+        # Lets clean up and delete our pool of workers, if it should not be reused in the next fit
+        if not (self.opt.use_parallel_processing and self.opt.use_persistent_pool):
             self.dismount_parallel()
         self.eval_fom = None
 
@@ -581,140 +642,150 @@ class DiffEv(GenxOptimizer):
         # Run application specific clean-up actions
         self.fitting_ended()
 
-    def optimize_mpi(self):
+    def optimize_steady_state(self):
         """
-        Method implementing the main loop of the differential evolution
-        algorithm using mpi. This should only be used from the command line.
-        The gui can not handle to use mpi.
+        Asynchronous (steady-state) variant of the main loop using the pool of workers.
+
+        Instead of evaluating a whole generation and waiting for the slowest worker,
+        trial vectors are submitted individually and each population member is
+        updated as soon as the result of its trial arrives. A new trial is then
+        created from the current state of the population. Every n_pop evaluations
+        count as one generation for logging, output and stopping criteria.
         """
         self.running = True
         self.init_fom_eval()
 
         self.text_output("Calculating start FOM ...")
-
-        self.running = True
         self.error = None
         self.n_fom = 0
-        # Old leftovers before going parallel
-        self.fom_vec = [self.calc_fom(vec) for vec in self.pop_vec]
-        [self.par_evals.append(vec, axis=0) for vec in self.pop_vec]
-        [self.fom_evals.append(vec) for vec in self.fom_vec]
+
+        self.trial_vec = self.pop_vec[:]
+        self.eval_fom()
+        self.par_evals.append_many(self.pop_vec)
+        self.fom_evals.append_many(self.trial_fom)
+        self.fom_vec = self.trial_fom[:]
+        self.trial_fom = list(self.trial_fom)
 
         best_index = argmin(self.fom_vec)
         self.best_vec = copy(self.pop_vec[best_index])
         self.best_fom = self.fom_vec[best_index]
         if len(self.fom_log) == 0:
-            self.fom_log = r_[self.fom_log, [[len(self.fom_log), self.best_fom]]]
-        # Flag to keep track if there has been any improvements
-        # in the fit - used for updates
+            self.log_best_fom()
         self.new_best = True
 
-        self.text_output("Going into optimization ...")
-
-        # Update the plot data for any gui or other output
+        self.text_output("Going into asynchronous optimization ...")
         self.plot_output()
         self.parameter_output()
 
-        # Just making gen live in this scope as well...
+        # each population member has at most one trial vector under evaluation
+        results = queue.Queue()
+        pending = set()
+        max_pending = min(self.n_pop, 2 * self.opt.parallel_processes)
+        next_index = 0
+
+        def submit():
+            nonlocal next_index
+            while len(pending) < max_pending:
+                index = next_index
+                next_index = (next_index + 1) % self.n_pop
+                if index in pending:
+                    continue
+                self.create_trial(index)
+                pending.add(index)
+                self.pool.apply_async(
+                    parallel_calc_fom,
+                    (self.trial_vec[index],),
+                    callback=lambda fom, i=index: results.put((i, fom, None)),
+                    error_callback=lambda err, i=index: results.put((i, None, err)),
+                )
+
+        def next_result():
+            while self.pool is not None:
+                if self.restart_replaced_workers():
+                    # trials sent to the old pool are lost or were evaluated with an outdated model
+                    pending.clear()
+                    while not results.empty():
+                        results.get()
+                    if not self.stop:
+                        submit()
+                    if not pending:
+                        return None
+                try:
+                    index, fom, err = results.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                pending.discard(index)
+                if err is not None:
+                    raise err
+                return index, fom
+            # pool has been terminated by stop_fit
+            raise OptimizerInterrupted("interrupted")
+
         gen = self.fom_log[-1, 0]
-        for gen in range(int(self.fom_log[-1, 0]) + 1, self.max_gen + int(self.fom_log[-1, 0]) + 1):
-            # synchronize stop parameter so all workers stop at the same time
-            self.stop = comm.bcast(self.stop, root=0)
+        first_gen = int(self.fom_log[-1, 0]) + 1
+        self.init_new_generation(first_gen)
+        submit()
+        for gen in range(first_gen, self.max_gen + first_gen):
             if self.stop:
                 break
 
             t_start = time.time()
+            if gen > first_gen:
+                self.init_new_generation(gen)
 
-            self.init_new_generation(gen)
-
-            # Create the vectors wjocj will be compared to the
-            # population vectors and broadcast to all workers
-            if rank == 0:
-                [self.create_trial(index) for index in range(self.n_pop)]
-            self.trial_vec = comm.bcast(self.trial_vec, root=0)
-            self.eval_fom()
-            tmp_fom = self.trial_fom
-            comm.Barrier()
-
-            # collect forms and reshape them and set the completed tmp_fom to trial_fom
-            tmp_fom = comm.gather(tmp_fom, root=0)
-            if rank == 0:
-                tmp_fom_list = []
-                for i in list(tmp_fom):
-                    tmp_fom_list = tmp_fom_list + i
-                tmp_fom = tmp_fom_list
-
-            tmp_fom = comm.bcast(tmp_fom, root=0)
-            self.trial_fom = array(tmp_fom).reshape(
-                self.n_pop,
-            )
-
-            [self.update_pop(index) for index in range(self.n_pop)]
-
-            # Calculate the fom of the trial vectors and update the population
-            if rank == 0:
-                # Add the evaluation to the logging
-                [self.par_evals.append(vec, axis=0) for vec in self.trial_vec]
-                [self.fom_evals.append(vec) for vec in self.trial_fom]
-
-                # Add the best value to the fom log
-                self.fom_log = r_[self.fom_log, [[len(self.fom_log), self.best_fom]]]
-
-                # Let the model calculate the simulation of the best.
-                sim_fom = self.calc_sim(self.best_vec)
-
-                # Sanity of the model does the simulations fom agree with
-                # the best fom
-                if abs(sim_fom - self.best_fom) > self.opt.allowed_fom_discrepancy and rank == 0:
-                    self.text_output("Disagrement between two different fom" " evaluations")
-                    self.error = (
-                        "The disagreement between two subsequent "
-                        "evaluations is larger than %s. Check the "
-                        "model for circular assignments." % self.opt.allowed_fom_discrepancy
-                    )
+            for _ in range(self.n_pop):
+                if not pending:
+                    break
+                result = next_result()
+                if result is None:
                     break
+                index, fom = result
+                self.n_fom += 1
+                self.trial_fom[index] = fom
+                self.par_evals.append(self.trial_vec[index], axis=0)
+                self.fom_evals.append(fom)
+                self.update_pop(index)
+                if not self.stop:
+                    submit()
+
+            self.log_best_fom()
+
+            if not self.simulate_best(gen):
+                break
 
-                # Update the plot data for any gui or other output
-                self.plot_output()
-                self.parameter_output()
+            self.plot_output()
+            self.parameter_output()
 
-                # Let the optimization sleep for a while
-                # time.sleep(self.opt.sleep_time)
+            t = time.time() - t_start
+            if t > 0:
+                speed = self.n_pop / t
+            else:
+                speed = 999999
+            self.text_output("FOM: %.3f Generation: %d Speed: %.1f" % (self.best_fom, gen, speed))
 
-                # Time measurement to track the speed
-                t = time.time() - t_start
-                if t > 0:
-                    speed = self.n_pop / t
-                else:
-                    speed = 999999
-                if rank == 0:
-                    self.text_output("FOM: %.3f Generation: %d Speed: %.1f" % (self.best_fom, gen, speed))
-
-                # Check if largest relative spread of a parameter is below the break threshold
-                pop = array(self.pop_vec)
-                norm = self.par_max - self.par_min
-                spread = (pop.max(axis=0) - pop.min(axis=0)) / norm
-                if spread.max() < (0.01 * self.opt.min_parameter_spread):
-                    self.text_output("Stopping fit as min_parameter_spread was reached")
-                    break
+            pop = array(self.pop_vec)
+            norm = self.par_max - self.par_min
+            spread = (pop.max(axis=0) - pop.min(axis=0)) / norm
+            if spread.max() < (0.01 * self.opt.min_parameter_spread):
+                self.text_output("Stopping fit as min_parameter_spread was reached")
+                break
 
-                self.new_best = False
-                # Do an autosave if activated and the interval is correct
-                if gen % self.opt.autosave_interval == 0 and self.opt.use_autosave:
-                    self.autosave()
+            self.new_best = False
+            if gen % self.opt.autosave_interval == 0 and self.opt.use_autosave:
+                self.autosave()
 
-        if rank == 0:
-            if not self.error:
-                self.text_output("Stopped at Generation: %d after %d fom evaluations..." % (gen, gen * self.n_pop))
+        # wait for the evaluations still running in the workers
+        while pending:
+            next_result()
 
-        # Lets clean up and delete our pool of workers
+        if not self.error:
+            self.finish_best_sim()
+            self.text_output("Stopped at Generation: %d after %d fom evaluations..." % (gen, self.n_fom))
 
+        if not self.opt.use_persistent_pool:
+            self.dismount_parallel()
         self.eval_fom = None
-
-        # Now the optimization has stopped
         self.running = False
-
-        # Run application specific clean-up actions
         self.fitting_ended()
 
     def calc_fom(self, vec):
@@ -734,6 +805,59 @@ class DiffEv(GenxOptimizer):
         """
         self.trial_fom = [self.calc_fom(vec) for vec in self.trial_vec]
 
+    def calc_trial_fom_batch(self):
+        """
+        Function to calculate the fom values for all trial vectors with
+        one call of the model Sim function
+        """
+        self.trial_fom = list(self.model.evaluate_fit_func_batch(self.par_funcs, self.trial_vec))
+        self.n_fom += len(self.trial_vec)
+
+    def simulate_best(self, gen):
+        """
+        Simulate the best vector to update the data of the model and check that the
+        fom agrees with the one of the fit evaluation. Returns False if it does not.
+
+        With use_lazy_sim the model data is kept from the last simulation as long as
+        the best vector does not change. The agreement is then only checked every
+        sim_check_interval generations or when a simulation was requested.
+        """
+        if self.opt.use_lazy_sim:
+            self.best_sim_current = False
+            if not (self.new_best or self.sim_requested or gen % self.opt.sim_check_interval == 0):
+                return True
+        self.sim_requested = False
+        sim_fom = self.calc_sim(self.best_vec)
+        self.best_sim_current = True
+
+        # Sanity of the model does the simulations fom agree with the best fom
+        if abs(sim_fom - self.best_fom) > self.opt.allowed_fom_discrepancy:
+            self.text_output("Disagrement between two different fom" " evaluations")
+            self.error = (
+                "The disagreement between two subsequent "
+                "evaluations is larger than %s. Check the "
+                "model for circular assignments." % self.opt.allowed_fom_discrepancy
+            )
+            return False
+        return True
+
+    def finish_best_sim(self):
+        """
+        Leave the model with the parameters of the best vector after the fit.
+        """
+        if not self.best_sim_current:
+            self.calc_sim(self.best_vec)
+            self.best_sim_current = True
+
+    def request_simulation(self):
+        """
+        Ask for a simulation of the best vector after the current generation,
+        e.g. when the plot data is needed while fitting with use_lazy_sim.
+        Called by the GUI when the plot page changes and by the job server when
+        a client asks for the status or result of a job.
+        """
+        self.sim_requested = True
+
     def calc_sim(self, vec):
         """calc_sim(self, vec) --> None
         Function that will evaluate the the data points for
@@ -770,20 +894,106 @@ class DiffEv(GenxOptimizer):
                     numba_procs = max(1, _cpu_count // self.opt.parallel_processes)
         else:
             numba_procs = None
+        pool_config = (self.opt.parallel_processes, numba_procs, overwrite_single, use_cuda)
+        if self.pool is not None and (pool_config != self._pool_config or self.workers_replaced()):
+            self.dismount_parallel()
+        parts = model_state_parts(self.model)
+        hashes = dict((key, state_hash(value)) for key, value in parts.items())
+        if self.pool is not None:
+            delta = dict((key, value) for key, value in parts.items() if self._pool_hashes.get(key) != hashes[key])
+            if not delta:
+                return
+            self.text_output("Updating %s in the worker pool ..." % ", ".join(sorted(map(str, delta.keys()))))
+            shared = SharedDataBuffer([di for key, di in delta.items() if key.startswith("data ")])
+            self._shared_data.append(shared)
+            # shared memory block that holds the data of each dataset after the update
+            data_buffers = dict(
+                (key, buffer) for key, buffer in self._data_buffers.items() if int(key.split()[1]) < parts["data"]
+            )
+            data_buffers.update((key, shared) for key in delta if key.startswith("data "))
+            live_blocks = [buffer.shm.name for buffer in set(data_buffers.values()) if buffer.shm is not None]
+            try:
+                self.pool.starmap(
+                    parallel_update,
+                    [(shared.dumps(delta), live_blocks)] * self.opt.parallel_processes,
+                    chunksize=1,
+                )
+            except Exception:
+                debug("Could not update worker pool, starting a new one", exc_info=True)
+                self.dismount_parallel()
+            else:
+                self._pool_hashes = hashes
+                self._data_buffers = data_buffers
+                self.release_data_buffers()
+                return
+
         self.text_output("Starting a pool with %i workers ..." % (self.opt.parallel_processes,))
-        pkl_str = pickle.dumps(self.model.pickable_copy())
+        # data arrays are transferred to the workers in shared memory that is kept until the pool is closed
+        # or the data is replaced by an update
+        shared = SharedDataBuffer(self.model.data)
+        self._shared_data = [shared]
+        self._data_buffers = dict((f"data {i}", shared) for i in range(len(self.model.data)))
+        pkl_str = shared.dumps(self.model.pickable_copy())
+        # each worker counts itself when started, a pool starts new workers to replace the ones that died
+        workers_started = processing.Value("i", 0)
         self.pool = processing.Pool(
             processes=self.opt.parallel_processes,
             initializer=parallel_init,
-            initargs=(pkl_str, numba_procs, False, overwrite_single, custom_logging.mp_logger.queue),
+            initargs=(
+                pkl_str,
+                numba_procs,
+                False,
+                overwrite_single,
+                custom_logging.mp_logger and custom_logging.mp_logger.queue,
+                processing.Barrier(self.opt.parallel_processes),
+                workers_started,
+            ),
         )
+        # make sure the workers and shared memory are released if the pool is not dismounted before exit
+        self._pool_finalizer = weakref.finalize(self, _terminate_pool, self.pool, self._shared_data)
         if use_cuda:
             self.pool.apply_async(init_cuda)
-        time.sleep(1.0)
-        # print "Starting a pool with ", self.opt.parallel_processes, " workers ..."
+        self._pool_config = pool_config
+        self._pool_hashes = hashes
+        self._workers_started = workers_started
+
+    def workers_replaced(self):
+        """
+        Check if the pool has started a worker to replace one that died.
+        A replacement is initialized with the model the pool was started with and misses all updates since.
+        """
+        if self._workers_started is None:
+            return False
+        return self._workers_started.value > self.opt.parallel_processes
+
+    def restart_replaced_workers(self):
+        """
+        Start a new pool if one of the workers has been replaced, see workers_replaced.
+        Returns True if the pool was restarted.
+        """
+        if not self.workers_replaced():
+            return False
+        self.text_output("A worker process has been replaced, restarting the pool ...")
+        # the task of a worker that died is never finished, so the pool can not be closed normally
+        self.pool.terminate()
+        self.dismount_parallel()
+        self.setup_parallel()
+        return True
+
+    def release_data_buffers(self):
+        """
+        Close the shared memory blocks that only hold data replaced by later updates.
+        """
+        live = list(self._data_buffers.values())
+        for shared in [shared for shared in self._shared_data if shared not in live]:
+            shared.close()
+            self._shared_data.remove(shared)
 
     def setup_parallel_mpi(self):
-        """Inits the number or process used for mpi."""
+        """
+        Send the model to all MPI ranks, which have to run mpi_engine.worker_loop.
+        Only used on rank 0.
+        """
         # check if CUDA has been activated
         from .models.lib import USE_NUMBA, paratt
 
@@ -794,11 +1004,22 @@ class DiffEv(GenxOptimizer):
         else:
             numba_procs = None
 
-        if rank == 0:
-            self.text_output("Inits mpi with %i processes ..." % (size,))
+        self.text_output("Inits mpi with %i processes ..." % (size,))
+        if self.mpi_evaluator is not None and self.mpi_evaluator.stopped:
+            raise RuntimeError("The MPI worker ranks have been stopped, no further fits can be performed")
+        if self.mpi_evaluator is None:
+            self.mpi_evaluator = MPIEvaluator(comm, parallel_init, parallel_calc_fom)
         pkl_str = pickle.dumps(self.model.pickable_copy())
-        parallel_init(pkl_str, numba_procs, use_mpi=True, overwrite_single=True)
-        time.sleep(0.1)
+        self.mpi_evaluator.start(pkl_str, numba_procs, True, True)
+
+    def dismount_parallel_mpi(self):
+        """
+        Stop the worker_loop on all other MPI ranks, after this no further fits can be performed.
+        The worker ranks wait in the loop from their start, so they are released even without a fit.
+        """
+        if self.mpi_evaluator is None:
+            self.mpi_evaluator = MPIEvaluator(comm, parallel_init, parallel_calc_fom)
+        self.mpi_evaluator.stop()
 
     def dismount_parallel(self):
         """
@@ -807,35 +1028,45 @@ class DiffEv(GenxOptimizer):
         if self.pool is None:
             return
 
+        self._pool_finalizer.detach()
+        self._pool_finalizer = None
         self.pool.close()
         self.pool.join()
 
         self.pool = None
+        self._pool_config = None
+        self._pool_hashes = {}
+        self._workers_started = None
+        for shared in self._shared_data:
+            shared.close()
+        self._shared_data = []
+        self._data_buffers = {}
 
     def calc_trial_fom_parallel(self):
         """
         Function to calculate the fom in parallel using the pool
         """
+        self.restart_replaced_workers()
         self.trial_fom = self.pool.map(parallel_calc_fom, self.trial_vec, chunksize=self.opt.parallel_chunksize)
+        self.n_fom += len(self.trial_vec)
 
-    def calc_trial_fom_parallel_mpi(self):
-        """Function to calculate the fom in parallel using mpi"""
-        step_len = int(len(self.trial_vec) / size)
-        remain = int(len(self.trial_vec) % size)
-        left, right = 0, 0
-
-        if rank <= remain - 1:
-            left = rank * (step_len + 1)
-            right = (rank + 1) * (step_len + 1) - 1
-        elif rank > remain - 1:
-            left = remain * (step_len + 1) + (rank - remain) * step_len
-            right = remain * (step_len + 1) + (rank - remain + 1) * step_len - 1
-        fom_temp = []
-
-        for i in range(left, right + 1):
-            fom_temp.append(parallel_calc_fom(self.trial_vec[i]))
+    def calc_trial_fom_parallel_batch(self):
+        """
+        Function to calculate the fom in parallel using the pool where each
+        worker evaluates one part of the population in batch mode
+        """
+        self.restart_replaced_workers()
+        sections = array_split(array(self.trial_vec), self.opt.parallel_processes)
+        fom_sections = self.pool.map(parallel_calc_fom_batch, [si for si in sections if len(si) > 0])
+        self.trial_fom = list(concatenate(fom_sections))
+        self.n_fom += len(self.trial_vec)
 
-        self.trial_fom = fom_temp
+    def calc_trial_fom_parallel_mpi(self):
+        """
+        Function to calculate the fom in parallel on all MPI ranks
+        """
+        self.trial_fom = list(self.mpi_evaluator.evaluate(array(self.trial_vec)))
+        self.n_fom += len(self.trial_vec)
 
     # noinspection PyArgumentList
     def calc_error_bar(self, index):
@@ -847,14 +1078,40 @@ class DiffEv(GenxOptimizer):
         """
         fom_level = self.opt.errorbar_level
         if self.setup_ok:  # and len(self.par_evals) != 0:
-            par_values = self.par_evals[:, index]
-            values_under_level = compress(self.fom_evals[:] < fom_level * self.best_fom, par_values)
+            par_values = self.par_evals.values()[:, index]
+            values_under_level = compress(self.fom_evals.values() < fom_level * self.best_fom, par_values)
             error_bar_low = values_under_level.min() - self.best_vec[index]
             error_bar_high = values_under_level.max() - self.best_vec[index]
             return error_bar_low, error_bar_high
         else:
             raise ErrorBarError()
 
+    # number of logged evaluations processed at once by calc_error_bars
+    eval_chunk_size = 65536
+
+    def calc_error_bars(self):
+        """
+        Calculates the errorbars of all parameters in one pass over the logged
+        evaluations. Returns an array of shape (n_dim, 2) with the lower and
+        upper error bar of each parameter.
+        """
+        if not self.setup_ok or len(self.fom_evals) == 0:
+            raise ErrorBarError()
+        fom_level = self.opt.errorbar_level * self.best_fom
+        par_values = self.par_evals.values()
+        fom_values = self.fom_evals.values()
+        low = zeros(par_values.shape[1]) + inf
+        high = zeros(par_values.shape[1]) - inf
+        for start in range(0, len(fom_values), self.eval_chunk_size):
+            stop = start + self.eval_chunk_size
+            values_under_level = par_values[start:stop][fom_values[start:stop] < fom_level]
+            if len(values_under_level) > 0:
+                low = minimum(low, values_under_level.min(axis=0))
+                high = maximum(high, values_under_level.max(axis=0))
+        if not isfinite(low).all():
+            raise ErrorBarError("No stored evaluation is below the error bar level.")
+        return array([low - self.best_vec, high - self.best_vec]).T
+
     def init_new_generation(self, gen):
         """Function that is called every time a new generation starts"""
         pass
@@ -879,6 +1136,50 @@ class DiffEv(GenxOptimizer):
                 self.best_vec = self.trial_vec[index].copy()
                 self.best_fom = fom
 
+    def standard_update_pop_population(self):
+        """
+        Vectorized version of standard_update_pop that updates all population
+        vectors in one step. Returns a boolean array marking the replaced vectors.
+        """
+        trial = array(self.trial_vec)
+        trial_fom = asarray(self.trial_fom, dtype=float)
+        fom_vec = asarray(self.fom_vec, dtype=float)
+        improved = trial_fom < fom_vec
+        if not improved.any():
+            return improved
+
+        self.pop_vec = list(where(improved[:, newaxis], trial, array(self.pop_vec)))
+        self.fom_vec = where(improved, trial_fom, fom_vec)
+        best_index = argmin(where(improved, trial_fom, inf))
+        if trial_fom[best_index] < self.best_fom:
+            self.new_best = True
+            self.best_vec = trial[best_index].copy()
+            self.best_fom = trial_fom[best_index]
+        return improved
+
+    def create_population_trials(self):
+        """
+        Create the trial vectors for all population members. Uses the vectorized
+        implementation of the selected mutation scheme if it exists and falls back
+        to calling create_trial for each index otherwise.
+        """
+        create_trials = getattr(self, self.create_trial.__name__ + "_population", None)
+        if create_trials is None:
+            [self.create_trial(index) for index in range(self.n_pop)]
+        else:
+            create_trials()
+
+    def update_population(self):
+        """
+        Update the population with the evaluated trial vectors using the vectorized
+        version of update_pop if it exists.
+        """
+        update_pop = getattr(self, self.update_pop.__name__ + "_population", None)
+        if update_pop is None:
+            [self.update_pop(index) for index in range(self.n_pop)]
+        else:
+            update_pop()
+
     # noinspection PyArgumentList
     def simplex_old_init_new_generation(self, gen):
         """It will run the simplex method every simplex_interval
@@ -899,7 +1200,7 @@ class DiffEv(GenxOptimizer):
                 # Check so that the parameters lie inside the bounds
                 ok = bitwise_and(self.par_max > new_vec, self.par_min < new_vec)
                 # If not inside make a random re-initialization of that parameter
-                new_vec = where(ok, new_vec, random.rand(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
+                new_vec = where(ok, new_vec, self.rng.random(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
 
             new_fom = self.calc_fom(new_vec)
             if new_fom < self.best_fom:
@@ -922,7 +1223,9 @@ class DiffEv(GenxOptimizer):
                     # Check so that the parameters lie inside the bounds
                     ok = bitwise_and(self.par_max > new_vec, self.par_min < new_vec)
                     # If not inside make a random re-initialization of that parameter
-                    new_vec = where(ok, new_vec, random.rand(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
+                    new_vec = where(
+                        ok, new_vec, self.rng.random(self.n_dim) * (self.par_max - self.par_min) + self.par_min
+                    )
 
                 new_fom = self.calc_fom(new_vec)
                 if new_fom < mem_fom:
@@ -961,7 +1264,9 @@ class DiffEv(GenxOptimizer):
                     # Check so that the parameters lie inside the bounds
                     ok = bitwise_and(self.par_max > new_vec, self.par_min < new_vec)
                     # If not inside make a random re-initialization of that parameter
-                    new_vec = where(ok, new_vec, random.rand(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
+                    new_vec = where(
+                        ok, new_vec, self.rng.random(self.n_dim) * (self.par_max - self.par_min) + self.par_min
+                    )
 
                 new_fom = self.calc_fom(new_vec)
                 if new_fom < mem_fom:
@@ -990,6 +1295,15 @@ class DiffEv(GenxOptimizer):
                 self.best_vec = self.trial_vec[index].copy()
                 self.best_fom = fom
 
+    def jade_update_pop_population(self):
+        """
+        Vectorized version of jade_update_pop.
+        """
+        improved = self.standard_update_pop_population()
+        self.updated_kr.extend(self.kr_vec[improved])
+        self.updated_km.extend(self.km_vec[improved])
+        return improved
+
     def jade_init_new_generation(self, gen):
         """
         A modified generation update for jade
@@ -1000,8 +1314,8 @@ class DiffEv(GenxOptimizer):
             if len(updated_kms) != 0:
                 self.opt.km = (1.0 - self.c) * self.opt.km + self.c * sum(updated_kms**2) / sum(updated_kms)
                 self.opt.kr = (1.0 - self.c) * self.opt.kr + self.c * mean(updated_krs)
-        self.km_vec = abs(self.opt.km + random.standard_cauchy(self.n_pop) * 0.1)
-        self.kr_vec = self.opt.kr + random.normal(size=self.n_pop) * 0.1
+        self.km_vec = abs(self.opt.km + self.rng.standard_cauchy(self.n_pop) * 0.1)
+        self.kr_vec = self.opt.kr + self.rng.normal(size=self.n_pop) * 0.1
         iprint("km: ", self.opt.km, ", kr: ", self.opt.kr)
         self.km_vec = where(self.km_vec > 0, self.km_vec, 0)
         self.km_vec = where(self.km_vec < 1, self.km_vec, 1)
@@ -1015,8 +1329,8 @@ class DiffEv(GenxOptimizer):
         vec = self.pop_vec[index]
         # Create mutation vector
         # Select two random vectors for the mutation
-        index1 = int(random.rand(1) * self.n_pop)
-        index2 = int(random.rand(1) * len(self.par_evals))
+        index1 = int(self.rng.integers(self.n_pop))
+        index2 = int(self.rng.integers(len(self.par_evals)))
         # Make sure it is not the same vector
         # while index2 == index1:
         #    index2 = int(random.rand(1)*self.n_pop)
@@ -1025,14 +1339,14 @@ class DiffEv(GenxOptimizer):
         mut_vec = (
             vec
             + self.km_vec[index] * (self.best_vec - vec)
-            + self.km_vec[index] * (self.pop_vec[index1] - self.par_evals[index2])
+            + self.km_vec[index] * (self.pop_vec[index1] - self.par_evals.values()[index2])
         )
 
         # Binomial test to determine which parameters to change
         # given by the recombination constant kr
-        recombine = random.rand(self.n_dim) < self.kr_vec[index]
+        recombine = self.rng.random(self.n_dim) < self.kr_vec[index]
         # Make sure at least one parameter is changed
-        recombine[int(random.rand(1) * self.n_dim)] = 1
+        recombine[int(self.rng.integers(self.n_dim))] = 1
         # Make the recombination
         trial = where(recombine, mut_vec, vec)
 
@@ -1041,7 +1355,7 @@ class DiffEv(GenxOptimizer):
             # Check so that the parameters lie inside the bounds
             ok = bitwise_and(self.par_max > trial, self.par_min < trial)
             # If not inside make a random re-initialization of that parameter
-            trial = where(ok, trial, random.rand(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
+            trial = where(ok, trial, self.rng.random(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
         self.trial_vec[index] = trial
         # return trial
 
@@ -1053,20 +1367,20 @@ class DiffEv(GenxOptimizer):
         vec = self.pop_vec[index]
         # Create mutation vector
         # Select two random vectors for the mutation
-        index1 = int(random.rand(1) * self.n_pop)
-        index2 = int(random.rand(1) * self.n_pop)
+        index1 = int(self.rng.integers(self.n_pop))
+        index2 = int(self.rng.integers(self.n_pop))
         # Make sure it is not the same vector
         while index2 == index1:
-            index2 = int(random.rand(1) * self.n_pop)
+            index2 = int(self.rng.integers(self.n_pop))
 
         # Calculate the mutation vector according to the best/1 scheme
         mut_vec = self.best_vec + self.opt.km * (self.pop_vec[index1] - self.pop_vec[index2])
 
         # Binomial test to determine which parameters to change
         # given by the recombination constant kr
-        recombine = random.rand(self.n_dim) < self.opt.kr
+        recombine = self.rng.random(self.n_dim) < self.opt.kr
         # Make sure at least one parameter is changed
-        recombine[int(random.rand(1) * self.n_dim)] = 1
+        recombine[int(self.rng.integers(self.n_dim))] = 1
         # Make the recombination
         trial = where(recombine, mut_vec, vec)
 
@@ -1075,7 +1389,7 @@ class DiffEv(GenxOptimizer):
             # Check so that the parameters lie inside the bounds
             ok = bitwise_and(self.par_max > trial, self.par_min < trial)
             # If not inside make a random re-initialization of that parameter
-            trial = where(ok, trial, random.rand(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
+            trial = where(ok, trial, self.rng.random(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
 
         self.trial_vec[index] = trial
         # return trial
@@ -1088,13 +1402,13 @@ class DiffEv(GenxOptimizer):
         vec = self.pop_vec[index]
         # Create mutation vector
         # Select two random vectors for the mutation
-        index1 = int(random.rand(1) * self.n_pop)
-        index2 = int(random.rand(1) * self.n_pop)
+        index1 = int(self.rng.integers(self.n_pop))
+        index2 = int(self.rng.integers(self.n_pop))
         # Make sure it is not the same vector
         while index2 == index1:
-            index2 = int(random.rand(1) * self.n_pop)
+            index2 = int(self.rng.integers(self.n_pop))
 
-        if random.rand(1) < self.pf:
+        if self.rng.random() < self.pf:
             # Calculate the mutation vector according to the best/1 scheme
             trial = self.best_vec + self.opt.km * (self.pop_vec[index1] - self.pop_vec[index2])
         else:
@@ -1106,7 +1420,7 @@ class DiffEv(GenxOptimizer):
             # Check so that the parameters lie inside the bounds
             ok = bitwise_and(self.par_max > trial, self.par_min < trial)
             # If not inside make a random re-initialization of that parameter
-            trial = where(ok, trial, random.rand(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
+            trial = where(ok, trial, self.rng.random(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
         self.trial_vec[index] = trial
         # return trial
 
@@ -1118,23 +1432,23 @@ class DiffEv(GenxOptimizer):
         vec = self.pop_vec[index]
         # Create mutation vector
         # Select three random vectors for the mutation
-        index1 = int(random.rand(1) * self.n_pop)
-        index2 = int(random.rand(1) * self.n_pop)
+        index1 = int(self.rng.integers(self.n_pop))
+        index2 = int(self.rng.integers(self.n_pop))
         # Make sure it is not the same vector
         while index2 == index1:
-            index2 = int(random.rand(1) * self.n_pop)
-        index3 = int(random.rand(1) * self.n_pop)
+            index2 = int(self.rng.integers(self.n_pop))
+        index3 = int(self.rng.integers(self.n_pop))
         while index3 == index1 or index3 == index2:
-            index3 = int(random.rand(1) * self.n_pop)
+            index3 = int(self.rng.integers(self.n_pop))
 
         # Calculate the mutation vector according to the rand/1 scheme
         mut_vec = self.pop_vec[index3] + self.opt.km * (self.pop_vec[index1] - self.pop_vec[index2])
 
         # Binomial test to determine which parameters to change
         # given by the recombination constant kr
-        recombine = random.rand(self.n_dim) < self.opt.kr
+        recombine = self.rng.random(self.n_dim) < self.opt.kr
         # Make sure at least one parameter is changed
-        recombine[int(random.rand(1) * self.n_dim)] = 1
+        recombine[int(self.rng.integers(self.n_dim))] = 1
         # Make the recombination
         trial = where(recombine, mut_vec, vec)
 
@@ -1143,7 +1457,7 @@ class DiffEv(GenxOptimizer):
             # Check so that the parameters lie inside the bounds
             ok = bitwise_and(self.par_max > trial, self.par_min < trial)
             # If not inside make a random re-initialization of that parameter
-            trial = where(ok, trial, random.rand(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
+            trial = where(ok, trial, self.rng.random(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
         self.trial_vec[index] = trial
         # return trial
 
@@ -1153,16 +1467,16 @@ class DiffEv(GenxOptimizer):
         """
         # Create mutation vector
         # Select two random vectors for the mutation
-        index1 = int(random.rand(1) * self.n_pop)
-        index2 = int(random.rand(1) * self.n_pop)
+        index1 = int(self.rng.integers(self.n_pop))
+        index2 = int(self.rng.integers(self.n_pop))
         # Make sure it is not the same vector
         while index2 == index1:
-            index2 = int(random.rand(1) * self.n_pop)
-        index0 = int(random.rand(1) * self.n_pop)
+            index2 = int(self.rng.integers(self.n_pop))
+        index0 = int(self.rng.integers(self.n_pop))
         while index0 == index1 or index0 == index2:
-            index0 = int(random.rand(1) * self.n_pop)
+            index0 = int(self.rng.integers(self.n_pop))
 
-        if random.rand(1) < self.pf:
+        if self.rng.random() < self.pf:
             # Calculate the mutation vector according to the best/1 scheme
             trial = self.pop_vec[index0] + self.opt.km * (self.pop_vec[index1] - self.pop_vec[index2])
         else:
@@ -1177,10 +1491,107 @@ class DiffEv(GenxOptimizer):
             # Check so that the parameters lie inside the bounds
             ok = bitwise_and(self.par_max > trial, self.par_min < trial)
             # If not inside make a random re-initialization of that parameter
-            trial = where(ok, trial, random.rand(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
+            trial = where(ok, trial, self.rng.random(self.n_dim) * (self.par_max - self.par_min) + self.par_min)
         self.trial_vec[index] = trial
         # return trial
 
+    def _distinct_indices(self, count):
+        """
+        Draw count arrays of random population indices with one entry per population member.
+        For each member the drawn indices are mutually distinct and uniformly distributed.
+        """
+        drawn = []
+        for i in range(count):
+            index = self.rng.integers(self.n_pop - i, size=self.n_pop)
+            if drawn:
+                # skip the indices already drawn for the member, in ascending order
+                for previous in sort(array(drawn), axis=0):
+                    index += index >= previous
+            drawn.append(index)
+        return drawn
+
+    def _recombine_population(self, mut_vec, pop, kr):
+        """
+        Binomial recombination of the mutation vectors with the population,
+        kr can be a scalar or one value per population member.
+        """
+        recombine = self.rng.random((self.n_pop, self.n_dim)) < asarray(kr).reshape(-1, 1)
+        # Make sure at least one parameter is changed
+        recombine[arange(self.n_pop), self.rng.integers(self.n_dim, size=self.n_pop)] = True
+        return where(recombine, mut_vec, pop)
+
+    def _constrain_population(self, trial):
+        """
+        Re-initialize all parameters of the trial population that lie outside the bounds.
+        """
+        if self.opt.use_boundaries:
+            ok = bitwise_and(self.par_max > trial, self.par_min < trial)
+            trial = where(ok, trial, self.rng.random(trial.shape) * (self.par_max - self.par_min) + self.par_min)
+        return trial
+
+    def best_1_bin_population(self):
+        """
+        Vectorized version of best_1_bin that creates the trial vectors of the whole population.
+        """
+        pop = array(self.pop_vec)
+        index1, index2 = self._distinct_indices(2)
+        mut_vec = self.best_vec + self.opt.km * (pop[index1] - pop[index2])
+        trial = self._recombine_population(mut_vec, pop, self.opt.kr)
+        self.trial_vec = list(self._constrain_population(trial))
+
+    def simplex_best_1_bin_population(self):
+        return self.best_1_bin_population()
+
+    def best_either_or_population(self):
+        """
+        Vectorized version of best_either_or.
+        """
+        pop = array(self.pop_vec)
+        index1, index2 = self._distinct_indices(2)
+        use_mutation = (self.rng.random(self.n_pop) < self.pf)[:, newaxis]
+        trial = where(
+            use_mutation,
+            self.best_vec + self.opt.km * (pop[index1] - pop[index2]),
+            pop + self.opt.kr * (pop[index1] + pop[index2] - 2 * pop),
+        )
+        self.trial_vec = list(self._constrain_population(trial))
+
+    def rand_1_bin_population(self):
+        """
+        Vectorized version of rand_1_bin.
+        """
+        pop = array(self.pop_vec)
+        index1, index2, index3 = self._distinct_indices(3)
+        mut_vec = pop[index3] + self.opt.km * (pop[index1] - pop[index2])
+        trial = self._recombine_population(mut_vec, pop, self.opt.kr)
+        self.trial_vec = list(self._constrain_population(trial))
+
+    def rand_either_or_population(self):
+        """
+        Vectorized version of rand_either_or.
+        """
+        pop = array(self.pop_vec)
+        index1, index2, index0 = self._distinct_indices(3)
+        use_mutation = (self.rng.random(self.n_pop) < self.pf)[:, newaxis]
+        trial = where(
+            use_mutation,
+            pop[index0] + self.opt.km * (pop[index1] - pop[index2]),
+            pop[index0] + self.opt.kr * (pop[index1] + pop[index2] - 2 * pop[index0]),
+        )
+        self.trial_vec = list(self._constrain_population(trial))
+
+    def jade_best_population(self):
+        """
+        Vectorized version of jade_best.
+        """
+        pop = array(self.pop_vec)
+        index1 = self.rng.integers(self.n_pop, size=self.n_pop)
+        index2 = self.rng.integers(len(self.par_evals), size=self.n_pop)
+        km = self.km_vec[:, newaxis]
+        mut_vec = pop + km * (self.best_vec - pop) + km * (pop[index1] - self.par_evals.values()[index2])
+        trial = self._recombine_population(mut_vec, pop, self.kr_vec)
+        self.trial_vec = list(self._constrain_population(trial))
+
     # Different function for accessing and setting parameters that
     # the user should have control over.
     def plot_output(self):
@@ -1244,7 +1655,24 @@ class DiffEv(GenxOptimizer):
         Returns the fom as a fcn of iteration in an array.
         Last element last fom value
         """
-        return array(self.fom_log)
+        # the logged values are never changed, so a read-only view can be shared
+        fom_log = self.fom_log[:]
+        fom_log.flags.writeable = False
+        return fom_log
+
+    def log_best_fom(self):
+        """
+        Adds the current best fom to the fom log. The log is a view of a larger
+        array that grows in chunks to avoid copying the whole log each generation.
+        """
+        n = len(self.fom_log)
+        storage = self._fom_log_storage
+        if storage is None or self.fom_log.base is not storage or n >= len(storage):
+            storage = zeros((max(2 * n, 1024), 2))
+            storage[:n] = self.fom_log
+            self._fom_log_storage = storage
+        storage[n] = (n, self.best_fom)
+        self.fom_log = storage[: n + 1]
 
     def get_create_trial(self, index=False):
         """
@@ -1352,32 +1780,34 @@ class DiffEv(GenxOptimizer):
 # Functions that is needed for parallel processing!
 model = None
 par_funcs = ()  # global variables set in functions below
+update_barrier = None
 
 
 def set_numba_single():
-    debug("Setting numba JIT compilation to single CPU")
-    import numba
-
-    old_jit = numba.jit
+    from .models.lib.numba_integration import set_numba_single
 
-    def jit(*args, **opts):
-        opts["parallel"] = False
-        return old_jit(*args, **opts)
+    set_numba_single()
 
-    numba.jit = jit
-    numba.GENX_OVERWRITE_SINGLE = True
-    try:
-        numba.set_num_threads(1)
-    except AttributeError:
-        pass
 
-
-def parallel_init(pkl_str: str, numba_procs=None, use_mpi=False, overwrite_single=False, log_queue=None):
+def parallel_init(
+    pkl_str: str,
+    numba_procs=None,
+    use_mpi=False,
+    overwrite_single=False,
+    log_queue=None,
+    barrier=None,
+    workers_started=None,
+):
     """
     parallel initialization of a pool of processes. The function takes a
     pickle safe copy of the model and resets the script module and the compiles
     the script and creates function to set the variables.
+    The optional barrier is used to synchronize all workers of a pool in parallel_update.
+    The optional shared counter workers_started is incremented by each worker process.
     """
+    if workers_started is not None:
+        with workers_started.get_lock():
+            workers_started.value += 1
     if log_queue:
         custom_logging.setup_mp(log_queue)
     debug(f"Initializing multiprocessing")
@@ -1403,7 +1833,8 @@ def parallel_init(pkl_str: str, numba_procs=None, use_mpi=False, overwrite_singl
 
             configure_numba()
 
-    global model, par_funcs
+    global model, par_funcs, update_barrier
+    update_barrier = barrier
     try:
         # manually unpickle so the errors in import etc. are logged
         model_copy = pickle.loads(pkl_str)
@@ -1415,6 +1846,79 @@ def parallel_init(pkl_str: str, numba_procs=None, use_mpi=False, overwrite_singl
         debug("Exception when initializing worker process", exc_info=True)
 
 
+def model_state_parts(model_obj: Model):
+    """
+    Split the state of a model into the parts that can be updated independently
+    in worker processes, see parallel_update.
+    """
+    parts = {
+        "script": model_obj.script,
+        "parameters": model_obj.parameters,
+        "settings": (model_obj.fom_func, model_obj.opt, model_obj.solver_parameters),
+        "data": len(model_obj.data),
+    }
+    for i, di in enumerate(model_obj.data):
+        parts[f"data {i}"] = di
+    return parts
+
+
+def state_hash(value):
+    """
+    Content hash of one part of the model state.
+    """
+    if isinstance(value, DataSet):
+        # simulation results change with each fit but are not used by the workers
+        value = dict((key, item) for key, item in value.__dict__.items() if key not in ("y_sim", "y_fom"))
+    return hashlib.sha1(pickle.dumps(value)).hexdigest()
+
+
+def parallel_update(pkl_str: bytes, live_blocks=None):
+    """
+    Update the model of a worker process with the changed parts of the
+    model state generated by model_state_parts. The script is only compiled
+    again if it has changed. If live_blocks is given, the shared memory blocks
+    not in this list are released after the update.
+    All workers wait for each other after the update, so each one of them
+    receives exactly one update if called with as many items as there are
+    workers in the pool.
+    """
+    global model, par_funcs
+    try:
+        delta = pickle.loads(pkl_str)
+        if "data" in delta:
+            model.data.items = model.data.items[: delta["data"]]
+        for key, value in delta.items():
+            if key == "script":
+                model.set_script(value)
+            elif key == "parameters":
+                model.parameters = value
+            elif key == "settings":
+                model.fom_func, model.opt, model.solver_parameters = value
+                model.create_fom_mask_func()
+            elif key.startswith("data "):
+                index = int(key.split()[1])
+                if index < len(model.data.items):
+                    model.data.items[index] = value
+                else:
+                    model.data.items.append(value)
+        debug(f"Updating worker model with {list(delta.keys())}")
+        model.simulate(compile="script" in delta or not model.compiled)
+        (par_funcs, start_guess, par_min, par_max) = model.get_fit_pars(use_bounds=False)
+        if live_blocks is not None:
+            release_blocks(live_blocks)
+    finally:
+        if update_barrier is not None:
+            update_barrier.wait(timeout=60.0)
+
+
+def _terminate_pool(pool, shared_data):
+    # finalizer of DiffEv objects with a running pool, see setup_parallel
+    pool.terminate()
+    pool.join()
+    for shared in shared_data:
+        shared.close()
+
+
 def init_cuda():
     debug("Init CUDA in one worker")
     # activate cuda in subprocesses
@@ -1447,6 +1951,15 @@ def parallel_calc_fom(vec):
     return fom
 
 
+def parallel_calc_fom_batch(vecs):
+    """
+    function that is used to calculate the fom of several vectors
+    in one batch evaluation within a parallel process.
+    """
+    global model, par_funcs
+    return model.evaluate_fit_func_batch(par_funcs, vecs)
+
+
 def _calc_fom(model_obj: Model, vec, param_funcs):
     """
     Function to calcuate the figure of merit for parameter vector
@@ -1462,82 +1975,117 @@ class CircBuffer:
     """A buffer with a fixed length to store the logging data from the diffev
     class. Initilized to a maximumlength after which it starts to overwrite
     the data again.
+
+    The storage grows in chunks up to maxlen, so short fits do not allocate the
+    full buffer. If backing_file (a path or an open binary file) is given, the
+    data is stored in a memory mapped file of maxlen elements instead.
     """
 
-    def __init__(self, maxlen, buffer=None):
+    chunk_size = 4096
+
+    def __init__(self, maxlen, buffer=None, backing_file=None):
         """Inits the class with a certain maximum length maxlen."""
         self.maxlen = int(maxlen)
-        self.pos = -1
-        self.filled = False
-        if buffer is None:
-            self.buffer = zeros((self.maxlen,))
-        else:
-            if len(buffer) != 0:
-                self.buffer = array(buffer).repeat(ceil(self.maxlen / (len(buffer) * 1.0)), 0)[: self.maxlen]
-                self.pos = len(buffer) - 1
-            else:
-                self.buffer = zeros((self.maxlen,) + buffer.shape[1:])
+        self.backing_file = backing_file
+        self.reset(buffer)
+
+    def __getstate__(self):
+        # memory mapped files can't be pickled, store the ordered data instead
+        state = self.__dict__.copy()
+        state["buffer"] = array(self.array())
+        state["pos"] = len(state["buffer"]) - 1
+        state["filled"] = len(state["buffer"]) >= self.maxlen
+        state["backing_file"] = None
+        return state
+
+    def _allocate(self, length, item_shape):
+        if getattr(self, "backing_file", None) is not None:
+            return memmap(self.backing_file, dtype=float64, mode="w+", shape=(self.maxlen,) + item_shape)
+        return zeros((length,) + item_shape)
 
     def reset(self, buffer=None):
         """Resets the buffer to the initial state"""
         self.pos = -1
         self.filled = False
-        # self.buffer = buffer
         if buffer is None:
-            self.buffer = zeros((self.maxlen,))
+            self.buffer = self._allocate(0, ())
         else:
-            if len(buffer) != 0:
-                self.buffer = array(buffer).repeat(ceil(self.maxlen / (len(buffer) * 1.0)), 0)[: self.maxlen]
-                self.pos = len(buffer) - 1
-            else:
-                self.buffer = zeros((self.maxlen,) + buffer.shape[1:])
+            buffer = asarray(buffer)
+            self.buffer = self._allocate(0, buffer.shape[1:])
+            self.append_many(buffer)
+
+    def _reserve(self, length):
+        """Make sure the storage can hold length elements, grows in chunks."""
+        capacity = len(self.buffer)
+        if length <= capacity:
+            return
+        new_capacity = min(self.maxlen, max(length, 2 * capacity, self.chunk_size))
+        new_buffer = zeros((new_capacity,) + self.buffer.shape[1:])
+        new_buffer[: self.pos + 1] = self.buffer[: self.pos + 1]
+        self.buffer = new_buffer
 
     def append(self, item, axis=None):
         """Appends an element to the last position of the buffer"""
-        new_pos = (self.pos + 1) % self.maxlen
-        if len(self.buffer) >= self.maxlen:
-            if self.pos >= (self.maxlen - 1):
-                self.filled = True
-            self.buffer[new_pos] = array(item).real
+        item = asarray(item).real
+        if self.filled:
+            self.pos = (self.pos + 1) % self.maxlen
         else:
-            self.buffer = append(self.buffer, item, axis=axis)
-        self.pos = new_pos
+            self._reserve(self.pos + 2)
+            self.pos += 1
+            self.filled = self.pos >= (self.maxlen - 1)
+        self.buffer[self.pos] = item
+
+    def append_many(self, items):
+        """Appends all elements of items (e.g. a whole population) in one operation"""
+        items = asarray(items).real
+        if len(items) > self.maxlen:
+            items = items[-self.maxlen :]
+        if len(items) == 0:
+            return
+        start = self.pos + 1
+        if not self.filled:
+            self._reserve(min(start + len(items), self.maxlen))
+        start %= self.maxlen
+        first = min(len(items), self.maxlen - start)
+        self.buffer[start : start + first] = items[:first]
+        self.buffer[: len(items) - first] = items[first:]
+        if not self.filled and self.pos + 1 + len(items) >= self.maxlen:
+            self.filled = True
+        self.pos = (start + len(items) - 1) % self.maxlen
+
+    def values(self):
+        """
+        Returns a view of all stored elements without copying. After the buffer
+        has been filled the elements are not in the order they have been added.
+        """
+        return self.buffer[: len(self)]
 
     def array(self):
         """returns an ordered array instead of the circular
-        working version
+        working version, this is a view as long as the buffer did not wrap around
         """
-        if self.filled:
-            return r_[self.buffer[self.pos + 1 :], self.buffer[: self.pos + 1]]
+        if self.filled and self.pos < (self.maxlen - 1):
+            return concatenate([self.buffer[self.pos + 1 : self.maxlen], self.buffer[: self.pos + 1]])
         else:
-            return r_[self.buffer[: self.pos + 1]]
+            return self.values()
 
     def copy_from(self, other):
         """Add copy support"""
-        if type(other) == type(array([])):
-            self.buffer = other[-self.maxlen :]
-            self.pos = len(self.buffer) - 1
-            self.filled = self.pos >= (self.maxlen - 1)
+        if isinstance(other, ndarray):
+            self.reset(other[0:0])
+            self.append_many(other)
         elif other.__class__ == self.__class__:
-            # Check if the buffer has been removed.
-            if len(other.buffer) == 0:
-                self.__init__(other.maxlen, other.buffer)
-            else:
-                self.buffer = other.buffer.copy()
-                self.maxlen = other.maxlen
-                self.pos = other.pos
-                try:
-                    self.filled = other.filled
-                except AttributeError:
-                    self.filled = False
+            self.maxlen = other.maxlen
+            self.reset(other.buffer[0:0])
+            self.append_many(other.array())
         else:
             raise TypeError("CircBuffer support only copying from CircBuffer" " and arrays.")
 
     def __len__(self):
         if self.filled:
-            return len(self.buffer)
+            return self.maxlen
         else:
-            return (self.pos > 0) * self.pos
+            return self.pos + 1
 
     def __getitem__(self, item):
         return self.array().__getitem__(item)
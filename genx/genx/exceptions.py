@@ -123,3 +123,11 @@ class FomError(RuntimeError, GenxError):
 
 class OptimizerInterrupted(RuntimeError, GenxError):
     """Error raised to stop a running refinement function from within a thread"""
+
+
+class BatchNotSupported(NotImplementedError, GenxError):
+    """Raised by model functions that can not evaluate a whole population in one call"""
+
+    def __init__(self, reason=""):
+        self.reason = reason
+        NotImplementedError.__init__(self, "Batch evaluation not supported: %s" % reason)
@@ -3,7 +3,6 @@ A dialog to import batches of datafiles to create a model sequence and perform
 fitting to a common model.
 """
 
-from copy import copy, deepcopy
 
 import numpy as np
 import wx.grid
@@ -291,11 +290,7 @@ class BatchDialog(wx.Dialog):
     def OnBatchFitModel(self, evt):
         evt.Skip()
         # synchronizing current model script and parameters to all datasets
-        script = self.model_control.get_model_script()
-        params = self.model_control.get_model_params()
-        for mi in self.model_control.controller.model_store:
-            mi.set_script(copy(script))
-            mi.parameters = deepcopy(params)
+        self.model_control.controller.update_store_models()
         # set first model and start fitting
         self.switch_line(self.model_control.controller.active_index(), 0)
         self.model_control.controller.activate_model(0)
@@ -305,12 +300,8 @@ class BatchDialog(wx.Dialog):
     def OnBatchFromHere(self, evt):
         evt.Skip()
         # synchronizing current model script and parameters to all datasets
-        script = self.model_control.get_model_script()
-        params = self.model_control.get_model_params()
         ci = self.model_control.controller.active_index()
-        for mi in self.model_control.controller.model_store[ci + 1 :]:
-            mi.set_script(copy(script))
-            mi.parameters = deepcopy(params)
+        self.model_control.controller.update_store_models(ci + 1)
         # set first model and start fitting
         self.set_batch_params()
         # put values for parameters from previous datasets
@@ -1605,6 +1605,11 @@ class GenxMainWindow(wx.Frame, conf_mod.Configurable):
             os.remove(self.script_file)
             self.script_file = None
 
+        # release the worker processes that optimizers keep between fits
+        for solver in self.model_control.solvers.values():
+            if hasattr(solver, "dismount_parallel") and not solver.is_running():
+                solver.dismount_parallel()
+
         self.Destroy()
 
     def eh_mb_copy_graph(self, event):
@@ -2009,6 +2014,9 @@ class GenxMainWindow(wx.Frame, conf_mod.Configurable):
         """
         sel = event.GetSelection()
         pages = self.get_pages()
+        if self.model_control.controller.optimizer.is_running():
+            # show the simulation of the current best parameters on the new page
+            self.model_control.RequestSimulation()
         if sel < len(pages):
             zoom_state = pages[sel].GetZoom()
             # Set the zoom button to the correct value
@@ -639,6 +639,9 @@ class ModelControlGUI(wx.EvtHandler):
     def ResumeFit(self):
         self.controller.ResumeFit()
 
+    def RequestSimulation(self):
+        self.controller.RequestSimulation()
+
     def IsFitted(self):
         return self.controller.IsFitted()
 
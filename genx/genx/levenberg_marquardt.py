@@ -3,14 +3,17 @@ Use Levenberg-Marquardt as minimizer to estimate errors and for fast decent to n
 """
 
 import _thread
+import multiprocessing as processing
 import pickle
 import sys
 
 from dataclasses import dataclass
 
-from numpy import array, ndarray, sign, sqrt
+from numpy import absolute, array, cbrt, diag, finfo, float64, ndarray, r_, sign, sqrt, where, zeros
 from scipy.optimize import leastsq
 
+from . import diffev
+from .core import custom_logging
 from .core.config import BaseConfig
 from .core.custom_logging import iprint
 from .exceptions import ErrorBarError, OptimizerInterrupted
@@ -37,11 +40,88 @@ class LMDefaultCallbacks(GenxOptimizerCallback):
         pass
 
 
+_cpu_count = processing.cpu_count()
+
+
 @dataclass
 class LMConfig(BaseConfig):
     section = "solver"
 
-    groups = {}
+    use_central_diff: bool = False
+    diff_step: float = BaseConfig.GParam(0.0, pmin=0.0, pmax=0.1, label="rel. step (0=auto)")
+
+    use_parallel_processing: bool = False
+    parallel_processes: int = BaseConfig.GParam(_cpu_count, pmin=2, pmax=_cpu_count, label="# processes")
+
+    groups = {  # for building config dialogs
+        "Jacobian": ["use_central_diff", "diff_step"],
+        "Parallel processing": ["use_parallel_processing", "parallel_processes"],
+    }
+
+
+def parallel_calc_residuals(vec):
+    """
+    Calculate the residuals for parameter vector vec in a worker process
+    initialized with diffev.parallel_init.
+    """
+    list(map(lambda func, value: func(value), diffev.par_funcs, vec))
+    fom = diffev.model.evaluate_fit_func(get_elements=True)
+    return sign(fom) * sqrt(absolute(fom))
+
+
+class FiniteDiffJacobian:
+    """
+    Finite difference Jacobian of a residual function. All perturbed parameter
+    vectors of one Jacobian are evaluated together by evaluate, which can map
+    them to a pool of workers. The residuals at the base point are reused
+    if the residual function has been evaluated at that point last.
+    """
+
+    def __init__(self, residuals, evaluate=None, central=False, rel_step=0.0):
+        self.residuals = residuals
+        if evaluate is None:
+            evaluate = lambda vecs: list(map(residuals, vecs))
+        self.evaluate = evaluate
+        self.central = central
+        if rel_step <= 0:
+            rel_step = cbrt(finfo(float64).eps) if central else sqrt(finfo(float64).eps)
+        self.rel_step = rel_step
+        self.last_x = None
+        self.last_f = None
+        self.n_evals = 0
+
+    def fun(self, x):
+        """Residual function that remembers its last result to be used in the Jacobian"""
+        f = self.residuals(x)
+        self.last_x = array(x, copy=True)
+        self.last_f = f
+        return f
+
+    def steps(self, x):
+        h = self.rel_step * where(x != 0, absolute(x), 1.0)
+        # make sure the step can be represented
+        return (x + h) - x
+
+    def __call__(self, x):
+        x = array(x, dtype=float64)
+        h = self.steps(x)
+        n = len(x)
+        vecs = list(x + diag(h))
+        if self.central:
+            vecs += list(x - diag(h))
+        if self.last_x is None or not (self.last_x == x).all():
+            vecs.append(x)
+        results = self.evaluate(vecs)
+        self.n_evals += len(vecs)
+        if len(results) > (2 * n if self.central else n):
+            self.last_x, self.last_f = x, results[-1]
+        jac = zeros((len(self.last_f), n))
+        for i in range(n):
+            if self.central:
+                jac[:, i] = (results[i] - results[n + i]) / (2.0 * h[i])
+            else:
+                jac[:, i] = (results[i] - self.last_f) / h[i]
+        return jac
 
 
 class LMOptimizer(GenxOptimizer):
@@ -67,6 +147,9 @@ class LMOptimizer(GenxOptimizer):
         self.model = Model()
         self.fom_log = array([[0, 0]])[0:0]
         self.covar = None
+        self.pool = None
+        self._stop_fit = False
+        self._fom_rows = []  # fom log entries of the running fit
 
     def pickle_string(self, clear_evals: bool = False):
         return pickle.dumps(self)
@@ -82,6 +165,8 @@ class LMOptimizer(GenxOptimizer):
         return self.model
 
     def get_fom_log(self):
+        if self._fom_rows:
+            return r_[self.fom_log, self._fom_rows]
         return self.fom_log
 
     def connect_model(self, model_obj: Model):
@@ -142,12 +227,94 @@ class LMOptimizer(GenxOptimizer):
         self._stop_fit = False
         _thread.start_new_thread(self.optimize, ())
 
+    def setup_parallel(self):
+        """
+        Creates a pool of workers that evaluate the residuals of the Jacobian.
+        """
+        numba_procs = max(1, _cpu_count // self.opt.parallel_processes)
+        self._callbacks.text_output("Starting a pool with %i workers ..." % (self.opt.parallel_processes,))
+        self.pool = processing.Pool(
+            processes=self.opt.parallel_processes,
+            initializer=diffev.parallel_init,
+            initargs=(
+                pickle.dumps(self.model.pickable_copy()),
+                numba_procs,
+                False,
+                False,
+                custom_logging.mp_logger and custom_logging.mp_logger.queue,
+            ),
+        )
+
+    def dismount_parallel(self):
+        if self.pool is None:
+            return
+        self.pool.close()
+        self.pool.join()
+        self.pool = None
+
+    def calc_jacobian_residuals(self, vecs):
+        """
+        Evaluates the residuals of all parameter vectors needed for one Jacobian.
+        """
+        if self._stop_fit:
+            raise OptimizerInterrupted("interrupted")
+        if self.pool is None:
+            return [self.calc_fom(vec) for vec in vecs]
+        results = self.pool.map(parallel_calc_residuals, vecs, chunksize=1)
+        self.n_fom_evals += len(vecs)
+        return results
+
+    def jacobian_output(self, jacobian):
+        """
+        Report the progress of the fit, called each time the Jacobian is evaluated.
+        """
+        self.best_vec = jacobian.last_x.copy()
+        fom = (jacobian.last_f**2).sum()
+        iteration = len(self.fom_log) + len(self._fom_rows)
+        self._fom_rows.append([iteration, fom])
+        self._callbacks.text_output("Chi2: %.4g Iteration: %d Evaluations: %d" % (fom, iteration + 1, self.n_fom_evals))
+        self._callbacks.parameter_output(
+            SolverParameterInfo(
+                values=self.best_vec.copy(),
+                new_best=True,
+                population=[],
+                max_val=[],
+                min_val=[],
+                fitting=True,
+            )
+        )
+
     def optimize(self):
+        jacobian = FiniteDiffJacobian(
+            self.calc_fom,
+            evaluate=self.calc_jacobian_residuals,
+            central=self.opt.use_central_diff,
+            rel_step=self.opt.diff_step,
+        )
+
+        def jac(x):
+            result = jacobian(x)
+            self.jacobian_output(jacobian)
+            return result
+
+        # without the options of the own Jacobian MINPACK calculates it by forward differences
+        use_jacobian = self.opt.use_parallel_processing or self.opt.use_central_diff or self.opt.diff_step > 0
+        self._fom_rows = []
         try:
-            res = leastsq(self.calc_fom, self.start_guess, full_output=True)
+            if self.opt.use_parallel_processing:
+                self.setup_parallel()
+            if use_jacobian:
+                res = leastsq(jacobian.fun, self.start_guess, Dfun=jac, full_output=True)
+            else:
+                res = leastsq(self.calc_fom, self.start_guess, full_output=True)
         except OptimizerInterrupted:
             self._callbacks.fitting_ended(self.get_result_info(interrupted=True))
             return
+        finally:
+            self.dismount_parallel()
+            if self._fom_rows:
+                self.fom_log = r_[self.fom_log, self._fom_rows]
+                self._fom_rows = []
         self.best_vec = res[0]
         if res[1] is None:
             self.covar = None
@@ -66,8 +66,11 @@ class SolverParameters(BaseConfig):
     fit_xmin: float = BaseConfig.GParam(0.0, pmin=-1000.0, pmax=1000.0)
     fit_xmax: float = BaseConfig.GParam(180.0, pmin=-1000.0, pmax=1000.0)
 
+    use_dataset_cache: bool = False
+
     groups = {
-        "FOM": ["figure_of_merit", ["ignore_fom_nan", "ignore_fom_inf"], "limit_fit_range", ["fit_xmin", "fit_xmax"]]
+        "FOM": ["figure_of_merit", ["ignore_fom_nan", "ignore_fom_inf"], "limit_fit_range", ["fit_xmin", "fit_xmax"]],
+        "Simulation": ["use_dataset_cache"],
     }
 
 
@@ -323,7 +326,12 @@ class Model(H5HintedExport):
         # Testing to see if this works under windows
         self.set_script("\n".join(self.script.splitlines()))
         try:
-            exec(self.script, self.script_module.__dict__)
+            if self.solver_parameters.use_dataset_cache:
+                from .models.lib.dataset_cache import compile_cached
+
+                exec(compile_cached(self.script, self.script_module), self.script_module.__dict__)
+            else:
+                exec(self.script, self.script_module.__dict__)
             for obj in self.script_module.__dict__.values():
                 if isinstance(obj, ModelParamBase):
                     obj._extract_callpars(self.script)
@@ -388,13 +396,14 @@ class Model(H5HintedExport):
         if self.solver_parameters.limit_fit_range:
             for i, di in enumerate(self.data):
                 fltr = (di.x < self.solver_parameters.fit_xmin) | (di.x > self.solver_parameters.fit_xmax)
-                fom_raw[i][fltr] = 0.0
-        # Sum up a unique fom for each data set in use
-        fom_indiv = [np.sum(np.abs(self.fom_mask_func(fom_set))) for fom_set in fom_raw]
-        fom = np.sum([f for f, d in zip(fom_indiv, self.data) if d.use])
+                fom_raw[i][..., fltr] = 0.0
+        # Sum up a unique fom for each data set in use, for batch evaluation the
+        # simulations have a leading population axis that is kept
+        fom_indiv = [np.sum(np.abs(self.fom_mask_func(fom_set)), axis=-1) for fom_set in fom_raw]
+        fom = np.sum([f for f, d in zip(fom_indiv, self.data) if d.use], axis=0)
 
         # Lets extract the number of data points as well:
-        N = np.sum([len(self.fom_mask_func(fom_set)) for fom_set, d in zip(fom_raw, self.data) if d.use])
+        N = np.sum([np.shape(fom_set)[-1] for fom_set, d in zip(fom_raw, self.data) if d.use])
         # And the number of fit parameters
         p = self.parameters.get_len_fit_pars()
         # self.fom_dof = fom/((N-p)*1.0)
@@ -424,6 +433,32 @@ class Model(H5HintedExport):
         else:
             return fom
 
+    def evaluate_fit_func_batch(self, param_funcs, population):
+        """
+        Evaluate the fom for a whole population of parameter vectors (shape n_pop x n_dim)
+        with a single call of the Sim function. Each parameter is set to a PopulationArray
+        and the model library has to return simulations with a leading population axis.
+        Models that can't handle this raise a BatchNotSupported exception.
+        """
+        from .models.lib.population import PopulationArray
+
+        population = np.asarray(population, dtype=np.float64)
+        n_pop = population.shape[0]
+        for func, values in zip(param_funcs, population.T):
+            func(PopulationArray(values))
+        try:
+            self.script_module._sim = False
+            simulated_data = self.script_module.Sim(self.data)
+            simulated_data = [
+                np.broadcast_to(si, (n_pop,) + np.shape(di.y)) for si, di in zip(simulated_data, self.data)
+            ]
+            fom_raw, fom_inidv, fom = self.calc_fom(simulated_data)
+        finally:
+            # don't leave population arrays in the model after evaluation
+            for func, value in zip(param_funcs, population[0]):
+                func(value)
+        return np.array(np.broadcast_to(fom, (n_pop,)))
+
     def evaluate_sim_func(self):
         """
         Evalute the Simulation function and updates the data simulated data
@@ -5,10 +5,10 @@ GenX model and optimizer control classes. All functional aspects should be cover
 import os
 import sys
 
+from copy import copy, deepcopy
 from logging import warning
 from typing import List
 
-import h5py
 import numpy as np
 
 from .core.config import config
@@ -142,6 +142,55 @@ class ModelController:
         # activate the first dataset
         self.activate_model(0)
 
+    def update_store_models(self, start=0):
+        """
+        Use the script and parameters of the current model for the models in the store from index start on.
+        """
+        script = self.get_model_script()
+        params = self.get_model_params()
+        for mi in self.model_store[start:]:
+            if mi is self.model:
+                continue
+            mi.set_script(copy(script))
+            mi.parameters = deepcopy(params)
+
+    def batch_fit(
+        self, processes=None, warm_start=False, adjust_bounds=False, calc_errors=False, fname=None, callback=None
+    ):
+        """
+        Fit all models in the store in a pool of processes with the options of a differential evolution
+        optimizer. If fname is given, each model is saved to this .hgx file as soon as its fit has finished.
+        """
+        from .batch import BatchFitter
+        from .diffev import DiffEvConfig, _cpu_count
+
+        if fname and not fname.lower().endswith(".hgx"):
+            # only .hgx files can store the sequence and be updated after each fit
+            raise GenxIOError("Wrong file ending, should be .hgx", fname)
+        if isinstance(self.optimizer.opt, DiffEvConfig):
+            opt = self.optimizer.opt
+        else:
+            opt = DiffEvConfig()
+
+        def result_callback(model, result):
+            if fname:
+                self.save_store_model(fname, result.index)
+            if callback:
+                callback(model, result)
+
+        if fname:
+            self.save_file(fname)
+        fitter = BatchFitter(
+            self.model_store,
+            opt,
+            processes=processes or _cpu_count,
+            warm_start=warm_start,
+            adjust_bounds=adjust_bounds,
+            calc_errors=calc_errors,
+            result_callback=result_callback,
+        )
+        return fitter.run()
+
     def active_index(self):
         try:
             return self.model_store.index(self.model)
@@ -309,12 +358,8 @@ class ModelController:
                 "Run a fit before calculating the errorbars."
             )
         if self.optimizer.get_start_guess() is not None and not self.optimizer.is_running():
-            n_elements = len(self.optimizer.get_start_guess())
-            error_values = []
-            for index in range(n_elements):
-                # calculate the error, this is threshold based and not rigours
-                error_values.append(self.optimizer.calc_error_bar(index))
-            return np.array(error_values)
+            # calculate the errors, this is threshold based and not rigours
+            return np.array(self.optimizer.calc_error_bars())
         else:
             raise ErrorBarError("Wait for fit to finish or fit to changed model first.")
 
@@ -347,6 +392,12 @@ class ModelController:
         """
         self.optimizer.stop_fit()
 
+    def RequestSimulation(self):
+        """
+        Function to get the simulation of the best parameters with the next update of a running fit
+        """
+        self.optimizer.request_simulation()
+
     def ResumeFit(self):
         """
         Function to resume the fitting after it has been stopped
@@ -392,6 +443,8 @@ class ModelController:
         self.history_clear()
 
     def save_hgx(self, fname: str, update_callback=None):
+        import h5py
+
         f = h5py.File(fname.encode("utf-8"), "w")
         g = f.create_group("current")
         self.model.write_h5group(g)
@@ -402,16 +455,35 @@ class ModelController:
         self.WriteConfig()
         g["config"] = config.model_dump().encode("utf-8")
         N = len(self.model_store) + 1
-        lN = len(f"{N}")
-        fmt = "%%0%ii-%%s" % lN  # put an index before the name to keep list order on load
         for i, modeli in enumerate(self.model_store):
             if update_callback:
                 update_callback(i + 1, N)
-            g = f.create_group(fmt % (i, modeli.h5group_name))
+            g = f.create_group(self._store_group_name(i))
             modeli.write_h5group(g)
         f.close()
 
+    def _store_group_name(self, index):
+        lN = len(f"{len(self.model_store) + 1}")
+        fmt = "%%0%ii-%%s" % lN  # put an index before the name to keep list order on load
+        return fmt % (index, self.model_store[index].h5group_name)
+
+    def save_store_model(self, fname: str, index: int):
+        """
+        Replace a single model of the store in an existing .hgx file.
+        """
+        import h5py
+
+        name = self._store_group_name(index)
+        prefix = name.split("-", 1)[0] + "-"
+        with h5py.File(fname.encode("utf-8"), "a") as f:
+            for key in list(f.keys()):
+                if key.startswith(prefix):
+                    del f[key]
+            self.model_store[index].write_h5group(f.create_group(name))
+
     def load_hgx(self, fname: str, update_callback=None):
+        import h5py
+
         f = h5py.File(fname.encode("utf-8"), "r")
         g = f["current"]
         self.model.read_h5group(g)
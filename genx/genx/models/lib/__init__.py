@@ -1 +1,47 @@
 USE_NUMBA = True
+
+
+class LazyNumbaFunction:
+    """
+    Stands in for a function of one of the numba modules in this package.
+
+    The numba module is only imported, and its functions compiled or loaded from the cache, when the
+    function is first called. If that fails the pure python implementation is used instead.
+    """
+
+    def __init__(self, module, name, fallback):
+        self.__module__ = f"{__name__}.{module}"
+        self.__name__ = name
+        self.__doc__ = fallback.__doc__
+        self.fallback = fallback
+        self.function = None
+
+    def resolve(self):
+        if self.function is None:
+            from importlib import import_module
+
+            try:
+                from .numba_integration import configure_numba
+
+                configure_numba()
+                self.function = getattr(import_module(self.__module__), self.__name__)
+            except Exception as e:
+                from genx.core.custom_logging import iprint
+
+                iprint("Could not use numba, no speed up from JIT compiler:\n" + str(e))
+                self.function = self.fallback
+        return self.function
+
+    def __call__(self, *args, **kwargs):
+        return (self.function or self.resolve())(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<lazy numba function {self.__module__}.{self.__name__}>"
+
+
+def lazy_numba(module, namespace, *names):
+    """
+    Replace the functions names in namespace by the ones of the numba module, imported on first use.
+    """
+    for name in names:
+        namespace[name] = LazyNumbaFunction(module, name, namespace[name])
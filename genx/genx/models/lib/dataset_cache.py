@@ -0,0 +1,496 @@
+"""
+Cache of the simulation results of individual datasets during fitting.
+
+Scripts generated by the Reflectivity plugin simulate each dataset within a
+block of the Sim function marked by "# BEGIN Dataset i" and "# END Dataset i"
+comments. When the cache is enabled the script is compiled with each of these
+blocks wrapped by calls to a DatasetCache. While a block is executed the cache
+records which parameters of model objects (ModelParamBase and UserVars) are read
+and written. For this, the model objects of the script namespace and the ones
+reached from them are temporarily given a subclass that records the attribute access.
+
+For each block the cache keeps the simulations of the most recently used values of
+these parameters and of the script variables used in the block. If a block is reached
+with the same values again, e.g. for a trial vector that only differs from an earlier
+one in parameters of other datasets, its simulation is reused. The recorded writes are
+applied again in that case, so following blocks see the same model state as if the
+block had been executed.
+
+The cache is only active during fitting (Model.evaluate_fit_func).
+Recordings are kept per thread, so models can be evaluated in several threads at once.
+"""
+
+import ast
+import builtins
+import hashlib
+import re
+import sys
+import threading
+import types
+
+from collections import OrderedDict
+from enum import Enum
+from logging import debug
+
+import numpy as np
+
+from ...data import DataSet
+from .base import ModelParamBase
+
+CACHE_NAME = "__dataset_cache__"
+BLOCK_BEGIN = re.compile(r"^\s*# BEGIN Dataset (\d+)")
+BLOCK_END = re.compile(r"^\s*# END Dataset (\d+)")
+
+_plain_types = (int, float, complex, bool, str, bytes, type(None), np.number, np.bool_)
+# objects that can't be changed in a way relevant for the simulation
+_identity_types = (types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType, Enum)
+_missing = object()
+
+
+def _snapshot(value, classes, seen):
+    if isinstance(value, _plain_types):
+        return type(value), value
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return "array", value.shape, tuple(_snapshot(vi, classes, seen) for vi in value.flat)
+        return "array", value.dtype.str, value.shape, hashlib.blake2b(np.ascontiguousarray(value).data).digest()
+    if isinstance(value, types.MethodType):
+        return "method", id(value.__self__), id(value.__func__)
+    if isinstance(value, classes + _identity_types):
+        # the parameters read from model objects are recorded separately
+        return "id", id(value)
+    if id(value) in seen:
+        return "ref", id(value)
+    if isinstance(value, (list, tuple)):
+        seen.add(id(value))
+        return type(value), tuple(_snapshot(vi, classes, seen) for vi in value)
+    if isinstance(value, dict):
+        seen.add(id(value))
+        return type(value), tuple(
+            (_snapshot(ki, classes, seen), _snapshot(vi, classes, seen)) for ki, vi in value.items()
+        )
+    if isinstance(value, (set, frozenset)):
+        return type(value), frozenset(_snapshot(vi, classes, seen) for vi in value)
+    attributes = getattr(value, "__dict__", None)
+    if not isinstance(attributes, dict):
+        return "id", id(value)
+    seen.add(id(value))
+    # simulation results are not an input of the simulation
+    excluded = ("y_sim", "y_fom") if isinstance(value, DataSet) else ()
+    return (
+        type(value),
+        id(value),
+        tuple((key, _snapshot(item, classes, seen)) for key, item in attributes.items() if key not in excluded),
+    )
+
+
+def snapshot(value):
+    """
+    Return a hashable object that equals a later snapshot of value if value has not changed.
+    Model objects, functions and classes are represented by their identity, other objects
+    like lists, dicts or arrays by their content, so changes made in place are detected.
+    """
+    if isinstance(value, _plain_types):
+        return type(value), value
+    return _snapshot(value, _model_classes(), set())
+
+
+def _is_parameter(obj, name, value):
+    parameters = getattr(type(obj), "__dataclass_fields__", None)
+    if parameters is not None:
+        return name in parameters
+    return not name.startswith("_") and not callable(value)
+
+
+def _model_classes():
+    # scripts can import the model library as "models" in addition to "genx.models"
+    output = (ModelParamBase,)
+    for module_name, class_name in [
+        ("genx.models.utils", "UserVars"),
+        ("models.utils", "UserVars"),
+        ("models.lib.base", "ModelParamBase"),
+    ]:
+        cls = getattr(sys.modules.get(module_name), class_name, None)
+        if cls is not None and cls not in output:
+            output += (cls,)
+    return output
+
+
+_local = threading.local()  # recording of the current thread
+_tracking_lock = threading.Lock()
+_tracking_classes = {}  # model class -> subclass that records the attribute access
+_tracked_objects = {}  # id -> [object, original class, number of recordings tracking it]
+
+
+def _tracking_class(cls):
+    tracking = _tracking_classes.get(cls)
+    if tracking is not None:
+        return tracking
+    getattribute = cls.__getattribute__
+    setattribute = cls.__setattr__
+
+    def __getattribute__(self, name):
+        value = getattribute(self, name)
+        recording = getattr(_local, "recording", None)
+        if recording is not None and not name.startswith("__"):
+            recording.read(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        setattribute(self, name, value)
+        recording = getattr(_local, "recording", None)
+        if recording is not None and not name.startswith("__"):
+            recording.write(self, name, value)
+
+    namespace = {
+        "__slots__": (),
+        "__module__": cls.__module__,
+        "__qualname__": cls.__qualname__,
+        "__getattribute__": __getattribute__,
+        "__setattr__": __setattr__,
+    }
+    tracking = type(cls)(cls.__name__, (cls,), namespace)
+    _tracking_classes[cls] = tracking
+    return tracking
+
+
+def _track_object(obj):
+    """
+    Give obj the tracking subclass of its class. Returns False if the class can't be replaced.
+    """
+    with _tracking_lock:
+        entry = _tracked_objects.get(id(obj))
+        if entry is not None:
+            entry[2] += 1
+            return True
+        cls = type(obj)
+        if cls in _tracking_classes.values():
+            # a copy of a model object created while it was tracked
+            return True
+        try:
+            object.__setattr__(obj, "__class__", _tracking_class(cls))
+        except TypeError:
+            return False
+        _tracked_objects[id(obj)] = [obj, cls, 1]
+        return True
+
+
+def _untrack_objects(objects):
+    with _tracking_lock:
+        for obj in objects:
+            entry = _tracked_objects.get(id(obj))
+            if entry is None:
+                continue
+            entry[2] -= 1
+            if entry[2] == 0:
+                object.__setattr__(obj, "__class__", entry[1])
+                del _tracked_objects[id(obj)]
+
+
+class _Recording:
+    """Parameter reads, writes and simulation output of one execution of a dataset block."""
+
+    def __init__(self, index, variables, output_start):
+        self.index = index
+        self.variables = variables
+        self.output_start = output_start
+        self.reads = {}
+        self.writes = {}
+        self.output = []
+        self.tracked = {}
+        self.complete = True  # False if the access to some model objects could not be recorded
+        self.classes = _model_classes()
+
+    def track(self, value):
+        """
+        Record the parameter access of the model objects in value, a model object or a container of them.
+        """
+        if isinstance(value, _plain_types + (np.ndarray,)) or id(value) in self.tracked:
+            return
+        if isinstance(value, self.classes):
+            self.tracked[id(value)] = value
+            if not _track_object(value):
+                debug(f"Can't record the parameter access of {type(value).__name__} object")
+                self.complete = False
+        elif isinstance(value, (list, tuple)):
+            self.tracked[id(value)] = value
+            for vi in value:
+                self.track(vi)
+        elif isinstance(value, dict):
+            self.tracked[id(value)] = value
+            for vi in value.values():
+                self.track(vi)
+
+    def untrack(self):
+        _untrack_objects(self.tracked.values())
+        self.tracked = {}
+
+    def read(self, obj, name, value):
+        if not callable(value):
+            # model objects reached through this one
+            self.track(value)
+        if not _is_parameter(obj, name, value):
+            return
+        key = (id(obj), name)
+        if key not in self.reads and key not in self.writes:
+            self.reads[key] = (obj, name, snapshot(value))
+
+    def write(self, obj, name, value):
+        if _is_parameter(obj, name, value):
+            self.writes[(id(obj), name)] = (obj, name, value)
+
+
+def start_tracking(recording):
+    """
+    Record the parameter access of model objects passed to recording.track within the
+    current thread until stop_tracking is called.
+    """
+    if getattr(_local, "recording", None) is not None:
+        stop_tracking()
+    _local.recording = recording
+
+
+def stop_tracking():
+    """
+    Stop the recording of the current thread and restore the classes of the objects it tracked.
+    """
+    recording = getattr(_local, "recording", None)
+    if recording is None:
+        return
+    _local.recording = None
+    recording.untrack()
+
+
+class _BlockEntries:
+    """
+    Recordings of one dataset block for the most recently used values of its inputs.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.recordings = OrderedDict()  # (variables, dependencies, values) -> recording
+        self.dependencies = OrderedDict()  # (id, name) of parameters read -> [(obj, name), number of recordings]
+
+    def get(self, variables):
+        for key, (parameters, _) in reversed(self.dependencies.items()):
+            values = tuple(snapshot(getattr(obj, name, _missing)) for obj, name in parameters)
+            recording = self.recordings.get((variables, key, values))
+            if recording is not None:
+                self.recordings.move_to_end((variables, key, values))
+                self.dependencies.move_to_end(key)
+                return recording
+        return None
+
+    def add(self, recording):
+        key = tuple(recording.reads.keys())
+        values = tuple(value for obj, name, value in recording.reads.values())
+        entry_key = (recording.variables, key, values)
+        if entry_key in self.recordings:
+            self.recordings.move_to_end(entry_key)
+        else:
+            if key not in self.dependencies:
+                self.dependencies[key] = [[(obj, name) for obj, name, value in recording.reads.values()], 0]
+            self.dependencies[key][1] += 1
+        self.recordings[entry_key] = recording
+        self.dependencies.move_to_end(key)
+        while len(self.recordings) > self.maxsize:
+            (_, old_key, _), _ = self.recordings.popitem(last=False)
+            self.dependencies[old_key][1] -= 1
+            if self.dependencies[old_key][1] == 0:
+                del self.dependencies[old_key]
+
+
+class DatasetCache:
+    """
+    Stores the simulations of each dataset block together with the parameters they depend on.
+    Up to maxsize simulations are kept per block.
+    Used by the Sim function of a script compiled with compile_cached.
+    """
+
+    def __init__(self, module, blocks, maxsize=64):
+        self.module = module
+        self.blocks = blocks  # dataset index -> names of script variables used in the block
+        self.maxsize = maxsize
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def _recording(self):
+        # the Sim function can be evaluated in several threads at once
+        return getattr(self._local, "recording", None)
+
+    @_recording.setter
+    def _recording(self, value):
+        self._local.recording = value
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+
+    def _values(self, index, namespace):
+        output = []
+        for name in self.blocks[index]:
+            value = namespace.get(name, _missing)
+            if value is _missing:
+                value = self.module.__dict__.get(name, _missing)
+            if value is _missing:
+                value = getattr(builtins, name, _missing)
+            output.append(value)
+        return output
+
+    def reuse(self, index, output, namespace):
+        """
+        Append the cached simulation of block index to output and return True if it has been
+        simulated with the same inputs before. Otherwise start recording the parameters used by
+        the block and return False.
+        """
+        if self.module._sim or self._recording is not None:
+            return False
+        values = self._values(index, namespace)
+        variables = tuple(snapshot(vi) for vi in values)
+        with self._lock:
+            entry = self.entries.get(index)
+            entry = entry and entry.get(variables)
+            if entry is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is not None:
+            for obj, name, value in entry.writes.values():
+                setattr(obj, name, value)
+            output.extend(entry.output)
+            return True
+        recording = _Recording(index, variables, len(output))
+        # keeps the objects alive that are identified by their id in the snapshots
+        recording.values = values
+        self._recording = recording
+        start_tracking(recording)
+        for value in values + list(self.module.__dict__.values()):
+            recording.track(value)
+        return False
+
+    def store(self, index, output):
+        """
+        Finish the recording of block index after it has appended its simulation to output.
+        """
+        recording = self._recording
+        if recording is None or recording.index != index:
+            return
+        self.abort()
+        if not recording.complete:
+            return
+        recording.output = list(output[recording.output_start :])
+        with self._lock:
+            if index not in self.entries:
+                self.entries[index] = _BlockEntries(self.maxsize)
+            self.entries[index].add(recording)
+
+    def abort(self):
+        stop_tracking()
+        self._recording = None
+
+
+def _block_ranges(script):
+    ranges = {}
+    begins = {}
+    for lno, line in enumerate(script.splitlines(), start=1):
+        match = BLOCK_BEGIN.match(line)
+        if match:
+            begins[int(match.group(1))] = lno
+            continue
+        match = BLOCK_END.match(line)
+        if match and int(match.group(1)) in begins:
+            index = int(match.group(1))
+            ranges[index] = (begins.pop(index), lno)
+    return ranges
+
+
+def _wrap_block(index, statements, output_name):
+    template = (
+        f"if not {CACHE_NAME}.reuse({index}, {output_name}, locals()):\n"
+        f"    try:\n"
+        f"        pass\n"
+        f"    except BaseException:\n"
+        f"        {CACHE_NAME}.abort()\n"
+        f"        raise\n"
+        f"    {CACHE_NAME}.store({index}, {output_name})\n"
+    )
+    node = ast.parse(template).body[0]
+    # the wrapper code gets the line number of the block to keep tracebacks meaningful
+    for ni in ast.walk(node):
+        if hasattr(ni, "lineno"):
+            ni.lineno = ni.end_lineno = statements[0].lineno
+            ni.col_offset = ni.end_col_offset = 0
+    node.body[0].body = statements
+    return node
+
+
+def _uses_output(stmt, output_name):
+    # True if the output list is used in any other way than appending to it
+    appending = {id(ni.value) for ni in ast.walk(stmt) if isinstance(ni, ast.Attribute) and ni.attr == "append"}
+    return any(isinstance(ni, ast.Name) and ni.id == output_name and id(ni) not in appending for ni in ast.walk(stmt))
+
+
+def _transform_sim(func: ast.FunctionDef, ranges):
+    """
+    Wrap the top level statements of the Sim function that belong to a dataset block.
+    Returns the names of script variables used as input of each block or None if the function
+    can't be transformed.
+    """
+    if not func.body or not isinstance(func.body[-1], ast.Return) or not isinstance(func.body[-1].value, ast.Name):
+        return None
+    output_name = func.body[-1].value.id
+    wrappers = {}
+    body = []
+    for stmt in func.body:
+        index = None
+        for i, (begin, end) in ranges.items():
+            if begin < stmt.lineno and stmt.end_lineno < end:
+                index = i
+            elif stmt.lineno < begin < stmt.end_lineno or stmt.lineno < end < stmt.end_lineno:
+                # a statement that reaches outside of the block
+                return None
+        if index is None:
+            body.append(stmt)
+        elif index in wrappers:
+            wrappers[index].body[0].body.append(stmt)
+        else:
+            wrappers[index] = _wrap_block(index, [stmt], output_name)
+            body.append(wrappers[index])
+    blocks = {}
+    for index, node in wrappers.items():
+        names = set()
+        assigned = set()  # variables set within the block before they are used are no inputs
+        for stmt in node.body[0].body:
+            loaded = {ni.id for ni in ast.walk(stmt) if isinstance(ni, ast.Name) and isinstance(ni.ctx, ast.Load)}
+            if not _uses_output(stmt, output_name):
+                # the simulations of earlier blocks are no input if the block only appends to the output
+                loaded.discard(output_name)
+            names |= loaded - assigned
+            if isinstance(stmt, (ast.Assign, ast.AnnAssign)) and stmt.value is not None:
+                targets = stmt.targets if isinstance(stmt, ast.Assign) else [stmt.target]
+                assigned |= {ti.id for ti in targets if isinstance(ti, ast.Name)}
+        blocks[index] = sorted(names)
+    func.body = body
+    return blocks
+
+
+def compile_cached(script, module):
+    """
+    Compile the script with the dataset blocks of its Sim function using a DatasetCache
+    that is placed in the namespace of module. Scripts without dataset blocks are compiled unchanged.
+    """
+    tree = ast.parse(script)
+    ranges = _block_ranges(script)
+    blocks = None
+    if ranges:
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef) and node.name == "Sim":
+                blocks = _transform_sim(node, ranges)
+    if blocks:
+        module.__dict__[CACHE_NAME] = DatasetCache(module, blocks)
+        debug(f"Compiling script with dataset cache for blocks {sorted(blocks.keys())}")
+    return compile(tree, "<string>", "exec")
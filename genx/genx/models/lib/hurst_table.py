@@ -0,0 +1,142 @@
+"""
+Tabulated Fourier transform of the height-height correlation function of self-affine rough
+interfaces used by the off-specular calculations in offspec.
+
+F(x, h) = integral_0^inf exp(-t^(2h)) cos(x t) dt
+
+is tabulated on a grid of the Hurst exponent h and of log(x). Each column of fixed h is only
+calculated when first needed and stored as .npy file in a sub-directory of the numba cache,
+so later sessions and the worker processes of a fit can just load it.
+"""
+
+import os
+import threading
+import warnings
+
+from logging import debug
+
+import numpy as np
+import platformdirs
+
+# directory of the stored columns, defaults to a sub-directory of the numba cache
+hurst_cache_dir = None
+
+
+def _cache_dir():
+    if hurst_cache_dir is not None:
+        return hurst_cache_dir
+    config_path = os.path.abspath(platformdirs.user_data_dir("GenX3", "ArturGlavic"))
+    return os.path.join(os.environ.get("NUMBA_CACHE_DIR", os.path.join(config_path, "numba_cache")), "hurst_table")
+
+
+def integrate_F(x, h):
+    """
+    Calculate F(x, h) for each value of x by numerical integration.
+    """
+    from scipy import integrate
+
+    def f(t):
+        return np.exp(-abs(t) ** (2 * h))
+
+    with warnings.catch_warnings():
+        # the integration of the tails for large x can be inaccurate but F is negligible there
+        warnings.simplefilter("ignore", integrate.IntegrationWarning)
+        return np.array([integrate.quad(f, 0, np.inf, weight="cos", wvar=xi)[0] for xi in x])
+
+
+class HurstTable:
+    """
+    Interpolation table of F(x, h), linear in log(x) and quadratic in h.
+
+    Values of h outside of [h_min, h_max] and of x above x_max are integrated directly.
+    """
+
+    x_min = 0.003  # smaller x are treated as x_min, as in the original calculation
+    x_max = 1000.0
+    points_per_decade = 128
+    h_min = 0.05
+    h_max = 1.0
+    h_step = 0.01
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns = {}
+        decades = np.log10(self.x_max / self.x_min)
+        self.n_x = int(round(decades * self.points_per_decade)) + 1
+        self.log_x = np.linspace(np.log(self.x_min), np.log(self.x_max), self.n_x)
+        self.n_h = int(round((self.h_max - self.h_min) / self.h_step)) + 1
+
+    def _column_file(self, index):
+        name = "F_%i_%i_%g_%g_%03i.npy" % (self.n_x, self.points_per_decade, self.x_min, self.h_step, index)
+        return os.path.join(_cache_dir(), name)
+
+    def h_value(self, index):
+        return self.h_min + index * self.h_step
+
+    def column(self, index):
+        """
+        Return F on the x-grid for the index-th value of h, calculating it if needed.
+        """
+        try:
+            return self._columns[index]
+        except KeyError:
+            pass
+        with self._lock:
+            if index in self._columns:
+                return self._columns[index]
+            fname = self._column_file(index)
+            try:
+                column = np.load(fname, allow_pickle=False)
+                if column.shape != (self.n_x,):
+                    raise ValueError("wrong table size")
+            except (OSError, ValueError):
+                debug("Calculating Hurst table column for h=%g" % self.h_value(index))
+                column = integrate_F(np.exp(self.log_x), self.h_value(index))
+                try:
+                    os.makedirs(os.path.dirname(fname), exist_ok=True)
+                    tmp_file = "%s.%i.tmp.npy" % (fname[:-4], os.getpid())
+                    np.save(tmp_file, column)
+                    os.replace(tmp_file, fname)
+                except OSError:
+                    debug("Could not store Hurst table column in %s" % fname, exc_info=True)
+            self._columns[index] = column
+            return column
+
+    def __call__(self, q, h):
+        """
+        Return F(|q|, h) for an array of q values.
+        """
+        x = np.maximum(abs(np.asarray(q, dtype=np.float64)), self.x_min)
+        if not (self.h_min <= h <= self.h_max):
+            return integrate_F(x, h)
+        # three nodes of h used for the quadratic interpolation
+        pos_h = (h - self.h_min) / self.h_step
+        if abs(pos_h - round(pos_h)) < 1e-9:
+            # h on the grid, only one column is used
+            pos_h = float(round(pos_h))
+        i0 = min(max(int(round(pos_h)) - 1, 0), self.n_h - 3)
+        w = pos_h - i0
+        weights = (0.5 * (w - 1.0) * (w - 2.0), -w * (w - 2.0), 0.5 * w * (w - 1.0))
+
+        output = np.empty_like(x)
+        inside = x <= self.x_max
+        pos_x = (np.log(x[inside]) - self.log_x[0]) / (self.log_x[1] - self.log_x[0])
+        ix = np.minimum(pos_x.astype(int), self.n_x - 2)
+        t = pos_x - ix
+        values = 0.0
+        for k, wk in enumerate(weights):
+            if wk == 0.0:
+                continue
+            column = self.column(i0 + k)
+            values = values + wk * ((1.0 - t) * column[ix] + t * column[ix + 1])
+        output[inside] = values
+        if not inside.all():
+            output[~inside] = integrate_F(x[~inside], h)
+        return output
+
+    def clear(self):
+        with self._lock:
+            self._columns = {}
+
+
+hurst_table = HurstTable()
@@ -17,8 +17,6 @@ except ImportError:
 
 from scipy.special import erf
 
-from genx.core.custom_logging import iprint
-
 rad = pi / 180.0
 sqrt2 = sqrt(2.0)
 
@@ -142,11 +140,8 @@ def get_pol_matrix(p1, p2, F1, F2):
     return P
 
 
-from . import USE_NUMBA
+from . import USE_NUMBA, lazy_numba
 
 if USE_NUMBA:
-    # try to use numba to speed up the calculation intensive functions:
-    try:
-        from .instrument_numba import GaussIntensity, QtoTheta, ResolutionVector, SquareIntensity, TwoThetatoQ
-    except Exception as e:
-        iprint("Could not use numba, no speed up from JIT compiler:\n" + str(e))
+    # use numba to speed up the calculation intensive functions, compiled when first called
+    lazy_numba("instrument_numba", globals(), "GaussIntensity", "QtoTheta", "ResolutionVector", "SquareIntensity", "TwoThetatoQ")
@@ -11,8 +11,6 @@ from os import path
 
 import numpy as np
 
-from scipy import interpolate
-
 from . import scatteringlengths as _sl
 from .parameters import Calc, ComplexArray, Float, HasParameters
 from .physical_constants import r_e, AA_to_eV
@@ -31,15 +29,15 @@ def create_fpdisp_lookup(path):
     that yields a function of dispersive scattering factors f(E) at Q = 0. NOTE energy is in eV
     """
 
+    table = _sl.get_factor_table(path)
+
     def create_dispersion_func(name):
-        e, f1, f2 = np.loadtxt(path + "%s.nff" % name.lower(), skiprows=1, unpack=True)
-        f1interp = interpolate.interp1d(e, f1, kind="linear")
-        f2interp = interpolate.interp1d(e, f2, kind="linear")
+        e, f1, f2 = table.table(name)
         def_wl = _AA_to_eV / np.mean(e)
 
         @MemoizeF
         def f(wl=def_wl, **kwargs):
-            return f1interp(_AA_to_eV / wl) - 1.0j * f2interp(_AA_to_eV / wl)
+            return table.interpolate(name, _AA_to_eV / wl)
 
         return Calc(f)
 
@@ -6,8 +6,6 @@ from functools import reduce
 
 from numpy import array, complex128, cos, exp, float64, hstack, newaxis, rollaxis, sin, sqrt, zeros
 
-from genx.core.custom_logging import iprint
-
 from . import int_lay_xmean
 from . import math_utils as mu
 
@@ -229,11 +227,8 @@ def Refl_int_lay(
         return Ruu, Rdd, Rud, Rdu
 
 
-from . import USE_NUMBA
+from . import USE_NUMBA, lazy_numba
 
 if USE_NUMBA:
-    # try to use numba to speed up the calculation intensive functions:
-    try:
-        from .neutron_numba import Refl
-    except Exception as e:
-        iprint("Could not use numba, no speed up from JIT compiler:\n" + str(e))
+    # use numba to speed up the calculation intensive functions, compiled when first called
+    lazy_numba("neutron_numba", globals(), "Refl")
@@ -1,35 +1,76 @@
+"""
+Configuration of the numba cache used by the compiled kernels of genx.models.lib.
+
+The kernels can be built ahead of time (genx --compile-nb) into a cache directory that is shared by
+all processes using the same NUMBA_CACHE_DIR, e.g. the workers of a fit or all MPI ranks on a node.
+"""
+
+import hashlib
+import json
 import os
+import subprocess
 import sys
+import time
 
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib import import_module
 from logging import debug
+from typing import List, Optional
 
+import numba
 import numba.core.caching as nc
 import platformdirs
 
-from ...version import __version__ as program_version
+from numba.core import event
+from numba.core.dispatcher import Dispatcher
 
 config_path = os.path.abspath(platformdirs.user_data_dir("GenX3", "ArturGlavic"))
 
+# modules of genx.models.lib with numba kernels, all of them are compiled when the module is imported
+KERNEL_MODULES = (
+    "paratt_numba",
+    "neutron_numba",
+    "instrument_numba",
+    "xrmr_numba",
+    "segmentation_numba",
+    "offspec",
+    "surface_scattering",
+)
+
+
+def cache_dir():
+    return os.environ.get("NUMBA_CACHE_DIR", os.path.join(config_path, "numba_cache"))
+
+
+@lru_cache(maxsize=None)
+def _hash_source_file(path, st_mtime, st_size):
+    # the file times are part of the key so a file changed while running is hashed again
+    with open(path, "rb") as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
 
 class _GenxCacheLocator(nc._SourceFileBackedLocatorMixin, nc._CacheLocator):
     """
     A locator that points to the GenX specific numba cache directory.
-    It dempents on the genx version but not the location of the source files.
+    It depends on the content of the source files but not on their location or the genx version,
+    functions compiled without parallel support (set_numba_single) are cached separately.
     """
 
     def __init__(self, py_func, py_file):
         self._py_file = py_file
         self._lineno = py_func.__code__.co_firstlineno
         cache_subpath = self.get_suitable_cache_subpath(py_file)
-        base_dir = os.environ.get("NUMBA_CACHE_DIR", os.path.join(config_path, "numba_cache"))
-        self._cache_path = os.path.join(base_dir, cache_subpath)
+        if getattr(numba, "GENX_OVERWRITE_SINGLE", False):
+            cache_subpath += "_single"
+        self._cache_path = os.path.join(cache_dir(), cache_subpath)
         debug(f"numba cache path for {py_func} from {py_file} is {self._cache_path}")
         debug(f"    source stamp is {self.get_source_stamp()}")
 
     def get_source_stamp(self):
-        # overwrite numba behavior to make sure the actual file times are used and not the executable
+        # overwrite numba behavior to make sure the actual files are used and not the executable
         st = os.stat(self._py_file)
-        return st.st_mtime, st.st_size
+        return _hash_source_file(self._py_file, st.st_mtime, st.st_size)
 
     def get_cache_path(self):
         return self._cache_path
@@ -62,15 +103,121 @@ class _GenxCacheLocator(nc._SourceFileBackedLocatorMixin, nc._CacheLocator):
         # separate caches for source and binary distribution
         # mostly if source is used to test on the same machine
         if getattr(sys, "frozen", False):
-            prefix = "genxsource"
-        else:
             prefix = "genxfrozen"
-        return f'{prefix}_{program_version.replace(".", "_")}_{parentdir}'
+        else:
+            prefix = "genxsource"
+        return f"{prefix}_{parentdir}"
 
 
 def configure_numba():
     if hasattr(nc, "_CacheImpl"):
-        nc._CacheImpl._locator_classes.insert(0, _GenxCacheLocator)
+        locator_classes = nc._CacheImpl._locator_classes
     else:
         # Newer version of numba
-        nc.CacheImpl._locator_classes.insert(0, _GenxCacheLocator)
+        locator_classes = nc.CacheImpl._locator_classes
+    if _GenxCacheLocator not in locator_classes:
+        locator_classes.insert(0, _GenxCacheLocator)
+
+
+def set_numba_single():
+    """
+    Compile the numba functions imported afterwards without parallel support and use one thread only.
+    """
+    if getattr(numba, "GENX_OVERWRITE_SINGLE", False):
+        return
+    debug("Setting numba JIT compilation to single CPU")
+    configure_numba()
+
+    old_jit = numba.jit
+
+    def jit(*args, **opts):
+        opts["parallel"] = False
+        return old_jit(*args, **opts)
+
+    numba.jit = jit
+    numba.GENX_OVERWRITE_SINGLE = True
+    try:
+        numba.set_num_threads(1)
+    except AttributeError:
+        pass
+
+
+@dataclass
+class KernelStatus:
+    module: str
+    name: str
+    signatures: int
+    compile_time: Optional[float] = None  # None if loaded from the cache
+
+    @property
+    def cached(self):
+        return self.compile_time is None
+
+    def __str__(self):
+        if self.cached:
+            state = "loaded from cache"
+        else:
+            state = f"compiled in {self.compile_time:.2f} s"
+        return f"{self.module}.{self.name} [{self.signatures} signature(s)]: {state}"
+
+
+class _CompileTimer(event.Listener):
+    # sums the compile time per dispatcher without the time to compile the functions it calls
+    def __init__(self):
+        self.times = {}
+        self._started = []
+
+    def on_start(self, ev):
+        self._started.append([time.perf_counter(), 0.0])
+
+    def on_end(self, ev):
+        start, nested = self._started.pop()
+        elapsed = time.perf_counter() - start
+        if self._started:
+            self._started[-1][1] += elapsed
+        dispatcher = ev.data["dispatcher"]
+        self.times[dispatcher] = self.times.get(dispatcher, 0.0) + elapsed - nested
+
+
+def build_kernels(modules=KERNEL_MODULES) -> List[KernelStatus]:
+    """
+    Import the kernel modules, which compiles their functions or loads them from the cache, and report
+    the status of each function. Functions of modules imported before are reported as cached.
+    """
+    configure_numba()
+    timer = _CompileTimer()
+    output = []
+    with event.install_listener("numba:compile", timer):
+        for module_name in modules:
+            module = import_module(f"{__package__}.{module_name}")
+            for name, item in vars(module).items():
+                if (
+                    isinstance(item, Dispatcher)
+                    and item.py_func.__module__ == module.__name__
+                    and len(item.signatures) > 0
+                ):
+                    output.append(KernelStatus(module_name, name, len(item.signatures), timer.times.get(item)))
+    return output
+
+
+def _report_kernels(modules, single):
+    # entry point of the process started in check_kernels
+    if single:
+        set_numba_single()
+    print(json.dumps([f"{k.module}.{k.name}" for k in build_kernels(modules) if not k.cached]))
+
+
+def check_kernels(modules=KERNEL_MODULES) -> List[str]:
+    """
+    Import the kernel modules in a new process with the same cache settings, as a worker would, and
+    return the names of the functions that could not be loaded from the cache.
+    """
+    single = getattr(numba, "GENX_OVERWRITE_SINGLE", False)
+    genx_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir())
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [genx_path, env.get("PYTHONPATH")]))
+    code = f"from {__name__} import _report_kernels; _report_kernels({tuple(modules)!r}, {single!r})"
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not import the numba kernels in a new process:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
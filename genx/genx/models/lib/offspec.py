@@ -6,11 +6,11 @@ Rebuild of old C++ extension module.
 
 import numba
 
-from numpy import arcsin, arctan, complex128, conj, cumsum, fabs, float64, inf, real, zeros
-from scipy import integrate
+from numpy import arcsin, arctan, complex128, conj, cumsum, fabs, float64, real, zeros
 from scipy.special import factorial
 
 from .elfield import *
+from .hurst_table import hurst_table
 
 
 @numba.jit(
@@ -224,13 +224,8 @@ def vec_realsymint(F, omega, eta, h, eta_z, qz_n, qz_np, sigma_n, sigma_np, max_
 
 
 def make_F(q, h):
-    def f(x):
-        return exp(-abs(x) ** (2 * h))
-
-    q = q * (abs(q) > 0.003) + 0.003 * (abs(q) < 0.003)
-    I = [integrate.quad(f, 0, inf, weight="cos", wvar=x)[0] for x in q]
-    I = array(I)
-    return I
+    # interpolated from the stored table instead of integrating for each q
+    return hurst_table(q, h)
 
 
 def DWBA_Interdiff(qx, qz, lamda, n, z, sigma, sigmaid, eta, h, eta_z, d=[0], taylor_n=1):
@@ -73,6 +73,14 @@ def ReflQ(Q, lamda, n, d, sigma, return_int=True):
         return r
 
 
+# Parratt's recursion for a whole population of samples
+# Q-2Dvector (pop, points), lamda-1Dvector (pop), n, d, sigma-2Dvector (pop, layers)
+def ReflQ_batch(Q, lamda, n, d, sigma, return_int=True):
+    return array(
+        [ReflQ(Qi, li, ni, di, si, return_int=return_int) for Qi, li, ni, di, si in zip(Q, lamda, n, d, sigma)]
+    )
+
+
 # paratts algorithm for n as function of lamda or theta
 def Refl_nvary2(theta, lamda, n_vector, d, sigma, return_int=True):
     d = d[1:-1]
@@ -213,11 +221,8 @@ def reflq_sra(q, lamda, n, d, sigma, return_int=True):
         return r
 
 
-from . import USE_NUMBA
+from . import USE_NUMBA, lazy_numba
 
 if USE_NUMBA:
-    # try to use numba to speed up the calculation intensive functions:
-    try:
-        from .paratt_numba import Refl, Refl_nvary2, ReflQ
-    except Exception as e:
-        iprint("Could not use numba, no speed up from JIT compiler:\n" + str(e))
+    # use numba to speed up the calculation intensive functions, compiled when first called
+    lazy_numba("paratt_numba", globals(), "Refl", "Refl_nvary2", "ReflQ", "ReflQ_batch")
@@ -174,6 +174,58 @@ def ReflQ(Q, lamda, n, d, sigma, return_int=True):
         return AmpQNB(Q, lamda, n, d, sigma)
 
 
+@numba.jit(
+    numba.complex128[:, :](
+        numba.float64[:, :], numba.float64[:], numba.complex128[:, :], numba.float64[:, :], numba.float64[:, :]
+    ),
+    nopython=True,
+    parallel=True,
+    cache=True,
+)
+def AmpQ_batchNB(Q, lamda, n, d, sigma):
+    population = Q.shape[0]
+    points = Q.shape[1]
+    layers = d.shape[1]
+
+    A = empty(Q.shape, dtype=complex128)
+
+    # flatten population and Q-points to get good load balancing for small populations
+    for idx in numba.prange(population * points):
+        pi_ = idx // points
+        qi = idx % points
+        n0 = n[pi_, -1]
+        Q0 = 4.0 * pi / lamda[pi_]
+
+        Qi = cmath.sqrt((n[pi_, 0] ** 2 - n0**2) * Q0**2 + n0**2 * Q[pi_, qi] ** 2)
+
+        Qj = cmath.sqrt((n[pi_, 1] ** 2 - n0**2) * Q0**2 + n0**2 * Q[pi_, qi] ** 2)
+        # Fresnel reflectivity for the interfaces
+        rpj = (Qj - Qi) / (Qj + Qi) * cmath.exp(-Qj * Qi / 2.0 * sigma[pi_, 0] ** 2)
+        Aj = rpj
+        Qi = Qj
+
+        for lj in range(2, layers):
+            Qj = cmath.sqrt((n[pi_, lj] ** 2 - n0**2) * Q0**2 + n0**2 * Q[pi_, qi] ** 2)
+            # Fresnel reflectivity for the interfaces
+            rpj = (Qj - Qi) / (Qj + Qi) * cmath.exp(-Qj * Qi / 2.0 * sigma[pi_, lj - 1] ** 2)
+
+            pj = cmath.exp(1.0j * d[pi_, lj - 1] * Qi)
+            part = Aj * pj
+            Aj = (rpj + part) / (1.0 + part * rpj)
+
+            Qi = Qj
+        A[pi_, qi] = Aj
+    return A
+
+
+def ReflQ_batch(Q, lamda, n, d, sigma, return_int=True):
+    A = AmpQ_batchNB(Q, lamda, n, d, sigma)
+    if return_int:
+        return abs(A) ** 2
+    else:
+        return A
+
+
 @numba.jit(
     numba.float64[:](numba.float64[:], numba.float64[:], numba.complex128[:, :], numba.float64[:], numba.float64[:]),
     nopython=True,
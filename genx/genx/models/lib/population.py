@@ -0,0 +1,77 @@
+"""
+Helpers for the vectorized evaluation of a whole population of parameter vectors.
+
+When the optimizer evaluates a population in batch mode each fitted parameter is set
+to a PopulationArray holding the values of all population members. Models that
+support this mode detect these arrays and calculate all members within one call,
+models that do not support it should raise a BatchNotSupported exception.
+"""
+
+import numpy as np
+
+from ...exceptions import BatchNotSupported
+
+
+class PopulationArray(np.ndarray):
+    """
+    A 1D array with one value per population member.
+    The subclass marks the array as population axis, arithmetic operations
+    (e.g. within the user script) keep this information.
+    """
+
+    def __new__(cls, values):
+        return np.asarray(values, dtype=np.float64).view(cls)
+
+
+def is_population(value):
+    return isinstance(value, PopulationArray) and value.ndim == 1
+
+
+def population_size(*objects):
+    """
+    Return the number of population members defined by any attribute (or list item within an attribute)
+    of the given objects, e.g. a ModelParamBase or resolved layer parameters.
+    Returns None if no parameter is a PopulationArray.
+    """
+    n_pop = None
+    for obj in objects:
+        values = obj.values() if isinstance(obj, dict) else obj.__dict__.values()
+        for value in values:
+            items = value if isinstance(value, list) else [value]
+            for item in items:
+                if not is_population(item):
+                    continue
+                if n_pop is not None and n_pop != item.shape[0]:
+                    raise BatchNotSupported("inconsistent population sizes")
+                n_pop = item.shape[0]
+    return n_pop
+
+
+def member(obj, index):
+    """
+    Return a shallow copy of a ModelParamBase object where all PopulationArray
+    attributes are replaced by the value of population member index.
+    """
+    output = obj.copy()
+    for key, value in obj.__dict__.items():
+        if is_population(value):
+            setattr(output, key, value.view(np.ndarray)[index])
+    return output
+
+
+def stack(values, n_pop, dtype=np.float64):
+    """
+    Stack a list of per-layer values that can be scalars or PopulationArrays to
+    a (n_pop, n_layers) array.
+    """
+    output = np.empty((n_pop, len(values)), dtype=dtype)
+    for i, value in enumerate(values):
+        output[:, i] = np.asarray(value)
+    return output
+
+
+def column(value):
+    """Prepare a scalar or PopulationArray for broadcasting against (n_pop, n_points) arrays."""
+    if is_population(value):
+        return value.view(np.ndarray)[:, np.newaxis]
+    return value
@@ -0,0 +1,146 @@
+"""
+Bounded cache for expensive intermediate results of the model calculations.
+
+Some calculations, like the spin-flip reflectivity, yield the results for several
+datasets at once (e.g. all polarization channels). The ResultCache stores these
+results with a key calculated as digest of the numerical input (layer parameters,
+Q, wavelength, ...) and keeps the most recently used entries up to a maximum number.
+This allows datasets measured on different Q-grids to each reuse their own result.
+
+The cache is thread safe. Each process uses its own cache, entries inherited by
+forked worker processes stay valid as the keys only depend on the input values.
+"""
+
+import hashlib
+import os
+import threading
+import weakref
+
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from enum import Enum
+
+import numpy as np
+
+# all caches of this process, reset after fork
+_instances = weakref.WeakSet()
+
+
+def _update_digest(hsh, item):
+    if isinstance(item, np.ndarray):
+        hsh.update(b"a" + item.dtype.str.encode() + repr(item.shape).encode())
+        hsh.update(np.ascontiguousarray(item).data)
+    elif isinstance(item, (list, tuple)):
+        hsh.update(b"l%i" % len(item))
+        for subitem in item:
+            _update_digest(hsh, subitem)
+    elif isinstance(item, dict):
+        hsh.update(b"d%i" % len(item))
+        for key in sorted(item.keys()):
+            hsh.update(repr(key).encode())
+            _update_digest(hsh, item[key])
+    elif is_dataclass(item) and not isinstance(item, type):
+        hsh.update(b"c" + type(item).__name__.encode())
+        for fi in fields(item):
+            _update_digest(hsh, getattr(item, fi.name))
+    elif isinstance(item, Enum):
+        hsh.update(b"e" + repr(item.value).encode())
+    else:
+        hsh.update(b"v" + repr(item).encode())
+
+
+def digest(*items) -> bytes:
+    """
+    Return a short digest of arrays, numbers, strings and (nested) lists, dicts or dataclasses of them.
+    """
+    hsh = hashlib.blake2b(digest_size=16)
+    for item in items:
+        _update_digest(hsh, item)
+    return hsh.digest()
+
+
+_array_digests = {}  # id -> (weak reference to the array, digest)
+
+
+def array_digest(*arrays) -> bytes:
+    """
+    Return a digest of input arrays like the hkl values of a dataset. The digest of each array
+    object is only calculated once, so the arrays must not be changed in place after they were used.
+    """
+    output = []
+    for array in arrays:
+        if not isinstance(array, np.ndarray):
+            output.append(digest(np.asarray(array)))
+            continue
+        key = id(array)
+        item = _array_digests.get(key)
+        if item is None or item[0]() is not array:
+            item = (weakref.ref(array, lambda ref, key=key: _array_digests.pop(key, None)), digest(array))
+            _array_digests[key] = item
+        output.append(item[1])
+    return digest(output)
+
+
+class ResultCache:
+    """
+    Least recently used cache with at most maxsize entries that keeps hit/miss statistics.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _instances.add(self)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _after_fork(self):
+        # the lock could have been held by another thread of the parent process
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+def _after_fork():
+    for cache in list(_instances):
+        cache._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+# cache shared by all reflectivity models, the keys start with an identifier of the calculation
+refl_cache = ResultCache()
+# cache for the bulk structure factors of the SXRD models
+bulk_cache = ResultCache(maxsize=128)
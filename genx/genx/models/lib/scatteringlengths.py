@@ -5,12 +5,16 @@ Programmer: Matts Bjorck
 Last changed: 2009-03-19
 """
 
+import glob
+import hashlib
+import os
 import string
+import threading
 
-import numpy as np
+from logging import debug
 
-# Imports needed for the dispersive table implementation
-from scipy import interpolate
+import numpy as np
+import platformdirs
 
 from genx.core.custom_logging import iprint
 
@@ -330,6 +334,183 @@ class ScatteringLength(Database):
         raise LookupError("The element %s does not exist in the database" % name)
 
 
+# ==============================================================================
+# Tabulated anomalous scattering factors
+
+table_cache_dir = os.path.join(platformdirs.user_data_dir("GenX3", "ArturGlavic"), "table_cache")
+
+
+def read_nff_tables(path):
+    """read_nff_tables(path) --> {name: (e, f1, f2)}
+
+    Reads all .nff files (energy in eV, f1, f2) within the directory path.
+    """
+    output = {}
+    for fname in sorted(glob.glob(os.path.join(path, "*.nff"))):
+        name = os.path.basename(fname)[:-4].lower()
+        output[name] = np.loadtxt(fname, skiprows=1, unpack=True)[:3]
+    return output
+
+
+def read_dabax_f1f2_tables(filename):
+    """read_dabax_f1f2_tables(filename) --> {name: (e, f1, f2)}
+
+    Reads a dabax file with f1f2 tables (energy in keV, f1, f2 and 4 more columns).
+    The energies are converted to eV.
+    """
+    output = {}
+    for name, values in read_dabax(filename).items():
+        table = np.array(values).reshape(-1, 7)
+        output[name] = (table[:, 0] * 1e3, table[:, 1], table[:, 2])
+    return output
+
+
+class FactorTable:
+    """Anomalous scattering factors f1 and f2 of all elements within one database.
+
+    The text files of the database are only read on first use, all values are then
+    stored in a single .npz file in table_cache_dir that is loaded in later sessions.
+    The tables of all elements are stored in contiguous arrays, sorted by element
+    and energy, to allow a vectorized interpolation with searchsorted.
+    """
+
+    key_scale = 100.0  # separation of the elements in the search key, has to be larger than the range of log(energy)
+
+    def __init__(self, source, reader):
+        self.source = source
+        self.reader = reader
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _source_files(self):
+        if os.path.isdir(self.source):
+            return sorted(glob.glob(os.path.join(self.source, "*")))
+        return [self.source]
+
+    def _cache_file(self):
+        stamp = hashlib.md5()
+        for fname in self._source_files():
+            st = os.stat(fname)
+            stamp.update(("%s %i %i;" % (os.path.basename(fname), st.st_size, st.st_mtime)).encode())
+        base_name = os.path.basename(os.path.normpath(self.source)).split(".")[0]
+        return os.path.join(table_cache_dir, "%s_%s.npz" % (base_name, stamp.hexdigest()[:16]))
+
+    def _read_source(self):
+        names, energy, f1, f2, starts = [], [], [], [], [0]
+        for name, (ei, f1i, f2i) in sorted(self.reader(self.source).items()):
+            order = np.argsort(ei, kind="stable")
+            names.append(name)
+            energy.append(ei[order])
+            f1.append(f1i[order])
+            f2.append(f2i[order])
+            starts.append(starts[-1] + len(ei))
+        return dict(
+            names=np.array(names),
+            energy=np.concatenate(energy),
+            f1=np.concatenate(f1),
+            f2=np.concatenate(f2),
+            starts=np.array(starts),
+        )
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            cache_file = self._cache_file()
+            try:
+                with np.load(cache_file, allow_pickle=False) as data:
+                    data = dict(data)
+            except (OSError, ValueError):
+                data = self._read_source()
+                try:
+                    os.makedirs(table_cache_dir, exist_ok=True)
+                    tmp_file = "%s.%i.tmp.npz" % (cache_file[:-4], os.getpid())
+                    np.savez(tmp_file, **data)
+                    os.replace(tmp_file, cache_file)
+                except OSError:
+                    debug("Could not store scattering factor table in %s" % cache_file, exc_info=True)
+            self._names = dict((str(name), i) for i, name in enumerate(data["names"]))
+            self.energy = data["energy"]
+            self.f1 = data["f1"]
+            self.f2 = data["f2"]
+            self._starts = data["starts"][:-1]
+            self._stops = data["starts"][1:]
+            element = np.repeat(np.arange(len(self._starts)), self._stops - self._starts)
+            self._key = element * self.key_scale + self.key_scale / 2.0 + np.log(self.energy)
+            self._loaded = True
+
+    def _index(self, names):
+        try:
+            return np.array([self._names[name.lower()] for name in names], dtype=int)
+        except KeyError as e:
+            raise LookupError("The element %s does not exist in the database" % e.args[0])
+
+    def __contains__(self, name):
+        self._load()
+        return name.lower() in self._names
+
+    def table(self, name):
+        """table(self, name) --> e, f1, f2
+
+        Returns the tabulated values of one element.
+        """
+        self._load()
+        i = self._index([name])[0]
+        item = slice(self._starts[i], self._stops[i])
+        return self.energy[item], self.f1[item], self.f2[item]
+
+    def energy_range(self, names):
+        """energy_range(self, names) --> e_min, e_max
+
+        Returns the first and last tabulated energy for each element.
+        """
+        self._load()
+        index = self._index(np.atleast_1d(names))
+        return self.energy[self._starts[index]], self.energy[self._stops[index] - 1]
+
+    def interpolate(self, names, energy):
+        """interpolate(self, names, energy) --> f1 - 1.0J*f2
+
+        Linear interpolation of the scattering factors of one element name or a list of elements
+        at the energy (in eV). The energy can be an array, for a list of elements the result gets
+        an additional leading axis.
+        """
+        self._load()
+        single = isinstance(names, str)
+        index = self._index(np.atleast_1d(names))
+        energy = np.asarray(energy, dtype=np.float64)
+        index, energy = np.broadcast_arrays(index.reshape(index.shape + (1,) * energy.ndim), energy)
+        starts = self._starts[index]
+        stops = self._stops[index]
+        if (energy < self.energy[starts]).any() or (energy > self.energy[stops - 1]).any():
+            raise ValueError("The energy/wavelength is outside the database range")
+        pos = np.searchsorted(self._key, index * self.key_scale + self.key_scale / 2.0 + np.log(energy), side="right")
+        upper = np.clip(pos, starts + 1, stops - 1)
+        lower = upper - 1
+        delta = self.energy[upper] - self.energy[lower]
+        weight = np.where(delta > 0, (energy - self.energy[lower]) / np.where(delta > 0, delta, 1.0), 0.0)
+        f1 = self.f1[lower] + weight * (self.f1[upper] - self.f1[lower])
+        f2 = self.f2[lower] + weight * (self.f2[upper] - self.f2[lower])
+        output = f1 - 1.0j * f2
+        if single:
+            output = output[0]
+        return output
+
+
+_factor_tables = {}
+
+
+def get_factor_table(source, reader=read_nff_tables):
+    """get_factor_table(source, reader) --> FactorTable
+
+    Returns the FactorTable of a database, each database is only loaded once per process.
+    """
+    key = os.path.abspath(source)
+    if key not in _factor_tables:
+        _factor_tables[key] = FactorTable(source, reader)
+    return _factor_tables[key]
+
+
 # ==============================================================================
 # Function to load databases and or values
 
@@ -400,12 +581,25 @@ def load_f0dabax(filename, create_rho=False):
         return f0
 
 
+def _lookup_table_value(table, name, energy):
+    # single value lookup that keeps the range check of the original implementation,
+    # the first and last point of the table can't be used for interpolation
+    e, f1, f2 = table.table(name)
+    if energy >= e[-2] or energy <= e[1]:
+        raise ValueError(
+            "The energy/wavelength is outside the databse"
+            + "range, the energy should be inside [%f,%f] " % (e[1], e[-2])
+        )
+    return table.interpolate(name, energy)[()]
+
+
 def create_fp_lookup(path):
     """create_f_lookup(filename) --> lookup_func(name, wavelength)
 
     Creates a lookup function to lookup element names and returns a function
     that yields dispersive scattering factors at Q = 0. NOTE wavelengths in AA
     """
+    table = get_factor_table(path)
 
     def lookup_func(name, wavelength):
         """lookup_func(name, wavelength) --> fp = f1 - 1.0J*f2
@@ -414,26 +608,8 @@ def create_fp_lookup(path):
         a element (note that the databases does not support ions).
         The data given is the dispersive part + f0 (non dispersive) at Q = 0.
         """
-        e, f1, f2 = np.loadtxt(path + "%s.nff" % name.lower(), skiprows=1, unpack=True)
         energy = 1239.842 / wavelength * 10
-        if energy >= e[-2] or energy <= e[1]:
-            raise ValueError(
-                "The energy/wavelength is outside the databse"
-                + "range, the energy should be inside [%f,%f] " % (e[1], e[-2])
-            )
-        pos1 = np.argmin(abs(e - energy))
-        # Is the energy point to the right or left of the current point
-        # If it is ontop it doesn't matter since the interpolation will be exact at
-        # the endpoints
-        if (e[pos1] - energy) > 0:
-            pos2 = pos1 - 1
-        else:
-            pos2 = pos1 + 1
-        # A quick linear interpolation:
-        f1_e = (energy - e[pos1]) * (f1[pos2] - f1[pos1]) / (e[pos2] - e[pos1]) + f1[pos1]
-        f2_e = (energy - e[pos1]) * (f2[pos2] - f2[pos1]) / (e[pos2] - e[pos1]) + f2[pos1]
-
-        return f1_e - 1.0j * f2_e
+        return _lookup_table_value(table, name, energy)
 
     return lookup_func
 
@@ -490,13 +666,13 @@ def create_fpdisp_lookup(path):
     that yields a function of dispersive scattering factors f(E) at Q = 0. NOTE energy is in eV
     """
 
+    table = get_factor_table(path)
+
     def create_dispersion_func(name):
-        e, f1, f2 = np.loadtxt(path + "%s.nff" % name.lower(), skiprows=1, unpack=True)
-        f1interp = interpolate.interp1d(e, f1, kind="linear")
-        f2interp = interpolate.interp1d(e, f2, kind="linear")
+        e, f1, f2 = table.table(name)
 
         def f(energy):
-            return f1interp(energy) - 1.0j * f2interp(energy)
+            return table.interpolate(name, energy)
 
         return refl.ReflFunction(f, (np.mean(e),), {}, id="f(E)")
 
@@ -617,36 +793,14 @@ def load_bdabax(filename):
 def load_fdabax(filename):
     """loads a dabax file with the scattering length tables returns a lookup
     function so that the wavelength can be changed."""
-    table = read_dabax(filename)
+    table = get_factor_table(filename, read_dabax_f1f2_tables)
 
     def lookup_func(name, wavelength):
         """Looks up the total form factor at Q = 0
         f = f1 + 1.0J*f2 of element name.
         """
-        el = np.array(table[name])
-        el = el.reshape(len(el) / 7, 7)
-        e = el[:, 0]
-        f1 = el[:, 1]
-        f2 = el[:, 2]
-        energy = 1239.842 / wavelength * 10 / 1e3  # keV
-        if energy >= e[-2] or energy <= e[1]:
-            raise ValueError(
-                "The energy/wavelength is outside the databse"
-                + "range, the energy should be inside [%f,%f] " % (e[1], e[-2])
-            )
-        pos1 = np.argmin(abs(e - energy))
-        # Is the energy point to the right or left of the current point
-        # If it is ontop it doesn't matter since the interpolation will be exact at
-        # the endpoints
-        if (e[pos1] - energy) > 0:
-            pos2 = pos1 - 1
-        else:
-            pos2 = pos1 + 1
-        # A quick linear interpolation:
-        f1_e = (energy - e[pos1]) * (f1[pos2] - f1[pos1]) / (e[pos2] - e[pos1]) + f1[pos1]
-        f2_e = (energy - e[pos1]) * (f2[pos2] - f2[pos1]) / (e[pos2] - e[pos1]) + f2[pos1]
-
-        return f1_e - 1.0j * f2_e
+        energy = 1239.842 / wavelength * 10
+        return _lookup_table_value(table, name, energy)
 
     return lookup_func
 
@@ -0,0 +1,92 @@
+"""
+SLD profiles and adaptive layer segmentation used by the spec_adaptive model.
+
+A profile is the sum of the interface transition functions of all interfaces weighted with the
+SLD step at each interface. The profile is then split into segments such that the variation
+of the SLD within each segment stays below a given threshold.
+
+The functions in this module evaluate the full (z, interface) matrix and search each segment
+boundary on the whole remaining profile. If numba is available they are replaced by the compiled
+versions in segmentation_numba, that evaluate each interface only close to its position and find
+all segment boundaries in one pass with identical results.
+"""
+
+from numpy import abs, add, asarray, complex128, diff, exp, logical_not, maximum, minimum, newaxis, sqrt, where
+from scipy.special import erf
+
+
+def transition_functions(z, int_pos, sigma, rough_type):
+    """
+    Transition functions of the interfaces at int_pos on the grid z, starting at 1 below
+    and going to 0 above each interface. The result has the shape (len(z), len(int_pos)).
+    """
+    # Gaussian (starts at 1 goes to 0, interface is at 0.5)
+    trans = (0.5 - 0.5 * erf((z[:, newaxis] - int_pos) / sqrt(2.0) / sigma)) * (rough_type == 0)
+    # Linear
+    trans += maximum(0.0, minimum(1.0, (1.0 + (int_pos - z[:, newaxis]) / 2.0 / sigma) / 2.0)) * (rough_type == 1)
+    # Exponential decrease or increase
+    trans += maximum(0.0, minimum(1.0, exp((int_pos - z[:, newaxis]) / sigma))) * (rough_type == 2)
+    trans += maximum(0.0, minimum(1.0, 1.0 - exp((z[:, newaxis] - int_pos) / sigma))) * (rough_type == 3)
+    return trans
+
+
+def interface_profiles(z, int_pos, sigma, rough_type, delta_pos, sigma_pos, crop, delta):
+    """
+    Calculate the profiles sum_k(delta[:, k]*trans_k(z)) for each row of the SLD steps delta.
+
+    With crop the transition functions are faded out at the split locations int_pos[1:]-delta_pos
+    within the layers with a width sigma_pos.
+    """
+    trans = transition_functions(z, int_pos, sigma, rough_type)
+    if crop:
+        # the fade out function applied to the interface from below and above located within a layer
+        interface = 0.5 - 0.5 * erf((z[:, newaxis] - int_pos[1:] + delta_pos) * sqrt(2.0) / sigma_pos)
+        trans[:, 0] = trans[:, 0] * interface[:, 0]
+        trans[:, 1:-1] = interface[:, :-1] + (1.0 - interface[:, :-1]) * trans[:, 1:-1] * interface[:, 1:]
+        trans[:, -1] = interface[:, -1] + (1.0 - interface[:, -1]) * trans[:, -1]
+    return asarray([(delta_i * trans).sum(axis=1) for delta_i in asarray(delta, dtype=complex128)])
+
+
+def next_segment(i, rho_x_r, rho_n_p, rho_n_m, rho_m_sf, max_diff_n, max_diff_x):
+    """
+    Index of the end of the segment starting at index i.
+    """
+    # calculate the maximum variation of SLD up to given index
+    diff_x = abs(maximum.accumulate(rho_x_r[i + 1 :]) - minimum.accumulate(rho_x_r[i + 1 :]))
+    diff_n_p = abs(maximum.accumulate(rho_n_p[i + 1 :]) - minimum.accumulate(rho_n_p[i + 1 :]))
+    diff_n_m = abs(maximum.accumulate(rho_n_m[i + 1 :]) - minimum.accumulate(rho_n_m[i + 1 :]))
+    diff_m_sf = abs(maximum.accumulate(rho_m_sf[i + 1 :]) - minimum.accumulate(rho_m_sf[i + 1 :]))
+    diff_idx = where(
+        logical_not(
+            (diff_n_p < max_diff_n) & (diff_x < max_diff_x) & (diff_n_m < max_diff_n) & (diff_m_sf < max_diff_n)
+        )
+    )[0]
+    if len(diff_idx) > 0:
+        j = min(len(rho_x_r) - 1, max(i + diff_idx[0] + 1, i + 5))
+    else:
+        j = len(rho_x_r) - 1  # last position
+    return j
+
+
+def segment_bounds(rho_x_r, rho_n_p, rho_n_m, rho_m_sf, max_diff_n, max_diff_x):
+    """
+    Indices of the segment boundaries, starting with 0 and ending with the last index of the profiles.
+    """
+    bounds = [0]
+    while bounds[-1] < (len(rho_x_r) - 1):
+        bounds.append(next_segment(bounds[-1], rho_x_r, rho_n_p, rho_n_m, rho_m_sf, max_diff_n, max_diff_x))
+    return asarray(bounds)
+
+
+def segment_means(values, bounds):
+    """
+    Average of the values within each segment [bounds[i], bounds[i+1]).
+    """
+    return add.reduceat(values[: bounds[-1]], bounds[:-1]) / diff(bounds)
+
+
+from . import USE_NUMBA, lazy_numba
+
+if USE_NUMBA:
+    # use numba to speed up the calculation intensive functions, compiled when first called
+    lazy_numba("segmentation_numba", globals(), "interface_profiles", "segment_bounds")
@@ -0,0 +1,163 @@
+"""
+Compiled versions of the SLD profile and segmentation functions in segmentation.
+
+Each transition function is exactly 1 below and exactly 0 above a window around its interface,
+so it is only evaluated within that window and the constant part below is added separately.
+The segment boundaries are found in one forward pass over the profiles.
+"""
+
+import math
+
+import numba
+
+from numpy import argsort, complex128, empty, int64, searchsorted, zeros
+
+sqrt2 = math.sqrt(2.0)
+# Distance from an interface in units of its roughness below and above which the transition function of each
+# rough_type is exactly 1 or 0 in double precision: erf(x)=1 for x>5.93 (gaussian with x=dz/sqrt(2)/sigma),
+# linear within 2 sigma, 1-exp(-x)=1 for x>37.5 and exp(-x)=0 for x>745.2.
+WINDOW_BELOW = (9.0, 2.5, 1.0, 40.0)
+WINDOW_ABOVE = (9.0, 2.5, 746.0, 1.0)
+# same for the erf fade out of the cropped transitions with x=dz*sqrt(2)/sigma_pos
+WINDOW_CROP = 9.0
+
+
+@numba.njit(cache=True, error_model="numpy")
+def transition(z, pos, sigma, rough_type):
+    if rough_type == 0:
+        return 0.5 - 0.5 * math.erf((z - pos) / sqrt2 / sigma)
+    elif rough_type == 1:
+        return max(0.0, min(1.0, (1.0 + (pos - z) / 2.0 / sigma) / 2.0))
+    elif rough_type == 2:
+        return max(0.0, min(1.0, math.exp((pos - z) / sigma)))
+    else:
+        return max(0.0, min(1.0, 1.0 - math.exp((z - pos) / sigma)))
+
+
+@numba.njit(cache=True, error_model="numpy")
+def fade_out(z, k, int_pos, delta_pos, sigma_pos):
+    return 0.5 - 0.5 * math.erf((z - int_pos[k + 1] + delta_pos[k]) * sqrt2 / sigma_pos[k])
+
+
+@numba.njit(cache=True, error_model="numpy")
+def column(z, k, int_pos, sigma, rough_type, delta_pos, sigma_pos, crop):
+    trans = transition(z, int_pos[k], sigma[k], rough_type[k])
+    if not crop:
+        return trans
+    last = int_pos.shape[0] - 1
+    if k == 0:
+        return trans * fade_out(z, 0, int_pos, delta_pos, sigma_pos)
+    below = fade_out(z, k - 1, int_pos, delta_pos, sigma_pos)
+    if k == last:
+        return below + (1.0 - below) * trans
+    return below + (1.0 - below) * trans * fade_out(z, k, int_pos, delta_pos, sigma_pos)
+
+
+@numba.njit(cache=True, error_model="numpy")
+def column_window(k, int_pos, sigma, rough_type, delta_pos, sigma_pos, crop):
+    below = WINDOW_BELOW[rough_type[k]]
+    above = WINDOW_ABOVE[rough_type[k]]
+    z_min = int_pos[k] - below * sigma[k]
+    z_max = int_pos[k] + above * sigma[k]
+    if crop:
+        for ki in (k - 1, k):
+            if 0 <= ki < int_pos.shape[0] - 1:
+                split = int_pos[ki + 1] - delta_pos[ki]
+                z_min = min(z_min, split - WINDOW_CROP * sigma_pos[ki])
+                z_max = max(z_max, split + WINDOW_CROP * sigma_pos[ki])
+    return z_min, z_max
+
+
+@numba.njit(
+    numba.complex128[:, ::1](
+        numba.float64[:],
+        numba.float64[:],
+        numba.float64[:],
+        numba.int64[:],
+        numba.float64[:],
+        numba.float64[:],
+        numba.boolean,
+        numba.complex128[:, :],
+    ),
+    cache=True,
+    error_model="numpy",
+)
+def interface_profiles(z, int_pos, sigma, rough_type, delta_pos, sigma_pos, crop, delta):
+    """
+    Calculate the profiles sum_k(delta[:, k]*trans_k(z)) for each row of the SLD steps delta.
+    """
+    n_values, n_int = delta.shape
+    n_z = z.shape[0]
+    profiles = zeros((n_values, n_z), dtype=complex128)
+    starts = empty(n_int, dtype=int64)
+    for k in range(n_int):
+        z_min, z_max = column_window(k, int_pos, sigma, rough_type, delta_pos, sigma_pos, crop)
+        starts[k] = searchsorted(z, z_min)
+        end = searchsorted(z, z_max, side="right")
+        for zi in range(starts[k], end):
+            trans = column(z[zi], k, int_pos, sigma, rough_type, delta_pos, sigma_pos, crop)
+            for vi in range(n_values):
+                profiles[vi, zi] += delta[vi, k] * trans
+    # add the transitions below their windows from the top down, so the profile above all windows stays exactly 0
+    order = argsort(starts)[::-1]
+    below = zeros(n_values, dtype=complex128)
+    ki = 0
+    for zi in range(n_z - 1, -1, -1):
+        while ki < n_int and starts[order[ki]] > zi:
+            for vi in range(n_values):
+                below[vi] += delta[vi, order[ki]]
+            ki += 1
+        for vi in range(n_values):
+            profiles[vi, zi] += below[vi]
+    return profiles
+
+
+@numba.njit(cache=True)
+def _extend(value, lower, upper):
+    # running minimum and maximum propagating NaN like numpy.minimum/maximum
+    if math.isnan(value) or math.isnan(lower):
+        return math.nan, math.nan
+    return min(lower, value), max(upper, value)
+
+
+@numba.njit(
+    numba.int64[::1](
+        numba.float64[:], numba.float64[:], numba.float64[:], numba.float64[:], numba.float64, numba.float64
+    ),
+    cache=True,
+)
+def segment_bounds(rho_x_r, rho_n_p, rho_n_m, rho_m_sf, max_diff_n, max_diff_x):
+    """
+    Indices of the segment boundaries, starting with 0 and ending with the last index of the profiles.
+    """
+    n_z = rho_x_r.shape[0]
+    bounds = empty(n_z, dtype=int64)
+    bounds[0] = 0
+    n_bounds = 1
+    i = 0
+    while i < (n_z - 1):
+        # variation of the SLDs from index i+1 up to index j
+        j = i + 1
+        x_min = x_max = rho_x_r[j]
+        n_p_min = n_p_max = rho_n_p[j]
+        n_m_min = n_m_max = rho_n_m[j]
+        m_sf_min = m_sf_max = rho_m_sf[j]
+        while j < n_z:
+            x_min, x_max = _extend(rho_x_r[j], x_min, x_max)
+            n_p_min, n_p_max = _extend(rho_n_p[j], n_p_min, n_p_max)
+            n_m_min, n_m_max = _extend(rho_n_m[j], n_m_min, n_m_max)
+            m_sf_min, m_sf_max = _extend(rho_m_sf[j], m_sf_min, m_sf_max)
+            if not (
+                abs(n_p_max - n_p_min) < max_diff_n
+                and abs(x_max - x_min) < max_diff_x
+                and abs(n_m_max - n_m_min) < max_diff_n
+                and abs(m_sf_max - m_sf_min) < max_diff_n
+            ):
+                break
+            j += 1
+        # segments have a minimum of 5 points
+        j = min(n_z - 1, max(j, i + 5))
+        bounds[n_bounds] = j
+        n_bounds += 1
+        i = j
+    return bounds[:n_bounds]
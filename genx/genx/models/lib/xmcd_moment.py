@@ -177,7 +177,7 @@ from dataclasses import dataclass, field
 
 import numpy as np
 
-from scipy import integrate, special
+from scipy import special
 
 from genx.core.custom_logging import iprint
 
@@ -1131,6 +1131,8 @@ def kk_int(e, f2, Z=0, e_min=None, e_max=None):
         X-ray data booklet, CXRO, Lawrence Berkley National Laboratory, Downloaded from http://xdb.lbl.gov 20140902.
 
     """
+    from scipy import integrate
+
     ekk = e
     if e_min is not None:
         min_val = np.argmin(np.abs(e_min - ekk))
@@ -1156,6 +1158,7 @@ def kk_int(e, f2, Z=0, e_min=None, e_max=None):
 
 def kk_int_old(e_new, e, f2, Z, offset=1e-1, offset_outer=1, e_step=0.1):
     """Original Kramer-Kronig transform - a slower implementation of kk_int"""
+    from scipy import integrate
 
     def create_int_func(e, f2, epoint):
         def integ(e_val):
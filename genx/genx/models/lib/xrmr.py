@@ -78,6 +78,28 @@ def calc_refl_int_lay(
         g_0, lamda, chi0, A, B * scale, C * scale**2, M, dd_u, mag_limit=mag_limit, mpy_limit=mpy_limit
     )
 
+    return do_calc_int_lay(
+        g_0,
+        lamda,
+        (chi_b, non_mag_b, mpy_b),
+        (chi_l, non_mag_l, mpy_l),
+        (chi_u, non_mag_u, mpy_u),
+        d,
+        sigma,
+        sigma_l,
+        sigma_u,
+        dd_l,
+        dd_u,
+    )
+
+
+def do_calc_int_lay(g_0, lamda, chi_b, chi_l, chi_u, d, sigma, sigma_l, sigma_u, dd_l, dd_u):
+    """Form the multilayer reflectivity matrix, W, including magnetic interface layers.
+    chi_b, chi_l and chi_u are the (chi, non_mag, mpy) tuples of the layers, the lower and the upper interface layers.
+    """
+    chi_b, non_mag_b, mpy_b = chi_b
+    chi_l, non_mag_l, mpy_l = chi_l
+    chi_u, non_mag_u, mpy_u = chi_u
     d = d - dd_l - dd_u
 
     # Setting up g0 to be the last index
@@ -406,6 +428,12 @@ def calc_nonres(g_0, lamda, chi0, d):
     return Mrt
 
 
+from . import USE_NUMBA, lazy_numba
+
+if USE_NUMBA:
+    # use numba to speed up the calculation intensive functions, compiled when first called
+    lazy_numba("xrmr_numba", globals(), "do_calc", "do_calc_int_lay")
+
 if __name__ == "__main__":
     import time
 
@@ -0,0 +1,513 @@
+"""
+Numba implementation of the recursion matrix calculation in xrmr.
+
+The pure python version builds (4, 4, layers, points) arrays for each step of the
+calculation. Here each point is calculated independently in parallel, looping over
+the layers with 4x4 and 2x2 matrices that are allocated once per point.
+The functions do_calc and do_calc_int_lay replace the ones in xrmr and take the same arguments.
+"""
+
+import cmath
+
+import numba
+import numpy as np
+
+from numpy import complex128, empty, float64
+
+
+@numba.njit(cache=True)
+def _dot4(A, B, D):
+    for i in range(4):
+        for j in range(4):
+            D[i, j] = A[i, 0] * B[0, j] + A[i, 1] * B[1, j] + A[i, 2] * B[2, j] + A[i, 3] * B[3, j]
+
+
+@numba.njit(cache=True)
+def _inv4(A, D):
+    # inverse by the adjugate matrix calculated from 2x2 sub-determinants
+    s0 = A[0, 0] * A[1, 1] - A[1, 0] * A[0, 1]
+    s1 = A[0, 0] * A[1, 2] - A[1, 0] * A[0, 2]
+    s2 = A[0, 0] * A[1, 3] - A[1, 0] * A[0, 3]
+    s3 = A[0, 1] * A[1, 2] - A[1, 1] * A[0, 2]
+    s4 = A[0, 1] * A[1, 3] - A[1, 1] * A[0, 3]
+    s5 = A[0, 2] * A[1, 3] - A[1, 2] * A[0, 3]
+
+    c5 = A[2, 2] * A[3, 3] - A[3, 2] * A[2, 3]
+    c4 = A[2, 1] * A[3, 3] - A[3, 1] * A[2, 3]
+    c3 = A[2, 1] * A[3, 2] - A[3, 1] * A[2, 2]
+    c2 = A[2, 0] * A[3, 3] - A[3, 0] * A[2, 3]
+    c1 = A[2, 0] * A[3, 2] - A[3, 0] * A[2, 2]
+    c0 = A[2, 0] * A[3, 1] - A[3, 0] * A[2, 1]
+
+    invdet = 1.0 / (s0 * c5 - s1 * c4 + s2 * c3 + s3 * c2 - s4 * c1 + s5 * c0)
+
+    D[0, 0] = (A[1, 1] * c5 - A[1, 2] * c4 + A[1, 3] * c3) * invdet
+    D[0, 1] = (-A[0, 1] * c5 + A[0, 2] * c4 - A[0, 3] * c3) * invdet
+    D[0, 2] = (A[3, 1] * s5 - A[3, 2] * s4 + A[3, 3] * s3) * invdet
+    D[0, 3] = (-A[2, 1] * s5 + A[2, 2] * s4 - A[2, 3] * s3) * invdet
+
+    D[1, 0] = (-A[1, 0] * c5 + A[1, 2] * c2 - A[1, 3] * c1) * invdet
+    D[1, 1] = (A[0, 0] * c5 - A[0, 2] * c2 + A[0, 3] * c1) * invdet
+    D[1, 2] = (-A[3, 0] * s5 + A[3, 2] * s2 - A[3, 3] * s1) * invdet
+    D[1, 3] = (A[2, 0] * s5 - A[2, 2] * s2 + A[2, 3] * s1) * invdet
+
+    D[2, 0] = (A[1, 0] * c4 - A[1, 1] * c2 + A[1, 3] * c0) * invdet
+    D[2, 1] = (-A[0, 0] * c4 + A[0, 1] * c2 - A[0, 3] * c0) * invdet
+    D[2, 2] = (A[3, 0] * s4 - A[3, 1] * s2 + A[3, 3] * s0) * invdet
+    D[2, 3] = (-A[2, 0] * s4 + A[2, 1] * s2 - A[2, 3] * s0) * invdet
+
+    D[3, 0] = (-A[1, 0] * c3 + A[1, 1] * c1 - A[1, 2] * c0) * invdet
+    D[3, 1] = (A[0, 0] * c3 - A[0, 1] * c1 + A[0, 2] * c0) * invdet
+    D[3, 2] = (-A[3, 0] * s3 + A[3, 1] * s1 - A[3, 2] * s0) * invdet
+    D[3, 3] = (A[2, 0] * s3 - A[2, 1] * s1 + A[2, 2] * s0) * invdet
+
+
+@numba.njit(cache=True)
+def _dot2(A, B, D):
+    D[0, 0] = A[0, 0] * B[0, 0] + A[0, 1] * B[1, 0]
+    D[0, 1] = A[0, 0] * B[0, 1] + A[0, 1] * B[1, 1]
+    D[1, 0] = A[1, 0] * B[0, 0] + A[1, 1] * B[1, 0]
+    D[1, 1] = A[1, 0] * B[0, 1] + A[1, 1] * B[1, 1]
+
+
+@numba.njit(cache=True)
+def _inv2(A, D):
+    invdet = 1.0 / (A[0, 0] * A[1, 1] - A[0, 1] * A[1, 0])
+    a00 = A[0, 0]
+    D[0, 0] = A[1, 1] * invdet
+    D[0, 1] = -A[0, 1] * invdet
+    D[1, 0] = -A[1, 0] * invdet
+    D[1, 1] = a00 * invdet
+
+
+@numba.njit(cache=True)
+def _roots4thdegree(a, b, c, d, e, x):
+    # Ferrari's solution as in math_utils.roots4thdegree, with the polynomial normalized by a
+    inv_a = 1.0 / a
+    b = b * inv_a
+    c = c * inv_a
+    d = d * inv_a
+    e = e * inv_a
+    b2 = b * b
+    alpha = -0.375 * b2 + c
+    beta = 0.125 * b2 * b - 0.5 * b * c + d
+    gamma = -3.0 / 256.0 * b2 * b2 + 0.0625 * c * b2 - 0.25 * b * d + e
+    p = -(alpha * alpha) / 12.0 - gamma
+    q = -(alpha * alpha * alpha) / 108.0 + alpha * gamma / 3.0 - 0.125 * beta * beta
+    r = -0.5 * q + cmath.sqrt(0.25 * q * q + p * p * p / 27.0)
+    u = r ** (1.0 / 3.0)
+    if u != 0:
+        y = -5.0 / 6.0 * alpha + u - p / (3.0 * u)
+    else:
+        y = -5.0 / 6.0 + u - q ** (1.0 / 3.0)
+    x0 = -0.25 * b
+    if beta != 0:
+        w = cmath.sqrt(alpha + 2 * y)
+        bw = 2 * beta / w
+        s1 = cmath.sqrt(-(3 * alpha + 2 * y + bw))
+        s2 = cmath.sqrt(-(3 * alpha + 2 * y - bw))
+        x[0] = x0 + 0.5 * (w - s1)
+        x[1] = x0 + 0.5 * (w + s1)
+        x[2] = x0 + 0.5 * (-w - s2)
+        x[3] = x0 + 0.5 * (-w + s2)
+    else:
+        s0 = cmath.sqrt(alpha * alpha - 4 * gamma)
+        s1 = cmath.sqrt(0.5 * (-alpha + s0))
+        s2 = cmath.sqrt(0.5 * (-alpha - s0))
+        x[0] = x0 + s1
+        x[1] = x0 + s2
+        x[2] = x0 - s1
+        x[3] = x0 - s2
+
+
+@numba.njit(cache=True)
+def _calc_u_S(chi, li, pi, g_0, non_mag, mpy, u, S):
+    """Calculate u and S of layer li at point pi as xrmr.calc_u_S"""
+    chi_xx = chi[0, 0, li, pi]
+    chi_xy = chi[0, 1, li, pi]
+    chi_xz = chi[0, 2, li, pi]
+    chi_yx = chi[1, 0, li, pi]
+    chi_yy = chi[1, 1, li, pi]
+    chi_yz = chi[1, 2, li, pi]
+    chi_zx = chi[2, 0, li, pi]
+    chi_zy = chi[2, 1, li, pi]
+    chi_zz = chi[2, 2, li, pi]
+    g2 = g_0**2
+    n_x = cmath.sqrt(1.0 - g2)
+    S[:, :] = 0.0
+
+    if mpy:
+        # the matrix singularity arising when M||Y
+        delta = chi_xz**2 * (1 + chi_xx)
+        u[0] = cmath.sqrt(g2 + chi_yy)
+        u[1] = cmath.sqrt(g2 + chi_zz)
+        u[2] = -u[0]
+        u[3] = -u[1]
+        S[0, 0] = 1.0
+        S[0, 2] = 1.0
+        S[1, 1] = -(u[1] * chi_xz + n_x * (1 + chi_xx)) / (n_x**2 - delta)
+        S[1, 3] = -(u[3] * chi_xz + n_x * (1 + chi_xx)) / (n_x**2 - delta)
+        S[2, 0] = u[0]
+        S[2, 2] = u[2]
+        S[3, 1] = -(u[1] * n_x + chi_xz) / (n_x**2 - delta)
+        S[3, 3] = -(u[3] * n_x + chi_xz) / (n_x**2 - delta)
+    elif non_mag:
+        nm_u1 = cmath.sqrt(g2 + chi_xx)
+        sqr_eps = cmath.sqrt(1 + chi_xx)
+        u[0] = nm_u1
+        u[1] = nm_u1
+        u[2] = -nm_u1
+        u[3] = -nm_u1
+        S[0, 0] = 1.0
+        S[0, 2] = 1.0
+        S[1, 1] = sqr_eps
+        S[1, 3] = sqr_eps
+        S[2, 0] = nm_u1
+        S[2, 2] = -nm_u1
+        S[3, 1] = nm_u1 / sqr_eps
+        S[3, 3] = -nm_u1 / sqr_eps
+    elif li == 0:
+        # the ambient layer
+        u[0] = g_0
+        u[1] = g_0
+        u[2] = -g_0
+        u[3] = -g_0
+        S[0, 0] = 1.0
+        S[0, 2] = 1.0
+        S[1, 1] = 1.0
+        S[1, 3] = 1.0
+        S[2, 0] = g_0
+        S[2, 2] = -g_0
+        S[3, 1] = g_0
+        S[3, 3] = -g_0
+    else:
+        q1 = 1 + chi_zz
+        q2 = n_x * (chi_xz + chi_zx)
+        q3 = chi_xz * chi_zx + chi_yz * chi_zy - (1 + chi_zz) * (g2 + chi_yy) - (1 + chi_xx) * (g2 + chi_zz)
+        q4 = n_x * (chi_xy * chi_yz + chi_yx * chi_zy - (chi_xz + chi_zx) * (g2 + chi_yy))
+        q5 = (
+            (1 + chi_xx) * ((g2 + chi_yy) * (g2 + chi_zz) - chi_yz * chi_zy)
+            - chi_xy * chi_yx * (g2 + chi_zz)
+            - chi_xz * chi_zx * (g2 + chi_yy)
+            + chi_xy * chi_zx * chi_yz
+            + chi_yx * chi_xz * chi_zy
+        )
+        _roots4thdegree(q1, q2, q3, q4, q5, u)
+        # sort the roots in descending order of the imaginary part, as the reversed argsort in xrmr
+        for i in range(1, 4):
+            ui = u[i]
+            j = i - 1
+            while j >= 0 and u[j].imag <= ui.imag:
+                u[j + 1] = u[j]
+                j -= 1
+            u[j + 1] = ui
+        for i in range(4):
+            inv_D = 1.0 / ((chi_xz + u[i] * n_x) * (chi_zx + u[i] * n_x) - (1.0 - u[i] ** 2 + chi_xx) * (g2 + chi_zz))
+            P_x = (chi_xy * (g2 + chi_zz) - chi_zy * (chi_xz + u[i] * n_x)) * inv_D
+            P_z = (chi_zy * (1.0 - u[i] ** 2 + chi_xx) - chi_xy * (chi_zx + u[i] * n_x)) * inv_D
+            S[0, i] = 1.0
+            S[1, i] = u[i] * P_x - n_x * P_z
+            S[2, i] = u[i]
+            S[3, i] = P_x
+
+
+@numba.njit(cache=True)
+def _recursion_step(X, u, kappa, d, W, M, T):
+    """Add the interface with matrix X and the following layer with roots u and thickness d to the
+    recursion matrices W = (Wtt, Wtr, Wrt, Wrr), M and T are used as work space."""
+    Mtt, Mtr, Mrt, Mrr = M[0], M[1], M[2], M[3]
+    Wtt, Wtr, Wrt, Wrr = W[0], W[1], W[2], W[3]
+    T0, T1, T2 = T[0], T[1], T[2]
+    # inverse of the diagonal elements of Fp
+    fp0 = cmath.exp(1.0j * u[0] * kappa * d)
+    fp1 = cmath.exp(1.0j * u[1] * kappa * d)
+    fm0 = cmath.exp(-1.0j * u[2] * kappa * d)
+    fm1 = cmath.exp(-1.0j * u[3] * kappa * d)
+
+    # Mtt = Fp^-1 Xtt^-1, Mtr = -Mtt Xtr Fm, Mrt = Xrt Xtt^-1, Mrr = (Xrr - Mrt Xtr) Fm
+    _inv2(X[:2, :2], T0)
+    Mtt[0, 0] = T0[0, 0] * fp0
+    Mtt[0, 1] = T0[0, 1] * fp0
+    Mtt[1, 0] = T0[1, 0] * fp1
+    Mtt[1, 1] = T0[1, 1] * fp1
+    _dot2(X[2:, :2], T0, Mrt)
+    _dot2(Mtt, X[:2, 2:], T1)
+    _dot2(Mrt, X[:2, 2:], T2)
+    for i in range(2):
+        Mtr[i, 0] = -T1[i, 0] * fm0
+        Mtr[i, 1] = -T1[i, 1] * fm1
+        Mrr[i, 0] = (X[2 + i, 2] - T2[i, 0]) * fm0
+        Mrr[i, 1] = (X[2 + i, 3] - T2[i, 1]) * fm1
+
+    # A = Mtt (1 - Wtr Mrt)^-1, B = Wrr (1 - Mrt Wtr)^-1
+    _dot2(Wtr, Mrt, T0)
+    T0[0, 0] = 1.0 - T0[0, 0]
+    T0[0, 1] = -T0[0, 1]
+    T0[1, 0] = -T0[1, 0]
+    T0[1, 1] = 1.0 - T0[1, 1]
+    _inv2(T0, T1)
+    A = T[3]
+    _dot2(Mtt, T1, A)
+    _dot2(Mrt, Wtr, T0)
+    T0[0, 0] = 1.0 - T0[0, 0]
+    T0[0, 1] = -T0[0, 1]
+    T0[1, 0] = -T0[1, 0]
+    T0[1, 1] = 1.0 - T0[1, 1]
+    _inv2(T0, T1)
+    B = T[4]
+    _dot2(Wrr, T1, B)
+
+    # Wtr = Mtr + A Wtr Mrr
+    _dot2(A, Wtr, T0)
+    _dot2(T0, Mrr, T1)
+    for i in range(2):
+        for j in range(2):
+            Wtr[i, j] = Mtr[i, j] + T1[i, j]
+    # Wrt = Wrt + B Mrt Wtt
+    _dot2(B, Mrt, T0)
+    _dot2(T0, Wtt, T1)
+    for i in range(2):
+        for j in range(2):
+            Wrt[i, j] += T1[i, j]
+    # Wtt = A Wtt, Wrr = B Mrr
+    _dot2(A, Wtt, T0)
+    Wtt[:, :] = T0
+    _dot2(B, Mrr, Wrr)
+
+
+@numba.njit(cache=True)
+def _init_W(W):
+    W[:, :, :] = 0.0
+    W[0, 0, 0] = 1.0
+    W[0, 1, 1] = 1.0
+    W[3, 0, 0] = 1.0
+    W[3, 1, 1] = 1.0
+
+
+@numba.jit(
+    numba.complex128[:, :, ::1](
+        numba.complex128[::1],
+        numba.float64[::1],
+        numba.complex128[:, :, :, ::1],
+        numba.float64[::1],
+        numba.boolean[:, ::1],
+        numba.boolean[:, ::1],
+    ),
+    nopython=True,
+    parallel=True,
+    cache=True,
+)
+def _calc_W(g_0, lamda, chi, d, non_mag, mpy):
+    layers = chi.shape[2]
+    points = g_0.shape[0]
+    Wout = empty((2, 2, points), dtype=complex128)
+    for pi in numba.prange(points):
+        kappa = 2 * np.pi / lamda[pi]
+        u_prev = empty(4, dtype=complex128)
+        u = empty(4, dtype=complex128)
+        S_prev = empty((4, 4), dtype=complex128)
+        S = empty((4, 4), dtype=complex128)
+        S_inv = empty((4, 4), dtype=complex128)
+        X = empty((4, 4), dtype=complex128)
+        W = empty((4, 2, 2), dtype=complex128)
+        M = empty((4, 2, 2), dtype=complex128)
+        T = empty((5, 2, 2), dtype=complex128)
+        _init_W(W)
+        _calc_u_S(chi, 0, pi, g_0[pi], non_mag[0, pi], mpy[0, pi], u_prev, S_prev)
+        for li in range(1, layers):
+            _calc_u_S(chi, li, pi, g_0[pi], non_mag[li, pi], mpy[li, pi], u, S)
+            _inv4(S_prev, S_inv)
+            _dot4(S_inv, S, X)
+            _recursion_step(X, u, kappa, d[li], W, M, T)
+            u_prev, u = u, u_prev
+            S_prev, S = S, S_prev
+        Wout[:, :, pi] = W[2]
+    return Wout
+
+
+@numba.njit(cache=True)
+def _roughness_factor(kappa, sigma, u1, u2):
+    return cmath.exp(-0.5 * kappa**2 * sigma**2 * (u1 - u2) ** 2)
+
+
+@numba.njit(cache=True)
+def _calc_Xmean(X_l, X_lu, X_u, u, u_next, u_l, u_u, kappa, sigma, sigma_l, sigma_u, dd_l, dd_u, E_l, E_u, E_d, Xmean):
+    """Interface matrix averaged over the roughness of the interfaces of the magnetic interface layers,
+    summed up term by term as in int_lay_xmean.calc_xrmr_Xmean"""
+    for i in range(4):
+        for a in range(4):
+            E_l[i, a] = _roughness_factor(kappa, sigma_l, u[i], u_l[a]) * X_l[i, a]
+    for b in range(4):
+        for j in range(4):
+            E_u[b, j] = _roughness_factor(kappa, sigma_u, u_next[j], u_u[b]) * X_u[b, j]
+    # the phase factor is separable, the last row is used to store the upper interface part
+    for b in range(4):
+        E_d[3, b] = cmath.exp(-1.0j * kappa * dd_u * u_u[b])
+    for a in range(4):
+        phase_l = cmath.exp(-1.0j * kappa * dd_l * u_l[a])
+        for b in range(4):
+            E_d[a, b] = phase_l * E_d[3, b] * X_lu[a, b]
+    for i in range(4):
+        for j in range(4):
+            value = 0.0j
+            for a in range(4):
+                for b in range(4):
+                    value += E_l[i, a] * E_d[a, b] * E_u[b, j]
+            Xmean[i, j] = _roughness_factor(kappa, sigma, u_next[j], u[i]) * value
+
+
+@numba.jit(
+    numba.complex128[:, :, ::1](
+        numba.complex128[::1],
+        numba.float64[::1],
+        numba.complex128[:, :, :, ::1],
+        numba.boolean[:, ::1],
+        numba.boolean[:, ::1],
+        numba.complex128[:, :, :, ::1],
+        numba.boolean[:, ::1],
+        numba.boolean[:, ::1],
+        numba.complex128[:, :, :, ::1],
+        numba.boolean[:, ::1],
+        numba.boolean[:, ::1],
+        numba.float64[::1],
+        numba.float64[::1],
+        numba.float64[::1],
+        numba.float64[::1],
+        numba.float64[::1],
+        numba.float64[::1],
+    ),
+    nopython=True,
+    parallel=True,
+    cache=True,
+)
+def _calc_W_int_lay(
+    g_0,
+    lamda,
+    chi_b,
+    non_mag_b,
+    mpy_b,
+    chi_l,
+    non_mag_l,
+    mpy_l,
+    chi_u,
+    non_mag_u,
+    mpy_u,
+    d,
+    sigma,
+    sigma_l,
+    sigma_u,
+    dd_l,
+    dd_u,
+):
+    layers = chi_b.shape[2]
+    points = g_0.shape[0]
+    Wout = empty((2, 2, points), dtype=complex128)
+    for pi in numba.prange(points):
+        kappa = 2 * np.pi / lamda[pi]
+        g0 = g_0[pi]
+        u_b_prev = empty(4, dtype=complex128)
+        u_b = empty(4, dtype=complex128)
+        u_l = empty(4, dtype=complex128)
+        u_u = empty(4, dtype=complex128)
+        S_b_prev = empty((4, 4), dtype=complex128)
+        S_b = empty((4, 4), dtype=complex128)
+        S_l = empty((4, 4), dtype=complex128)
+        S_u = empty((4, 4), dtype=complex128)
+        S_inv = empty((4, 4), dtype=complex128)
+        X_l = empty((4, 4), dtype=complex128)
+        X_lu = empty((4, 4), dtype=complex128)
+        X_u = empty((4, 4), dtype=complex128)
+        E = empty((3, 4, 4), dtype=complex128)
+        Xmean = empty((4, 4), dtype=complex128)
+        W = empty((4, 2, 2), dtype=complex128)
+        M = empty((4, 2, 2), dtype=complex128)
+        T = empty((5, 2, 2), dtype=complex128)
+        _init_W(W)
+        _calc_u_S(chi_b, 0, pi, g0, non_mag_b[0, pi], mpy_b[0, pi], u_b_prev, S_b_prev)
+        for li in range(1, layers):
+            # lower interface layer of the previous layer
+            _calc_u_S(chi_l, li - 1, pi, g0, non_mag_l[li - 1, pi], mpy_l[li - 1, pi], u_l, S_l)
+            _inv4(S_b_prev, S_inv)
+            _dot4(S_inv, S_l, X_l)
+            # upper interface layer of this layer
+            _calc_u_S(chi_u, li, pi, g0, non_mag_u[li, pi], mpy_u[li, pi], u_u, S_u)
+            _inv4(S_l, S_inv)
+            _dot4(S_inv, S_u, X_lu)
+            _calc_u_S(chi_b, li, pi, g0, non_mag_b[li, pi], mpy_b[li, pi], u_b, S_b)
+            _inv4(S_u, S_inv)
+            _dot4(S_inv, S_b, X_u)
+
+            _calc_Xmean(
+                X_l,
+                X_lu,
+                X_u,
+                u_b_prev,
+                u_b,
+                u_l,
+                u_u,
+                kappa,
+                sigma[li],
+                sigma_l[li - 1],
+                sigma_u[li],
+                dd_l[li - 1],
+                dd_u[li],
+                E[0],
+                E[1],
+                E[2],
+                Xmean,
+            )
+            _recursion_step(Xmean, u_b, kappa, d[li] - dd_l[li] - dd_u[li], W, M, T)
+            u_b_prev, u_b = u_b, u_b_prev
+            S_b_prev, S_b = S_b, S_b_prev
+        Wout[:, :, pi] = W[2]
+    return Wout
+
+
+def _layer_point_array(value, shape, dtype):
+    value = np.asarray(value)
+    if value.ndim == 1:
+        value = value[:, np.newaxis]
+    return np.array(np.broadcast_to(value, shape), dtype=dtype, order="C")
+
+
+def _chi_array(chi, shape):
+    output = empty((3, 3) + shape, dtype=complex128)
+    for i in range(3):
+        for j in range(3):
+            output[i, j] = _layer_point_array(chi[i][j], shape, complex128)
+    return output
+
+
+def _point_arrays(g_0, lamda):
+    g_0 = np.array(g_0, dtype=complex128, order="C")
+    lamda = np.array(np.broadcast_to(lamda, g_0.shape), dtype=float64, order="C")
+    return g_0, lamda
+
+
+def do_calc(g_0, lamda, chi, d, non_mag, mpy):
+    """Do the calculation to form the multilayer reflectivity matrix, W"""
+    g_0, lamda = _point_arrays(g_0, lamda)
+    shape = (len(d), g_0.shape[0])
+    return _calc_W(
+        g_0,
+        lamda,
+        _chi_array(chi, shape),
+        np.array(d, dtype=float64, order="C"),
+        _layer_point_array(non_mag, shape, np.bool_),
+        _layer_point_array(mpy, shape, np.bool_),
+    )
+
+
+def do_calc_int_lay(g_0, lamda, chi_b, chi_l, chi_u, d, sigma, sigma_l, sigma_u, dd_l, dd_u):
+    """Form the multilayer reflectivity matrix, W, including magnetic interface layers"""
+    g_0, lamda = _point_arrays(g_0, lamda)
+    shape = (len(d), g_0.shape[0])
+    chi_args = []
+    for chi, non_mag, mpy in [chi_b, chi_l, chi_u]:
+        chi_args += [
+            _chi_array(chi, shape),
+            _layer_point_array(non_mag, shape, np.bool_),
+            _layer_point_array(mpy, shape, np.bool_),
+        ]
+    layer_args = [np.array(value, dtype=float64, order="C") for value in [d, sigma, sigma_l, sigma_u, dd_l, dd_u]]
+    return _calc_W_int_lay(g_0, lamda, *chi_args, *layer_args)
@@ -30,6 +30,7 @@ from .lib import xrmr
 from .lib.base import AltStrEnum
 from .lib.instrument import *
 from .lib.physical_constants import AA_to_eV, muB_to_SL, r_e
+from .lib.result_cache import digest, refl_cache
 from .lib.testing import ModelTestCase
 
 
@@ -507,25 +508,6 @@ class Sample(refl.SampleBase):
     _layer_parameter_class = LayerParameters
 
 
-# A buffer to save previous calculations for XRMR calculations
-class XBuffer:
-    W = None
-    parameters = None
-    g_0 = None
-    coords = None
-    wavelength = None
-
-
-# A buffer to save previous calculations for spin-flip calculations
-class NBuffer:
-    Ruu = 0
-    Rdd = 0
-    Rdu = 0
-    Rud = 0
-    parameters = None
-    TwoThetaQz = None
-
-
 def correct_reflectivity(R, TwoThetaQz, instrument: Instrument, theta, weight):
     pol = instrument.xpol
     theory = instrument.probe
@@ -1391,21 +1373,27 @@ def analytical_reflectivity(
 
         g_0 = sin(theta * pi / 180.0)
 
-        # Full theory
-        if XBuffer.g_0 is not None:
-            g0_ok = XBuffer.g_0.shape == g_0.shape
-            if g0_ok:
-                g0_ok = any(not_equal(XBuffer.g_0, g_0))
-        else:
-            g0_ok = False
-        # TODO: fix buffering for aniso model
-        if True or (
-            XBuffer.parameters != parameters
-            or XBuffer.coords != instrument.coords
-            or not g0_ok
-            or XBuffer.wavelength != lamda
-        ):
-            # print g_0.shape, lamda.shape, A.shape, B.shape, C.shape, M.shape,
+        # Full theory, the W matrix is shared by all polarization channels
+        key = digest(
+            "mag_refl.analytical.xray_aniso",
+            instrument.coords,
+            g_0,
+            lamda,
+            A,
+            B,
+            C,
+            M,
+            d,
+            sigma,
+            sigma_l,
+            sigma_u,
+            dd_l,
+            dd_u,
+            dmag_l,
+            dmag_u,
+        )
+        W = refl_cache.get(key)
+        if W is None:
             W = xrmr.calc_refl_int_lay(
                 g_0,
                 lamda,
@@ -1423,14 +1411,7 @@ def analytical_reflectivity(
                 dmag_l[::-1],
                 dmag_u[::-1],
             )
-            XBuffer.W = W
-            XBuffer.parameters = parameters
-            XBuffer.coords = instrument.coords
-            XBuffer.g_0 = g_0.copy()
-            XBuffer.wavelength = lamda
-        else:
-            # print 'Reusing W'
-            W = XBuffer.W
+            refl_cache.put(key, W)
         trans = ones(W.shape, dtype=complex128)
         trans[0, 1] = 1.0j
         trans[1, 1] = -1.0j
@@ -1629,12 +1610,9 @@ def analytical_reflectivity(
         wl = instrument.wavelength
         Q = 4 * pi / wl * sin(theta * pi / 180)
         # Check if we have calcluated the same sample previous:
-        Q_ok = False
-        if NBuffer.TwoThetaQz is not None:
-            Q_ok = NBuffer.TwoThetaQz.shape == Q.shape
-            if Q_ok:
-                Q_ok = any(not_equal(NBuffer.TwoThetaQz, Q))
-        if NBuffer.parameters != parameters or not Q_ok:
+        key = digest("mag_refl.analytical.npolsf", Q, wl, parameters)
+        channels = refl_cache.get(key)
+        if channels is None:
             b = array(parameters.b, dtype=complex128) * 1e-5
             abs_xs = array(parameters.xs_ai, dtype=complex128) * 1e-4**2
             # Bulk of the layers
@@ -1660,23 +1638,19 @@ def analytical_reflectivity(
                 phi[::-1],
                 sigma_l[::-1],
             )
-            NBuffer.Ruu = Ruu.copy()
-            NBuffer.Rdd = Rdd.copy()
-            NBuffer.Rud = Rud.copy()
-            NBuffer.parameters = parameters
-            NBuffer.TwoThetaQz = Q.copy()
-        else:
-            pass
+            channels = (Ruu.copy(), Rdd.copy(), Rud.copy())
+            refl_cache.put(key, channels)
+        Ruu, Rdd, Rud = channels
 
         pol = instrument.npol
         if pol == NeutronPol.up_up:
-            R = NBuffer.Ruu
+            R = Ruu
         elif pol == NeutronPol.down_down:
-            R = NBuffer.Rdd
+            R = Rdd
         elif pol in [NeutronPol.up_down or NeutronPol.down_up]:
-            R = NBuffer.Rud
+            R = Rud
         elif pol == NeutronPol.asymmetry:
-            R = (NBuffer.Ruu - NBuffer.Rdd) / (NBuffer.Ruu + NBuffer.Rdd + 2 * NBuffer.Rud)
+            R = (Ruu - Rdd) / (Ruu + Rdd + 2 * Rud)
         else:
             raise ValueError("The value of the polarization is WRONG." " It should be ++, -- or +-")
     elif theory == ProbeTheory.ntofpol:
@@ -1711,7 +1685,6 @@ def analytical_reflectivity(
 
 def slicing_reflectivity(sample: Sample, instrument: Instrument, theta, TwoThetaQz, xray_energy, return_amplitude=True):
     lamda = AA_to_eV / xray_energy
-    parameters = sample.resolveLayerParameters()
 
     (d, sl_c, sl_m1, sl_m2, M, chi, non_mag, mpy, sl_n, abs_n, mag_dens, mag_dens_x, mag_dens_y, z0) = compose_sld(
         sample, instrument, theta, xray_energy
@@ -1719,37 +1692,16 @@ def slicing_reflectivity(sample: Sample, instrument: Instrument, theta, TwoTheta
     g_0 = sin(theta * pi / 180.0)
     theory = instrument.probe
     # Full theory
-    if not XBuffer.g_0 is None:
-        g0_ok = XBuffer.g_0.shape == g_0.shape
-        if g0_ok:
-            g0_ok = allclose(XBuffer.g_0, g_0)
-    else:
-        g0_ok = False
-
-    buffer_wl = array(XBuffer.wavelength)
-    current_wl = array(lamda)
-    if not XBuffer.wavelength is None:
-        wl_ok = buffer_wl.shape == current_wl.shape
-        if wl_ok:
-            wl_ok = allclose(buffer_wl, lamda)
-    else:
-        wl_ok = False
-
     if theory == ProbeTheory.xray_aniso:
-        if XBuffer.parameters != parameters or XBuffer.coords != instrument.coords or not g0_ok or not wl_ok:
+        key = digest("mag_refl.slicing.xray_aniso", g_0, lamda, chi, d, non_mag, mpy)
+        W = refl_cache.get(key)
+        if W is None:
             chi = tuple([tuple([item[::-1] for item in row]) for row in chi])
             d = d[::-1]
             non_mag = non_mag[::-1]
             mpy = mpy[::-1]
             W = xrmr.do_calc(g_0, lamda, chi, d, non_mag, mpy)
-            XBuffer.W = W
-            XBuffer.parameters = parameters
-            XBuffer.coords = instrument.coords
-            XBuffer.g_0 = g_0.copy()
-            XBuffer.wavelength = lamda
-        else:
-            # print "Reusing W"
-            W = XBuffer.W
+            refl_cache.put(key, W)
         trans = ones(W.shape, dtype=complex128)
         trans[0, 1] = 1.0j
         trans[1, 1] = -1.0j
@@ -1850,12 +1802,10 @@ def slicing_reflectivity(sample: Sample, instrument: Instrument, theta, TwoTheta
         abs_n = abs_n * 1e-8
         Q = 4 * pi / lamda * sin(theta * pi / 180)
         # Check if we have calcluated the same sample previous:
-        Q_ok = False
-        if NBuffer.TwoThetaQz is not None:
-            Q_ok = NBuffer.TwoThetaQz.shape == Q.shape
-            if Q_ok:
-                Q_ok = any(not_equal(NBuffer.TwoThetaQz, Q))
-        if NBuffer.parameters != parameters or not Q_ok or True:
+        key = digest("mag_refl.slicing.npolsf", Q, lamda, sl_n, abs_n, mag_dens_x, mag_dens_y, d)
+        key += digest(sample.Ambient.dens, sample.Ambient.b, sample.Ambient.xs_ai)
+        channels = refl_cache.get(key)
+        if channels is None:
             # Bulk of the layers
             # V0 = 2*2*pi*dens*(sqrt(b**2 - (abs_xs/2.0/wl)**2) -
             #                   1.0J*abs_xs/2.0/wl)
@@ -1874,24 +1824,19 @@ def slicing_reflectivity(sample: Sample, instrument: Instrument, theta, TwoTheta
             phi_tmp = arccos(mag_dens_x / mag)
             phi = where(mag < 1e-20, zeros_like(mag), phi_tmp)
             (Ruu, Rdd, Rud, Rdu) = neutron_refl.Refl(Q, V0[::1] + Vmag[::1], V0[::1] - Vmag[::1], d[::1], phi[::1])
-
-            NBuffer.Ruu = Ruu.copy()
-            NBuffer.Rdd = Rdd.copy()
-            NBuffer.Rud = Rud.copy()
-            NBuffer.parameters = parameters
-            NBuffer.TwoThetaQz = Q.copy()
-        else:
-            pass
+            channels = (Ruu.copy(), Rdd.copy(), Rud.copy())
+            refl_cache.put(key, channels)
+        Ruu, Rdd, Rud = channels
 
         pol = instrument.npol
         if pol == NeutronPol.up_up:
-            R = NBuffer.Ruu
+            R = Ruu
         elif pol == NeutronPol.down_down:
-            R = NBuffer.Rdd
+            R = Rdd
         elif pol in [NeutronPol.up_down, NeutronPol.down_up]:
-            R = NBuffer.Rud
+            R = Rud
         elif pol == NeutronPol.asymmetry:
-            R = (NBuffer.Ruu - NBuffer.Rdd) / (NBuffer.Ruu + NBuffer.Rdd + 2 * NBuffer.Rud)
+            R = (Ruu - Rdd) / (Ruu + Rdd + 2 * Rud)
         else:
             raise ValueError("The value of the polarization is WRONG." " It should be ++(0), --(1) or +-(2)")
 
@@ -29,6 +29,7 @@ from .lib.footprint import *
 from .lib.instrument import *
 from .lib.physical_constants import muB_to_SL, r_e
 from .lib.resolution import *
+from .lib.result_cache import digest, refl_cache
 from .lib.testing import ModelTestCase
 from .spec_nx import (AA_to_eV, Coords, FootType, Instrument, Polarization, Probe, ResType, footprintcorr, q_limit,
                       resolution_init, resolutioncorr)
@@ -136,16 +137,6 @@ class Sample(refl.SampleBase):
     _layer_parameter_class = LayerParameters
 
 
-# A buffer to save previous calculations for spin-flip calculations
-class Buffer:
-    Ruu = 0
-    Rdd = 0
-    Rdu = 0
-    Rud = 0
-    parameters = None
-    TwoThetaQz = None
-
-
 def Specular(TwoThetaQz, sample: Sample, instrument: Instrument):
     """Simulate the specular signal from sample when probed with instrument
 
@@ -207,13 +198,9 @@ def Specular(TwoThetaQz, sample: Sample, instrument: Instrument):
     # Spin flip
     elif ptype == Probe.npolsf:
         # Check if we have calcluated the same sample previous:
-        if Buffer.TwoThetaQz is not None:
-            Q_ok = Buffer.TwoThetaQz.shape == Q.shape
-            if Q_ok:
-                Q_ok = not (Buffer.TwoThetaQz != Q).any()
-        else:
-            Q_ok = False
-        if Buffer.parameters != parameters or not Q_ok:
+        key = digest("soft_nx.npolsf", Q, instrument.wavelength, sld, sld_m, d, magn_ang, sigma)
+        channels = refl_cache.get(key)
+        if channels is None:
             if sld_m[-1] != 0.0 or sld[-1] != 0:
                 sld_m -= sld_m[-1]
                 sld -= sld[-1]
@@ -224,22 +211,18 @@ def Specular(TwoThetaQz, sample: Sample, instrument: Instrument):
             )  # (1-np**2) - better numerical accuracy
             Vm = (2 * pi / instrument.wavelength) ** 2 * (sld_m * (2.0 + sld_m))  # (1-nm**2)
             (Ruu, Rdd, Rud, Rdu) = MatrixNeutron.Refl(Q, Vp, Vm, d, magn_ang, sigma)
-            Buffer.Ruu = Ruu
-            Buffer.Rdd = Rdd
-            Buffer.Rud = Rud
-            Buffer.parameters = parameters
-            Buffer.TwoThetaQz = Q.copy()
-        else:
-            pass
+            channels = (Ruu, Rdd, Rud)
+            refl_cache.put(key, channels)
+        Ruu, Rdd, Rud = channels
         if pol == Polarization.up_up:
-            R = Buffer.Ruu
+            R = Ruu
         elif pol == Polarization.down_down:
-            R = Buffer.Rdd
+            R = Rdd
         elif pol in [Polarization.up_down, Polarization.down_up]:
-            R = Buffer.Rud
+            R = Rud
         # Calculating the asymmetry ass
         elif pol == Polarization.asymmetry:
-            R = (Buffer.Ruu - Buffer.Rdd) / (Buffer.Ruu + Buffer.Rdd + 2 * Buffer.Rud)
+            R = (Ruu - Rdd) / (Ruu + Rdd + 2 * Rud)
         else:
             raise ValueError("The value of the polarization is WRONG." " It should be uu(0), dd(1) or ud(2)")
     # TODO: Check the following to cases
@@ -28,6 +28,8 @@ from .lib.footprint import *
 from .lib.instrument import *
 from .lib.physical_constants import T_to_SL, muB_to_SL, r_e
 from .lib.resolution import *
+from .lib.result_cache import digest, refl_cache
+from .lib.segmentation import interface_profiles, segment_bounds, segment_means
 from .lib.testing import ModelTestCase
 from .spec_nx import AA_to_eV, Coords, FootType
 from .spec_nx import Instrument as NXInstrument
@@ -298,16 +300,6 @@ class Instrument(NXInstrument):
     Groups = NXInstrument.Groups + [("Zeeman correction", ["zeeman", "mag_field"])]
 
 
-# A buffer to save previous calculations for spin-flip calculations
-class Buffer:
-    Ruu = 0
-    Rdd = 0
-    Rdu = 0
-    Rud = 0
-    parameters = None
-    TwoThetaQz = None
-
-
 def specular_calc_zeemann(TwoThetaQz, sample: Sample, instrument: Instrument):
     """For details see spec_nx implementation with more comments.
 
@@ -358,13 +350,9 @@ def specular_calc_zeemann(TwoThetaQz, sample: Sample, instrument: Instrument):
     sld = spec_nx.neutron_sld(abs_xs, dens, fb, wl)
 
     # Check if we have calcluated the same sample previous:
-    if Buffer.TwoThetaQz is not None:
-        Q_ok = Buffer.TwoThetaQz.shape == Q.shape
-        if Q_ok:
-            Q_ok = not (Buffer.TwoThetaQz != Q).any()
-    else:
-        Q_ok = False
-    if Buffer.parameters != (parameters, instrument.mag_field) or not Q_ok:
+    key = digest("spec_adaptive.zeeman", Q, wl, rho_Z, sld, magn, dens, d, magn_ang, sigma)
+    channels = refl_cache.get(key)
+    if channels is None:
         msld = muB_to_SL * magn * dens
         # apply Zeeman correction to magnetic parameters
         magn_x = msld * cos(magn_ang)  # M parallel to polarization
@@ -382,22 +370,18 @@ def specular_calc_zeemann(TwoThetaQz, sample: Sample, instrument: Instrument):
         Vp = (2 * pi) * (sld_p * (2.0 + sld_p))  # (1-np**2) - better numerical accuracy
         Vm = (2 * pi) * (sld_m * (2.0 + sld_m))  # (1-nm**2)
         (Ruu, Rdd, Rud, Rdu) = MatrixNeutron.Refl(Q, Vp, Vm, d, magn_ang, sigma, return_int=True)
-        Buffer.Ruu = Ruu
-        Buffer.Rdd = Rdd
-        Buffer.Rud = Rud
-        Buffer.parameters = (parameters, instrument.mag_field)
-        Buffer.TwoThetaQz = Q.copy()
-    else:
-        pass
+        channels = (Ruu, Rdd, Rud)
+        refl_cache.put(key, channels)
+    Ruu, Rdd, Rud = channels
     if pol == Polarization.up_up:
-        R = Buffer.Ruu
+        R = Ruu
     elif pol == Polarization.down_down:
-        R = Buffer.Rdd
+        R = Rdd
     elif pol in [Polarization.up_down, Polarization.down_up]:
-        R = Buffer.Rud
+        R = Rud
     # Calculating the asymmetry ass
     elif pol == Polarization.asymmetry:
-        R = (Buffer.Ruu - Buffer.Rdd) / (Buffer.Ruu + Buffer.Rdd + 2 * Buffer.Rud)
+        R = (Ruu - Rdd) / (Ruu + Rdd + 2 * Rud)
     else:
         raise ValueError("The value of the polarization is WRONG." " It should be uu(0), dd(1) or ud(2)")
 
@@ -512,7 +496,6 @@ def calculate_segmentation(sample):
     magn_ang = array(parameters["magn_ang"], dtype=float64) / 180.0 * pi
     magn_void = array(parameters["magn_void"], dtype=float64)
 
-    crop_sigma = sample.crop_sigma
     sld_x = dens * f
     sld_n = dens * b
     sld_xs = dens * xs_ai
@@ -526,22 +509,11 @@ def calculate_segmentation(sample):
     d = d[1:-1]
     # Include one extra element - the zero pos (substrate/film interface)
     int_pos = cumsum(r_[0, d])
-    rough_type = array([_rough_mapping[rti] for rti in parameters["rough_type"]], dtype=int)[:-1]
+    rough_type = array([_rough_mapping[rti] for rti in parameters["rough_type"]], dtype=np.int64)[:-1]
     sigma_n = array(parameters["sigma"], dtype=float64)[:-1] + 1e-7
     sigma_m = array(parameters["sigma_mag"], dtype=float64)[:-1] + 1e-7
     z = arange(-sigma_n[0] * 5, int_pos.max() + sigma_n[-1] * 5, sample.minimal_steps / 5.0)
-    # interface transition functions, products for different per-layer rough_type cases
-    # Gaussian (starts at 1 goes to 0, interface is at 0.5)
-    trans_n = (0.5 - 0.5 * erf((z[:, newaxis] - int_pos) / sqrt(2.0) / sigma_n)) * (rough_type == 0)
-    # Linear
-    trans_n += maximum(0.0, minimum(1.0, (1.0 + (int_pos - z[:, newaxis]) / 2.0 / sigma_n) / 2.0)) * (rough_type == 1)
-    # Exponential decrease or increase
-    trans_n += maximum(0.0, minimum(1.0, exp((int_pos - z[:, newaxis]) / sigma_n))) * (rough_type == 2)
-    trans_n += maximum(0.0, minimum(1.0, 1.0 - exp((z[:, newaxis] - int_pos) / sigma_n))) * (rough_type == 3)
-    trans_m = (0.5 - 0.5 * erf((z[:, newaxis] - int_pos) / sqrt(2.0) / sigma_m)) * (rough_type == 0)
-    trans_m += maximum(0.0, minimum(1.0, (1.0 + (int_pos - z[:, newaxis]) / 2.0 / sigma_m) / 2.0)) * (rough_type == 1)
-    trans_m += maximum(0.0, minimum(1.0, exp((int_pos - z[:, newaxis]) / sigma_m))) * (rough_type == 2)
-    trans_m += maximum(0.0, minimum(1.0, 1.0 - exp((z[:, newaxis] - int_pos) / sigma_m))) * (rough_type == 3)
+    crop_sigma = sample.crop_sigma and len(d) > 0
     if crop_sigma:
         # Cop the roughness tails above and below the interface to avoid overspill.
         # This is done by introducing a split-location within a layer where the
@@ -554,23 +526,17 @@ def calculate_segmentation(sample):
         # location of split relative to bottom interface
         delta_pos = (0.5 + 0.5 * sratio) * d
         sigma_pos = (1.0 - abs(sratio)) * d / 2.0
-        # the fade out function applied to the interface from below and above located within a layer
-        interface = 0.5 - 0.5 * erf((z[:, newaxis] - int_pos[1:] + delta_pos) * sqrt(2.0) / sigma_pos)
-
-        # Fade out roughness influence close to top and bottom split location
-        trans_n[:, 0] = trans_n[:, 0] * interface[:, 0]
-        trans_n[:, 1:-1] = interface[:, :-1] + (1.0 - interface[:, :-1]) * trans_n[:, 1:-1] * interface[:, 1:]
-        trans_n[:, -1] = interface[:, -1] + (1.0 - interface[:, -1]) * trans_n[:, -1]
-        trans_m[:, 0] = trans_m[:, 0] * interface[:, 0]
-        trans_m[:, 1:-1] = interface[:, :-1] + (1.0 - interface[:, :-1]) * trans_m[:, 1:-1] * interface[:, 1:]
-        trans_m[:, -1] = interface[:, -1] + (1.0 - interface[:, -1]) * trans_m[:, -1]
-    # SLD calculations
-    rho_x = sum((sld_x[:-1] - sld_x[1:]) * trans_n, 1) + sld_x[-1]
-    rho_n = sum((sld_n[:-1] - sld_n[1:]) * trans_n, 1) + sld_n[-1]
-    rho_m_nsf = sum((mag_sld_nsf[:-1] - mag_sld_nsf[1:]) * trans_m, 1) + mag_sld_nsf[-1]
-    rho_m_sf = sum((mag_sld_sf[:-1] - mag_sld_sf[1:]) * trans_m, 1) + mag_sld_sf[-1]
-    rho_void = sum((magn_void[:-1] - magn_void[1:]) * trans_n, 1) + magn_void[-1]
-    xs_ai_comb = sum((sld_xs[:-1] - sld_xs[1:]) * trans_n, 1) + sld_xs[-1]
+    else:
+        delta_pos = sigma_pos = zeros(0, dtype=float64)
+    # SLD calculations, sums of the SLD steps times the interface transition functions
+    sld_n_steps = array([sld_x, sld_n, magn_void, sld_xs], dtype=complex128)
+    sld_m_steps = array([mag_sld_nsf, mag_sld_sf], dtype=complex128)
+    rho_x, rho_n, rho_void, xs_ai_comb = interface_profiles(
+        z, int_pos, sigma_n, rough_type, delta_pos, sigma_pos, crop_sigma, sld_n_steps[:, :-1] - sld_n_steps[:, 1:]
+    ) + sld_n_steps[:, -1:]
+    rho_m_nsf, rho_m_sf = interface_profiles(
+        z, int_pos, sigma_m, rough_type, delta_pos, sigma_pos, crop_sigma, sld_m_steps[:, :-1] - sld_m_steps[:, 1:]
+    ) + sld_m_steps[:, -1:]
     # add more elements to the SLDs
     for params in parameters["Elements"][1:]:
         dens = array(params["dens"], dtype=float64)
@@ -589,75 +555,43 @@ def calculate_segmentation(sample):
         d = d[1:-1]
         # Include one extra element - the zero pos (substrate/film interface)
         int_pos = cumsum(r_[0, d])
-        rough_type = array([_rough_mapping[rti] for rti in params["rough_type"]], dtype=int)[:-1]
+        rough_type = array([_rough_mapping[rti] for rti in params["rough_type"]], dtype=np.int64)[:-1]
         sigma_n = array(params["sigma"], dtype=float64)[:-1] + 1e-7
         sigma_m = array(params["sigma_mag"], dtype=float64)[:-1] + 1e-7
-        # interface transition functions
-        trans_n = (0.5 - 0.5 * erf((z[:, newaxis] - int_pos) / sqrt(2.0) / sigma_n)) * (rough_type == 0)
-        trans_n += maximum(0.0, minimum(1.0, (1.0 + (int_pos - z[:, newaxis]) / 2.0 / sigma_n) / 2.0)) * (
-            rough_type == 1
-        )
-        trans_n += maximum(0.0, minimum(1.0, exp((int_pos - z[:, newaxis]) / sigma_n))) * (rough_type == 2)
-        trans_n += maximum(0.0, minimum(1.0, 1.0 - exp((z[:, newaxis] - int_pos) / sigma_n))) * (rough_type == 3)
-        trans_m = (0.5 - 0.5 * erf((z[:, newaxis] - int_pos) / sqrt(2.0) / sigma_m)) * (rough_type == 0)
-        trans_m += maximum(0.0, minimum(1.0, (1.0 + (int_pos - z[:, newaxis]) / 2.0 / sigma_m) / 2.0)) * (
-            rough_type == 1
-        )
-        trans_m += maximum(0.0, minimum(1.0, exp((int_pos - z[:, newaxis]) / sigma_m))) * (rough_type == 2)
-        trans_m += maximum(0.0, minimum(1.0, 1.0 - exp((z[:, newaxis] - int_pos) / sigma_m))) * (rough_type == 3)
         # SLD calculations
-        rho_x += sum((sld_x[:-1] - sld_x[1:]) * trans_n, 1) + sld_x[-1]
-        rho_n += sum((sld_n[:-1] - sld_n[1:]) * trans_n, 1) + sld_n[-1]
-        rho_m_nsf += sum((mag_sld_nsf[:-1] - mag_sld_nsf[1:]) * trans_m, 1) + mag_sld_nsf[-1]
-        rho_m_sf += sum((mag_sld_sf[:-1] - mag_sld_sf[1:]) * trans_m, 1) + mag_sld_sf[-1]
-        xs_ai_comb += sum((sld_xs[:-1] - sld_xs[1:]) * trans_n, 1) + sld_xs[-1]
+        sld_n_steps = array([sld_x, sld_n, sld_xs], dtype=complex128)
+        sld_m_steps = array([mag_sld_nsf, mag_sld_sf], dtype=complex128)
+        no_crop = zeros(0, dtype=float64)
+        element_n = interface_profiles(
+            z, int_pos, sigma_n, rough_type, no_crop, no_crop, False, sld_n_steps[:, :-1] - sld_n_steps[:, 1:]
+        ) + sld_n_steps[:, -1:]
+        element_m = interface_profiles(
+            z, int_pos, sigma_m, rough_type, no_crop, no_crop, False, sld_m_steps[:, :-1] - sld_m_steps[:, 1:]
+        ) + sld_m_steps[:, -1:]
+        rho_x = rho_x + element_n[0]
+        rho_n = rho_n + element_n[1]
+        xs_ai_comb = xs_ai_comb + element_n[2]
+        rho_m_nsf = rho_m_nsf + element_m[0]
+        rho_m_sf = rho_m_sf + element_m[1]
+    rho_void = rho_void.real
+    xs_ai_comb = xs_ai_comb.real
+    rho_m_nsf = rho_m_nsf.real
+    rho_m_sf = rho_m_sf.real
     # calculate the segmentation
-    d_segments = [0.0]
-    i = 0
-    rho_x_out = [rho_x[0]]
-    rho_n_out = [rho_n[0]]
-    rho_nsf_out = [rho_m_nsf[0]]
-    rho_sf_out = [rho_m_sf[0]]
-    xs_ai_out = [xs_ai_comb[0]]
-    rho_x_r = rho_x.real
     rho_n_p = rho_n.real + rho_m_nsf
     rho_n_m = rho_n.real - rho_m_nsf
-    while i < (len(z) - 1):
-        j = next_adaptive_segment(i, rho_x_r, rho_n_p, rho_n_m, rho_m_sf, sample.max_diff_n, sample.max_diff_x, z)
-        d_segments.append(z[j] - z[i])
-        rho_x_out.append(rho_x[i:j].mean())
-        rho_n_out.append(rho_n[i:j].mean())
-        rho_nsf_out.append(
-            rho_m_nsf[i:j].mean() * (1.0 - rho_void[i:j].mean())
-        )  # averadge magn taking voids into account
-        rho_sf_out.append(
-            rho_m_sf[i:j].mean() * (1.0 - rho_void[i:j].mean())
-        )  # averadge magn taking voids into account
-        xs_ai_out.append(xs_ai_comb[i:j].mean())  # averadge mang angle
-        i = j
-    rho_nsf_out = array(rho_nsf_out)
-    rho_sf_out = array(rho_sf_out)
+    bounds = segment_bounds(rho_x.real, rho_n_p, rho_n_m, rho_m_sf, sample.max_diff_n, sample.max_diff_x)
+    d_segments = z[bounds[1:]] - z[bounds[:-1]]
+    rho_x_out = segment_means(rho_x, bounds)
+    rho_n_out = segment_means(rho_n, bounds)
+    # averadge magn taking voids into account
+    void_out = segment_means(rho_void, bounds)
+    rho_nsf_out = segment_means(rho_m_nsf, bounds) * (1.0 - void_out)
+    rho_sf_out = segment_means(rho_m_sf, bounds) * (1.0 - void_out)
+    xs_ai_out = segment_means(xs_ai_comb, bounds)
     rho_m_out = sqrt(rho_nsf_out**2 + rho_sf_out**2).tolist()
     magn_ang_out = (arctan2(rho_nsf_out, -rho_sf_out) * 180.0 / pi - 90.0).tolist()
-    return (d_segments[1:], rho_x_out[1:], rho_n_out[1:], rho_m_out[1:], xs_ai_out[1:], magn_ang_out[1:])
-
-
-def next_adaptive_segment(i, rho_x_r, rho_n_p, rho_n_m, rho_m_sf, max_diff_n, max_diff_x, z):
-    # calculate the maximum variation of SLD up to given index
-    diff_x = abs(maximum.accumulate(rho_x_r[i + 1 :]) - minimum.accumulate(rho_x_r[i + 1 :]))
-    diff_n_p = abs(maximum.accumulate(rho_n_p[i + 1 :]) - minimum.accumulate(rho_n_p[i + 1 :]))
-    diff_n_m = abs(maximum.accumulate(rho_n_m[i + 1 :]) - minimum.accumulate(rho_n_m[i + 1 :]))
-    diff_m_sf = abs(maximum.accumulate(rho_m_sf[i + 1 :]) - minimum.accumulate(rho_m_sf[i + 1 :]))
-    diff_idx = where(
-        logical_not(
-            (diff_n_p < max_diff_n) & (diff_x < max_diff_x) & (diff_n_m < max_diff_n) & (diff_m_sf < max_diff_n)
-        )
-    )[0]
-    if len(diff_idx) > 0:
-        j = min(len(z) - 1, max(i + diff_idx[0] + 1, i + 5))
-    else:
-        j = len(z) - 1  # last position
-    return j
+    return (d_segments.tolist(), rho_x_out.tolist(), rho_n_out.tolist(), rho_m_out, xs_ai_out.tolist(), magn_ang_out)
 
 
 def resolve_parameters_by_element(sample):
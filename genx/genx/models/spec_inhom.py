@@ -36,8 +36,6 @@ from .spec_nx import Polarization, Probe, ResType, q_limit
 # Preamble to define the parameters needed for the models outlined below:
 ModelID = "SpecInhom"
 
-Buffer = spec_nx.Buffer
-
 __xlabel__ = "q [Å$^{-1}$]"
 __ylabel__ = "Instnsity [a.u.]"
 
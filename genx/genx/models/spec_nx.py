@@ -18,13 +18,16 @@ import numpy as np
 from .lib import footprint as footprint_module
 from .lib import neutron_refl as MatrixNeutron
 from .lib import paratt as Paratt
+from .lib import population
 from .lib import refl_base as refl
 from .lib import resolution as resolution_module
+from ..exceptions import BatchNotSupported
 from .lib.base import AltStrEnum
 from .lib.footprint import *
 from .lib.instrument import *
 from .lib.physical_constants import AA_to_eV, muB_to_SL, r_e
 from .lib.resolution import *
+from .lib.result_cache import digest, refl_cache
 from .lib.testing import ModelTestCase
 
 # Preamble to define the parameters needed for the models outlined below:
@@ -302,16 +305,6 @@ class Instrument(refl.ReflBase):
     ]
 
 
-# A buffer to save previous calculations for spin-flip calculations
-class Buffer:
-    Ruu = 0
-    Rdd = 0
-    Rdu = 0
-    Rud = 0
-    parameters = None
-    TwoThetaQz = None
-
-
 def footprintcorr(Q, instrument: Instrument):
     foocor = 1.0
     footype = instrument.footype
@@ -435,6 +428,11 @@ def specular_calcs(TwoThetaQz, sample: Sample, instrument: Instrument, return_in
     # END Parameters
     """
 
+    parameters: LayerParameters = sample.resolveLayerParameters()
+    n_pop = population.population_size(instrument, parameters)
+    if n_pop is not None:
+        return specular_calcs_batch(TwoThetaQz, parameters, instrument, n_pop, return_int=return_int)
+
     # preamble to get it working with my class interface
     restype = instrument.restype
     Q, TwoThetaQz, weight = resolution_init(TwoThetaQz, instrument)
@@ -444,8 +442,6 @@ def specular_calcs(TwoThetaQz, sample: Sample, instrument: Instrument, return_in
     ptype = instrument.probe
     pol = instrument.pol
 
-    parameters: LayerParameters = sample.resolveLayerParameters()
-
     dens = array(parameters.dens, dtype=float64)
     d = array(parameters.d, dtype=float64)
     magn = array(parameters.magn, dtype=float64)
@@ -492,13 +488,9 @@ def specular_calcs(TwoThetaQz, sample: Sample, instrument: Instrument, return_in
     # Spin flip
     elif ptype == Probe.npolsf:
         # Check if we have calcluated the same sample previous:
-        if Buffer.TwoThetaQz is not None:
-            Q_ok = Buffer.TwoThetaQz.shape == Q.shape
-            if Q_ok:
-                Q_ok = not (Buffer.TwoThetaQz != Q).any()
-        else:
-            Q_ok = False
-        if Buffer.parameters != parameters or not Q_ok:
+        key = digest("spec_nx.npolsf", Q, instrument.wavelength, sld, magn, dens, d, magn_ang, sigma, return_int)
+        channels = refl_cache.get(key)
+        if channels is None:
             msld = muB_to_SL * magn * dens * instrument.wavelength**2 / 2 / pi
             # renormalize SLDs if ambient layer is not vacuum
             if msld[-1] != 0.0 or sld[-1] != 0:
@@ -511,22 +503,18 @@ def specular_calcs(TwoThetaQz, sample: Sample, instrument: Instrument, return_in
             )  # (1-np**2) - better numerical accuracy
             Vm = (2 * pi / instrument.wavelength) ** 2 * (sld_m * (2.0 + sld_m))  # (1-nm**2)
             (Ruu, Rdd, Rud, Rdu) = MatrixNeutron.Refl(Q, Vp, Vm, d, magn_ang, sigma, return_int=return_int)
-            Buffer.Ruu = Ruu
-            Buffer.Rdd = Rdd
-            Buffer.Rud = Rud
-            Buffer.parameters = parameters
-            Buffer.TwoThetaQz = Q.copy()
-        else:
-            pass
+            channels = (Ruu, Rdd, Rud)
+            refl_cache.put(key, channels)
+        Ruu, Rdd, Rud = channels
         if pol == Polarization.up_up:
-            R = Buffer.Ruu
+            R = Ruu
         elif pol == Polarization.down_down:
-            R = Buffer.Rdd
+            R = Rdd
         elif pol in [Polarization.up_down, Polarization.down_up]:
-            R = Buffer.Rud
+            R = Rud
         # Calculating the asymmetry ass
         elif pol == Polarization.asymmetry:
-            R = (Buffer.Ruu - Buffer.Rdd) / (Buffer.Ruu + Buffer.Rdd + 2 * Buffer.Rud)
+            R = (Ruu - Rdd) / (Ruu + Rdd + 2 * Rud)
         else:
             raise ValueError("The value of the polarization is WRONG." " It should be uu(0), dd(1) or ud(2)")
 
@@ -608,6 +596,74 @@ def specular_calcs(TwoThetaQz, sample: Sample, instrument: Instrument, return_in
         return R
 
 
+def specular_calcs_batch(TwoThetaQz, parameters: LayerParameters, instrument: Instrument, n_pop, return_int=True):
+    """
+    Simulate the specular signal for a whole population of parameter sets in one Parratt kernel call.
+    Layer or instrument parameters given as PopulationArray vary between the members,
+    the result has the shape (n_pop, len(TwoThetaQz)).
+    """
+    ptype = instrument.probe
+    pol = instrument.pol
+    if ptype not in [Probe.xray, Probe.neutron, Probe.npol]:
+        raise BatchNotSupported(f"probe {ptype}")
+    if population.is_population(instrument.wavelength):
+        raise BatchNotSupported("wavelength can not be fitted")
+    wl = instrument.wavelength
+
+    if population.population_size(instrument) is None:
+        instruments = [instrument] * n_pop
+        Q, TwoThetaQz, weight = resolution_init(TwoThetaQz, instrument)
+        resolution = [(Q, TwoThetaQz, weight)] * n_pop
+    else:
+        instruments = [population.member(instrument, i) for i in range(n_pop)]
+        resolution = [resolution_init(TwoThetaQz, inst_i) for inst_i in instruments]
+    Q = array([maximum(ri[0], q_limit) for ri in resolution], dtype=float64)
+    if Q.ndim != 2:
+        raise BatchNotSupported("population members use different number of resolution points")
+
+    dens = population.stack(parameters.dens, n_pop)
+    d = population.stack(parameters.d, n_pop)
+    sigma = population.stack(parameters.sigma, n_pop)
+
+    if ptype == Probe.xray:
+        e = AA_to_eV / wl
+        f = [fi(e) if refl.is_reflfunction(fi) else fi for fi in parameters.f]
+        sld = dens * population.stack(f, n_pop, dtype=complex128) * wl**2 / 2 / pi
+        n = [1.0 - r_e * sld]
+    else:
+        fb = population.stack(parameters.b, n_pop, dtype=complex128) * 1e-5
+        abs_xs = population.stack(parameters.xs_ai, n_pop, dtype=complex128) * 1e-4**2
+        sld = neutron_sld(abs_xs, dens, fb, wl)
+        if ptype == Probe.neutron:
+            n = [1.0 - sld]
+        else:
+            msld = muB_to_SL * population.stack(parameters.magn, n_pop) * dens * wl**2 / 2 / pi
+            if pol == Polarization.up_up:
+                n = [1.0 - sld - msld]
+            elif pol == Polarization.down_down:
+                n = [1.0 - sld + msld]
+            elif pol == Polarization.asymmetry:
+                n = [1.0 - sld - msld, 1.0 - sld + msld]
+            else:
+                raise ValueError("The value of the polarization is WRONG." " It should be uu(0) or dd(1)")
+
+    lamda = wl * ones(n_pop, dtype=float64)
+    R = [Paratt.ReflQ_batch(Q, lamda, ni, d, sigma, return_int=return_int) for ni in n]
+    if len(R) == 2:
+        R = (R[0] - R[1]) / (R[0] + R[1])
+    else:
+        R = R[0]
+    if not return_int:
+        return R
+
+    return array(
+        [
+            resolutioncorr(Ri, TTQi, footprintcorr(Qi, inst_i), inst_i, weight_i) * inst_i.I0 + inst_i.Ibkg
+            for Ri, Qi, (_, TTQi, weight_i), inst_i in zip(R, Q, resolution, instruments)
+        ]
+    )
+
+
 def EnergySpecular(Energy, TwoThetaQz, sample: Sample, instrument: Instrument):
     """Simulate the specular signal from sample when probed with instrument. Energy should be in eV.
 
@@ -1120,6 +1176,48 @@ class TestSpecNX(ModelTestCase):
         inv = Specular(self.tth, sample_inv, instrument)
         np.testing.assert_array_equal(ref, inv)
 
+    def test_batch(self):
+        layer = Layer(d=150, sigma=2.0, f=3e-5 + 1e-7j, b=3e-6, dens=0.1, magn=0.1)
+        sample = Sample(
+            Stacks=[Stack(Layers=[layer])],
+            Ambient=Layer(),
+            Substrate=Layer(f=5e-5 + 2e-7j, b=4e-6, dens=0.1, sigma=3.0),
+        )
+        instrument = Instrument(
+            probe=Probe.xray,
+            coords=Coords.tth,
+            res=0.01,
+            restype=ResType.fast_conv,
+            beamw=0.1,
+            footype=FootType.square,
+            tthoff=0.0,
+            wavelength=1.54,
+        )
+        d_values = np.array([100.0, 150.0, 200.0])
+        I0_values = np.array([1.0, 2.0, 0.5])
+        for probe, pol in [
+            (Probe.xray, Polarization.up_up),
+            (Probe.neutron, Polarization.up_up),
+            (Probe.npol, Polarization.down_down),
+            (Probe.npol, Polarization.asymmetry),
+        ]:
+            with self.subTest(f"batch {probe}-{pol}"):
+                instrument.probe = probe
+                instrument.pol = pol
+                ref = []
+                for d, I0 in zip(d_values, I0_values):
+                    layer.d = d
+                    instrument.I0 = I0
+                    ref.append(Specular(self.tth, sample, instrument))
+                layer.d = population.PopulationArray(d_values)
+                instrument.I0 = population.PopulationArray(I0_values)
+                res = Specular(self.tth, sample, instrument)
+                np.testing.assert_array_almost_equal(np.array(ref), res)
+        with self.subTest("batch not supported"):
+            instrument.probe = Probe.npolsf
+            with self.assertRaises(BatchNotSupported):
+                Specular(self.tth, sample, instrument)
+
 
 def standard_xray():
     """
@@ -110,6 +110,7 @@ from genx.core.custom_logging import iprint
 from . import utils
 from .lib import USE_NUMBA
 from .lib.physical_constants import r_e
+from .lib.result_cache import array_digest, bulk_cache, digest
 from .symmetries import Sym, SymTrans
 
 if USE_NUMBA:
@@ -354,8 +355,35 @@ class Domain:
         return fs
 
     def calc_fb(self, inst, h, k, l):
-        """Calculate the structure factors from the bulk"""
+        """Calculate the structure factors from the bulk, the result is cached
+        as the bulk is rarely changed during a fit. The form factor functions
+        of the bulk elements are part of the key, so changes of the form factor
+        library are detected.
+        """
+        hkl = array_digest(h, k, l)
         h, k, l = self._to_array(h), self._to_array(k), self._to_array(l)
+        values = self.bulk_slab._extract_values()
+        # the functions are kept with the result, so their id is not reused while it is cached
+        fatoms = [getattr(inst.flib, elem) for elem in dict.fromkeys(values[3])]
+        key = digest(
+            "sxrd2.bulk",
+            hkl,
+            values,
+            [(so.P, so.t) for so in self.bulk_sym],
+            vars(self.unit_cell),
+            inst.alpha,
+            inst.wavel,
+            [id(fi) for fi in fatoms],
+        )
+        cached = bulk_cache.get(key)
+        if cached is not None:
+            return cached[0]
+        fb = self._calc_fb(inst, h, k, l)
+        bulk_cache.put(key, (fb, fatoms))
+        return fb
+
+    def _calc_fb(self, inst, h, k, l):
+        """Calculate the structure factors from the bulk without caching"""
         dinv = self.unit_cell.abs_hkl(h, k, l)
         x, y, z, el, u, oc, c = self.bulk_slab._extract_values()
         oc = oc / float(len(self.bulk_sym))
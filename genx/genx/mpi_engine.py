@@ -0,0 +1,203 @@
+"""
+Master-worker engine to evaluate parameter vectors on several MPI ranks.
+
+Rank 0 runs the optimizer and uses an MPIEvaluator to distribute the trial vectors,
+all other ranks run worker_loop. The model is broadcast once at startup and each
+evaluation transfers only float64 buffers using Scatterv/Gatherv. The number of vectors
+sent to each rank is adjusted after every evaluation according to the measured
+throughput of the ranks.
+
+If mpi4py is not available SerialComm is used, a communicator with just one rank
+that implements the same interface and allows to use the engine without MPI.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from logging import debug
+
+import numpy as np
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+
+class SerialComm:
+    """
+    Pure python replacement for an MPI communicator with a single rank.
+    Only implements the methods used within this module.
+    """
+
+    def Get_rank(self):
+        return 0
+
+    def Get_size(self):
+        return 1
+
+    def bcast(self, obj, root=0):
+        return obj
+
+    def gather(self, obj, root=0):
+        return [obj]
+
+    def Barrier(self):
+        pass
+
+    def Scatterv(self, sendbuf, recvbuf, root=0):
+        data, counts, displs = sendbuf[:3]
+        recvbuf.ravel()[:] = data.ravel()[displs[0] : displs[0] + counts[0]]
+
+    def Gatherv(self, sendbuf, recvbuf, root=0):
+        data, counts, displs = recvbuf[:3]
+        data.ravel()[displs[0] : displs[0] + counts[0]] = sendbuf
+
+
+def get_comm():
+    """
+    Return the MPI world communicator or a SerialComm if mpi4py is not installed.
+    """
+    if MPI is None:
+        return SerialComm()
+    return MPI.COMM_WORLD
+
+
+def _buffer_spec(data, counts, displs):
+    counts, displs = np.asarray(counts).tolist(), np.asarray(displs).tolist()
+    if MPI is None:
+        return [data, counts, displs]
+    return [data, counts, displs, MPI.DOUBLE]
+
+
+def split_counts(n_items, weights):
+    """
+    Split n_items into integer counts proportional to weights, the counts always add up to n_items.
+    """
+    weights = np.asarray(weights, dtype=float)
+    shares = n_items * weights / weights.sum()
+    counts = np.floor(shares).astype(int)
+    # distribute the remaining items to the largest remainders
+    remaining = n_items - counts.sum()
+    counts[np.argsort(counts - shares)[:remaining]] += 1
+    return counts
+
+
+def evaluate_share(comm, eval_func, vectors, counts, n_dim):
+    """
+    Scatter vectors (only needed on rank 0) according to counts, evaluate the
+    local share with eval_func and gather the results on rank 0.
+    Returns the array of all results on rank 0 and the local evaluation time.
+    """
+    rank = comm.Get_rank()
+    counts = np.asarray(counts, dtype=int)
+    displs = np.r_[0, np.cumsum(counts)[:-1]]
+    local = np.empty((counts[rank], n_dim), dtype=np.float64)
+    if rank == 0:
+        sendbuf = _buffer_spec(np.ascontiguousarray(vectors, dtype=np.float64), counts * n_dim, displs * n_dim)
+    else:
+        sendbuf = None
+    comm.Scatterv(sendbuf, local, root=0)
+
+    t_start = time.perf_counter()
+    local_result = np.array([eval_func(vec) for vec in local], dtype=np.float64)
+    t_eval = time.perf_counter() - t_start
+
+    if rank == 0:
+        result = np.empty(counts.sum(), dtype=np.float64)
+        recvbuf = _buffer_spec(result, counts, displs)
+    else:
+        result = None
+        recvbuf = None
+    comm.Gatherv(local_result, recvbuf, root=0)
+    return result, t_eval
+
+
+def worker_loop(comm, init_func, eval_func):
+    """
+    Main loop of ranks > 0. Waits for commands broadcast by the MPIEvaluator on rank 0.
+    """
+    debug(f"MPI rank {comm.Get_rank()} waiting for commands")
+    while True:
+        command = comm.bcast(None, root=0)
+        if command[0] == "init":
+            init_func(*command[1])
+        elif command[0] == "eval":
+            _, n_dim, counts = command
+            _, t_eval = evaluate_share(comm, eval_func, None, counts, n_dim)
+            comm.gather(t_eval, root=0)
+        elif command[0] == "stop":
+            break
+    debug(f"MPI rank {comm.Get_rank()} stopped")
+
+
+class MPIEvaluator:
+    """
+    Used on rank 0 to evaluate vectors on all ranks, the master rank evaluates its own share.
+    """
+
+    smoothing = 0.5  # weight of the latest throughput measurement in the load balancing
+
+    def __init__(self, comm, init_func, eval_func):
+        self.comm = comm
+        self.size = comm.Get_size()
+        self.init_func = init_func
+        self.eval_func = eval_func
+        self.weights = np.ones(self.size)
+        self.running = False
+        self.stopped = False
+
+    def start(self, *init_args):
+        """
+        Broadcast the initialization arguments (e.g. the pickled model) to all ranks.
+        """
+        self.comm.bcast(("init", init_args), root=0)
+        self.init_func(*init_args)
+        self.running = True
+
+    def evaluate(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float64)
+        n_items, n_dim = vectors.shape
+        counts = split_counts(n_items, self.weights)
+        self.comm.bcast(("eval", n_dim, counts), root=0)
+        result, t_eval = evaluate_share(self.comm, self.eval_func, vectors, counts, n_dim)
+        times = np.array(self.comm.gather(t_eval, root=0))
+        self.update_weights(counts, times)
+        return result
+
+    def update_weights(self, counts, times):
+        """
+        Adapt the weight of each rank to the number of evaluations it performed per second.
+        Ranks without evaluations keep their weight.
+        """
+        measured = (counts > 0) & (times > 0)
+        if not measured.any():
+            return
+        throughput = counts[measured] / times[measured]
+        # scale to the weights of the measured ranks to keep them comparable to the others
+        throughput *= self.weights[measured].mean() / throughput.mean()
+        self.weights[measured] = (1.0 - self.smoothing) * self.weights[measured] + self.smoothing * throughput
+
+    def stop(self):
+        """
+        Let all worker ranks leave the worker_loop, also if start was never called.
+        """
+        if not self.stopped:
+            self.comm.bcast(("stop",), root=0)
+            self.running = False
+            self.stopped = True
+
+
+def launch_mpi(n_processes, args, mpirun=None):
+    """
+    Start GenX with the given command line arguments on n_processes MPI ranks of the local machine.
+    """
+    mpirun = mpirun or os.environ.get("GENX_MPIRUN") or shutil.which("mpirun") or shutil.which("mpiexec")
+    if mpirun is None:
+        raise FileNotFoundError("Could not find mpirun or mpiexec, set GENX_MPIRUN to the MPI launcher")
+    cmd = [mpirun, "-n", str(n_processes), sys.executable, "-m", "genx", "--mpi"] + list(args)
+    debug(f"Launching MPI run: {cmd}")
+    return subprocess.call(cmd)
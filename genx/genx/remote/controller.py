@@ -3,15 +3,19 @@ The model controller and socket server for remote optimization.
 """
 
 import asyncio
-import struct
+import threading
+import time
+
+from dataclasses import replace
 
 from hashlib import blake2b
 from logging import debug, info, warning
 
 from ..core import AUTH_SIZE, HANDSHAKE1, HANDSHAKE2
-from ..diffev import DiffEv
+from ..diffev import DiffEv, parallel_calc_fom, parallel_init
 from ..model_control import ModelController
 from ..solver_basis import GenxOptimizerCallback, SolverParameterInfo, SolverResultInfo, SolverUpdateInfo
+from ..mpi_engine import get_comm, worker_loop
 from . import messaging
 
 try:
@@ -22,19 +26,58 @@ except ImportError:
 else:
     __mpi__ = bool(MPI.COMM_WORLD.Get_size() > 1)
     rank = MPI.COMM_WORLD.Get_rank()
-    comm = MPI.COMM_WORLD
+
+
+async def server_handshake(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, key: bytes):
+    """
+    Authenticate a new client connection, closes the connection and returns False if it fails.
+    """
+    ref1 = blake2b(HANDSHAKE1, key=key, digest_size=AUTH_SIZE).hexdigest().encode("ascii")
+    ref2 = blake2b(HANDSHAKE2, key=key, digest_size=AUTH_SIZE).hexdigest().encode("ascii")
+    res = await reader.read(len(ref1))
+    if res == ref1:
+        debug("Incoming message correct, sending response.")
+        writer.write(ref2)
+        await writer.drain()
+        return True
+    else:
+        debug("Handshake failed")
+        writer.close()
+        await writer.wait_closed()
+        debug("Connection closed")
+        return False
 
 
 class RemotCallback(GenxOptimizerCallback):
+    """
+    Sends the optimizer output to the client. Plot and parameter updates are sent at most
+    every min_time seconds, only the latest update is sent if there were several in between.
+    That update is marked as new best if any of the updates it replaces was.
+    With delta_updates only the changes since the last update are sent, see messaging.DeltaEncoder.
+    """
+
     loop: asyncio.AbstractEventLoop = None
+    delta_updates = False
+    min_time = 0.0
 
     def __init__(self, parent):
         GenxOptimizerCallback.__init__(self)
         self.parent = parent
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_sent = {}
+        self._sims = None
+        self.encoder = messaging.DeltaEncoder()
+
+    def configure(self, options: messaging.UpdateOptions):
+        self.delta_updates = options.delta_updates
+        self.min_time = options.min_time
+        self.encoder = messaging.DeltaEncoder()
+        self._last_sent = {}
+        self._sims = None
 
     async def send_message(self, message: messaging.GenXMessage):
-        self.parent.writer.write(message.message())
-        await self.parent.writer.drain()
+        await message.send(self.parent.writer)
 
     def _send_message(self, message: messaging.GenXMessage):
         if self.loop is None:
@@ -50,21 +93,73 @@ class RemotCallback(GenxOptimizerCallback):
             debug(f"cleanup fit locally")
             asyncio.run_coroutine_threadsafe(self.parent.cleanup(), self.loop)
 
+    def _send_throttled(self, kind, build, new_best):
+        """
+        Send the message created by build(new_best) at most every min_time seconds for each kind of update.
+        """
+        if self.loop is None:
+            raise RuntimeError("Could not send message, no asyncio event loop defined")
+        with self._lock:
+            scheduled = kind in self._pending
+            if scheduled:
+                # don't lose a new best update that has not been sent yet
+                new_best = new_best or self._pending[kind][1]
+            self._pending[kind] = (build, new_best)
+        if not scheduled:
+            asyncio.run_coroutine_threadsafe(self._send_pending(kind), self.loop)
+
+    async def _send_pending(self, kind):
+        delay = self._last_sent.get(kind, 0.0) + self.min_time - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        with self._lock:
+            pending = self._pending.pop(kind, None)
+        if pending is not None:
+            build, new_best = pending
+            self._last_sent[kind] = time.monotonic()
+            await self.send_message(build(new_best))
+
+    async def _send_final(self, message: messaging.GenXMessage):
+        # write the updates that are still waiting before the result without giving way to the cleanup
+        with self._lock:
+            builds = list(self._pending.values())
+            self._pending.clear()
+        writer = self.parent.writer
+        async with messaging.writer_lock(writer):
+            for build, new_best in builds:
+                for chunk in build(new_best).message_chunks():
+                    writer.write(chunk)
+            for chunk in message.message_chunks():
+                writer.write(chunk)
+            await writer.drain()
+
     def text_output(self, text):
         msg = messaging.StingMessage(text)
         self._send_message(msg)
 
     def plot_output(self, update_data: SolverUpdateInfo):
-        msg = messaging.OptimizerUpdate(update_data)
-        self._send_message(msg)
+        if self.delta_updates:
+            if update_data.new_best or self._sims is None:
+                self._sims = self.encoder.sim_snapshot(update_data.data)
+            sims = self._sims
+            build = lambda new_best: self.encoder.update_message(replace(update_data, new_best=new_best), sims)
+        else:
+            build = lambda new_best: messaging.OptimizerUpdate(replace(update_data, new_best=new_best))
+        self._send_throttled("plot", build, update_data.new_best)
 
     def parameter_output(self, param_info: SolverParameterInfo):
-        msg = messaging.OptimizerUpdate(param_info)
-        self._send_message(msg)
+        if self.delta_updates:
+            build = lambda new_best: self.encoder.parameter_message(replace(param_info, new_best=new_best))
+        else:
+            build = lambda new_best: messaging.OptimizerUpdate(replace(param_info, new_best=new_best))
+        self._send_throttled("parameters", build, param_info.new_best)
 
     def fitting_ended(self, result_data: SolverResultInfo):
         msg = messaging.OptimizerUpdate(result_data)
-        self._send_message(msg)
+        if self.loop is None:
+            raise RuntimeError("Could not send message, no asyncio event loop defined")
+        debug(f"sending message {msg}")
+        asyncio.run_coroutine_threadsafe(self._send_final(msg), self.loop)
         self._end_fit()
 
     def autosave(self):
@@ -95,12 +190,17 @@ class RemoteController(ModelController):
         if rank == 0:
             server = await asyncio.start_server(self.handle_connection, address, port)
 
-            async with server:
-                info(f"Starting listening on {address} with port={port}")
-                await server.serve_forever()
+            try:
+                async with server:
+                    info(f"Starting listening on {address} with port={port}")
+                    await server.serve_forever()
+            finally:
+                # release the other MPI ranks from their worker_loop
+                self.optimizer.dismount_parallel_mpi()
         else:
-            debug(f"Starting MPI client process for server on {address} with port={port}")
-            await self.recive_mpi()
+            # the model of each fit is sent by the MPIEvaluator of rank 0
+            debug(f"Starting MPI worker process for server on {address} with port={port}")
+            worker_loop(get_comm(), parallel_init, parallel_calc_fom)
 
     async def handle_connection(self, reader, writer):
         debug("New connection")
@@ -114,26 +214,14 @@ class RemoteController(ModelController):
                 await self.recv_messages()
 
     async def handshake(self):
-        key = self.key
-        ref1 = blake2b(HANDSHAKE1, key=key, digest_size=AUTH_SIZE).hexdigest().encode("ascii")
-        ref2 = blake2b(HANDSHAKE2, key=key, digest_size=AUTH_SIZE).hexdigest().encode("ascii")
-        res = await self.reader.read(len(ref1))
-        if res == ref1:
-            debug("Incoming message correct, sending response.")
-            self.writer.write(ref2)
-            await self.writer.drain()
-        else:
-            debug("Handshake failed")
-            self.writer.close()
-            await self.writer.wait_closed()
-            debug("Connection closed")
+        if not await server_handshake(self.reader, self.writer, self.key):
             self.reader = None
             self.writer = None
 
     async def recv_messages(self):
         try:
             res = await messaging.GenXMessage.receive(self.reader)
-        except (ConnectionResetError, struct.error):
+        except (ConnectionResetError, asyncio.IncompleteReadError):
             if self.cleanup_phase:
                 return
             else:
@@ -148,12 +236,9 @@ class RemoteController(ModelController):
                 self.callbacks.loop = asyncio.get_running_loop()
                 if self.optimizer.opt.use_mpi:
                     if __mpi__:
-                        # server is just run on rank=0 so send model to clients
+                        # the server runs on rank 0, the optimizer distributes the model to the other ranks
                         self.optimizer.opt.use_parallel_processing = False
                         self.optimizer.WriteConfig()
-                        comm.Barrier()
-                        comm.bcast(self.model, root=0)
-                        comm.bcast(self.optimizer.opt, root=0)
                     else:
                         warning(
                             "Fit was started with use_mpi option selected, but server is started without MPI support"
@@ -168,6 +253,9 @@ class RemoteController(ModelController):
             else:
                 warning(f"Action not implemented {res!r}")
                 return
+        elif isinstance(res, messaging.UpdateOptions):
+            info(f"Update options: delta_updates={res.delta_updates}, min_time={res.min_time}")
+            self.callbacks.configure(res)
         elif isinstance(res, messaging.ModelTransfer):
             info("Setting a new model")
             self.model = res.model
@@ -180,18 +268,7 @@ class RemoteController(ModelController):
 
     async def send_message(self, message: messaging.GenXMessage):
         debug(f"Sending message {message}")
-        self.writer.write(message.message())
-        await self.writer.drain()
-
-    async def recive_mpi(self):
-        while True:
-            comm.Barrier()
-            self.model = comm.bcast(self.model, root=0)
-            self.optimizer.opt = comm.bcast(self.optimizer.opt, root=0)
-            self.optimizer.WriteConfig()
-            self.StartFit()
-            while self.optimizer.is_running():
-                await asyncio.sleep(0.1)
+        await message.send(self.writer)
 
     async def cleanup(self):
         if self.cleanup_phase:
@@ -203,7 +280,8 @@ class RemoteController(ModelController):
         while self.optimizer.is_running():
             await asyncio.sleep(0.1)
         debug("Closing connection")
-        self.writer.close()
+        async with messaging.writer_lock(self.writer):
+            self.writer.close()
         await self.writer.wait_closed()
         debug("Connection closed")
         self.reader = None
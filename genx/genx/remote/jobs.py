@@ -0,0 +1,393 @@
+"""
+Job server for remote refinement that runs several fits at the same time.
+
+Clients submit a model as fit job and can reconnect to it later with its job id to
+follow the refinement or to retrieve the result. Each job has its own DiffEv optimizer
+and at most max_jobs of them are running at a time, the others wait in a queue.
+Each job evaluates its population in a pool of worker processes. The pool gets an equal
+share of the server cores among the jobs running at the moment the job starts.
+"""
+
+import asyncio
+import secrets
+import threading
+import time
+
+from collections import OrderedDict, deque
+from logging import debug, info, warning
+from typing import List
+
+from ..diffev import DiffEv, DiffEvConfig, _cpu_count
+from ..model import Model
+from ..solver_basis import GenxOptimizerCallback, SolverParameterInfo, SolverResultInfo, SolverUpdateInfo
+from . import messaging
+from .controller import RemotCallback, server_handshake
+
+JobState = messaging.JobState
+
+
+class JobCallbacks(GenxOptimizerCallback):
+    """
+    Keeps the latest output of the optimizer of a job and forwards it to all attached clients.
+    """
+
+    def __init__(self, job: "FitJob"):
+        GenxOptimizerCallback.__init__(self)
+        self.job = job
+        self.listeners = []
+        self.ended = False
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: RemotCallback):
+        """
+        Attach a client to the job, returns False if the job has ended already.
+        """
+        with self._lock:
+            if self.ended:
+                return False
+            self.listeners.append(listener)
+            return True
+
+    def remove_listener(self, listener: RemotCallback):
+        with self._lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def _get_listeners(self):
+        with self._lock:
+            return list(self.listeners)
+
+    def text_output(self, text):
+        debug(f"Job {self.job.job_id}: {text}")
+        for listener in self._get_listeners():
+            listener.text_output(text)
+
+    def plot_output(self, update_data: SolverUpdateInfo):
+        self.job.last_update = update_data
+        if len(update_data.fom_log) > 0:
+            self.job.generation = int(update_data.fom_log[-1][0])
+            self.job.best_fom = float(update_data.fom_log[-1][1])
+        for listener in self._get_listeners():
+            listener.plot_output(update_data)
+
+    def parameter_output(self, param_info: SolverParameterInfo):
+        self.job.last_param = param_info
+        for listener in self._get_listeners():
+            listener.parameter_output(param_info)
+
+    def fitting_ended(self, result_data: SolverResultInfo):
+        self.job_ended(result_data)
+
+    def job_ended(self, result_data: SolverResultInfo = None, error_message=None):
+        with self._lock:
+            self.ended = True
+            listeners = self.listeners
+            self.listeners = []
+        self.job.finish(result_data, error_message)
+        for listener in listeners:
+            if result_data is None:
+                listener.text_output(f"Job {self.job.job_id} ended without result")
+                listener._end_fit()
+            else:
+                listener.fitting_ended(result_data)
+
+    def autosave(self):
+        pass
+
+
+class FitJob:
+    """
+    A model that is refined on the server with its own optimizer.
+    """
+
+    def __init__(self, job_id: str, model: Model, fitparams: DiffEvConfig, description=""):
+        self.job_id = job_id
+        self.model = model
+        self.description = description
+        self.optimizer = DiffEv()
+        self.optimizer.opt = fitparams
+        self.callbacks = JobCallbacks(self)
+        self.optimizer.set_callbacks(self.callbacks)
+
+        self.state = JobState.QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.ended = None
+        self.generation = 0
+        self.best_fom = None
+        self.error_message = None
+        self.cancelled = False
+
+        self.last_update = None
+        self.last_param = None
+        self.result = None
+        self.on_end = None  # called with the job after it has ended, from the thread of the optimizer
+
+    def info(self) -> messaging.JobInfo:
+        return messaging.JobInfo(
+            job_id=self.job_id,
+            description=self.description,
+            state=self.state,
+            submitted=self.submitted,
+            started=self.started,
+            ended=self.ended,
+            generation=self.generation,
+            best_fom=self.best_fom,
+            n_fom_evals=getattr(self.optimizer, "n_fom", 0),
+            error_message=self.error_message,
+        )
+
+    def start(self):
+        """
+        Compile the model and start the fit, the fit itself runs in the thread of the optimizer.
+        """
+        self.state = JobState.RUNNING
+        self.started = time.time()
+        try:
+            if not self.model.compiled:
+                self.model.simulate(recompile=True)
+            self.model.parameters.clear_error_pars()
+            if self.cancelled:
+                self.callbacks.job_ended()
+            elif not self.optimizer.start_fit(self.model):
+                self.callbacks.job_ended(error_message="Fit could not be started")
+        except Exception as e:
+            debug(f"Could not start job {self.job_id}", exc_info=True)
+            self.callbacks.job_ended(error_message=f"Could not start the fit:\n{e!r}")
+
+    def request_simulation(self):
+        """
+        Get the simulation of the best parameters with the next update of a running job.
+        """
+        if self.state is JobState.RUNNING:
+            self.optimizer.request_simulation()
+
+    def stop(self):
+        self.cancelled = True
+        if self.state is JobState.QUEUED:
+            self.callbacks.job_ended()
+        elif self.state is JobState.RUNNING and self.optimizer.is_running():
+            self.optimizer.stop_fit()
+
+    def finish(self, result: SolverResultInfo = None, error_message=None):
+        self.result = result
+        if error_message is None and result is not None:
+            error_message = result.error_message
+        self.error_message = error_message
+        if error_message:
+            self.state = JobState.FAILED
+        elif self.cancelled or result is None:
+            self.state = JobState.STOPPED
+        else:
+            self.state = JobState.FINISHED
+        self.ended = time.time()
+        if self.on_end is not None:
+            self.on_end(self)
+
+
+class JobConnection:
+    """
+    A client connection to the JobServer. Clients that follow a job receive its output
+    through a RemotCallback, the connection is closed by the server after the job has ended.
+    """
+
+    def __init__(self, server: "JobServer", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.transfer = None
+        self.options = messaging.UpdateOptions(delta_updates=False, min_time=0.0)
+        self.listener = None
+        self.job = None
+        self.cleanup_phase = False
+
+    async def run(self):
+        while self.reader is not None and not self.cleanup_phase:
+            try:
+                res = await messaging.GenXMessage.receive(self.reader)
+            except (ConnectionResetError, asyncio.IncompleteReadError):
+                if not self.cleanup_phase:
+                    debug("Connection was closed by the client")
+                    await self.cleanup()
+                return
+            await self.handle_message(res)
+
+    async def handle_message(self, res: messaging.GenXMessage):
+        if isinstance(res, messaging.ModelTransfer):
+            info("Received a model")
+            self.transfer = res
+        elif isinstance(res, messaging.UpdateOptions):
+            self.options = res
+        elif isinstance(res, messaging.ActionMessage):
+            await self.handle_action(res)
+        elif isinstance(res, messaging.StingMessage):
+            info(f"Received text message: {res.text}")
+        elif isinstance(res, messaging.EchoMessage):
+            info(f'Echoing message "{res.text}"')
+            await self.send_message(messaging.StingMessage(res.text))
+        else:
+            warning(f"Message not implemented {res!r}")
+
+    async def handle_action(self, action: messaging.ActionMessage):
+        action_type = action.action_type
+        if action_type in [messaging.ActionType.START_FIT, messaging.ActionType.SUBMIT_JOB]:
+            if self.transfer is None:
+                await self.send_message(messaging.StingMessage("A model has to be transferred before starting a fit"))
+                return
+            job = self.server.submit(self.transfer.model, self.transfer.fitparams, action.description)
+            self.transfer = None
+            if action_type is messaging.ActionType.START_FIT:
+                # clients that started a fit directly follow the new job
+                await self.send_message(messaging.StingMessage(f"Fit is running as job {job.job_id}"))
+                self.attach(job)
+            else:
+                await self.send_status([job])
+        elif action_type is messaging.ActionType.STOP_FIT:
+            if self.job is not None:
+                self.job.stop()
+        elif action_type is messaging.ActionType.ATTACH_JOB:
+            job = self.server.jobs.get(action.short_info)
+            await self.send_status([job] if job else [])
+            if job is not None:
+                self.attach(job)
+        elif action_type is messaging.ActionType.JOB_STATUS:
+            if action.short_info:
+                job = self.server.jobs.get(action.short_info)
+                if job is not None:
+                    # clients following the job get the simulation of the best parameters with the next update
+                    job.request_simulation()
+                await self.send_status([job] if job else [])
+            else:
+                await self.send_status(list(self.server.jobs.values()))
+        elif action_type is messaging.ActionType.JOB_RESULT:
+            job = self.server.jobs.get(action.short_info)
+            if job is not None:
+                job.request_simulation()
+            await self.send_status([job] if job else [])
+            if job is not None and job.last_update is not None:
+                await self.send_message(messaging.OptimizerUpdate(job.last_update))
+            if job is not None and job.result is not None:
+                await self.send_message(messaging.OptimizerUpdate(job.result))
+        elif action_type is messaging.ActionType.CANCEL_JOB:
+            job = self.server.jobs.get(action.short_info)
+            if job is not None:
+                job.stop()
+            await self.send_status([job] if job else [])
+        else:
+            warning(f"Action not implemented {action!r}")
+
+    def attach(self, job: FitJob):
+        """
+        Send the output of job to this client, starting with its last state.
+        """
+        listener = RemotCallback(self)
+        listener.configure(self.options)
+        listener.loop = asyncio.get_running_loop()
+        self.listener = listener
+        self.job = job
+        if not job.callbacks.add_listener(listener):
+            if job.result is not None:
+                listener.fitting_ended(job.result)
+            else:
+                listener._end_fit()
+            return
+        if job.last_param is not None:
+            listener.parameter_output(job.last_param)
+        if job.last_update is not None:
+            listener.plot_output(job.last_update)
+
+    async def send_status(self, jobs: List[FitJob]):
+        await self.send_message(messaging.JobStatus([job.info() for job in jobs]))
+
+    async def send_message(self, message: messaging.GenXMessage):
+        debug(f"Sending message {message}")
+        await message.send(self.writer)
+
+    async def cleanup(self):
+        if self.cleanup_phase:
+            return
+        debug("Closing connection")
+        self.cleanup_phase = True
+        if self.job is not None:
+            # the job keeps running, the client can attach to it again later
+            self.job.callbacks.remove_listener(self.listener)
+        async with messaging.writer_lock(self.writer):
+            self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        self.reader = None
+
+
+class JobServer:
+    """
+    Socket server that accepts fit jobs from several clients and runs up to max_jobs of them
+    at the same time. When a job starts, the given number of cores is split evenly between the
+    jobs running at that moment, so a job running alone uses all of them.
+    """
+
+    key = b"empty"
+
+    def __init__(self, max_jobs=1, cores=_cpu_count, keep_ended=100):
+        self.max_jobs = max(1, max_jobs)
+        self.cores = max(1, cores)
+        self.keep_ended = keep_ended
+        self.jobs = OrderedDict()
+        self.queue = deque()
+        self.loop = None
+
+    def submit(self, model: Model, fitparams: DiffEvConfig, description="") -> FitJob:
+        job_id = secrets.token_hex(6)
+        fitparams.use_mpi = False
+        # the population is always evaluated in worker processes of the job, also with a single core per job,
+        # so the evaluations of different jobs don't share the interpreter and the model caches of the server
+        fitparams.use_parallel_processing = True
+        fitparams.use_persistent_pool = False
+        job = FitJob(job_id, model, fitparams, description)
+        job.on_end = lambda job: self.loop.call_soon_threadsafe(self.job_ended, job)
+        info(f"Job {job_id} queued")
+        self.jobs[job_id] = job
+        self.queue.append(job)
+        self.schedule()
+        return job
+
+    def running_jobs(self):
+        return [job for job in self.jobs.values() if job.state is JobState.RUNNING]
+
+    def schedule(self):
+        """
+        Start queued jobs until max_jobs are running. The pools of the started jobs
+        get an equal share of the cores among all running jobs.
+        """
+        started = []
+        while self.queue and len(self.running_jobs()) < self.max_jobs:
+            job = self.queue.popleft()
+            if job.state is not JobState.QUEUED:
+                continue
+            job.state = JobState.RUNNING
+            started.append(job)
+        processes = max(1, self.cores // max(1, len(self.running_jobs())))
+        for job in started:
+            info(f"Starting job {job.job_id} with {processes} processes")
+            job.optimizer.opt.parallel_processes = processes
+            self.loop.run_in_executor(None, job.start)
+
+    def job_ended(self, job: FitJob):
+        info(f"Job {job.job_id} ended with state {job.state.value}")
+        ended = [ji for ji in self.jobs.values() if ji.ended is not None]
+        for ji in ended[: max(0, len(ended) - self.keep_ended)]:
+            del self.jobs[ji.job_id]
+        self.schedule()
+
+    async def serve(self, address, port):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle_connection, address, port)
+        async with server:
+            info(f"Starting job server on {address} with port={port}, {self.max_jobs} jobs on {self.cores} cores")
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        debug("New connection")
+        if await server_handshake(reader, writer, self.key):
+            await JobConnection(self, reader, writer).run()
@@ -4,15 +4,21 @@ Messaging protocol for remote model refinement with GenX server.
 
 import asyncio
 import struct
+import weakref
 import zlib
 
 from abc import ABC
+from copy import deepcopy
 from dataclasses import dataclass
 from enum import Enum
+from hashlib import blake2b
 from logging import debug
-from pickle import dumps, loads
-from typing import Union
+from pickle import PickleBuffer, dumps, loads
+from typing import Dict, Iterator, List, Optional, Union
 
+from numpy import array, concatenate, float64, frombuffer
+
+from ..data import DataList
 from ..diffev import DiffEvConfig
 from ..model import Model
 from ..solver_basis import GenxOptimizer, SolverParameterInfo, SolverResultInfo, SolverUpdateInfo
@@ -20,6 +26,68 @@ from ..solver_basis import GenxOptimizer, SolverParameterInfo, SolverResultInfo,
 header_types = {}
 
 
+# buffers of at least this size (e.g. numpy arrays) are send outside of the pickle stream
+OUT_OF_BAND_SIZE = 64 * 1024
+# size of the pieces that are compressed and send at a time
+CHUNK_SIZE = 1024 * 1024
+
+_write_locks = weakref.WeakKeyDictionary()
+
+
+def writer_lock(writer: asyncio.StreamWriter) -> asyncio.Lock:
+    """
+    Lock to acquire for writing to writer, a message is send in several pieces.
+    """
+    try:
+        return _write_locks[writer]
+    except KeyError:
+        lock = _write_locks[writer] = asyncio.Lock()
+        return lock
+
+
+def compressed_stream(data) -> Iterator[bytes]:
+    """
+    Compress data piece by piece. Yields the uncompressed length followed by length prefixed
+    compressed chunks, a chunk of length zero ends the stream.
+    """
+    data = memoryview(data).cast("B")
+    yield struct.pack("<Q", data.nbytes)
+    compressor = zlib.compressobj(1)
+    for start in range(0, data.nbytes, CHUNK_SIZE):
+        chunk = compressor.compress(data[start : start + CHUNK_SIZE])
+        if chunk:
+            yield struct.pack("<Q", len(chunk)) + chunk
+    chunk = compressor.flush()
+    if chunk:
+        yield struct.pack("<Q", len(chunk)) + chunk
+    yield struct.pack("<Q", 0)
+
+
+async def read_compressed_stream(io: asyncio.StreamReader) -> bytearray:
+    """
+    Read a stream created by compressed_stream and decompress it into a single pre-allocated buffer.
+    """
+    length = struct.unpack("<Q", await io.readexactly(8))[0]
+    output = bytearray(length)
+    decompressor = zlib.decompressobj()
+    pos = 0
+    while True:
+        chunk_length = struct.unpack("<Q", await io.readexactly(8))[0]
+        if chunk_length == 0:
+            chunk = decompressor.flush()
+        else:
+            chunk = decompressor.decompress(await io.readexactly(chunk_length))
+        if pos + len(chunk) > length:
+            raise ValueError("Received more data than announced in message")
+        output[pos : pos + len(chunk)] = chunk
+        pos += len(chunk)
+        if chunk_length == 0:
+            break
+    if pos != length:
+        raise ValueError(f"Received {pos} bytes of data but {length} bytes were announced in message")
+    return output
+
+
 @dataclass
 class GenXMessage(ABC):
     """
@@ -31,11 +99,17 @@ class GenXMessage(ABC):
     to work with the data.
 
     The Constructed message has the following form:
-    ## Header Length ## (4 bytes, single unsigned integer)
+    ## Header Length ## (8 bytes, single unsigned long long)
     ## Header Type ## (4 bytes, single unsigned integer) Defines the message class for the header
-    ## Header Data ## (pickled header with length {Header Length}-24)
-    ## Data Length ## (8 bytes, single unsigned long long)
-    ## Data ## (bz2 compressed pickled class with data)
+    ## Header Data ## (pickled header with length {Header Length})
+    ## Buffer Count ## (4 bytes, single unsigned integer)
+    ## Data ## (compressed stream of the class pickled with protocol 5)
+    ## Buffers ## ({Buffer Count} compressed streams of the out-of-band pickle buffers)
+
+    Large numpy arrays are transferred as out-of-band buffers and are neither copied into the
+    pickle string nor concatenated to one message. Each compressed stream starts with the
+    uncompressed length (8 bytes) followed by compressed chunks, each prefixed with its
+    length (8 bytes). A chunk of length zero ends the stream.
     """
 
     HEADER_TYPE = 0
@@ -53,38 +127,51 @@ class GenXMessage(ABC):
         """
         return b""
 
-    def make_data(self):
-        return dumps(self)
+    def make_data(self, buffer_callback=None):
+        return dumps(self, protocol=5, buffer_callback=buffer_callback)
+
+    def message_chunks(self) -> Iterator[bytes]:
+        """
+        Yield the message in pieces, the buffers are compressed while the message is being send.
+        """
+        buffers = []
+
+        def buffer_callback(buffer: PickleBuffer):
+            if buffer.raw().nbytes < OUT_OF_BAND_SIZE:
+                return True
+            buffers.append(buffer)
+            return False
 
-    def message(self):
         header = self.make_header()
-        data = self.make_data()
-        data = zlib.compress(data, 1)
-        message = struct.pack("I", len(header) + 4)
-        message += struct.pack("I", self.HEADER_TYPE)
-        message += header
-        message += struct.pack("I", len(data))
-        message += data
-        return message
+        data = self.make_data(buffer_callback)
+        yield struct.pack("<QI", len(header), self.HEADER_TYPE) + header + struct.pack("<I", len(buffers))
+        yield from compressed_stream(data)
+        for buffer in buffers:
+            yield from compressed_stream(buffer.raw())
+
+    def message(self):
+        return b"".join(self.message_chunks())
+
+    async def send(self, writer: asyncio.StreamWriter):
+        async with writer_lock(writer):
+            for chunk in self.message_chunks():
+                writer.write(chunk)
+                await writer.drain()
 
     @staticmethod
     async def receive(io: asyncio.StreamReader) -> "GenXMessage":
         debug("GenXMessage receiving")
-        header_length = struct.unpack("I", await io.read(4))[0]
-        header_type = struct.unpack("I", await io.read(4))[0]
+        header_length, header_type = struct.unpack("<QI", await io.readexactly(12))
         debug(f"GenXMessage header_length={header_length} ; header_type={header_type}")
+        header_string = await io.readexactly(header_length)
         if header_type != 0:
-            header_string = await io.read(header_length)
             header_data = loads(header_string)
             header_types[header_type].use_header(header_data)
-        data_length = struct.unpack("I", await io.read(4))[0]
-        debug(f"GenXMessage data_length={data_length}")
-        data_string = await io.read(data_length)
-        debug(f"Length of data_string received: {len(data_string)}")
-        while len(data_string) < data_length:
-            data_string += await io.read(data_length - len(data_string))
-        data_string = zlib.decompress(data_string)
-        res = loads(data_string)
+        n_buffers = struct.unpack("<I", await io.readexactly(4))[0]
+        data_string = await read_compressed_stream(io)
+        debug(f"GenXMessage data_length={len(data_string)} ; n_buffers={n_buffers}")
+        buffers = [await read_compressed_stream(io) for _ in range(n_buffers)]
+        res = loads(data_string, buffers=buffers)
         debug(f"GenXMessage of type {type(res)} sucessfully unpacked")
         return res
 
@@ -103,6 +190,12 @@ class EchoMessage(GenXMessage):
 class ActionType(int, Enum):
     START_FIT = 1
     STOP_FIT = 2
+    # actions of the job server, the job id is send as short_info
+    SUBMIT_JOB = 3
+    ATTACH_JOB = 4
+    JOB_STATUS = 5
+    JOB_RESULT = 6
+    CANCEL_JOB = 7
 
 
 @dataclass
@@ -118,9 +211,174 @@ class ModelTransfer(GenXMessage):
     fitparams: DiffEvConfig
 
 
+class JobState(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    STOPPED = "stopped"
+    FAILED = "failed"
+
+
+@dataclass
+class JobInfo:
+    # Status of a fit job on the server
+    job_id: str
+    description: str
+    state: JobState
+    submitted: float
+    started: Optional[float] = None
+    ended: Optional[float] = None
+    generation: int = 0
+    best_fom: Optional[float] = None
+    n_fom_evals: int = 0
+    error_message: Optional[str] = None
+
+
+@dataclass
+class JobStatus(GenXMessage):
+    # Answer of the job server to all job actions
+    jobs: List[JobInfo]
+
+
 @dataclass
 class OptimizerUpdate(GenXMessage):
     payload: Union[SolverUpdateInfo, SolverParameterInfo, SolverResultInfo]
 
     def __repr__(self):
         return f"OptimizerUpdate(payload={self.payload.__class__.__name__})"
+
+
+@dataclass
+class UpdateOptions(GenXMessage):
+    # Client request for the way the server sends optimizer updates
+    delta_updates: bool
+    min_time: float
+
+
+def pack_array(value) -> bytes:
+    return array(value, dtype=float64).tobytes()
+
+
+def unpack_array(value: bytes, columns=None):
+    output = frombuffer(value, dtype=float64)
+    if columns:
+        output = output.reshape(-1, columns)
+    return output
+
+
+@dataclass
+class UpdateDelta(GenXMessage):
+    """
+    Changes of a SolverUpdateInfo since the last update that has been sent.
+    Contains the new part of the fom_log and the simulations of the datasets that have changed.
+    """
+
+    new_best: bool
+    fom_value: float
+    fom_name: str
+    fom_log_start: int
+    fom_log: bytes
+    sims: Dict[int, tuple]
+
+    def __repr__(self):
+        return f"UpdateDelta(fom_log_start={self.fom_log_start}, sims={sorted(self.sims.keys())})"
+
+
+@dataclass
+class ParameterDelta(GenXMessage):
+    # A SolverParameterInfo with the arrays packed as bytes
+    values: bytes
+    new_best: bool
+    population: bytes
+    max_val: bytes
+    min_val: bytes
+    fitting: bool
+
+    def __repr__(self):
+        return f"ParameterDelta(new_best={self.new_best})"
+
+
+class DeltaEncoder:
+    """
+    Creates the delta messages for optimizer updates on the server. Keeps track of
+    what has been sent to the client before.
+    """
+
+    def __init__(self):
+        self.fom_log_sent = 0
+        self.sim_hashes = {}
+
+    @staticmethod
+    def sim_snapshot(data: DataList):
+        """
+        Copy the simulation of all datasets, used when the update is not sent immediately.
+        """
+        return [(di.y_sim.copy(), di.y_fom.copy()) for di in data]
+
+    def update_message(self, update_data: SolverUpdateInfo, sims) -> UpdateDelta:
+        fom_log = array(update_data.fom_log, dtype=float64)
+        start = min(self.fom_log_sent, len(fom_log))
+        self.fom_log_sent = len(fom_log)
+        changed = {}
+        for i, (y_sim, y_fom) in enumerate(sims):
+            packed = (pack_array(y_sim), pack_array(y_fom))
+            sim_hash = blake2b(packed[0] + packed[1], digest_size=16).digest()
+            if self.sim_hashes.get(i) != sim_hash:
+                self.sim_hashes[i] = sim_hash
+                changed[i] = packed
+        return UpdateDelta(
+            new_best=update_data.new_best,
+            fom_value=float(update_data.fom_value),
+            fom_name=update_data.fom_name,
+            fom_log_start=start,
+            fom_log=pack_array(fom_log[start:]),
+            sims=changed,
+        )
+
+    @staticmethod
+    def parameter_message(param_info: SolverParameterInfo) -> ParameterDelta:
+        return ParameterDelta(
+            values=pack_array(param_info.values),
+            new_best=param_info.new_best,
+            population=pack_array(param_info.population),
+            max_val=pack_array(param_info.max_val),
+            min_val=pack_array(param_info.min_val),
+            fitting=param_info.fitting,
+        )
+
+
+class DeltaDecoder:
+    """
+    Rebuilds the optimizer updates from delta messages on the client, starting from a
+    copy of the data of the model that is fitted.
+    """
+
+    def __init__(self, data: DataList):
+        self.data = deepcopy(data)
+        self.fom_log = array([[0, 0]], dtype=float64)[0:0]
+
+    def update_info(self, message: UpdateDelta) -> SolverUpdateInfo:
+        tail = unpack_array(message.fom_log, 2)
+        self.fom_log = concatenate([self.fom_log[: message.fom_log_start], tail])
+        for i, (y_sim, y_fom) in message.sims.items():
+            self.data[i].y_sim = unpack_array(y_sim).copy()
+            self.data[i].y_fom = unpack_array(y_fom).copy()
+        return SolverUpdateInfo(
+            new_best=message.new_best,
+            fom_value=message.fom_value,
+            fom_name=message.fom_name,
+            fom_log=self.fom_log,
+            data=self.data,
+        )
+
+    @staticmethod
+    def parameter_info(message: ParameterDelta) -> SolverParameterInfo:
+        values = unpack_array(message.values)
+        return SolverParameterInfo(
+            values=values,
+            new_best=message.new_best,
+            population=list(unpack_array(message.population, len(values))),
+            max_val=unpack_array(message.max_val),
+            min_val=unpack_array(message.min_val),
+            fitting=message.fitting,
+        )
@@ -5,12 +5,12 @@ Currently, only differential evolution is supported.
 """
 
 import asyncio
-import struct
 
 from dataclasses import dataclass
 from hashlib import blake2b
 from logging import debug
 from threading import Thread
+from typing import List
 
 from numpy import array
 
@@ -29,10 +29,13 @@ class RemoteDiffEvConfig(BaseConfig):
     address: str = "localhost"
     port: int = 3000
     key: str = "empty"
+    use_delta_updates: bool = True
+    min_update_time: float = BaseConfig.GParam(0.5, pmin=0.0, pmax=60.0, label="min. update interval (s)")
 
     km: float = BaseConfig.GParam(0.7, pmin=0.0, pmax=1.0)
     kr: float = BaseConfig.GParam(0.7, pmin=0.0, pmax=1.0)
     allowed_fom_discrepancy: float = 1e-10
+    random_seed: int = -1
 
     use_pop_mult: bool = True
     pop_size: int = BaseConfig.GParam(50, pmin=5, pmax=10000, label="Fixed size")
@@ -56,19 +59,28 @@ class RemoteDiffEvConfig(BaseConfig):
     use_parallel_processing: bool = False
     parallel_processes: int = BaseConfig.GParam(16, pmin=2, pmax=1000, label="# processes")
     parallel_chunksize: int = BaseConfig.GParam(10, pmin=1, pmax=1000, label="items/chunk")
+    use_batch_eval: bool = False
+    use_persistent_pool: bool = False
+    use_steady_state: bool = False
 
     use_autosave: bool = False
     autosave_interval: int = BaseConfig.GParam(10, pmin=1, pmax=1000, label=", interval")
 
     save_all_evals: bool = False
+    use_evals_file: bool = False
     errorbar_level: float = BaseConfig.GParam(1.05, pmin=1.001, pmax=2.0)
 
+    use_lazy_sim: bool = False
+    sim_check_interval: int = BaseConfig.GParam(10, pmin=1, pmax=1000, label=", check interval")
+
     groups = {  # for building config dialogs
-        "Server": ["address", "port", "key"],
+        "Server": ["address", "port", "key", "use_delta_updates", "min_update_time"],
         "Fitting": [
             ["use_start_guess", "use_boundaries"],
             ["use_autosave", "autosave_interval"],
             ["save_all_evals", "max_log_elements"],
+            "use_evals_file",
+            ["use_lazy_sim", "sim_check_interval"],
         ],
         "Differential Evolution": [
             "km",
@@ -78,7 +90,15 @@ class RemoteDiffEvConfig(BaseConfig):
             ["Max. Generations:", "use_max_generations", "max_generations", "max_generation_mult"],
             "min_parameter_spread",
         ],
-        "Parallel processing": ["use_mpi", "use_parallel_processing", "parallel_processes", "parallel_chunksize"],
+        "Parallel processing": [
+            "use_mpi",
+            "use_parallel_processing",
+            "parallel_processes",
+            "parallel_chunksize",
+            "use_batch_eval",
+            "use_persistent_pool",
+            "use_steady_state",
+        ],
     }
 
 
@@ -106,6 +126,7 @@ class RemoteOptimizer(GenxOptimizer):
 
         self.reader = None
         self.writer = None
+        self.decoder = None
 
     def pickle_string(self, clear_evals: bool = False):
         pass
@@ -164,6 +185,8 @@ class RemoteOptimizer(GenxOptimizer):
             await self.connect()
             debug("Connection successful")
             await self.send_message(self.model_message(model))
+            self.decoder = messaging.DeltaDecoder(model.data)
+            await self.send_message(messaging.UpdateOptions(self.opt.use_delta_updates, self.opt.min_update_time))
             self.text_output("Starting the fit...")
             await self.send_message(messaging.ActionMessage(messaging.ActionType.START_FIT, "Start fit", ""))
             self.running = True
@@ -173,6 +196,70 @@ class RemoteOptimizer(GenxOptimizer):
                 "Trying to start new fit while remote fit should be running, " "this is unexpected behavior"
             )
 
+    def submit_job(self, model: Model, description: str = "") -> messaging.JobInfo:
+        """
+        Queue the model as fit job on the server without following its progress.
+        """
+        status = asyncio.run(
+            self.job_request(
+                messaging.ActionMessage(messaging.ActionType.SUBMIT_JOB, "", description), self.model_message(model)
+            )
+        )
+        return status.jobs[0]
+
+    def job_status(self, job_id: str = "") -> List[messaging.JobInfo]:
+        """
+        Return the state of a job on the server or of all jobs, if no job_id is given.
+        """
+        status = asyncio.run(self.job_request(messaging.ActionMessage(messaging.ActionType.JOB_STATUS, job_id, "")))
+        return status.jobs
+
+    def cancel_job(self, job_id: str) -> List[messaging.JobInfo]:
+        status = asyncio.run(self.job_request(messaging.ActionMessage(messaging.ActionType.CANCEL_JOB, job_id, "")))
+        return status.jobs
+
+    async def job_request(self, action: messaging.ActionMessage, *messages: messaging.GenXMessage):
+        await self.connect()
+        try:
+            for message in messages:
+                await self.send_message(message)
+            await self.send_message(action)
+            return await messaging.GenXMessage.receive(self.reader)
+        finally:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.reader = None
+            self.writer = None
+
+    def attach_job(self, model: Model, job_id: str):
+        """
+        Follow a job running on the server like a fit started with start_fit. The model has to
+        contain the same datasets as the one used to submit the job.
+        """
+        if not self.running:
+            self.n_fom_evals = 0
+            self.start_guess = array([])
+            thread = Thread(target=self._attach_remote_fit, args=(model, job_id))
+            thread.start()
+            return True
+        else:
+            self.text_output("Fit is already running, stop and then start")
+            return False
+
+    def _attach_remote_fit(self, model: Model, job_id: str):
+        asyncio.run(self.attach_remote_fit(model, job_id))
+
+    async def attach_remote_fit(self, model: Model, job_id: str):
+        self.stop = False
+        self.text_output("Trying to connect to server...")
+        await self.connect()
+        self.decoder = messaging.DeltaDecoder(model.data)
+        await self.send_message(messaging.UpdateOptions(self.opt.use_delta_updates, self.opt.min_update_time))
+        self.text_output(f"Attaching to job {job_id}...")
+        await self.send_message(messaging.ActionMessage(messaging.ActionType.ATTACH_JOB, job_id, ""))
+        self.running = True
+        await self.receive()
+
     async def connect(self):
         self.reader, self.writer = await asyncio.open_connection(self.opt.address, self.opt.port)
         key = self.opt.key.encode("utf-8")
@@ -192,20 +279,30 @@ class RemoteOptimizer(GenxOptimizer):
 
     async def send_message(self, message: messaging.GenXMessage):
         debug(f"send_message {message}")
-        self.writer.write(message.message())
-        await self.writer.drain()
+        await message.send(self.writer)
 
     async def receive(self):
         while self.running:
             try:
                 obj = await messaging.GenXMessage.receive(self.reader)
-            except struct.error:
-                debug("strcut.error raised, connection interrupted")
+            except asyncio.IncompleteReadError:
+                debug("Connection interrupted")
                 self.running = False
                 return
             debug(f"remote send message: {obj!r}")
             if isinstance(obj, messaging.StingMessage):
                 self._callbacks.text_output(obj.text)
+            elif isinstance(obj, messaging.JobStatus):
+                if len(obj.jobs) == 0:
+                    self._callbacks.text_output("Job not found on server")
+                    self.running = False
+                    return
+                job = obj.jobs[0]
+                self._callbacks.text_output(f"Job {job.job_id} is {job.state.value}")
+            elif isinstance(obj, messaging.UpdateDelta):
+                self._callbacks.plot_output(self.decoder.update_info(obj))
+            elif isinstance(obj, messaging.ParameterDelta):
+                self._callbacks.parameter_output(self.decoder.parameter_info(obj))
             elif isinstance(obj, messaging.OptimizerUpdate):
                 if isinstance(obj.payload, SolverUpdateInfo):
                     self._callbacks.plot_output(obj.payload)
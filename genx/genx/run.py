@@ -170,23 +170,9 @@ def modify_file(args):
 
 
 def set_numba_single():
-    debug("Setting numba JIT compilation to single CPU")
-    os.environ["NUMBA_CACHE_DIR"] = os.path.join(config_path, "single_cpu_numba_cache")
+    from .models.lib.numba_integration import set_numba_single
 
-    import numba
-
-    old_jit = numba.jit
-
-    def jit(*args, **opts):
-        opts["parallel"] = False
-        return old_jit(*args, **opts)
-
-    numba.jit = jit
-    numba.GENX_OVERWRITE_SINGLE = True
-    try:
-        numba.set_num_threads(1)
-    except AttributeError:
-        pass
+    set_numba_single()
 
 
 class InputThread(Thread):
@@ -269,70 +255,133 @@ def start_fitting(args, rank=0):
         except ImportError:
             pass
 
-    if rank == 0:
-        iprint("Loading model %s..." % args.infile)
-    ctrl.load_file(args.infile)
-    # has to be used in order to save everything....
-    if args.esave:
-        io.config.set("solver", "save all evals", True)
-    # Simulate, this will also compile the model script
-    if rank == 0:
-        iprint("Simulating model...")
-    mod.simulate()
+    if rank > 0:
+        # all other MPI ranks only evaluate the model broadcast by rank 0
+        from .diffev import parallel_calc_fom, parallel_init
+        from .mpi_engine import get_comm, worker_loop
 
-    # Sets up the fitting ...
-    set_optimiser_pars(opt, args)
-    if rank == 0:
-        iprint("Setting up the optimizer...")
-        iprint(opt)
+        worker_loop(get_comm(), parallel_init, parallel_calc_fom)
+        return
 
-    if args.outfile and rank == 0:
-        iprint("Saving the initial model to %s" % args.outfile)
-        ctrl.save_file(args.outfile)
+    try:
+        if rank == 0:
+            iprint("Loading model %s..." % args.infile)
+        ctrl.load_file(args.infile)
+        # has to be used in order to save everything....
+        if args.esave:
+            io.config.set("solver", "save all evals", True)
+        # Simulate, this will also compile the model script
+        if rank == 0:
+            iprint("Simulating model...")
+        mod.simulate()
 
-    # To start the fitting
-    if rank == 0:
-        iprint("Fitting starting...")
-        t1 = time.time()
-    # print opt.use_mpi, opt.use_parallel_processing
-    opt.start_fit(mod)
-    if rank == 0:
-        inp = InputThread()
-        inp.start()
-    else:
+        # Sets up the fitting ...
+        set_optimiser_pars(opt, args)
+        if rank == 0:
+            iprint("Setting up the optimizer...")
+            iprint(opt)
 
-        class Inp:
-            stop_fit = False
+        if args.outfile and rank == 0:
+            iprint("Saving the initial model to %s" % args.outfile)
+            ctrl.save_file(args.outfile)
 
-        inp = Inp()
-    while opt.is_running():
-        try:
-            time.sleep(0.1)
-            if inp.stop_fit:
+        # To start the fitting
+        if rank == 0:
+            iprint("Fitting starting...")
+            t1 = time.time()
+        # print opt.use_mpi, opt.use_parallel_processing
+        opt.start_fit(mod)
+        if rank == 0:
+            inp = InputThread()
+            inp.start()
+        else:
+
+            class Inp:
+                stop_fit = False
+
+            inp = Inp()
+        while opt.is_running():
+            try:
+                time.sleep(0.1)
+                if inp.stop_fit:
+                    opt.stop = True
+            except KeyboardInterrupt:
+                iprint("KeyboardInterrupt, trying to stop fit.")
                 opt.stop = True
-        except KeyboardInterrupt:
-            iprint("KeyboardInterrupt, trying to stop fit.")
-            opt.stop = True
 
-    if rank == 0:
-        t2 = time.time()
-        iprint("Fitting finished!")
-        iprint("Time to fit: ", (t2 - t1) / 60.0, " min")
+        if rank == 0:
+            t2 = time.time()
+            iprint("Fitting finished!")
+            iprint("Time to fit: ", (t2 - t1) / 60.0, " min")
 
-    if rank == 0:
-        iprint("Updating the parameters")
-        mod.parameters.set_value_pars(opt.best_vec)
+        if rank == 0:
+            iprint("Updating the parameters")
+            mod.parameters.set_value_pars(opt.best_vec)
 
-    if args.outfile and rank == 0:
-        if args.error:
-            iprint("Calculating errorbars")
-            calc_errorbars(mod, opt)
-        iprint("Saving the fit to %s" % args.outfile)
-        # opt.set_use_mpi(False)
-        ctrl.save_file(args.outfile)
+        if args.outfile and rank == 0:
+            if args.error:
+                iprint("Calculating errorbars")
+                calc_errorbars(mod, opt)
+            iprint("Saving the fit to %s" % args.outfile)
+            # opt.set_use_mpi(False)
+            ctrl.save_file(args.outfile)
+
+        if rank == 0:
+            iprint("Fitting successfully completed")
+    finally:
+        if args.mpi:
+            # always release the other ranks from their worker_loop, also if the fit failed
+            opt.dismount_parallel_mpi()
 
-    if rank == 0:
-        iprint("Fitting successfully completed")
+
+def start_batch_fitting(args):
+    """
+    Function to fit all models of a sequence in parallel from the command line.
+    """
+    from .core import config as io
+    from .diffev import DiffEv
+    from .model_control import ModelController
+
+    if args.outfile and not args.outfile.lower().endswith(".hgx"):
+        iprint("The results of a batch fit can only be saved to a .hgx file")
+        return
+    io.config.load_default(os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles", "default.profile"))
+    ctrl = ModelController(DiffEv())
+    iprint("Loading model %s..." % args.infile)
+    ctrl.load_file(args.infile)
+    if len(ctrl.model_store) == 0:
+        iprint("The file does not contain a sequence of datasets to fit")
+        return
+    set_diffev_pars(ctrl.optimizer, args)
+    # fit all datasets with the script and parameters of the current model
+    ctrl.update_store_models()
+
+    n_models = len(ctrl.model_store)
+    finished = []
+
+    def report(model, result):
+        finished.append(result.index)
+        if result.error_message:
+            iprint(f"{len(finished)}/{n_models} {model.h5group_name} failed: {result.error_message}")
+        else:
+            iprint(
+                f"{len(finished)}/{n_models} {model.h5group_name} FOM: {result.fom:.4g} "
+                f"({result.n_fom_evals} evaluations in {result.fit_time:.1f} s)"
+            )
+
+    iprint("Fitting %i models in parallel..." % n_models)
+    ctrl.batch_fit(
+        processes=args.pr or None,
+        warm_start=args.warm_start,
+        adjust_bounds=args.adjust_bounds,
+        calc_errors=args.error,
+        fname=args.outfile or None,
+        callback=report,
+    )
+    if args.outfile:
+        iprint("Batch fitting finished, results saved to %s" % args.outfile)
+    else:
+        iprint("Batch fitting finished")
 
 
 def set_diffev_pars(optimiser, args):
@@ -379,50 +428,59 @@ def set_bumps_pars(optimiser, args):
         optimiser.opt.parallel_processes = args.pr
 
 
+def mpi_launch_args(argv):
+    """
+    Remove the options from the command line that are not used within the MPI processes.
+    """
+    output = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == "--mpirun":
+            skip = True
+        elif not (arg.startswith("--mpirun=") or arg in ["-r", "--run"]):
+            output.append(arg)
+    return output
+
+
 def compile_numba(cache_dir=None):
+    """
+    Build the caches of all numba kernels and check that a new process, like a fit worker, loads them
+    without compiling. With set_numba_single called before the single CPU versions are built.
+    """
+    if cache_dir:
+        os.environ["NUMBA_CACHE_DIR"] = os.path.abspath(cache_dir)
     try:
-        # perform a compilation of numba functions with console feedback
         import numba
 
-        from .models.lib.numba_integration import configure_numba
-
-        configure_numba()
-
-        import inspect
-
-        real_jit = numba.jit
-
-        class UpdateJit:
-            update_counter = 1
-
-            def __call__(self, *args, **opts):
-                if inspect.stack()[1][3] != "<lambda>":
-                    print(f"compiling numba functions {self.update_counter}/21")
-                    self.update_counter += 1
-                return real_jit(*args, **opts)
-
-        print("Starting to compile numba functions..")
-        numba.jit = UpdateJit()
-        print("paratt")
-        from .models.lib import paratt_numba
-
-        print("neutron")
-        from .models.lib import neutron_numba
-
-        print("instrument")
-        from .models.lib import instrument_numba
-
-        print("offspec")
-        from .models.lib import offspec
-
-        print("surface")
-        from .models.lib import surface_scattering
+        from .models.lib import numba_integration
+    except ImportError as e:
+        print(f"Numba is not available: {e}")
+        return 1
 
-        numba.jit = real_jit
+    if getattr(numba, "GENX_OVERWRITE_SINGLE", False):
+        print(f"Building numba kernels without parallel support in {numba_integration.cache_dir()}")
+    else:
+        print(f"Building numba kernels in {numba_integration.cache_dir()}")
+    total = 0.0
+    try:
+        for module in numba_integration.KERNEL_MODULES:
+            for kernel in numba_integration.build_kernels((module,)):
+                print(f"    {kernel}")
+                total += kernel.compile_time or 0.0
+        print(f"Total compile time {total:.1f} s, checking that the cache is used by new processes..")
+        missing = numba_integration.check_kernels()
     except Exception as e:
         print("An exception occured when trying to compile the numba functions:")
         print(e)
         return 1
+    if missing:
+        print("The following functions could not be loaded from the cache:")
+        for name in missing:
+            print(f"    {name}")
+        return 1
+    print("All kernels are loaded from the cache.")
     return 0
 
 
@@ -452,8 +510,10 @@ def main():
     )
     run_group = parser.add_mutually_exclusive_group()
     run_group.add_argument("-r", "--run", action="store_true", help="run GenX fit (no gui)")
-    if __mpi__:
-        run_group.add_argument("--mpi", action="store_true", help="run GenX fit with mpi (no gui)")
+    run_group.add_argument("--mpi", action="store_true", help="run GenX fit with mpi (no gui), started by mpirun")
+    run_group.add_argument(
+        "-b", "--batch", action="store_true", help="fit all datasets of a sequence in parallel (no gui)"
+    )
     run_group.add_argument("-g", "--gen", action="store_true", help="generate data.y with poisson noise added")
     run_group.add_argument("--pars", action="store_true", help="extract the parameters from the infile")
     run_group.add_argument("--mod", action="store_true", help="modify the GenX file")
@@ -473,6 +533,24 @@ def main():
     opt_group.add_argument(
         "--bumps", action="store_true", help="Use Bumps DREAM optimizer instead of GenX Differential Evolution"
     )
+    opt_group.add_argument(
+        "--warm-start",
+        dest="warm_start",
+        action="store_true",
+        help="Batch fit: start each fit with the result of the previous dataset in the sequence",
+    )
+    opt_group.add_argument(
+        "--adjust-bounds",
+        dest="adjust_bounds",
+        action="store_true",
+        help="Batch fit: center the parameter bounds around the start values of a warm start",
+    )
+    opt_group.add_argument(
+        "--mpirun",
+        type=int,
+        default=0,
+        help="Run the fit with this number of MPI processes on the local machine using mpirun.",
+    )
     data_group = parser.add_argument_group("data arguments")
     data_group.add_argument(
         "-d", dest="data_set", type=int, default=0, help="Active data set to act upon. Index starting at 0."
@@ -517,14 +595,22 @@ def main():
         default=False,
         action="store_true",
         help="Compile numba JIT functions without parallel computing support (use one core only). "
-        "Caching in this case is done in a different user directory.",
+        "These are cached separately from the parallel versions.",
     )
     data_group.add_argument(
         "--compile-nb",
         dest="compile_nb",
         default=False,
         action="store_true",
-        help="Perform a first-/recompilation of the numba modules and exit",
+        help="Compile all numba modules into the cache, report the compile time per function, check that "
+        "new processes load them from the cache and exit. Use with --nb1 for the single CPU versions.",
+    )
+    data_group.add_argument(
+        "--nb-cache",
+        dest="numba_cache",
+        default="",
+        help="Directory of the numba cache, e.g. shared by all processes and MPI ranks on a node. "
+        "Fill it ahead of time with --compile-nb.",
     )
 
     parser.add_argument(
@@ -533,10 +619,19 @@ def main():
     parser.add_argument("outfile", nargs="?", default="", help="The .gx  or hgx file to save into")
 
     args = parser.parse_args()
-    if not __mpi__:
+    if args.bumps and (args.mpi or args.mpirun > 0):
+        parser.error("the Bumps optimizer can not be used with MPI")
+    if args.mpirun > 0:
+        from .mpi_engine import launch_mpi
+
+        sys.exit(launch_mpi(args.mpirun, mpi_launch_args(sys.argv[1:])))
+    if args.mpi and not __mpi__:
+        # e.g. --mpirun 1 or started without mpirun
+        iprint("Only one MPI process available, running the fit without MPI")
         args.mpi = False
+        args.run = True
 
-    if args.run or args.mpi or args.pars or args.mod:
+    if args.run or args.batch or args.mpi or args.pars or args.mod:
         # make sure at least info-messages are shown (default is warning)
         custom_logging.CONSOLE_LEVEL = min(logging.INFO, custom_logging.CONSOLE_LEVEL)
     if rank > 0:
@@ -558,6 +653,9 @@ def main():
     if args.infile:
         args.infile = os.path.abspath(args.infile)
 
+    if args.numba_cache:
+        # inherited by the worker processes
+        os.environ["NUMBA_CACHE_DIR"] = os.path.abspath(args.numba_cache)
     if args.disable_numba:
         debug("disable numba")
         # set numba flag
@@ -571,6 +669,8 @@ def main():
 
     if args.run:
         start_fitting(args)
+    elif args.batch:
+        start_batch_fitting(args)
     elif args.mpi:
         start_fitting(args, rank)
     elif args.gen:
@@ -18,24 +18,9 @@ os.environ["NUMBA_CACHE_DIR"] = os.path.join(config_path, "numba_cache")
 
 
 def set_numba_single():
-    logging.debug("Setting numba JIT compilation to single CPU")
-    os.environ["NUMBA_CACHE_DIR"] = os.path.join(config_path, "single_cpu_numba_cache")
+    from .models.lib.numba_integration import set_numba_single
 
-    logging.debug("Setting numba JIT compilation to single CPU")
-    import numba
-
-    old_jit = numba.jit
-
-    def jit(*args, **opts):
-        opts["parallel"] = False
-        return old_jit(*args, **opts)
-
-    numba.jit = jit
-    numba.GENX_OVERWRITE_SINGLE = True
-    try:
-        numba.set_num_threads(1)
-    except AttributeError:
-        pass
+    set_numba_single()
 
 
 def main():
@@ -90,6 +75,21 @@ def main():
         help="Compile numba JIT functions with parallel computing support (use more then one core). "
         "This is the default for no-server based fits.",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        default=1,
+        type=int,
+        help="Number of fit jobs that are run at the same time, further jobs are queued.",
+    )
+    parser.add_argument(
+        "--cores",
+        dest="cores",
+        default=os.cpu_count() or 1,
+        type=int,
+        help="Number of cores for parallel processing, split evenly between the jobs running when a job starts.",
+    )
 
     args = parser.parse_args()
 
@@ -126,16 +126,26 @@ def main():
                 logging.debug("Numba not found, don't import JIT functions.")
             else:
                 logging.info("Importing numba based modules to pre-compile JIT functions, this can take some time")
-                from genx.models.lib import instrument_numba, neutron_numba, offspec, paratt_numba, surface_scattering
+                from genx.models.lib.numba_integration import build_kernels
+
+                for kernel in build_kernels():
+                    logging.debug(str(kernel))
 
         if rank == 0:
             logging.info("Modules imported successfully")
 
-    if rank == 0:
-        logging.info("Starting RemoteController")
-    from .remote import controller
+    if __mpi__:
+        # the MPI ranks evaluate the population of a single fit
+        if rank == 0:
+            logging.info("Starting RemoteController")
+        from .remote import controller
+
+        ctrl = controller.RemoteController()
+    else:
+        logging.info("Starting JobServer")
+        from .remote import jobs
 
-    ctrl = controller.RemoteController()
+        ctrl = jobs.JobServer(max_jobs=args.jobs, cores=args.cores)
     ctrl.key = args.password.encode("utf-8")
     asyncio.run(ctrl.serve(args.address, args.port))
 
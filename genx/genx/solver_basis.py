@@ -59,6 +59,10 @@ class GenxOptimizer(Configurable, H5HintedExport, metaclass=ABCMeta):
     def calc_error_bar(self, index: int) -> (float, float):
         """Use simple threshold based calculation for errorbar estimation"""
 
+    def calc_error_bars(self) -> ArrayLike:
+        """Calculate the errorbars of all parameters as list of (low, high) tuples"""
+        return [self.calc_error_bar(index) for index in range(len(self.get_start_guess()))]
+
     @abstractmethod
     def project_evals(self, index: int) -> (ArrayLike, ArrayLike):
         """Generate parameter value vs. FOM for previous run of solver"""
@@ -95,6 +99,9 @@ class GenxOptimizer(Configurable, H5HintedExport, metaclass=ABCMeta):
     def get_result_info(self) -> "SolverResultInfo":
         """Return the result info of a previous run"""
 
+    def request_simulation(self):
+        """Ask for up to date simulation data of the best parameters while a refinement is running"""
+
     def __repr__(self):
         output = f"{self.__class__.__name__} Optimizer:\n"
         for gname, group in self.opt.groups.items():
@@ -0,0 +1,63 @@
+# measure the time needed to import genx and to start a fitting process or a pool worker
+# each statement is run in a fresh interpreter, the best of several runs is reported
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+REPEAT = 5
+GENX_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE = os.path.join(GENX_PATH, "genx", "examples", "X-ray_Reflectivity.hgx")
+
+TIMER = """
+import time
+t_start = time.perf_counter()
+%s
+print(time.perf_counter() - t_start)
+"""
+
+STATEMENTS = [
+    ("import genx", "import genx"),
+    ("legacy model import", "import genx\nimport models.spec_nx"),
+    ("import genx.run", "import genx.run"),
+    ("import genx.model_control", "import genx.model_control"),
+    (
+        "genx --run setup",
+        "from genx.model_control import ModelController\n"
+        "from genx.diffev import DiffEv\n"
+        "ctrl = ModelController(DiffEv())\n"
+        "ctrl.load_file(%r)" % EXAMPLE,
+    ),
+    ("import genx.models.spec_nx", "import genx.models.spec_nx"),
+    ("pool worker parallel_init", "from genx.diffev import parallel_init\nparallel_init(open(PICKLE, 'rb').read())"),
+]
+
+
+def model_pickle(fname):
+    from genx.diffev import DiffEv
+    from genx.model_control import ModelController
+
+    ctrl = ModelController(DiffEv())
+    ctrl.load_file(EXAMPLE)
+    with open(fname, "wb") as fh:
+        pickle.dump(ctrl.model.pickable_copy(), fh)
+
+
+def measure(statement, pickle_file):
+    env = dict(os.environ, PYTHONPATH=GENX_PATH)
+    code = TIMER % statement.replace("PICKLE", repr(pickle_file))
+    times = []
+    for _ in range(REPEAT):
+        result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, GENX_PATH)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pickle_file = os.path.join(tmp_dir, "model.pkl")
+        model_pickle(pickle_file)
+        for label, statement in STATEMENTS:
+            print(f"{label:30s} {measure(statement, pickle_file) * 1000.0:8.1f} ms")
@@ -0,0 +1,119 @@
+"""
+Tests of the parallel batch fitting of a sequence of models.
+"""
+
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+import numpy as np
+
+from genx.batch import BatchFitter, batch_fit
+from genx.diffev import DiffEv
+from genx.exceptions import GenxIOError
+from genx.model_control import ModelController
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "genx", "examples")
+
+
+class SerialPool:
+    # runs the tasks within the test process when they are submitted
+    def __init__(self):
+        self.tasks = []
+
+    def apply_async(self, func, args, callback=None, error_callback=None):
+        self.tasks.append(args)
+        try:
+            result = func(*args)
+        except Exception as e:
+            error_callback(e)
+        else:
+            callback(result)
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+class TestBatchFit(unittest.TestCase):
+    def setUp(self):
+        self.ctrl = ModelController(DiffEv())
+        self.ctrl.load_file(os.path.join(EXAMPLE_PATH, "X-ray_Reflectivity.hgx"))
+        opt = self.ctrl.optimizer.opt
+        opt.use_pop_mult = False
+        opt.pop_size = 10
+        opt.use_max_generations = True
+        opt.max_generations = 3
+        opt.use_parallel_processing = True
+        model = self.ctrl.model
+        for i in range(5):
+            model.h5group_name = f"sequence_{i:05}"
+            model.sequence_value = float(i)
+            self.ctrl.put_in_store()
+        self.pool = SerialPool()
+
+    def fitter(self, **opts):
+        fitter = BatchFitter(self.ctrl.model_store, self.ctrl.optimizer.opt, **opts)
+        fitter.pool = self.pool
+        return fitter
+
+    def test_segments(self):
+        self.assertEqual(self.fitter(processes=2).segments(), [[0], [1], [2], [3], [4]])
+        self.assertEqual(self.fitter(processes=2, warm_start=True).segments(), [[0, 1], [2, 3, 4]])
+        self.assertEqual(self.fitter(processes=8, warm_start=True).processes, 5)
+
+    def test_warm_start(self):
+        fitter = self.fitter(processes=2, warm_start=True)
+        self.assertFalse(fitter.config.use_parallel_processing)
+        results = fitter.run()
+        self.assertTrue(all(ri is not None and ri.error_message is None for ri in results))
+        start_values = {args[0]: args[3] for args in self.pool.tasks}
+        self.assertIsNone(start_values[0])
+        self.assertIsNone(start_values[2])
+        np.testing.assert_array_equal(start_values[1], results[0].values)
+        np.testing.assert_array_equal(start_values[4], results[3].values)
+        # the results are applied to the models
+        for model, result in zip(self.ctrl.model_store, results):
+            self.assertEqual(model.parameters.get_value_pars(), list(result.values))
+            self.assertEqual(model.fom, result.fom)
+
+    def test_error(self):
+        model = self.ctrl.model_store[0].pickable_copy()
+        model.set_script("raise ValueError('broken model')")
+        result = batch_fit(0, model, self.ctrl.optimizer.opt)
+        self.assertIn("broken model", result.error_message)
+        self.assertIsNone(result.values)
+
+    def test_save_incremental(self):
+        saved = []
+
+        def callback(model, result):
+            saved.append(result.index)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, "batch.hgx")
+            with patch.object(BatchFitter, "setup_pool", lambda fitter: setattr(fitter, "pool", self.pool)):
+                results = self.ctrl.batch_fit(processes=2, fname=fname, callback=callback)
+            self.assertEqual(saved, list(range(5)))
+            ctrl = ModelController(DiffEv())
+            ctrl.load_file(fname)
+        self.assertEqual([mi.h5group_name for mi in ctrl.model_store], [f"sequence_{i:05}" for i in range(5)])
+        for model, result in zip(ctrl.model_store, results):
+            np.testing.assert_array_almost_equal(model.parameters.get_value_pars(), result.values)
+
+    def test_reject_gx_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, "batch.gx")
+            with patch.object(BatchFitter, "setup_pool", lambda fitter: setattr(fitter, "pool", self.pool)):
+                with self.assertRaises(GenxIOError):
+                    self.ctrl.batch_fit(processes=2, fname=fname)
+            self.assertFalse(os.path.exists(fname))
+        self.assertEqual(self.pool.tasks, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
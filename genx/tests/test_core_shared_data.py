@@ -0,0 +1,53 @@
+"""
+Tests of the shared memory transport of data arrays.
+"""
+
+import pickle
+import unittest
+
+import numpy as np
+
+from genx.core.shared_data import SharedDataBuffer, shared_memory
+from genx.data import DataSet
+
+
+@unittest.skipIf(shared_memory is None, "shared memory not available")
+class TestSharedDataBuffer(unittest.TestCase):
+
+    def create_dataset(self, points):
+        ds = DataSet(name="test")
+        x = np.linspace(0.01, 0.3, points)
+        ds.x_raw, ds.y_raw, ds.error_raw = x, np.exp(-x), 0.1 * np.exp(-x)
+        ds.set_extra_data("res", 0.01 * x)
+        ds.run_command()
+        return ds
+
+    def test_shared_transport(self):
+        ds = self.create_dataset(10000)
+        shared = SharedDataBuffer([ds])
+        try:
+            self.assertGreater(shared.size, 0)
+            pkl_str = shared.dumps({"data": ds})
+            # the pickle only contains references to the shared memory block
+            self.assertLess(len(pkl_str), ds.x.nbytes)
+
+            copied = pickle.loads(pkl_str)["data"]
+            for name in ["x", "y", "error", "x_raw", "y_raw", "error_raw"]:
+                np.testing.assert_array_equal(getattr(copied, name), getattr(ds, name))
+                self.assertFalse(getattr(copied, name).flags.writeable)
+            np.testing.assert_array_equal(copied.extra_data["res"], ds.extra_data["res"])
+        finally:
+            shared.close()
+
+    def test_small_data_pickled(self):
+        ds = self.create_dataset(10)
+        shared = SharedDataBuffer([ds])
+        self.assertEqual(shared.size, 0)
+        copied = pickle.loads(shared.dumps(ds))
+        np.testing.assert_array_equal(copied.y, ds.y)
+        self.assertTrue(copied.y.flags.writeable)
+        shared.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
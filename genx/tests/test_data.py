@@ -0,0 +1,65 @@
+"""
+Tests of the data transform commands of the DataSet class.
+"""
+
+import unittest
+
+import numpy as np
+
+from genx import data
+
+
+class TestDataCommands(unittest.TestCase):
+    def setUp(self):
+        self.ds = data.DataSet()
+        self.ds.x_raw = np.linspace(0.01, 0.3, 20)
+        self.ds.y_raw = np.exp(-10.0 * self.ds.x_raw)
+        self.ds.error_raw = 0.1 * self.ds.y_raw
+        self.ds.set_extra_data("res", 0.01 * self.ds.x_raw, "res*2")
+        self.ds.set_extra_data("lamda", np.ones(20))
+
+    def test_run_command(self):
+        self.ds.x_command = "x*lamda"
+        self.ds.y_command = "y/y.max()"
+        self.ds.error_command = "rms(e, fpe(0.02, 0.01), 0.1*dydx()*res)"
+        self.ds.run_command()
+        x, y, e, res = self.ds.x_raw, self.ds.y_raw, self.ds.error_raw, self.ds.extra_data_raw["res"]
+        yt = y / y.max()
+        np.testing.assert_array_equal(self.ds.x, x)
+        np.testing.assert_array_equal(self.ds.y, yt)
+        np.testing.assert_array_equal(self.ds.res, 2 * res)
+        np.testing.assert_array_equal(self.ds.lamda, 1.0)
+        dydx = np.gradient(yt, x, edge_order=1)
+        expected = np.sqrt(e**2 + np.where(x < 0.02, 0.01 * yt, 0.0) ** 2 + (0.1 * dydx * res) ** 2)
+        np.testing.assert_allclose(self.ds.error, expected)
+
+    def test_single_commands(self):
+        self.ds.y_command = "log10(y)"
+        self.ds.run_y_command()
+        np.testing.assert_allclose(self.ds.y, np.log10(self.ds.y_raw))
+        self.ds.error_command = "e/yt"
+        self.ds.run_error_command()
+        np.testing.assert_allclose(self.ds.error, self.ds.error_raw / self.ds.y)
+
+    def test_compiled_once(self):
+        data.compile_command.cache_clear()
+        self.ds.run_command()
+        self.ds.copy().run_command()
+        info = data.compile_command.cache_info()
+        self.assertEqual(info.misses, 5)
+        self.assertEqual(info.hits, 5)
+
+    def test_try_commands(self):
+        commands = self.ds.get_commands()
+        self.assertEqual(self.ds.try_commands(commands), "")
+        commands["e"] = "fpe()"
+        self.assertEqual(self.ds.try_commands(commands), "")
+        commands["y"] = "y["
+        self.assertIn("Error in evaluating y expression", self.ds.try_commands(commands))
+        commands["y"] = "y[:5]"
+        commands["e"] = "e"
+        self.assertIn("not of the same size", self.ds.try_commands(commands))
+
+
+if __name__ == "__main__":
+    unittest.main()
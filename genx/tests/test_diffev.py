@@ -0,0 +1,476 @@
+"""
+Tests of the population handling within the differential evolution optimizer.
+"""
+
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+import unittest
+
+from unittest.mock import patch
+
+import numpy as np
+
+from genx import api, diffev
+from genx.core.shared_data import SharedDataBuffer, shared_memory
+from genx.diffev import CircBuffer, DiffEv
+
+
+class TestDiffEvPopulation(unittest.TestCase):
+    n_pop = 200
+    n_dim = 6
+
+    def setUp(self):
+        self.de = DiffEv()
+        self.de.rng = np.random.default_rng(1234)
+        self.de.n_pop = self.n_pop
+        self.de.n_dim = self.n_dim
+        self.de.par_min = np.zeros(self.n_dim)
+        self.de.par_max = np.arange(1.0, self.n_dim + 1.0)
+        self.de.pop_vec = list(self.de.par_min + self.de.rng.random((self.n_pop, self.n_dim)) * self.de.par_max)
+        self.de.trial_vec = [np.zeros(self.n_dim) for _ in range(self.n_pop)]
+        self.de.fom_vec = self.de.rng.random(self.n_pop)
+        self.de.best_vec = self.de.pop_vec[int(np.argmin(self.de.fom_vec))].copy()
+        self.de.best_fom = self.de.fom_vec.min()
+        self.de.km_vec = np.full(self.n_pop, self.de.opt.km)
+        self.de.kr_vec = np.full(self.n_pop, self.de.opt.kr)
+        self.de.par_evals = CircBuffer(1000, buffer=np.array(self.de.pop_vec))
+
+    def test_distinct_indices(self):
+        indices = np.array(self.de._distinct_indices(3))
+        self.assertEqual(indices.shape, (3, self.n_pop))
+        self.assertTrue((indices >= 0).all() and (indices < self.n_pop).all())
+        self.assertTrue((indices[0] != indices[1]).all())
+        self.assertTrue((indices[0] != indices[2]).all())
+        self.assertTrue((indices[1] != indices[2]).all())
+        # all indices have to be reachable
+        many = np.concatenate([np.array(self.de._distinct_indices(3)).flatten() for _ in range(20)])
+        self.assertEqual(len(np.unique(many)), self.n_pop)
+
+    def test_population_trials(self):
+        for method in self.de.methods:
+            with self.subTest(method=method):
+                self.de.set_create_trial(method)
+                self.de.create_population_trials()
+                trial = np.array(self.de.trial_vec)
+                self.assertEqual(trial.shape, (self.n_pop, self.n_dim))
+                self.assertTrue((trial >= self.de.par_min).all())
+                self.assertTrue((trial <= self.de.par_max).all())
+
+    def test_population_trials_seeded(self):
+        results = []
+        for _ in range(2):
+            self.setUp()
+            self.de.create_population_trials()
+            results.append(np.array(self.de.trial_vec))
+        np.testing.assert_array_equal(results[0], results[1])
+
+    def test_population_recombination(self):
+        # binomial recombination has to change the fraction kr of the parameters but at least one
+        self.de.opt.use_boundaries = False
+        self.de.opt.kr = 0.0
+        self.de.create_population_trials()
+        changed = np.array(self.de.trial_vec) != np.array(self.de.pop_vec)
+        np.testing.assert_array_equal(changed.sum(axis=1), 1)
+
+        self.de.opt.kr = 0.5
+        self.de.create_population_trials()
+        changed = np.array(self.de.trial_vec) != np.array(self.de.pop_vec)
+        self.assertAlmostEqual(changed.mean(), 0.5 + 0.5 / self.n_dim, delta=0.05)
+
+    def test_update_population(self):
+        self.de.create_population_trials()
+        self.de.trial_fom = list(self.de.rng.random(self.n_pop) * 0.5)
+        self.de.new_best = False
+
+        reference = DiffEv()
+        reference.n_pop = self.n_pop
+        reference.pop_vec = [vec.copy() for vec in self.de.pop_vec]
+        reference.trial_vec = [vec.copy() for vec in self.de.trial_vec]
+        reference.trial_fom = list(self.de.trial_fom)
+        reference.fom_vec = self.de.fom_vec.copy()
+        reference.best_vec = self.de.best_vec.copy()
+        reference.best_fom = self.de.best_fom
+        reference.new_best = False
+        [reference.standard_update_pop(index) for index in range(self.n_pop)]
+
+        self.de.update_population()
+        np.testing.assert_array_equal(np.array(self.de.pop_vec), np.array(reference.pop_vec))
+        np.testing.assert_array_equal(self.de.fom_vec, reference.fom_vec)
+        np.testing.assert_array_equal(self.de.best_vec, reference.best_vec)
+        self.assertEqual(self.de.best_fom, reference.best_fom)
+        self.assertTrue(self.de.new_best)
+
+    def test_jade_update_population(self):
+        self.de.set_create_trial("jade_best")
+        self.de.create_population_trials()
+        self.de.trial_fom = self.de.rng.random(self.n_pop)
+        improved = self.de.trial_fom < self.de.fom_vec
+        self.de.update_population()
+        self.assertEqual(len(self.de.updated_km), improved.sum())
+        self.assertEqual(len(self.de.updated_kr), improved.sum())
+
+
+class TestWorkerUpdate(unittest.TestCase):
+    def setUp(self):
+        example_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "genx", "examples")
+        self.model, _ = api.load(os.path.join(example_path, "X-ray_Reflectivity.hgx"))
+        self.model.simulate()
+        diffev.model = pickle.loads(pickle.dumps(self.model.pickable_copy()))
+        diffev.model.simulate()
+        diffev.update_barrier = None
+
+    def tearDown(self):
+        diffev.model = None
+        diffev.par_funcs = ()
+
+    def get_delta(self, old_hashes):
+        parts = diffev.model_state_parts(self.model)
+        return dict((key, value) for key, value in parts.items() if old_hashes[key] != diffev.state_hash(value))
+
+    def test_unchanged_after_simulation(self):
+        hashes = dict((key, diffev.state_hash(value)) for key, value in diffev.model_state_parts(self.model).items())
+        self.model.data[0].y_sim = self.model.data[0].y_sim * 2.0
+        self.assertEqual(self.get_delta(hashes), {})
+
+    def test_update(self):
+        hashes = dict((key, diffev.state_hash(value)) for key, value in diffev.model_state_parts(self.model).items())
+        self.model.data[0].y = self.model.data[0].y * 2.0
+        self.model.set_script(self.model.script + "\n# modified\n")
+        self.model.simulate()
+        delta = self.get_delta(hashes)
+        self.assertEqual(sorted(delta.keys()), ["data 0", "script"])
+
+        diffev.parallel_update(pickle.dumps(delta))
+        self.assertEqual(diffev.model.script, self.model.script)
+        np.testing.assert_array_equal(diffev.model.data[0].y, self.model.data[0].y)
+
+        funcs, start, _, _ = self.model.get_fit_pars()
+        worker_fom = diffev.parallel_calc_fom(start)
+        self.assertAlmostEqual(worker_fom, diffev._calc_fom(self.model, start, funcs))
+
+
+@unittest.skipIf(shared_memory is None, "shared memory not available")
+class TestPersistentPool(unittest.TestCase):
+    def setUp(self):
+        example_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "genx", "examples")
+        self.model, _ = api.load(os.path.join(example_path, "X-ray_Reflectivity.hgx"))
+        self.model.simulate()
+        self.de = DiffEv()
+        self.de.model = self.model
+        self.de.opt.parallel_processes = 2
+        # use shared memory for the small example dataset
+        min_size = patch.object(SharedDataBuffer, "min_size", 0)
+        min_size.start()
+        self.addCleanup(min_size.stop)
+        # start the workers as on Windows and macOS, forking after numba started its threads can block the exit
+        context = patch.object(diffev, "processing", multiprocessing.get_context("spawn"))
+        context.start()
+        self.addCleanup(context.stop)
+        self.addCleanup(self.de.dismount_parallel)
+
+    def check_foms(self):
+        funcs, start, _, _ = self.model.get_fit_pars()
+        vecs = [np.array(start), np.array(start) * 1.01]
+        expected = [diffev._calc_fom(self.model, vec, funcs) for vec in vecs]
+        np.testing.assert_allclose(self.de.pool.map(diffev.parallel_calc_fom, vecs), expected)
+
+    def test_release_replaced_data(self):
+        self.de.setup_parallel()
+        first = self.de._shared_data[0]
+        self.assertGreater(first.size, 0)
+        self.model.data[0].y = self.model.data[0].y * 2.0
+        self.model.simulate()
+        self.de.setup_parallel()
+        # only the block with the new data is kept
+        self.assertEqual(len(self.de._shared_data), 1)
+        self.assertIsNot(self.de._shared_data[0], first)
+        self.assertIsNone(first.shm)
+        self.check_foms()
+
+    def test_restart_replaced_worker(self):
+        self.de.setup_parallel()
+        self.model.set_script(self.model.script + "\n# modified\n")
+        self.model.data[0].y = self.model.data[0].y * 2.0
+        self.model.simulate()
+        self.de.setup_parallel()
+        pool = self.de.pool
+        self.assertFalse(self.de.workers_replaced())
+
+        # a worker that dies while evaluating is replaced by the pool
+        pool.apply_async(os._exit, (1,))
+        for _ in range(100):
+            if self.de.workers_replaced():
+                break
+            time.sleep(0.1)
+        self.assertTrue(self.de.workers_replaced())
+        self.de.restart_replaced_workers()
+        self.assertIsNot(self.de.pool, pool)
+        self.assertFalse(self.de.workers_replaced())
+        self.check_foms()
+
+    def test_finalizer(self):
+        self.de.setup_parallel()
+        pool = self.de.pool
+        shared = self.de._shared_data[0]
+        finalizer = self.de._pool_finalizer
+        self.assertTrue(finalizer.alive)
+        # the pool is terminated when the optimizer is no longer used
+        finalizer()
+        self.assertIsNone(shared.shm)
+        with self.assertRaises(ValueError):
+            pool.apply_async(os.getpid)
+        self.de.pool = None
+
+        self.de.setup_parallel()
+        finalizer = self.de._pool_finalizer
+        self.de.dismount_parallel()
+        self.assertFalse(finalizer.alive)
+
+
+class SerialPool:
+    """Replacement for multiprocessing.Pool evaluating all tasks directly in the calling process."""
+
+    def map(self, func, iterable, chunksize=None):
+        return list(map(func, iterable))
+
+    def apply_async(self, func, args=(), callback=None, error_callback=None):
+        try:
+            result = func(*args)
+        except Exception as e:
+            error_callback(e)
+        else:
+            callback(result)
+
+
+class TestSteadyState(unittest.TestCase):
+    def setUp(self):
+        example_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "genx", "examples")
+        self.model, _ = api.load(os.path.join(example_path, "X-ray_Reflectivity.hgx"))
+        self.model.simulate()
+        diffev.model = pickle.loads(pickle.dumps(self.model.pickable_copy()))
+        diffev.model.simulate()
+        diffev.par_funcs = diffev.model.get_fit_pars(use_bounds=False)[0]
+
+    def tearDown(self):
+        diffev.model = None
+        diffev.par_funcs = ()
+
+    def test_steady_state_fit(self):
+        de = DiffEv()
+        de.opt.use_parallel_processing = True
+        de.opt.use_steady_state = True
+        # the replacement pool is not dismounted after the fit
+        de.opt.use_persistent_pool = True
+        de.opt.use_max_generations = True
+        de.opt.max_generations = 3
+        de.opt.random_seed = 1
+        de.setup_parallel = lambda: None
+        de.pool = SerialPool()
+        de.init_fitting(self.model)
+        de.optimize()
+
+        self.assertIsNone(de.error)
+        # the start population and three generations
+        self.assertEqual(de.n_fom, 4 * de.n_pop)
+        self.assertEqual(len(de.fom_log), 4)
+        self.assertAlmostEqual(de.best_fom, min(de.fom_vec))
+        self.assertAlmostEqual(de.best_fom, de.calc_fom(de.best_vec))
+
+
+class TestLazySimulation(unittest.TestCase):
+    def setUp(self):
+        example_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "genx", "examples")
+        self.model, _ = api.load(os.path.join(example_path, "X-ray_Reflectivity.hgx"))
+        self.model.simulate()
+
+    def fit(self, lazy, request_at=None):
+        de = DiffEv()
+        de.opt.use_lazy_sim = lazy
+        de.opt.sim_check_interval = 5
+        de.opt.use_max_generations = True
+        de.opt.max_generations = 10
+        de.opt.random_seed = 1
+        sim_vectors = []
+        self.sim_generations = []
+        calc_sim = de.calc_sim
+        plot_output = de.plot_output
+
+        def counting_calc_sim(vec):
+            sim_vectors.append(vec.copy())
+            self.sim_generations.append(int(de.fom_log[-1, 0]))
+            return calc_sim(vec)
+
+        def requesting_plot_output():
+            # the GUI asks for a simulation while showing the results of generation request_at
+            plot_output()
+            if de.fom_log[-1, 0] == request_at:
+                de.request_simulation()
+
+        de.calc_sim = counting_calc_sim
+        de.plot_output = requesting_plot_output
+        de.init_fitting(self.model)
+        de.optimize()
+        self.assertIsNone(de.error)
+        return de, sim_vectors
+
+    def test_skip_unchanged_best(self):
+        de_full, sims_full = self.fit(False)
+        de, sims = self.fit(True)
+        self.assertEqual(len(sims_full), 10)
+        self.assertLess(len(sims), 10)
+        # the fit itself is unchanged and the model ends with the best parameters
+        self.assertEqual(de.best_fom, de_full.best_fom)
+        np.testing.assert_array_equal(sims[-1], de.best_vec)
+        self.assertAlmostEqual(self.model.fom, de.best_fom)
+
+    def test_request_during_fit(self):
+        self.fit(True)
+        generations = self.sim_generations
+        skipped = [gen for gen in range(2, 10) if gen not in generations]
+        self.assertNotEqual(skipped, [])
+        self.fit(True, request_at=skipped[0] - 1)
+        self.assertEqual(sorted(self.sim_generations), sorted(generations + [skipped[0]]))
+
+    def test_requested_simulation(self):
+        de = DiffEv()
+        de.opt.use_lazy_sim = True
+        de.calc_sim = lambda vec: 0.0
+        de.best_vec = np.zeros(2)
+        de.best_fom = 0.0
+        de.new_best = False
+        self.assertTrue(de.simulate_best(1))
+        self.assertFalse(de.best_sim_current)
+        de.request_simulation()
+        self.assertTrue(de.simulate_best(2))
+        self.assertTrue(de.best_sim_current)
+        self.assertFalse(de.sim_requested)
+
+
+class BatchModel:
+    """Model with a large FOM whose batch evaluation adds the given deviations to the result."""
+
+    def __init__(self, deviations):
+        self.values = np.zeros(2)
+        self.deviations = np.asarray(deviations)
+        self.par_funcs = [lambda value, i=i: self.values.__setitem__(i, value) for i in range(2)]
+
+    def evaluate_fit_func(self):
+        return 1e8 * (1.0 + (self.values**2).sum())
+
+    def evaluate_fit_func_batch(self, param_funcs, population):
+        return 1e8 * (1.0 + (population**2).sum(axis=1)) + self.deviations
+
+
+class TestBatchCheck(unittest.TestCase):
+    def check(self, deviations):
+        de = DiffEv()
+        de.model = BatchModel(deviations)
+        de.par_funcs = de.model.par_funcs
+        de.pop_vec = list(np.random.default_rng(1).random((10, 2)))
+        de.best_vec = de.pop_vec[0]
+        result = de.check_batch_eval()
+        # the model is left with the parameters of the best vector
+        np.testing.assert_array_equal(de.model.values, de.best_vec)
+        return result
+
+    def test_rounding(self):
+        self.assertTrue(self.check([1e-7, -1e-7, 0.0, 2e-7, 0.0]))
+
+    def test_deviation(self):
+        self.assertFalse(self.check([0.0, 0.0, 0.0, 10.0, 0.0]))
+
+    def test_not_finite(self):
+        self.assertFalse(self.check([0.0, 0.0, np.nan, 0.0, 0.0]))
+        self.assertFalse(self.check([0.0, 0.0, 0.0, 0.0, np.inf]))
+
+
+class TestCircBuffer(unittest.TestCase):
+    def test_append_many(self):
+        buffer = CircBuffer(10, buffer=np.zeros((0, 2)))
+        buffer.append_many(np.arange(12.0).reshape(6, 2))
+        self.assertEqual(len(buffer), 6)
+        self.assertTrue(np.shares_memory(buffer.array(), buffer.buffer))
+        buffer.append([12.0, 13.0])
+        buffer.append_many(np.arange(14.0, 30.0).reshape(8, 2))
+        self.assertEqual(len(buffer), 10)
+        np.testing.assert_array_equal(buffer.array(), np.arange(10.0, 30.0).reshape(10, 2))
+        np.testing.assert_array_equal(np.sort(buffer.values()[:, 0]), np.arange(10.0, 30.0, 2.0))
+        # more items than the buffer can hold
+        buffer.append_many(np.arange(40.0).reshape(20, 2))
+        np.testing.assert_array_equal(buffer[:, 1], np.arange(21.0, 40.0, 2.0))
+
+    def test_same_as_append(self):
+        buffer, reference = CircBuffer(7), CircBuffer(7)
+        for i in range(5):
+            items = np.arange(3.0) + 3 * i
+            buffer.append_many(items)
+            for item in items:
+                reference.append(item)
+            np.testing.assert_array_equal(buffer.array(), reference.array())
+
+    def test_copy_and_pickle(self):
+        with tempfile.TemporaryFile() as backing_file:
+            buffer = CircBuffer(5, backing_file=backing_file)
+            self.assertIsInstance(buffer.buffer, np.memmap)
+            buffer.append_many(np.arange(8.0))
+            copied = CircBuffer(1000)
+            copied.copy_from(buffer)
+            loaded = pickle.loads(pickle.dumps(buffer))
+        for other in [copied, loaded]:
+            np.testing.assert_array_equal(other.array(), np.arange(3.0, 8.0))
+            self.assertNotIsInstance(other.buffer, np.memmap)
+        copied.copy_from(np.arange(3.0))
+        np.testing.assert_array_equal(copied.array(), np.arange(3.0))
+
+
+class TestFomLog(unittest.TestCase):
+    def test_log_best_fom(self):
+        de = DiffEv()
+        for i in range(3000):
+            de.best_fom = 1.0 / (i + 1)
+            de.log_best_fom()
+        fom_log = de.get_fom_log()
+        self.assertEqual(fom_log.shape, (3000, 2))
+        np.testing.assert_array_equal(fom_log[:, 0], np.arange(3000))
+        self.assertEqual(de.fom_log[-1, 1], 1.0 / 3000)
+        self.assertFalse(fom_log.flags.writeable)
+        # a returned log is not changed by later updates
+        de.best_fom = 0.0
+        de.log_best_fom()
+        self.assertEqual(len(fom_log), 3000)
+        self.assertEqual(len(de.get_fom_log()), 3001)
+
+
+class TestErrorBars(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.de = DiffEv()
+        self.de.eval_chunk_size = 300
+        self.de.setup_ok = True
+        self.de.par_min = np.zeros(4)
+        self.de.par_max = np.array([1.0, 2.0, 3.0, 4.0])
+        par_values = rng.random((1000, 4)) * self.de.par_max
+        fom_values = ((par_values - 0.5) ** 2).sum(axis=1) + 1.0
+        self.de.par_evals = CircBuffer(800, buffer=par_values)
+        self.de.fom_evals = CircBuffer(800, buffer=fom_values)
+        self.de.best_fom = self.de.fom_evals.values().min()
+        self.de.best_vec = self.de.par_evals.values()[np.argmin(self.de.fom_evals.values())]
+
+    def test_all_parameters(self):
+        error_bars = self.de.calc_error_bars()
+        self.assertEqual(error_bars.shape, (4, 2))
+        for index in range(4):
+            np.testing.assert_array_almost_equal(error_bars[index], self.de.calc_error_bar(index))
+        self.assertTrue((error_bars[:, 0] <= 0).all() and (error_bars[:, 1] >= 0).all())
+
+    def test_not_fitted(self):
+        self.de.setup_ok = False
+        with self.assertRaises(diffev.ErrorBarError):
+            self.de.calc_error_bars()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Tests of the Levenberg-Marquardt optimizer and its finite difference Jacobian.
+"""
+
+import os
+import pickle
+import unittest
+
+from unittest.mock import patch
+
+import numpy as np
+
+from scipy.optimize import leastsq
+
+from genx import api, diffev
+from genx.levenberg_marquardt import FiniteDiffJacobian, LMOptimizer
+
+
+def residuals(x):
+    t = np.linspace(0.0, 1.0, 20)
+    return x[0] * np.exp(-x[1] * t) - 2.0 * np.exp(-0.5 * t)
+
+
+class TestFiniteDiffJacobian(unittest.TestCase):
+    def exact(self, x):
+        t = np.linspace(0.0, 1.0, 20)
+        return np.array([np.exp(-x[1] * t), -x[0] * t * np.exp(-x[1] * t)]).T
+
+    def test_forward(self):
+        x = np.array([1.5, 0.0])
+        jacobian = FiniteDiffJacobian(residuals)
+        np.testing.assert_array_almost_equal(jacobian(x), self.exact(x), decimal=6)
+        self.assertEqual(jacobian.n_evals, 3)
+        # the residuals at x are reused after the function has been evaluated there
+        jacobian.fun(x)
+        jacobian(x)
+        self.assertEqual(jacobian.n_evals, 5)
+
+    def test_central(self):
+        x = np.array([1.5, 0.7])
+        evaluated = []
+
+        def evaluate(vecs):
+            evaluated.append(len(vecs))
+            return [residuals(vec) for vec in vecs]
+
+        jacobian = FiniteDiffJacobian(residuals, evaluate=evaluate, central=True)
+        jacobian.fun(x)
+        np.testing.assert_array_almost_equal(jacobian(x), self.exact(x), decimal=9)
+        self.assertEqual(evaluated, [4])
+
+
+class SerialPool:
+    # evaluates the worker functions within the test process
+    def map(self, func, iterable, chunksize=None):
+        return list(map(func, iterable))
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+class TestLMOptimizer(unittest.TestCase):
+    def setUp(self):
+        example_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "genx", "examples")
+        self.model, _ = api.load(os.path.join(example_path, "X-ray_Reflectivity.hgx"))
+        self.model.simulate()
+        diffev.model = pickle.loads(pickle.dumps(self.model.pickable_copy()))
+        diffev.model.simulate()
+        diffev.par_funcs = diffev.model.get_fit_pars(use_bounds=False)[0]
+
+    def tearDown(self):
+        diffev.model = None
+        diffev.par_funcs = ()
+
+    def fit(self, parallel=False, **opts):
+        lm = LMOptimizer()
+        for key, value in opts.items():
+            setattr(lm.opt, key, value)
+        if parallel:
+            lm.opt.use_parallel_processing = True
+            lm.setup_parallel = lambda: setattr(lm, "pool", SerialPool())
+        lm.connect_model(self.model)
+        lm.optimize()
+        return lm
+
+    def test_fit(self):
+        # without options for the Jacobian MINPACK calculates it as before
+        with patch("genx.levenberg_marquardt.leastsq", wraps=leastsq) as fit_func:
+            lm = self.fit()
+        self.assertEqual(fit_func.call_args.args[0], lm.calc_fom)
+        self.assertNotIn("Dfun", fit_func.call_args.kwargs)
+        self.assertGreater(lm.n_fom_evals, lm.n_dim)
+
+    def test_fom_log(self):
+        lm = self.fit(use_central_diff=True)
+        self.assertEqual(lm.fom_log.shape[1], 2)
+        self.assertGreater(len(lm.fom_log), 0)
+        np.testing.assert_array_equal(lm.fom_log[:, 0], np.arange(len(lm.fom_log)))
+        # the log of a following fit is appended
+        n_first = len(lm.fom_log)
+        lm.optimize()
+        np.testing.assert_array_equal(lm.fom_log[:, 0], np.arange(len(lm.fom_log)))
+        self.assertGreater(len(lm.fom_log), n_first)
+
+    def test_parallel(self):
+        for central in [False, True]:
+            with self.subTest(central=central):
+                # a relative step selects the Jacobian that is evaluated in the pool also for the serial fit
+                lm_serial = self.fit(use_central_diff=central, diff_step=1e-7)
+                self.model.parameters.set_value_pars(lm_serial.start_guess)
+                lm = self.fit(parallel=True, use_central_diff=central, diff_step=1e-7)
+                self.model.parameters.set_value_pars(lm_serial.start_guess)
+                self.assertIsNone(lm.pool)
+                np.testing.assert_array_equal(lm.best_vec, lm_serial.best_vec)
+                self.assertEqual(lm.n_fom_evals, lm_serial.n_fom_evals)
+
+
+if __name__ == "__main__":
+    unittest.main()
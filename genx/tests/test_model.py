@@ -2,12 +2,17 @@
 Tests of low lever functionality of GenX Model class.
 """
 import os
+import threading
 import unittest
 import h5py
+import numpy as np
 import tempfile
 from pickle import loads, dumps
 
+from genx import api
 from genx.model import Model
+from genx.models.lib import dataset_cache
+from genx.models.lib.base import ModelParamBase
 
 
 class TestModelClass(unittest.TestCase):
@@ -61,5 +66,116 @@ class TestModelClass(unittest.TestCase):
                 self.assertEqual(old, new)
 
 
+class TestDatasetCache(unittest.TestCase):
+    def setUp(self):
+        example_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'genx', 'examples')
+        self.m, _ = api.load(os.path.join(example_path, 'SuperAdam_SiO.hgx'))
+        self.m.data.items.append(self.m.data[0].copy())
+        script = self.m.script.replace('cp = UserVars()\n', 'cp = UserVars()\ncp.new_var("I1", 3.0)\n')
+        script = script.replace('    # END Dataset 0\n', (
+            '    # END Dataset 0\n'
+            '    # BEGIN Dataset 1 DO NOT CHANGE\n'
+            '    d = data[1]\n'
+            '    inst.setI0(cp.I1)\n'
+            '    I.append(sample.SimSpecular(d.x, inst))\n'
+            '    # END Dataset 1\n'))
+        self.m.set_script(script)
+        self.m.solver_parameters.use_dataset_cache = True
+        self.m.simulate()
+        self.cache = self.m.script_module.__dataset_cache__
+
+    def fit_sim(self):
+        self.m.script_module._sim = False
+        return [si.copy() for si in self.m.script_module.Sim(self.m.data)]
+
+    def test_reuse(self):
+        first = self.fit_sim()
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        # dataset 0 does not depend on cp.I1 but uses the intensity set in block 1
+        self.m.script_module.cp.setI1(5.0)
+        second = self.fit_sim()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+        np.testing.assert_array_equal(second[0], first[0])
+        np.testing.assert_array_almost_equal(second[1], first[1] * 5.0 / 3.0)
+
+        self.m.script_module.SiO.setD(1000.0)
+        third = self.fit_sim()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 5))
+        self.assertFalse(np.allclose(third[0], first[0]))
+
+    def test_same_fom(self):
+        self.fit_sim()
+        self.m.script_module.cp.setI1(5.0)
+        fom_cached = self.m.evaluate_fit_func()
+        self.m.solver_parameters.use_dataset_cache = False
+        self.m.simulate()
+        self.assertFalse(hasattr(self.m.script_module, '__dataset_cache__'))
+        self.m.script_module.cp.setI1(5.0)
+        self.assertAlmostEqual(self.m.evaluate_fit_func(), fom_cached)
+
+    def test_previous_values(self):
+        # several simulations are kept for each block, like for the members of a population
+        d_start = self.m.script_module.SiO.d
+        first = self.fit_sim()
+        self.m.script_module.SiO.setD(1000.0)
+        self.fit_sim()
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 4))
+        self.m.script_module.SiO.setD(d_start)
+        self.m.evaluate_sim_func()
+        second = self.fit_sim()
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 4))
+        np.testing.assert_array_equal(second[0], first[0])
+        np.testing.assert_array_equal(second[1], first[1])
+
+    def test_in_place_change(self):
+        first = self.fit_sim()
+        self.m.data[0].x *= 1.01
+        second = self.fit_sim()
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 4))
+        self.assertFalse(np.allclose(second[0], first[0]))
+
+    def test_error_stops_tracking(self):
+        inst = self.m.script_module.inst
+        inst_class = type(inst)
+        inst.setRestype('unknown')
+        with self.assertRaises(Exception):
+            self.fit_sim()
+        self.assertIs(type(inst), inst_class)
+        self.assertEqual(dataset_cache._tracked_objects, {})
+        self.assertNotIn('__getattribute__', ModelParamBase.__dict__)
+
+    def test_threads(self):
+        inst = self.m.script_module.inst
+        inst_class = type(inst)
+        recordings = [dataset_cache._Recording(i, [], 0) for i in range(2)]
+        started = threading.Barrier(2)
+        first_stopped = threading.Event()
+
+        def record(i):
+            dataset_cache.start_tracking(recordings[i])
+            recordings[i].track(inst)
+            started.wait()
+            if i == 0:
+                inst.I0
+                dataset_cache.stop_tracking()
+                first_stopped.set()
+            else:
+                first_stopped.wait()
+                inst.I0 = 2.0
+                dataset_cache.stop_tracking()
+
+        threads = [threading.Thread(target=record, args=(i,)) for i in range(2)]
+        for ti in threads:
+            ti.start()
+        for ti in threads:
+            ti.join()
+        # each recording only contains the access of its own thread, also after the other thread stopped
+        self.assertEqual([name for obj, name, value in recordings[0].reads.values()], ['I0'])
+        self.assertEqual(recordings[0].writes, {})
+        self.assertEqual([name for obj, name, value in recordings[1].writes.values()], ['I0'])
+        self.assertEqual(recordings[1].reads, {})
+        self.assertIs(type(inst), inst_class)
+
+
 if __name__=='__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+"""
+Test of the interpolation table of the correlation function integral used by the off-specular models.
+"""
+
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+import numpy as np
+
+from genx.models.lib import hurst_table as ht
+
+
+class TestHurstTable(unittest.TestCase):
+
+    def setUp(self):
+        self._cache_dir = ht.hurst_cache_dir
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        ht.hurst_cache_dir = self.tmp_dir.name
+        self.table = ht.HurstTable()
+        self.q = np.geomspace(0.001, 500.0, 97)
+
+    def tearDown(self):
+        ht.hurst_cache_dir = self._cache_dir
+        self.tmp_dir.cleanup()
+
+    def compare(self, h, tolerance):
+        result = self.table(self.q, h)
+        reference = ht.integrate_F(np.maximum(self.q, 0.003), h)
+        self.assertLess(abs(result - reference).max(), tolerance * abs(reference).max())
+
+    def test_interpolation(self):
+        for h in [0.057, 0.35, 0.5, 0.777, 1.0]:
+            with self.subTest(h=h):
+                self.compare(h, 2e-3)
+        # a value of h on the grid only needs one column
+        self.table.clear()
+        self.table(self.q, 0.5)
+        self.assertEqual(list(self.table._columns.keys()), [45])
+
+    def test_symmetric(self):
+        np.testing.assert_array_equal(self.table(-self.q, 0.8), self.table(self.q, 0.8))
+
+    def test_outside(self):
+        self.table([1.0], 0.5)
+        with patch.object(ht, "integrate_F", wraps=ht.integrate_F) as integrate:
+            self.table([1.0, 2000.0], 0.5)
+            integrate.assert_called_once()
+            self.assertEqual(list(integrate.call_args[0][0]), [2000.0])
+        self.compare(0.02, 1e-12)
+
+    def test_stored_columns(self):
+        self.table(self.q, 0.731)
+        self.assertEqual(len(os.listdir(self.tmp_dir.name)), 3)
+        # a new table loads the stored columns
+        with patch.object(ht, "integrate_F") as integrate:
+            table = ht.HurstTable()
+            np.testing.assert_array_equal(table(self.q, 0.731), self.table(self.q, 0.731))
+            integrate.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
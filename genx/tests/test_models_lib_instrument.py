@@ -147,9 +147,11 @@ class TestInstrumentModuleBranching(unittest.TestCase):
         global instrument
         lib.USE_NUMBA = True
         reload(instrument)
+        self.assertIsInstance(instrument.SquareIntensity, lib.LazyNumbaFunction)
         from genx.models.lib import instrument_numba
 
-        self.assertTrue(instrument.SquareIntensity is instrument_numba.SquareIntensity)
+        # the numba function is loaded on first use
+        self.assertTrue(instrument.SquareIntensity.resolve() is instrument_numba.SquareIntensity)
 
     def test_numba_error(self):
         global instrument
@@ -159,7 +161,10 @@ class TestInstrumentModuleBranching(unittest.TestCase):
         # make sure the module misses a required function so an exception is raised in instrument when importing
         del instrument_numba.SquareIntensity
         reload(instrument)
+        I = instrument.SquareIntensity(np.linspace(0.0, 1.0, 10), 10.0, 0.5)
         instrument_numba.SquareIntensity = self.SquareIntensity
+        self.assertTrue(instrument.SquareIntensity.resolve() is instrument.SquareIntensity.fallback)
+        np.testing.assert_array_almost_equal(I, self.SquareIntensity(np.linspace(0.0, 1.0, 10), 10.0, 0.5))
 
 
 if __name__ == "__main__":
@@ -2,22 +2,28 @@
 Test that all functions implemented in Numba yield same results as pure python functions.
 """
 
+import importlib
 import unittest
 
+from unittest.mock import patch
+
 import numpy as np
 
-from genx.models import lib, sxrd
+from genx.models import lib, spec_adaptive, sxrd
 
 lib.USE_NUMBA = False
-from genx.models.lib import instrument, neutron_refl, paratt
+from genx.models.lib import instrument, neutron_refl, paratt, segmentation, xrmr
 
 try:
-    from genx.models.lib import paratt_numba, instrument_numba, neutron_numba, surface_scattering
+    from genx.models.lib import paratt_numba, instrument_numba, neutron_numba, surface_scattering, xrmr_numba
+    from genx.models.lib import segmentation_numba
 except ModuleNotFoundError:
     # numba might not be installed
     paratt_numba = None
     instrument_numba = None
     neutron_numba = None
+    xrmr_numba = None
+    segmentation_numba = None
 
 try:
     from genx.models.lib import neutron_cuda, paratt_cuda
@@ -309,6 +315,36 @@ class TestParattModule(unittest.TestCase):
             G2 = paratt_cuda.ReflQ(Q, lamda, n, d, sigma, return_int=False)
             np.testing.assert_array_almost_equal(G1, G2)
 
+    def test_reflq_batch(self):
+        Q = np.linspace(0.0, 0.5, 200, dtype=np.float64)
+        lamda = 4.5
+        n = np.array(
+            [
+                1 - 7.57e-6 + 1.73e-7j,
+                1 - 2.24e-5 + 2.89e-6j,
+                1 - 7.57e-6 + 1.73e-7j,
+                1 - 2.24e-5 + 2.89e-6j,
+                1,
+            ],
+            dtype=np.complex128,
+        )
+        d = np.array([2, 80, 20, 80, 2], dtype=np.float64)
+        sigma = np.array([10, 5, 0, 3, 2], dtype=np.float64)
+        scale = np.linspace(0.5, 1.5, 4)[:, np.newaxis]
+        Qb = Q * np.ones_like(scale)
+        lamdab = lamda * np.ones(scale.shape[0])
+        nb = 1.0 - (1.0 - n) * scale
+        db = d * scale
+        sigmab = sigma * scale
+        for return_int in [True, False]:
+            G1 = np.array(
+                [paratt.ReflQ(Q, lamda, ni, di, si, return_int=return_int) for ni, di, si in zip(nb, db, sigmab)]
+            )
+            G2 = paratt.ReflQ_batch(Qb, lamdab, nb, db, sigmab, return_int=return_int)
+            G3 = paratt_numba.ReflQ_batch(Qb, lamdab, nb, db, sigmab, return_int=return_int)
+            np.testing.assert_array_almost_equal(G1, G2)
+            np.testing.assert_array_almost_equal(G1, G3)
+
     def test_refl_nvary_int_roughness(self):
         theta = np.linspace(0.0, 5.0, 1000, dtype=np.float64)
         lamda = np.linspace(4.0, 5.0, 1000, dtype=np.float64)
@@ -599,5 +635,156 @@ class TestSXRD(unittest.TestCase):
                     np.testing.assert_array_almost_equal(res, res_nb)
 
 
+@unittest.skipIf(xrmr_numba is None, 'Numba not available')
+class TestXRMRModule(unittest.TestCase):
+    # Test the models.lib.xrmr recursion matrix functions implemented in models.lib.xrmr_numba
+
+    @classmethod
+    def setUpClass(cls):
+        # xrmr could have been imported with the numba functions by other tests
+        importlib.reload(xrmr)
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.g_0 = np.sin(np.linspace(0.25, 30.0, 500) * np.pi / 180.0)
+        self.lamda = 15.77
+        layers = 12
+        pre = self.lamda**2 * 2.8179402894e-5 / np.pi * 0.08
+        self.chi0 = np.r_[0.0, -pre * (27.0 - 0.001j) * np.ones(layers - 2), -pre * (78.0 - 0.001j)]
+        self.A = np.r_[0.0, pre * (32.0 + 20.0j) * (1.0 + 0.1 * rng.random(layers - 2)), 0.0]
+        self.B = np.r_[0.0, pre * (-8.0 - 8.0j) * rng.random(layers - 2), 0.0]
+        self.C = np.r_[0.0, pre * (4.0 + 2.0j) * rng.random(layers - 2), 0.0]
+        # a non-magnetic layer and a layer magnetized along y
+        self.B[3] = self.C[3] = 0.0
+        theta = rng.random(layers) * np.pi
+        phi = rng.random(layers) * 2 * np.pi
+        self.M = np.c_[np.cos(theta) * np.cos(phi), np.cos(theta) * np.sin(phi), np.sin(theta)]
+        self.M[5] = [0.0, 1.0, 0.0]
+        self.d = np.r_[0.0, 20.0 + 30.0 * rng.random(layers - 2), 0.0]
+        self.roughness = [rng.random(layers) * 3.0 for _ in range(3)]
+        self.interface = [rng.random(layers) * 3.0 for _ in range(2)] + [rng.random(layers) - 0.5 for _ in range(2)]
+
+    def test_do_calc(self):
+        chi, non_mag, mpy = xrmr.create_chi(self.g_0, self.lamda, self.chi0, self.A, self.B, self.C, self.M, self.d)
+        self.assertTrue(non_mag[3] and mpy[5])
+        W1 = xrmr.do_calc(self.g_0, self.lamda, chi, self.d, non_mag, mpy)
+        W2 = xrmr_numba.do_calc(self.g_0, self.lamda, chi, self.d, non_mag, mpy)
+        np.testing.assert_array_almost_equal(W1, W2)
+
+    def test_do_calc_int_lay(self):
+        args = (self.g_0, self.lamda, self.chi0, self.A, self.B, self.C, self.M, self.d)
+        W1 = xrmr.calc_refl_int_lay(*args, *self.roughness, *self.interface)
+        with patch.object(xrmr, "do_calc_int_lay", xrmr_numba.do_calc_int_lay):
+            W2 = xrmr.calc_refl_int_lay(*args, *self.roughness, *self.interface)
+        np.testing.assert_array_almost_equal(W1, W2)
+
+    def test_do_calc_int_lay_energy(self):
+        # parameters that depend on the energy of each point
+        points = self.g_0.shape[0]
+        scale = np.linspace(0.8, 1.2, points)
+        lamda = np.linspace(15.0, 16.0, points)
+        args = (
+            self.g_0,
+            lamda,
+            self.chi0[:, np.newaxis] * scale,
+            self.A[:, np.newaxis] * scale,
+            self.B[:, np.newaxis] * scale,
+            self.C[:, np.newaxis] * scale,
+            self.M[:, :, np.newaxis] * np.ones(points),
+            self.d,
+        )
+        W1 = xrmr.calc_refl_int_lay(*args, *self.roughness, *self.interface)
+        with patch.object(xrmr, "do_calc_int_lay", xrmr_numba.do_calc_int_lay):
+            W2 = xrmr.calc_refl_int_lay(*args, *self.roughness, *self.interface)
+        np.testing.assert_array_almost_equal(W1, W2)
+
+
+@unittest.skipIf(segmentation_numba is None, 'Numba not available')
+class TestSegmentationModule(unittest.TestCase):
+    # Test the models.lib.segmentation functions implemented in models.lib.segmentation_numba
+
+    @classmethod
+    def setUpClass(cls):
+        # segmentation could have been imported with the numba functions by other tests
+        importlib.reload(segmentation)
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        layers = 40
+        d = rng.random(layers - 1) * 40.0 + 2.0
+        self.int_pos = np.cumsum(np.r_[0.0, d])
+        self.sigma = rng.random(layers) * 6.0 + 1e-7
+        self.rough_type = np.arange(layers) % 4
+        sratio = (self.sigma[1:] - self.sigma[:-1]) / (self.sigma[1:] + self.sigma[:-1])
+        self.delta_pos = (0.5 + 0.5 * sratio) * d
+        self.sigma_pos = (1.0 - abs(sratio)) * d / 2.0
+        self.z = np.arange(-30.0, self.int_pos[-1] + 100.0, 0.1)
+        sld = rng.random((3, layers + 1)) * (1.0 - 0.1j)
+        sld[:, -1] = 0.0
+        self.delta = sld[:, :-1] - sld[:, 1:]
+
+    def profiles(self, module, crop):
+        return module.interface_profiles(
+            self.z, self.int_pos, self.sigma, self.rough_type, self.delta_pos, self.sigma_pos, crop, self.delta
+        )
+
+    def test_interface_profiles(self):
+        for crop in [False, True]:
+            with self.subTest(crop=crop):
+                P1 = self.profiles(segmentation, crop)
+                P2 = self.profiles(segmentation_numba, crop)
+                np.testing.assert_allclose(P2, P1, rtol=1e-12, atol=1e-14)
+                # regions without any SLD contribution are not affected by rounding errors,
+                # the exponential transitions are not exactly zero far above the interface
+                self.rough_type %= 2
+                P1 = self.profiles(segmentation, crop)
+                P2 = self.profiles(segmentation_numba, crop)
+                self.assertTrue((P1 == 0.0).any())
+                np.testing.assert_array_equal(P2[P1 == 0.0], 0.0)
+
+    def test_segment_bounds(self):
+        rho = self.profiles(segmentation, True).real
+        for max_diff in [1e-3, 0.05, 10.0]:
+            with self.subTest(max_diff=max_diff):
+                B1 = segmentation.segment_bounds(rho[0], rho[1], rho[1], rho[2], max_diff, 2 * max_diff)
+                B2 = segmentation_numba.segment_bounds(rho[0], rho[1], rho[1], rho[2], max_diff, 2 * max_diff)
+                np.testing.assert_array_equal(B1, B2)
+        rho[1, 500] = np.nan
+        B1 = segmentation.segment_bounds(rho[0], rho[1], rho[1], rho[2], 0.05, 0.1)
+        B2 = segmentation_numba.segment_bounds(rho[0], rho[1], rho[1], rho[2], 0.05, 0.1)
+        np.testing.assert_array_equal(B1, B2)
+
+    def test_calculate_segmentation(self):
+        Layer = spec_adaptive.Layer
+        layers = [
+            Layer(d=25.0, sigma=3.0, dens=0.05, f=30.0 + 1.0j, b=5e-5, magn=1.5, magn_ang=30.0, rough_type=rti)
+            for rti in ["gauss", "linear", "exp-1", "exp-2"]
+        ] + [Layer(d=50.0, sigma=1.0, dens=0.08, f=60.0 + 2.0j, b=-2e-5, magn_void=True)]
+        sample = spec_adaptive.Sample(
+            Stacks=[
+                spec_adaptive.Stack(Layers=layers, Repetitions=5),
+                spec_adaptive.Stack(Layers=[Layer(d=40.0, sigma=2.0, dens=0.02, b=1e-5)], Element=1),
+            ],
+            Substrate=Layer(sigma=4.0, dens=0.1, f=40.0 + 1.0j, b=4e-5),
+            crop_sigma=True,
+            max_diff_n=1e-6,
+        )
+        with patch.multiple(
+            spec_adaptive,
+            interface_profiles=segmentation.interface_profiles,
+            segment_bounds=segmentation.segment_bounds,
+        ):
+            S1 = spec_adaptive.calculate_segmentation(sample)
+        with patch.multiple(
+            spec_adaptive,
+            interface_profiles=segmentation_numba.interface_profiles,
+            segment_bounds=segmentation_numba.segment_bounds,
+        ):
+            S2 = spec_adaptive.calculate_segmentation(sample)
+        # d, x-ray SLD, neutron SLD, magnetization and absorption, the angle is undefined without magnetization
+        for v1, v2 in zip(S1[:5], S2[:5]):
+            np.testing.assert_allclose(v2, v1, rtol=1e-12, atol=1e-12 * abs(np.array(v1)).max())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,64 @@
+"""
+Test of the numba cache configuration and the ahead of time build of the kernel caches.
+"""
+
+import hashlib
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+try:
+    import numba
+
+    from genx.models.lib import numba_integration
+except ImportError:
+    # numba might not be installed
+    numba = None
+
+
+def kernel():
+    pass
+
+
+@unittest.skipIf(numba is None, "Numba not available")
+class TestNumbaIntegration(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        environ = patch.dict(os.environ, NUMBA_CACHE_DIR=self.tmp_dir.name)
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def test_locator(self):
+        locator = numba_integration._GenxCacheLocator(kernel, __file__)
+        self.assertEqual(os.path.dirname(locator.get_cache_path()), self.tmp_dir.name)
+        self.assertEqual(os.path.basename(locator.get_cache_path()), "genxsource_tests")
+        with open(__file__, "rb") as fh:
+            self.assertEqual(locator.get_source_stamp(), hashlib.sha256(fh.read()).hexdigest())
+        with patch.object(numba, "GENX_OVERWRITE_SINGLE", True, create=True):
+            locator = numba_integration._GenxCacheLocator(kernel, __file__)
+        self.assertEqual(os.path.basename(locator.get_cache_path()), "genxsource_tests_single")
+
+    def test_configure(self):
+        numba_integration.configure_numba()
+        numba_integration.configure_numba()
+        locators = numba.core.caching.CacheImpl._locator_classes
+        self.assertEqual(locators.count(numba_integration._GenxCacheLocator), 1)
+
+    def test_shared_cache(self):
+        modules = ("segmentation_numba",)
+        compiled = numba_integration.check_kernels(modules)
+        self.assertIn("segmentation_numba.interface_profiles", compiled)
+        self.assertIn("segmentation_numba.segment_bounds", compiled)
+        # a second process loads all kernels from the cache
+        self.assertEqual(numba_integration.check_kernels(modules), [])
+        # versions without parallel support are not taken from the parallel cache
+        with patch.object(numba, "GENX_OVERWRITE_SINGLE", True, create=True):
+            self.assertIn("segmentation_numba.interface_profiles", numba_integration.check_kernels(modules))
+            self.assertEqual(numba_integration.check_kernels(modules), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
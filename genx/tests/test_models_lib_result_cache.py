@@ -0,0 +1,172 @@
+"""
+Test of the result cache used to store spin-flip and anisotropic x-ray calculations of the
+reflectivity models and the bulk structure factors of the SXRD models.
+"""
+
+import unittest
+
+from unittest.mock import patch
+
+import numpy as np
+
+from genx.models import mag_refl, spec_nx, sxrd
+from genx.models.lib.result_cache import ResultCache, array_digest, bulk_cache, digest, refl_cache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_digest(self):
+        q = np.linspace(0.01, 0.2, 50)
+        self.assertEqual(digest(q, 1.54, [1.0, 2.0]), digest(q.copy(), 1.54, [1.0, 2.0]))
+        self.assertNotEqual(digest(q, 1.54), digest(q, 1.55))
+        self.assertNotEqual(digest(q), digest(q[:-1]))
+        self.assertNotEqual(digest(q), digest(q.astype(np.float32)))
+        self.assertNotEqual(digest([1.0, 2.0]), digest([[1.0], [2.0]]))
+
+    def test_array_digest(self):
+        q = np.linspace(0.01, 0.2, 50)
+        self.assertEqual(array_digest(q, 1.0), array_digest(q.copy(), 1.0))
+        self.assertNotEqual(array_digest(q, 1.0), array_digest(q[:-1], 1.0))
+        with patch("genx.models.lib.result_cache.digest", wraps=digest) as counted:
+            array_digest(q)
+        # only the combination of the stored digests is calculated again
+        self.assertEqual(counted.call_count, 1)
+
+    def test_lru(self):
+        cache = ResultCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        # "b" was the least recently used entry
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats(), {"hits": 3, "misses": 1, "size": 2, "maxsize": 2})
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TestSpinFlipCache(unittest.TestCase):
+
+    def setUp(self):
+        refl_cache.clear()
+        layer = spec_nx.Layer(d=100.0, dens=0.05, b=9.45, magn=1.5, magn_ang=45.0, sigma=3.0)
+        substrate = spec_nx.Layer(dens=0.05, b=4.15, sigma=2.0)
+        stack = spec_nx.Stack(Layers=[layer], Repetitions=1)
+        self.sample = spec_nx.Sample(Stacks=[stack], Ambient=spec_nx.Layer(), Substrate=substrate)
+        self.inst = spec_nx.Instrument(probe="neutron pol spin flip", coords="q", wavelength=4.4, restype="no conv")
+
+    def specular(self, q, pol):
+        self.inst.pol = pol
+        return spec_nx.Specular(q, self.sample, self.inst)
+
+    def test_channels_on_different_grids(self):
+        q1 = np.linspace(0.01, 0.1, 40)
+        q2 = np.linspace(0.01, 0.1, 25)
+        uu = self.specular(q1, "uu")
+        ud = self.specular(q2, "ud")
+        self.assertEqual(refl_cache.stats()["misses"], 2)
+        # both grids are reused when alternating between the datasets
+        np.testing.assert_array_equal(self.specular(q1, "dd").shape, uu.shape)
+        np.testing.assert_array_equal(self.specular(q2, "ud"), ud)
+        self.assertEqual(refl_cache.stats()["hits"], 2)
+
+        refl_cache.clear()
+        np.testing.assert_array_almost_equal(self.specular(q1, "uu"), uu)
+
+    def test_parameter_change(self):
+        q = np.linspace(0.01, 0.1, 40)
+        uu = self.specular(q, "uu")
+        self.sample.Stacks[0].Layers[0].magn = 0.5
+        self.assertFalse(np.allclose(self.specular(q, "uu"), uu))
+        self.inst.wavelength = 5.0
+        self.specular(q, "uu")
+        self.assertEqual(refl_cache.stats()["misses"], 3)
+
+
+class TestXrayAnisoCache(unittest.TestCase):
+
+    def setUp(self):
+        refl_cache.clear()
+        layer = mag_refl.Layer(d=150.0, sigma=2.0, f=30.0 + 1.0j, fm1=1.0 + 1.0j, dens=0.1, magn=1.0, magn_ang=24.0)
+        self.sample = mag_refl.Sample(
+            Stacks=[mag_refl.Stack(Layers=[layer])],
+            Ambient=mag_refl.Layer(),
+            Substrate=mag_refl.Layer(f=50.0 + 2.0j, dens=0.1),
+            slicing=False,
+        )
+        self.inst = mag_refl.Instrument(probe="x-ray anis.", coords="2θ", restype="no conv", wavelength=1.54)
+
+    def specular(self, tth, pol):
+        self.inst.xpol = pol
+        return mag_refl.Specular(tth, self.sample, self.inst)
+
+    def test_channels(self):
+        tth = np.linspace(0.5, 5.0, 50)
+        plus = self.specular(tth, "circ+")
+        minus = self.specular(tth, "circ-")
+        self.specular(tth, "ass")
+        self.assertEqual(refl_cache.stats()["misses"], 1)
+        self.assertEqual(refl_cache.stats()["hits"], 2)
+        self.assertFalse(np.allclose(plus, minus))
+
+        refl_cache.clear()
+        np.testing.assert_array_almost_equal(self.specular(tth, "circ-"), minus)
+
+    def test_parameter_change(self):
+        tth = np.linspace(0.5, 5.0, 50)
+        plus = self.specular(tth, "circ+")
+        self.sample.Stacks[0].Layers[0].magn_ang = 60.0
+        self.assertFalse(np.allclose(self.specular(tth, "circ+"), plus))
+        self.specular(tth[:-1], "circ+")
+        self.assertEqual(refl_cache.stats()["misses"], 3)
+
+
+class TestBulkCache(unittest.TestCase):
+
+    def setUp(self):
+        bulk_cache.clear()
+        self.inst = sxrd.Instrument(wavel=1.0, alpha=1.0)
+        bulk = sxrd.Slab()
+        bulk.add_atom("Sr", "sr2p", 0.0, 0.0, 0.0, 0.08, 1.0)
+        bulk.add_atom("Ti", "ti4p", 0.5, 0.5, 0.5, 0.08, 1.0)
+        bulk.add_atom("O1", "o2m", 0.5, 0.5, 0.0, 0.08, 1.0)
+        surface = sxrd.Slab()
+        surface.add_atom("Sr", "sr2p", 0.0, 0.0, 0.0, 0.08, 1.0)
+        self.unit_cell = sxrd.UnitCell(3.9045, 3.9045, 3.9045)
+        self.sample = sxrd.Sample(self.inst, bulk, [surface], self.unit_cell)
+        self.l = np.linspace(0.1, 3.0, 100)
+        self.h = 0 * self.l + 1.0
+        self.k = 0 * self.l
+
+    def test_reuse(self):
+        fb = self.sample.calc_fb(self.h, self.k, self.l)
+        np.testing.assert_array_equal(fb, self.sample._calc_fb(self.h, self.k, self.l))
+        with patch("genx.models.sxrd._get_f", wraps=sxrd._get_f) as get_f:
+            self.sample.calc_f(self.h, self.k, self.l)
+        self.assertEqual(bulk_cache.stats()["hits"], 1)
+        # the form factors are only evaluated for the surface
+        self.assertEqual(get_f.call_count, 1)
+
+    def test_parameter_change(self):
+        fb = self.sample.calc_fb(self.h, self.k, self.l)
+        self.inst.alpha = 2.0
+        self.sample.calc_fb(self.h, self.k, self.l)
+        self.unit_cell.set_c(3.95)
+        self.assertFalse(np.allclose(self.sample.calc_fb(self.h, self.k, self.l), fb))
+        self.assertEqual(bulk_cache.stats()["misses"], 3)
+
+    def test_form_factor_change(self):
+        fb = self.sample.calc_fb(self.h, self.k, self.l)
+        # a custom form factor function for one element within the same library
+        f_sr = self.inst.flib.sr2p
+        object.__getattribute__(self.inst.flib, "stored_values")["sr2p"] = lambda s: 0.5 * f_sr(s)
+        fb_changed = self.sample.calc_fb(self.h, self.k, self.l)
+        self.assertEqual(bulk_cache.stats()["misses"], 2)
+        self.assertFalse(np.allclose(fb_changed, fb))
+        np.testing.assert_array_equal(fb_changed, self.sample._calc_fb(self.h, self.k, self.l))
+
+
+if __name__ == "__main__":
+    unittest.main()
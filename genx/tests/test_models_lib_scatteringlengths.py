@@ -0,0 +1,64 @@
+"""
+Test of the tabulated scattering factor databases.
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from genx.models.lib import scatteringlengths as sl
+
+NIST_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "genx", "models", "databases", "f1f2_nist"
+)
+
+
+class TestFactorTable(unittest.TestCase):
+
+    def setUp(self):
+        self._cache_dir = sl.table_cache_dir
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        sl.table_cache_dir = self.tmp_dir.name
+        self.table = sl.FactorTable(NIST_PATH, sl.read_nff_tables)
+
+    def tearDown(self):
+        sl.table_cache_dir = self._cache_dir
+        self.tmp_dir.cleanup()
+
+    def test_interpolation(self):
+        e, f1, f2 = np.loadtxt(os.path.join(NIST_PATH, "fe.nff"), skiprows=1, unpack=True)
+        energy = np.linspace(5000.0, 9000.0, 101)
+        result = self.table.interpolate("Fe", energy)
+        np.testing.assert_array_almost_equal(result, np.interp(energy, e, f1) - 1.0j * np.interp(energy, e, f2))
+        self.assertAlmostEqual(self.table.interpolate("fe", e[10]), f1[10] - 1.0j * f2[10])
+
+    def test_vectorized(self):
+        energy = np.linspace(5000.0, 9000.0, 11)
+        result = self.table.interpolate(["fe", "co", "o"], energy)
+        self.assertEqual(result.shape, (3, 11))
+        np.testing.assert_array_equal(result[1], self.table.interpolate("co", energy))
+
+    def test_errors(self):
+        with self.assertRaises(LookupError):
+            self.table.interpolate("xx", 8000.0)
+        with self.assertRaises(ValueError):
+            self.table.interpolate("fe", 1e9)
+
+    def test_binary_store(self):
+        self.table.interpolate("fe", 8000.0)
+        self.assertEqual(len(os.listdir(self.tmp_dir.name)), 1)
+        # a new table loads the stored file
+        table = sl.FactorTable(NIST_PATH, None)
+        self.assertEqual(table.interpolate("fe", 8000.0), self.table.interpolate("fe", 8000.0))
+
+    def test_lookup_functions(self):
+        lookup = sl.create_fp_lookup(NIST_PATH)
+        self.assertAlmostEqual(lookup("fe", 1.54), self.table.interpolate("fe", 1239.842 / 1.54 * 10))
+        with self.assertRaises(ValueError):
+            lookup("fe", 1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+"""
+Test of the legacy module names (e.g. import models.spec_nx) used by model scripts.
+"""
+
+import importlib
+import sys
+import unittest
+
+import genx
+
+
+class TestModuleFinder(unittest.TestCase):
+    def test_alias(self):
+        import genx.models.spec_nx
+
+        model = importlib.import_module("models.spec_nx")
+        self.assertIs(model, genx.models.spec_nx)
+        self.assertIs(sys.modules["models"], sys.modules["genx.models"])
+        self.assertEqual(model.__spec__.name, "genx.models.spec_nx")
+        from models.utils import UserVars
+
+        self.assertEqual(UserVars.__module__, "genx.models.utils")
+
+    def test_unknown(self):
+        finder = sys.meta_path[0]
+        self.assertIsInstance(finder, genx.GenxModuleFinder)
+        self.assertIsNone(finder.find_spec("numpy.linalg"))
+        self.assertIsNone(finder.find_spec("models.does_not_exist"))
+        with self.assertRaises(ModuleNotFoundError):
+            importlib.import_module("models.does_not_exist")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Tests of the MPI master-worker engine using the single rank fallback communicator.
+"""
+
+import argparse
+import unittest
+
+from unittest.mock import patch
+
+import numpy as np
+
+from genx import run
+from genx.diffev import DiffEv
+from genx.mpi_engine import MPIEvaluator, SerialComm, evaluate_share, split_counts
+
+
+class RecordingComm(SerialComm):
+    def __init__(self):
+        self.broadcasts = []
+
+    def bcast(self, obj, root=0):
+        self.broadcasts.append(obj)
+        return obj
+
+
+class TestSplitCounts(unittest.TestCase):
+
+    def test_even(self):
+        np.testing.assert_array_equal(split_counts(12, np.ones(4)), [3, 3, 3, 3])
+
+    def test_sum(self):
+        rng = np.random.default_rng(0)
+        for n_items in [0, 1, 7, 50, 1001]:
+            for n_ranks in [1, 3, 16]:
+                counts = split_counts(n_items, rng.random(n_ranks) + 0.1)
+                self.assertEqual(counts.sum(), n_items)
+                self.assertTrue((counts >= 0).all())
+
+    def test_weighted(self):
+        np.testing.assert_array_equal(split_counts(90, [1.0, 2.0]), [30, 60])
+
+
+class TestMPIEvaluator(unittest.TestCase):
+
+    def setUp(self):
+        self.init_args = None
+
+    def init_func(self, *args):
+        self.init_args = args
+
+    @staticmethod
+    def eval_func(vec):
+        return (vec**2).sum()
+
+    def test_evaluate(self):
+        evaluator = MPIEvaluator(SerialComm(), self.init_func, self.eval_func)
+        evaluator.start(b"model", 1)
+        self.assertEqual(self.init_args, (b"model", 1))
+
+        vectors = np.random.default_rng(1).random((25, 4))
+        result = evaluator.evaluate(vectors)
+        np.testing.assert_array_almost_equal(result, (vectors**2).sum(axis=1))
+        evaluator.stop()
+        self.assertFalse(evaluator.running)
+
+    def test_evaluate_share(self):
+        vectors = np.arange(12.0).reshape(6, 2)
+        result, t_eval = evaluate_share(SerialComm(), self.eval_func, vectors, [6], 2)
+        np.testing.assert_array_equal(result, (vectors**2).sum(axis=1))
+        self.assertGreaterEqual(t_eval, 0.0)
+
+    def test_load_balancing(self):
+        evaluator = MPIEvaluator(SerialComm(), self.init_func, self.eval_func)
+        evaluator.size = 2
+        evaluator.weights = np.ones(2)
+        # second rank was twice as fast
+        evaluator.update_weights(np.array([10, 10]), np.array([2.0, 1.0]))
+        self.assertGreater(evaluator.weights[1], evaluator.weights[0])
+        counts = split_counts(30, evaluator.weights)
+        self.assertGreater(counts[1], counts[0])
+
+    def test_load_balancing_idle_rank(self):
+        evaluator = MPIEvaluator(SerialComm(), self.init_func, self.eval_func)
+        evaluator.size = 3
+        evaluator.weights = np.ones(3)
+        # more ranks than vectors, the last rank got nothing to evaluate
+        evaluator.update_weights(np.array([1, 1, 0]), np.array([2.0, 1.0, 0.0]))
+        self.assertGreater(evaluator.weights[1], evaluator.weights[0])
+        self.assertEqual(evaluator.weights[2], 1.0)
+
+    def test_stop_without_start(self):
+        # the worker ranks wait in worker_loop from their start and have to be released once
+        comm = RecordingComm()
+        evaluator = MPIEvaluator(comm, self.init_func, self.eval_func)
+        evaluator.stop()
+        evaluator.stop()
+        self.assertEqual(comm.broadcasts, [("stop",)])
+
+
+class TestStartFitting(unittest.TestCase):
+
+    def test_release_workers_on_error(self):
+        args = argparse.Namespace(
+            bumps=False,
+            mpi=True,
+            pr=0,
+            error=False,
+            outfile="",
+            use_curses=False,
+            disable_numba=True,
+            infile="does_not_exist.hgx",
+            esave=False,
+        )
+        with patch.object(DiffEv, "dismount_parallel_mpi") as dismount:
+            with self.assertRaises(Exception):
+                run.start_fitting(args, rank=0)
+        dismount.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Tests of the MPI paths of the remote controller using the single rank fallback communicator.
+"""
+
+import asyncio
+import os
+import pickle
+import time
+import unittest
+
+from unittest.mock import patch
+
+from genx import api, diffev
+from genx.mpi_engine import SerialComm
+from genx.remote import controller, messaging
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "genx", "examples")
+
+
+class ScriptedComm(SerialComm):
+    """
+    Communicator of a worker rank that receives a fixed sequence of commands from rank 0.
+    """
+
+    def __init__(self, commands):
+        self.commands = list(commands)
+
+    def Get_rank(self):
+        return 1
+
+    def bcast(self, obj, root=0):
+        return self.commands.pop(0)
+
+
+class TestRemoteControllerMPI(unittest.TestCase):
+    def setUp(self):
+        self.model, _ = api.load(os.path.join(EXAMPLE_PATH, "X-ray_Reflectivity.hgx"))
+        # start the numba threads from the main thread, the tbb layer blocks the exit otherwise
+        self.model.simulate()
+
+    def test_worker_rank(self):
+        pkl_str = pickle.dumps(self.model.pickable_copy())
+        comm = ScriptedComm([("init", (pkl_str, None, True, False)), ("stop",)])
+        with patch.object(controller, "rank", 1), patch.object(controller, "get_comm", return_value=comm):
+            ctrl = controller.RemoteController()
+            asyncio.run(asyncio.wait_for(ctrl.serve("127.0.0.1", 0), 30.0))
+        # the worker received the model from the init command and left the loop with stop
+        self.assertEqual(comm.commands, [])
+        self.assertEqual(diffev.model.script, self.model.script)
+
+    def test_start_fit(self):
+        ctrl = controller.RemoteController()
+        ctrl.set_callbacks(diffev.DiffEvDefaultCallbacks())
+        ctrl.model = self.model
+        opt = ctrl.optimizer.opt
+        opt.use_mpi = True
+        opt.use_parallel_processing = True
+        opt.use_autosave = False
+        opt.use_pop_mult = False
+        opt.pop_size = 8
+        opt.use_max_generations = True
+        opt.max_generations = 3
+
+        async def run():
+            server_task = asyncio.create_task(ctrl.serve("127.0.0.1", 0))
+            ctrl.reader = asyncio.StreamReader()
+            for chunk in messaging.ActionMessage(messaging.ActionType.START_FIT, "", "").message_chunks():
+                ctrl.reader.feed_data(chunk)
+            await ctrl.recv_messages()
+            while ctrl.optimizer.is_running():
+                await asyncio.sleep(0.05)
+            evaluator = ctrl.optimizer.mpi_evaluator
+            self.assertTrue(evaluator.running)
+            server_task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await server_task
+            return evaluator
+
+        comm = SerialComm()
+        with patch.object(controller, "__mpi__", True), patch.object(diffev, "comm", comm):
+            with patch.object(diffev, "set_numba_single"):
+                evaluator = asyncio.run(asyncio.wait_for(run(), 60.0))
+        # the fit used the master-worker engine without parallel processes
+        self.assertFalse(opt.use_parallel_processing)
+        self.assertIs(evaluator.comm, comm)
+        # shutting down the server releases the worker ranks
+        self.assertFalse(evaluator.running)
+        self.assertTrue(evaluator.stopped)
+
+
+if __name__ == "__main__":
+    unittest.main()
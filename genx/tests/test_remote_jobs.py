@@ -0,0 +1,137 @@
+"""
+Tests of the job server that runs several remote refinements.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import unittest
+
+from unittest.mock import patch
+
+import numpy as np
+
+from genx import api, diffev
+from genx.diffev import DiffEv
+from genx.remote import messaging
+from genx.remote.jobs import JobServer
+from genx.remote.optimizer import RemoteOptimizer
+from genx.solver_basis import SolverResultInfo
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "genx", "examples")
+
+
+class TestJobServer(unittest.TestCase):
+    def setUp(self):
+        self.model, _ = api.load(os.path.join(EXAMPLE_PATH, "X-ray_Reflectivity.hgx"))
+        self.client = RemoteOptimizer()
+        self.client.opt.address = "127.0.0.1"
+        self.client.opt.use_pop_mult = False
+        self.client.opt.pop_size = 10
+        self.client.opt.use_max_generations = True
+        self.client.opt.max_generations = 10
+        # start the workers as on Windows and macOS, forking after numba started its threads can block the exit
+        context = patch.object(diffev, "processing", multiprocessing.get_context("spawn"))
+        context.start()
+        self.addCleanup(context.stop)
+
+    def run_server(self, test, **server_opts):
+        async def run():
+            server = JobServer(**server_opts)
+            server.loop = asyncio.get_running_loop()
+            tcp_server = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+            self.client.opt.port = tcp_server.sockets[0].getsockname()[1]
+            async with tcp_server:
+                await asyncio.wait_for(test(server), 60.0)
+
+        asyncio.run(run())
+
+    async def request(self, action_type, job_id="", *messages):
+        status = await self.client.job_request(messaging.ActionMessage(action_type, job_id, ""), *messages)
+        self.assertIsInstance(status, messaging.JobStatus)
+        return status.jobs
+
+    async def wait_ended(self, job_id):
+        while True:
+            jobs = await self.request(messaging.ActionType.JOB_STATUS, job_id)
+            if jobs[0].ended is not None:
+                return jobs[0]
+            await asyncio.sleep(0.05)
+
+    def test_queue(self):
+        async def test(server):
+            transfer = self.client.model_message(self.model)
+            first = (await self.request(messaging.ActionType.SUBMIT_JOB, "", transfer))[0]
+            second = (await self.request(messaging.ActionType.SUBMIT_JOB, "", transfer))[0]
+            self.assertNotEqual(first.job_id, second.job_id)
+            # only one job can run at a time
+            self.assertEqual(second.state, messaging.JobState.QUEUED)
+            # the job evaluates its population in its own worker process
+            self.assertTrue(server.jobs[first.job_id].optimizer.opt.use_parallel_processing)
+            self.assertEqual(server.jobs[first.job_id].optimizer.opt.parallel_processes, 1)
+
+            jobs = await self.request(messaging.ActionType.JOB_STATUS)
+            self.assertEqual([job.job_id for job in jobs], [first.job_id, second.job_id])
+            jobs = await self.request(messaging.ActionType.CANCEL_JOB, second.job_id)
+            self.assertEqual(jobs[0].state, messaging.JobState.STOPPED)
+
+            first = await self.wait_ended(first.job_id)
+            self.assertEqual(first.state, messaging.JobState.FINISHED)
+            self.assertEqual(first.generation, 10)
+            self.assertGreater(first.n_fom_evals, 0)
+            self.assertEqual(await self.request(messaging.ActionType.JOB_STATUS, "unknown"), [])
+
+        self.run_server(test, max_jobs=1, cores=1)
+
+    def test_attach(self):
+        async def test(server):
+            transfer = self.client.model_message(self.model)
+            job = (await self.request(messaging.ActionType.SUBMIT_JOB, "", transfer))[0]
+            await self.wait_ended(job.job_id)
+
+            # attaching to an ended job sends its result and closes the connection
+            await self.client.connect()
+            await self.client.send_message(messaging.ActionMessage(messaging.ActionType.ATTACH_JOB, job.job_id, ""))
+            messages = []
+            while not self.client.reader.at_eof():
+                try:
+                    messages.append(await messaging.GenXMessage.receive(self.client.reader))
+                except asyncio.IncompleteReadError:
+                    break
+            self.client.writer.close()
+            self.assertIsInstance(messages[0], messaging.JobStatus)
+            self.assertIsInstance(messages[-1].payload, SolverResultInfo)
+            result = server.jobs[job.job_id].result
+            self.assertEqual(list(messages[-1].payload.start_guess), list(result.start_guess))
+
+        self.run_server(test, max_jobs=2, cores=2)
+
+    def test_parallel_jobs(self):
+        self.client.opt.random_seed = 3
+        optimizers = []
+
+        async def test(server):
+            transfer = self.client.model_message(self.model)
+            jobs = [(await self.request(messaging.ActionType.SUBMIT_JOB, "", transfer))[0] for _ in range(2)]
+            self.assertEqual([job.state for job in jobs], [messaging.JobState.RUNNING] * 2)
+            for job in jobs:
+                self.assertEqual((await self.wait_ended(job.job_id)).state, messaging.JobState.FINISHED)
+                optimizers.append(server.jobs[job.job_id].optimizer)
+
+        self.run_server(test, max_jobs=2, cores=2)
+
+        # both jobs yield the same result as a fit within this process
+        serial = DiffEv()
+        serial.opt = self.client.model_message(self.model).fitparams
+        serial.opt.use_parallel_processing = False
+        serial.init_fitting(self.model)
+        serial.optimize()
+        # the first job started alone and uses all cores
+        self.assertEqual([optimizer.opt.parallel_processes for optimizer in optimizers], [2, 1])
+        for optimizer in optimizers:
+            self.assertAlmostEqual(optimizer.best_fom, serial.best_fom)
+            np.testing.assert_allclose(optimizer.best_vec, serial.best_vec)
+
+
+if __name__ == "__main__":
+    unittest.main()
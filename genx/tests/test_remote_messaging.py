@@ -0,0 +1,194 @@
+"""
+Tests of the messages and delta encoded optimizer updates used for remote refinement.
+"""
+
+import asyncio
+import struct
+import unittest
+
+import numpy as np
+
+from genx.data import DataList, DataSet
+from genx.remote import messaging
+from genx.remote.controller import RemotCallback
+from genx.solver_basis import SolverParameterInfo, SolverUpdateInfo
+
+
+async def read_all(raw: bytes):
+    reader = asyncio.StreamReader()
+    reader.feed_data(raw)
+    reader.feed_eof()
+    output = []
+    while not reader.at_eof():
+        output.append(await messaging.GenXMessage.receive(reader))
+    return output
+
+
+def receive_all(raw: bytes):
+    return asyncio.run(read_all(raw))
+
+
+def make_data():
+    data = DataList([DataSet(name="A"), DataSet(name="B")])
+    for i, di in enumerate(data):
+        di.x = np.linspace(0.0, 1.0, 100)
+        di.y_sim = di.x**2 + i
+        di.y_fom = di.x - i
+    return data
+
+
+class TestFraming(unittest.TestCase):
+    def n_buffers(self, message):
+        header = next(message.message_chunks())
+        return struct.unpack("<I", header[-4:])[0]
+
+    def test_out_of_band(self):
+        data = make_data()
+        # larger than one compression chunk
+        data[0].x = np.linspace(0.0, 1.0, 300000)
+        data[0].y = np.random.random((200, 1000))
+        msg = messaging.OptimizerUpdate(
+            SolverUpdateInfo(new_best=True, fom_value=0.5, fom_name="log", fom_log=np.zeros((0, 2)), data=data)
+        )
+        self.assertEqual(self.n_buffers(msg), 2)
+        raw = msg.message()
+        result = receive_all(raw + raw)
+        self.assertEqual(len(result), 2)
+        received = result[1].payload.data
+        np.testing.assert_array_equal(received[0].x, data[0].x)
+        np.testing.assert_array_equal(received[0].y, data[0].y)
+        np.testing.assert_array_equal(received[1].y_sim, data[1].y_sim)
+        self.assertTrue(received[0].y.flags.writeable)
+
+    def test_small_message(self):
+        msg = messaging.StingMessage("text")
+        self.assertEqual(self.n_buffers(msg), 0)
+        self.assertEqual(receive_all(msg.message())[0].text, "text")
+
+    def test_truncated(self):
+        raw = messaging.ActionMessage(messaging.ActionType.STOP_FIT, "Stop fit", "").message()
+        with self.assertRaises(asyncio.IncompleteReadError):
+            receive_all(raw[:-10])
+
+
+class TestDeltaUpdates(unittest.TestCase):
+    def test_update_roundtrip(self):
+        data = make_data()
+        encoder = messaging.DeltaEncoder()
+        decoder = messaging.DeltaDecoder(data)
+        fom_log = np.array([[0, 1.0], [1, 0.5]])
+        update = SolverUpdateInfo(new_best=True, fom_value=0.5, fom_name="log", fom_log=fom_log, data=data)
+        msg = encoder.update_message(update, encoder.sim_snapshot(data))
+        self.assertEqual(sorted(msg.sims.keys()), [0, 1])
+        info = decoder.update_info(receive_all(msg.message())[0])
+        np.testing.assert_array_equal(info.fom_log, fom_log)
+        np.testing.assert_array_equal(info.data[1].y_sim, data[1].y_sim)
+
+        # only the changed dataset and the new part of the log are sent
+        data[1].y_sim = data[1].y_sim * 2.0
+        fom_log = np.array([[0, 1.0], [1, 0.5], [2, 0.25]])
+        update = SolverUpdateInfo(new_best=True, fom_value=0.25, fom_name="log", fom_log=fom_log, data=data)
+        msg = encoder.update_message(update, encoder.sim_snapshot(data))
+        self.assertEqual(list(msg.sims.keys()), [1])
+        self.assertEqual(msg.fom_log_start, 2)
+        info = decoder.update_info(receive_all(msg.message())[0])
+        np.testing.assert_array_equal(info.fom_log, fom_log)
+        np.testing.assert_array_equal(info.data[1].y_sim, data[1].y_sim)
+        np.testing.assert_array_equal(info.data[0].y_fom, data[0].y_fom)
+        self.assertEqual(info.fom_value, 0.25)
+
+    def test_parameters(self):
+        population = [np.arange(3.0) + i for i in range(5)]
+        param_info = SolverParameterInfo(
+            values=population[0],
+            new_best=True,
+            population=population,
+            max_val=np.ones(3),
+            min_val=np.zeros(3),
+            fitting=True,
+        )
+        msg = receive_all(messaging.DeltaEncoder.parameter_message(param_info).message())[0]
+        result = messaging.DeltaDecoder.parameter_info(msg)
+        np.testing.assert_array_equal(np.array(result.population), np.array(population))
+        np.testing.assert_array_equal(result.values, population[0])
+        self.assertTrue(result.fitting)
+
+
+class WriterStub:
+    def __init__(self):
+        self.written = b""
+
+    def write(self, data):
+        self.written += data
+
+    async def drain(self):
+        pass
+
+
+class TestThrottledCallback(unittest.TestCase):
+    def test_min_time(self):
+        writer = WriterStub()
+        parent = type("Parent", (), {"writer": writer})()
+        callbacks = RemotCallback(parent)
+        callbacks.configure(messaging.UpdateOptions(delta_updates=True, min_time=0.2))
+        data = make_data()
+
+        def update(i):
+            fom_log = np.array([[j, 1.0 / (j + 1)] for j in range(i + 1)])
+            callbacks.plot_output(
+                SolverUpdateInfo(new_best=True, fom_value=fom_log[-1, 1], fom_name="log", fom_log=fom_log, data=data)
+            )
+
+        async def run():
+            callbacks.loop = asyncio.get_running_loop()
+            for i in range(5):
+                update(i)
+            await asyncio.sleep(0.05)
+            for i in range(5, 10):
+                update(i)
+            await asyncio.sleep(0.05)
+            self.assertEqual(len(await read_all(writer.written)), 1)
+            await asyncio.sleep(0.3)
+
+        asyncio.run(run())
+        messages = receive_all(writer.written)
+        self.assertEqual(len(messages), 2)
+        decoder = messaging.DeltaDecoder(data)
+        infos = [decoder.update_info(msg) for msg in messages]
+        self.assertEqual(len(infos[0].fom_log), 5)
+        self.assertEqual(len(infos[1].fom_log), 10)
+
+    def test_keep_new_best(self):
+        writer = WriterStub()
+        parent = type("Parent", (), {"writer": writer})()
+        callbacks = RemotCallback(parent)
+        callbacks.configure(messaging.UpdateOptions(delta_updates=False, min_time=0.2))
+        data = make_data()
+
+        def update(i, new_best):
+            fom_log = np.array([[j, 1.0 / (j + 1)] for j in range(i + 1)])
+            callbacks.plot_output(
+                SolverUpdateInfo(
+                    new_best=new_best, fom_value=fom_log[-1, 1], fom_name="log", fom_log=fom_log, data=data
+                )
+            )
+
+        async def run():
+            callbacks.loop = asyncio.get_running_loop()
+            update(0, False)
+            await asyncio.sleep(0.05)
+            # the best update is replaced by a later one before it could be sent
+            update(1, True)
+            update(2, False)
+            await asyncio.sleep(0.3)
+            update(3, False)
+            await asyncio.sleep(0.3)
+
+        asyncio.run(run())
+        messages = receive_all(writer.written)
+        self.assertEqual([msg.payload.new_best for msg in messages], [False, True, False])
+        self.assertEqual(len(messages[1].payload.fom_log), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()